@@ -0,0 +1,370 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.corpus import CORPORA, generate_corpus
+from business_logic.create_backup import build_backup, build_split_backup
+from business_logic.scan_planner import plan_scans
+from models.files_to_backup import FilesToBackup
+from typing import Dict, List, Optional
+from utils.human_readable_bytes import human_readable_bytes
+from utils.metrics import peak_rss
+from utils.validate import validate_compression
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Outputs of the archiver measured by the benchmark: a zip file, or volumes
+# deleted once complete as if they were uploaded
+OUTPUTS = ("file", "volumes")
+# Number of volumes the archive is split in with the volumes output
+VOLUMES_PER_ARCHIVE = 4
+# Delay between two measures of the disk used by a case
+DISK_SAMPLING_INTERVAL = 0.01
+# Measures compared with the baseline, and the threshold option of each one
+COMPARED_MEASURES = {
+    "discoverySeconds": "max_time_regression",
+    "archiveSeconds": "max_time_regression",
+    "peakRss": "max_memory_regression",
+    "diskHighWater": "max_disk_regression",
+}
+
+
+class DiskUsageSampler:
+    """
+    Samples the size of the files of a folder in a background thread, keeping the
+    highest one: the temporary disk used by the archiver, spooled blocks included.
+    """
+
+    def __init__(self, folder: str, interval: float = DISK_SAMPLING_INTERVAL):
+        self.folder = folder
+        self.interval = interval
+        self.high_water = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def sample(self) -> None:
+        """
+        Measure the disk used now, e.g. right before a file is removed.
+        """
+        self.high_water = max(self.high_water, self._usage())
+
+    def _usage(self) -> int:
+        usage = 0
+        for directory, _, file_names in os.walk(self.folder):
+            for file_name in file_names:
+                try:
+                    usage += os.stat(os.path.join(directory, file_name)).st_size
+                except OSError:
+                    # Removed since it was listed
+                    pass
+        return usage
+
+    def _sample(self) -> None:
+        while not self._stop.is_set():
+            self.sample()
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "DiskUsageSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+def run_case(
+    corpus_dir: str, work_dir: str, codec: str, workers: int, output: str
+) -> dict:
+    """
+    Measure the discovery and the archiving of a corpus with a codec, a number of
+    workers and an output. Meant to run in a process of its own, whose temporary
+    files go to work_dir, so that its peak memory and disk usage are its own.
+    """
+    paths_to_backup = [
+        FilesToBackup(
+            corpus_dir, ".*", "corpus", None, compression=codec, recursive=True
+        )
+    ]
+
+    start = time.perf_counter()
+    discovered_count = sum(
+        1 for group in plan_scans(paths_to_backup) for _ in group.scan()
+    )
+    discovery_seconds = time.perf_counter() - start
+
+    destination_path = os.path.join(work_dir, "backup.zip")
+    archive_size = 0
+    with DiskUsageSampler(work_dir) as sampler:
+        start = time.perf_counter()
+        if output == "file":
+            build_backup(paths_to_backup, destination_path, workers)
+            archive_size = os.path.getsize(destination_path)
+        else:
+            corpus_size = sum(
+                file.stat.st_size
+                for group in plan_scans(paths_to_backup)
+                for file, _ in group.scan()
+            )
+
+            def on_volume_complete(volume_path: str, *_) -> None:
+                nonlocal archive_size
+                archive_size += os.path.getsize(volume_path)
+                sampler.sample()
+                os.remove(volume_path)
+
+            build_split_backup(
+                paths_to_backup,
+                destination_path,
+                max(corpus_size // VOLUMES_PER_ARCHIVE, 1024**2),
+                on_volume_complete,
+                workers,
+            )
+        archive_seconds = time.perf_counter() - start
+
+    return {
+        "files": discovered_count,
+        "discoverySeconds": discovery_seconds,
+        "archiveSeconds": archive_seconds,
+        "archiveSize": archive_size,
+        "peakRss": peak_rss(),
+        "diskHighWater": sampler.high_water,
+        # Disk used at worst for each byte of archive: 1 is the archive itself,
+        # 2 would be a full extra copy
+        "diskAmplification": (
+            sampler.high_water / archive_size if archive_size else None
+        ),
+    }
+
+
+def measure_case(
+    corpus_dir: str, benchmark_dir: str, codec: str, workers: int, output: str
+) -> dict:
+    """
+    Run a case in a new process, with its temporary files in a folder of its own.
+    """
+    work_dir = tempfile.mkdtemp(dir=benchmark_dir, prefix="case-")
+    environment = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(
+            filter(None, [REPOSITORY_ROOT, os.environ.get("PYTHONPATH")])
+        ),
+        "TMPDIR": work_dir,
+    }
+    try:
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.archive_benchmark",
+                "--run-case",
+                json.dumps([corpus_dir, work_dir, codec, workers, output]),
+            ],
+            env=environment,
+            capture_output=True,
+            text=True,
+        )
+        if process.returncode != 0:
+            raise RuntimeError(f"Benchmark case failed:\n{process.stderr}")
+        return json.loads(process.stdout.splitlines()[-1])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def summarize(measures: List[dict]) -> dict:
+    """
+    Combine the measures of the repetitions of a case: median times, highest
+    memory and disk usage.
+    """
+    summary = dict(measures[0])
+    for key in ("discoverySeconds", "archiveSeconds"):
+        summary[key] = statistics.median(measure[key] for measure in measures)
+    for key in ("peakRss", "diskHighWater", "diskAmplification"):
+        values = [measure[key] for measure in measures if measure[key] is not None]
+        summary[key] = max(values) if values else None
+    return summary
+
+
+def compare(
+    results: Dict[str, dict],
+    baseline: Dict[str, dict],
+    thresholds: Dict[str, float],
+    min_seconds: float,
+) -> List[str]:
+    """
+    The regressions of the results against the baseline, for the cases in both.
+    A measure regresses when it grew by more than its threshold, e.g. 0.2 for 20%.
+    Times shorter than min_seconds in the baseline are too noisy to be compared.
+    """
+    regressions = []
+    for case, result in results.items():
+        if case not in baseline:
+            continue
+        for measure, threshold_name in COMPARED_MEASURES.items():
+            before, after = baseline[case].get(measure), result.get(measure)
+            if not before or after is None:
+                continue
+            if measure.endswith("Seconds") and before < min_seconds:
+                continue
+            growth = after / before - 1
+            if growth > thresholds[threshold_name]:
+                regressions.append(
+                    f"{case}: {measure} {before:.3g} -> {after:.3g} (+{growth:.0%})"
+                )
+    return regressions
+
+
+def print_result(case: str, result: dict, corpus_size: int) -> None:
+    print(
+        f"{case:<36}{result['files']:>7}{result['discoverySeconds']:>9.3f}s"
+        f"{result['archiveSeconds']:>9.3f}s"
+        f"{corpus_size / result['archiveSeconds'] / 1024**2:>9.1f}"
+        f"{result['archiveSize'] / corpus_size if corpus_size else 0:>7.2f}"
+        f"{human_readable_bytes(result['peakRss'] or 0):>11}"
+        f"{human_readable_bytes(result['diskHighWater']):>11}"
+        f"{result['diskAmplification'] or 0:>6.2f}"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark the discovery and the archiving of reproducible corpora."
+    )
+    parser.add_argument(
+        "--corpora",
+        default=",".join(CORPORA),
+        help=f"Comma separated corpora among {', '.join(CORPORA)}",
+    )
+    parser.add_argument(
+        "--scale", type=float, default=1.0, help="Multiplies the number of files"
+    )
+    parser.add_argument("--codecs", default="store,deflate,zstd,auto")
+    parser.add_argument("--workers", default="1,4")
+    parser.add_argument("--outputs", default="file", help="file, volumes or both")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", help="Compare the results with this baseline")
+    parser.add_argument(
+        "--save-baseline", help="Write the results to this file, as the new baseline"
+    )
+    parser.add_argument("--max-time-regression", type=float, default=0.2)
+    parser.add_argument("--max-memory-regression", type=float, default=0.2)
+    parser.add_argument("--max-disk-regression", type=float, default=0.1)
+    parser.add_argument(
+        "--max-disk-amplification",
+        type=float,
+        default=1.5,
+        help="Fails when the disk used exceeds the archive size by this factor",
+    )
+    parser.add_argument(
+        "--min-seconds",
+        type=float,
+        default=0.05,
+        help="Baseline times below this are not compared",
+    )
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    arguments = parser.parse_args(argv)
+
+    if arguments.run_case:
+        print(json.dumps(run_case(*json.loads(arguments.run_case))))
+        return
+
+    codecs = []
+    for codec in arguments.codecs.split(","):
+        if validate_compression(codec):
+            codecs.append(codec)
+        else:
+            print(f"Skipping codec {codec}, invalid or missing its package")
+    workers_counts = [int(workers) for workers in arguments.workers.split(",")]
+    outputs = arguments.outputs.split(",")
+    if any(output not in OUTPUTS for output in outputs):
+        parser.error(f"outputs must be among {', '.join(OUTPUTS)}")
+
+    baseline = {}
+    if arguments.baseline:
+        with open(arguments.baseline) as baseline_file:
+            baseline = json.load(baseline_file)["cases"]
+
+    benchmark_dir = tempfile.mkdtemp(prefix="backup2gdrive-archive-benchmark-")
+    results = {}
+    failures = []
+    try:
+        print(
+            f"{'case':<36}{'files':>7}{'discover':>10}{'archive':>10}{'MB/s':>9}"
+            f"{'ratio':>7}{'peak RSS':>11}{'disk':>11}{'amp':>6}"
+        )
+        for corpus in arguments.corpora.split(","):
+            corpus_dir = os.path.join(benchmark_dir, corpus)
+            corpus_size = generate_corpus(
+                corpus, corpus_dir, arguments.scale, arguments.seed
+            )
+            for codec in codecs:
+                for workers in workers_counts:
+                    for output in outputs:
+                        case = f"{corpus}/{codec}/w{workers}/{output}"
+                        result = summarize(
+                            [
+                                measure_case(
+                                    corpus_dir, benchmark_dir, codec, workers, output
+                                )
+                                for _ in range(arguments.repeat)
+                            ]
+                        )
+                        results[case] = result
+                        print_result(case, result, corpus_size)
+                        if (
+                            result["diskAmplification"] or 0
+                        ) > arguments.max_disk_amplification:
+                            failures.append(
+                                f"{case}: used {result['diskAmplification']:.2f} "
+                                "times the archive size on disk"
+                            )
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+    finally:
+        shutil.rmtree(benchmark_dir, ignore_errors=True)
+
+    if arguments.save_baseline:
+        with open(arguments.save_baseline, "w") as baseline_file:
+            json.dump(
+                {
+                    "machine": {
+                        "platform": platform.platform(),
+                        "python": platform.python_version(),
+                        "cpus": os.cpu_count(),
+                    },
+                    "scale": arguments.scale,
+                    "cases": results,
+                },
+                baseline_file,
+                indent=2,
+            )
+
+    failures.extend(
+        compare(
+            results,
+            baseline,
+            {
+                "max_time_regression": arguments.max_time_regression,
+                "max_memory_regression": arguments.max_memory_regression,
+                "max_disk_regression": arguments.max_disk_regression,
+            },
+            arguments.min_seconds,
+        )
+    )
+    if failures:
+        print("\nRegressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import os
+import random
+import re
+
+SHAPES = ("flat", "deep", "mixed")
+
+
+def parse_size(size: str) -> int:
+    """
+    Parse a size like "512", "64KB" or "1.5GB" into bytes.
+    """
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMG]?)B?\s*", size.upper())
+    if not match:
+        raise argparse.ArgumentTypeError(f"Invalid size: {size}")
+    return int(float(match.group(1)) * 1024 ** "_KMG".index(match.group(2) or "_"))
+
+
+def synthetic_data(rng: random.Random, size: int, compressibility: float) -> bytes:
+    """
+    Data of which about `compressibility` is repeated text, the rest being random.
+    """
+    compressible_size = int(size * compressibility)
+    text = b"backup2gdrive synthetic line %d\n" % rng.randrange(1000)
+    compressible = (text * (compressible_size // len(text) + 1))[:compressible_size]
+    return compressible + rng.randbytes(size - compressible_size)
+
+
+def generate_tree(
+    root: str,
+    files: int,
+    file_size: int,
+    shape: str = "mixed",
+    depth: int = 3,
+    fan_out: int = 4,
+    compressibility: float = 0.5,
+    seed: int = 0,
+) -> int:
+    """
+    Generate a tree of synthetic files to backup.
+
+    Parameters
+    ----------
+    root : str
+        The folder receiving the files.
+    files : int
+        The number of files.
+    file_size : int
+        The size of the files, in bytes. It is their average size with the mixed shape.
+    shape : str, optional
+        "flat" puts every file in root, "deep" spreads them over `depth` levels of
+        `fan_out` subfolders, "mixed" does the same with Pareto distributed sizes
+        averaging file_size: many small files and a few large ones. Default is "mixed".
+    depth : int, optional
+        Default is 3.
+    fan_out : int, optional
+        Default is 4.
+    compressibility : float, optional
+        The part of the data which compresses well, between 0 and 1. Default is 0.5.
+    seed : int, optional
+        Default is 0.
+
+    Returns
+    -------
+    int
+        The total size of the files, in bytes.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"shape must be one of {', '.join(SHAPES)}")
+    rng = random.Random(seed)
+    folders = [root]
+    if shape != "flat":
+        level = [root]
+        for _ in range(depth):
+            level = [
+                os.path.join(folder, f"dir{index}")
+                for folder in level
+                for index in range(fan_out)
+            ]
+            folders.extend(level)
+
+    total_size = 0
+    for index in range(files):
+        folder = rng.choice(folders)
+        os.makedirs(folder, exist_ok=True)
+        size = (
+            min(int(rng.paretovariate(1.2) * file_size / 6), 100 * file_size)
+            if shape == "mixed"
+            else file_size
+        )
+        with open(os.path.join(folder, f"file{index}.dat"), "wb") as output:
+            output.write(synthetic_data(rng, size, compressibility))
+        total_size += size
+    return total_size
+
+
+# Reproducible corpora of the archive benchmarks, at scale 1
+CORPORA = {
+    # Many tiny files in a single folder: per file costs dominate
+    "tiny": {"files": 20000, "file_size": 512, "shape": "flat", "compressibility": 0.7},
+    # A few large database dumps, which compress well
+    "dumps": {
+        "files": 3,
+        "file_size": 64 * 1024**2,
+        "shape": "flat",
+        "compressibility": 0.8,
+    },
+    # Already compressed media or archives
+    "incompressible": {
+        "files": 24,
+        "file_size": 4 * 1024**2,
+        "shape": "flat",
+        "compressibility": 0.0,
+    },
+    # A deep tree of small files: the scan dominates
+    "deep": {
+        "files": 5000,
+        "file_size": 4096,
+        "shape": "deep",
+        "depth": 6,
+        "fan_out": 3,
+        "compressibility": 0.5,
+    },
+}
+
+
+def generate_corpus(name: str, root: str, scale: float = 1.0, seed: int = 0) -> int:
+    """
+    Generate one of the CORPORA in root, with scale times its number of files.
+
+    Returns
+    -------
+    int
+        The total size of the files, in bytes.
+    """
+    if name not in CORPORA:
+        raise ValueError(f"corpus must be one of {', '.join(CORPORA)}")
+    spec = dict(CORPORA[name])
+    spec["files"] = max(1, round(spec["files"] * scale))
+    return generate_tree(root, seed=seed, **spec)
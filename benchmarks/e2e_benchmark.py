@@ -0,0 +1,235 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.corpus import SHAPES, generate_tree, parse_size
+from benchmarks.fake_drive_server import FakeDrive, FakeDriveServer
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from utils.human_readable_bytes import human_readable_bytes
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Google Drive folder receiving the backups of the benchmarks
+DESTINATION_PATH = ["benchmarks", "backup2gdrive"]
+# Phases reported first, the others follow in alphabetical order
+PHASE_ORDER = (
+    "config",
+    "scan",
+    "archive",
+    "chunking",
+    "folder_resolution",
+    "upload",
+    "sharing",
+    "retention",
+)
+
+
+def write_config(workdir: str, data_dir: str, overrides: dict) -> str:
+    """
+    Write the config of a benchmark run, backing up data_dir as a whole.
+    """
+    config = {
+        "projectName": "benchmark",
+        "usersEmails": ["reader@example.com"],
+        "daysToKeep": 7,
+        "pathsToBackup": [
+            {
+                "folderPath": data_dir,
+                "filterFile": ".*",
+                "zipName": "data",
+                "recursive": True,
+            }
+        ],
+        "gDriveDestinationPath": DESTINATION_PATH,
+        **overrides,
+    }
+    config_path = os.path.join(workdir, "config.json")
+    with open(config_path, "w") as config_file:
+        json.dump(config, config_file, indent=2)
+    return config_path
+
+
+def run_backup(workdir: str, config_path: str, root_url: str) -> Optional[dict]:
+    """
+    Run main.main in a process of its own, so that its peak memory is its own, and
+    return the report of the run.
+    """
+    environment = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(
+            filter(None, [REPOSITORY_ROOT, os.environ.get("PYTHONPATH")])
+        ),
+        "GOOGLE_DRIVE_API_ROOT_URL": root_url,
+        "BACKUP2GDRIVE_CONFIG_PATH": config_path,
+    }
+    with open(os.path.join(workdir, "output.log"), "w") as output:
+        process = subprocess.run(
+            [sys.executable, "-c", "import main; main.main()"],
+            cwd=workdir,
+            env=environment,
+            stdout=output,
+            stderr=subprocess.STDOUT,
+        )
+    if process.returncode != 0:
+        print(
+            f"The backup failed with exit code {process.returncode}, "
+            f"see {os.path.join(workdir, 'output.log')}"
+        )
+    report_path = os.path.join(workdir, "logs", "run_report.json")
+    if not os.path.exists(report_path):
+        return None
+    with open(report_path) as report_file:
+        return json.load(report_file)
+
+
+def print_report(report: dict, drive: FakeDrive, server: FakeDriveServer) -> None:
+    phases = sorted(
+        report["phases"].items(),
+        key=lambda item: (
+            PHASE_ORDER.index(item[0]) if item[0] in PHASE_ORDER else len(PHASE_ORDER),
+            item[0],
+        ),
+    )
+    print(
+        f"{'phase':<18}{'duration':>10}{'busy':>9}{'files':>8}{'in':>11}{'out':>11}"
+        f"{'MB/s in':>9}{'MB/s out':>9}{'calls':>7}{'retries':>8}{'peak RSS':>11}"
+    )
+    for phase, stats in phases:
+        print(
+            f"{phase:<18}{stats['duration']:>9.2f}s{stats['busyTime']:>8.2f}s"
+            f"{stats['files']:>8}"
+            f"{human_readable_bytes(stats['bytesIn']):>11}"
+            f"{human_readable_bytes(stats['bytesOut']):>11}"
+            f"{_megabytes(stats['throughputIn']):>9}"
+            f"{_megabytes(stats['throughputOut']):>9}"
+            f"{stats['apiCalls']:>7}{stats['apiRetries']:>8}"
+            f"{human_readable_bytes(stats['peakRss'] or 0):>11}"
+        )
+    print(
+        f"Total: {report['duration']:.2f}s, success: {report['success']}, "
+        f"peak RSS: {human_readable_bytes(report['peakRss'] or 0)}"
+    )
+    drive_stats = drive.stats()
+    print(
+        f"Fake Drive: {sum(stats['calls'] for stats in drive_stats.values())} requests, "
+        f"{sum(stats['faults'] for stats in drive_stats.values())} injected faults, "
+        f"{human_readable_bytes(server.bytes_received)} received"
+    )
+
+
+def _megabytes(throughput: Optional[float]) -> str:
+    return "-" if throughput is None else f"{throughput / 1024**2:.1f}"
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark backup runs against a local stand-in of Google Drive."
+    )
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--file-size", type=parse_size, default=parse_size("64KB"))
+    parser.add_argument("--shape", choices=SHAPES, default="mixed")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--fan-out", type=int, default=4)
+    parser.add_argument("--compressibility", type=float, default=0.5)
+    parser.add_argument(
+        "--old-files",
+        type=int,
+        default=0,
+        help="Old backups to delete in the destination folder, to measure the retention",
+    )
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument(
+        "--config",
+        action="append",
+        default=[],
+        metavar="KEY=JSON",
+        help="Config entry, e.g. --config workers=4 --config backupMode='\"dedup\"'",
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--upload-mbps", type=float)
+    parser.add_argument("--download-mbps", type=float)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", help="Write the reports of the runs to this JSON file"
+    )
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the data and the working folders"
+    )
+    arguments = parser.parse_args(argv)
+
+    overrides = {}
+    for entry in arguments.config:
+        key, _, value = entry.partition("=")
+        overrides[key] = json.loads(value)
+
+    benchmark_dir = tempfile.mkdtemp(prefix="backup2gdrive-benchmark-")
+    data_dir = os.path.join(benchmark_dir, "data")
+    total_size = generate_tree(
+        data_dir,
+        arguments.files,
+        arguments.file_size,
+        arguments.shape,
+        arguments.depth,
+        arguments.fan_out,
+        arguments.compressibility,
+        arguments.seed,
+    )
+    print(
+        f"Generated {arguments.files} files, {human_readable_bytes(total_size)}, "
+        f"in {data_dir}"
+    )
+
+    reports = []
+    try:
+        for run in range(arguments.runs):
+            # Every run starts from an empty Google Drive and an empty working folder
+            workdir = os.path.join(benchmark_dir, f"run{run}")
+            os.makedirs(workdir)
+            drive = FakeDrive(
+                keep_content=False,
+                error_rate=arguments.error_rate,
+                seed=arguments.seed + run,
+            )
+            if arguments.old_files:
+                folder_id = drive.create_folder_path(DESTINATION_PATH)
+                old_time = (datetime.now(timezone.utc) - timedelta(days=60)).strftime(
+                    "%Y-%m-%dT%H:%M:%S.000Z"
+                )
+                for index in range(arguments.old_files):
+                    drive.create_file(
+                        f"old_backup{index}.zip", folder_id, modified_time=old_time
+                    )
+            with FakeDriveServer(
+                drive,
+                latency=arguments.latency,
+                upload_bandwidth=arguments.upload_mbps
+                and arguments.upload_mbps * 1024**2,
+                download_bandwidth=arguments.download_mbps
+                and arguments.download_mbps * 1024**2,
+            ) as server:
+                config_path = write_config(workdir, data_dir, overrides)
+                report = run_backup(workdir, config_path, server.root_url)
+            print(f"\nRun {run + 1}/{arguments.runs}")
+            if report is None:
+                print("No run report was written")
+                continue
+            print_report(report, drive, server)
+            reports.append({**report, "fakeDrive": drive.stats()})
+    finally:
+        if arguments.keep:
+            print(f"\nKept {benchmark_dir}")
+        else:
+            shutil.rmtree(benchmark_dir, ignore_errors=True)
+
+    if arguments.output:
+        with open(arguments.output, "w") as output:
+            json.dump({"arguments": vars(arguments), "runs": reports}, output, indent=2)
+
+
+if __name__ == "__main__":
+    main()
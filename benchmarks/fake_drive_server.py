@@ -0,0 +1,1104 @@
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+
+from collections import Counter
+from datetime import datetime, timezone
+from email.parser import Parser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl, unquote, urlsplit
+from utils.token_bucket import TokenBucket
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# Chunks of resumable uploads, except the last one, are multiples of this size
+UPLOAD_CHUNK_GRANULARITY = 256 * 1024
+# Default and maximum page sizes of files.list
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Reasons given with the injected faults, as Google Drive does
+FAULT_REASONS = {403: "userRateLimitExceeded", 429: "rateLimitExceeded"}
+# Fields returned when a request does not ask for fields
+DEFAULT_FILE_FIELDS = "kind, id, name, mimeType"
+DEFAULT_LIST_FIELDS = (
+    "kind, incompleteSearch, nextPageToken, files(kind, id, name, mimeType)"
+)
+DEFAULT_PERMISSION_FIELDS = "kind, id, type, role"
+# Size of the pieces in which bodies are read and written, throttled one by one
+TRANSFER_PIECE_SIZE = 64 * 1024
+
+
+class DriveError(Exception):
+    """
+    An error response of the API.
+    """
+
+    def __init__(self, status: int, reason: str, message: str):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.message = message
+
+    def to_json(self) -> bytes:
+        return json.dumps(
+            {
+                "error": {
+                    "code": self.status,
+                    "message": self.message,
+                    "errors": [
+                        {
+                            "domain": "global",
+                            "reason": self.reason,
+                            "message": self.message,
+                        }
+                    ],
+                }
+            }
+        ).encode()
+
+
+class FakeResponse(NamedTuple):
+    status: int
+    headers: Dict[str, str]
+    body: bytes
+
+
+def now_rfc3339() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds")[:-6] + "Z"
+
+
+def parse_rfc3339(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def parse_fields(fields: str) -> dict:
+    """
+    Parse a partial response selector, e.g. "nextPageToken, files(id, name)", into
+    a tree: {"nextPageToken": None, "files": {"id": None, "name": None}}.
+    """
+    tree, stack, name = {}, [], ""
+    for character in fields + ",":
+        if character in ",()":
+            name = name.strip()
+            if character == "(":
+                stack.append(tree)
+                tree[name] = {}
+                tree = tree[name]
+            elif name:
+                tree[name] = None
+            if character == ")":
+                tree = stack.pop()
+            name = ""
+        else:
+            name += character
+    return tree
+
+
+def select_fields(resource, tree: Optional[dict]):
+    """
+    Keep the fields of a resource, or of a list of resources, selected by a tree.
+    """
+    if tree is None or "*" in tree:
+        return resource
+    if isinstance(resource, list):
+        return [select_fields(item, tree) for item in resource]
+    return {
+        name: select_fields(resource[name], subtree)
+        for name, subtree in tree.items()
+        if name in resource
+    }
+
+
+def split_query(query: str) -> List[str]:
+    """
+    Split a files.list query on the "and" outside of quoted values.
+    """
+    clauses, current, quoted, escaped = [], "", False, False
+    index = 0
+    while index < len(query):
+        character = query[index]
+        if escaped:
+            escaped = False
+        elif character == "\\":
+            escaped = True
+        elif character == "'":
+            quoted = not quoted
+        elif not quoted and query[index : index + 5].lower() == " and ":
+            clauses.append(current)
+            current = ""
+            index += 5
+            continue
+        current += character
+        index += 1
+    clauses.append(current)
+    return clauses
+
+
+QUERY_CLAUSE = re.compile(
+    r"^\s*(?:'(?P<parent>(?:[^'\\]|\\.)*)'\s+in\s+parents"
+    r"|(?P<field>\w+)\s*(?P<operator>!=|<=|>=|=|<|>|\scontains\s)\s*"
+    r"(?P<value>'(?:[^'\\]|\\.)*'|true|false))\s*$"
+)
+
+
+def compile_query(query: str):
+    """
+    Compile the subset of the files.list query language used by the service:
+    clauses like `name = 'x'`, `'id' in parents` or `modifiedTime < '...'` joined
+    with "and". Anything else is rejected, as a reminder to extend this stand-in.
+    """
+    predicates = []
+    for clause in split_query(query):
+        match = QUERY_CLAUSE.match(clause)
+        if not match:
+            raise DriveError(400, "invalid", f"Unsupported query clause: {clause}")
+        if match["parent"] is not None:
+            parent = re.sub(r"\\(.)", r"\1", match["parent"])
+            predicates.append(lambda file, parent=parent: parent in file["parents"])
+            continue
+        field, operator, value = (
+            match["field"],
+            match["operator"].strip(),
+            match["value"],
+        )
+        if value in ("true", "false"):
+            value = value == "true"
+        else:
+            value = re.sub(r"\\(.)", r"\1", value[1:-1])
+        if field.endswith("Time"):
+            value = parse_rfc3339(value)
+        predicates.append(
+            lambda file, field=field, operator=operator, value=value: _compare(
+                file, field, operator, value
+            )
+        )
+    return lambda file: all(predicate(file) for predicate in predicates)
+
+
+def _compare(file: dict, field: str, operator: str, value) -> bool:
+    actual = file.get(field)
+    if actual is None:
+        return False
+    if field.endswith("Time"):
+        actual = parse_rfc3339(actual)
+    if operator == "contains":
+        return value in actual
+    return {
+        "=": actual == value,
+        "!=": actual != value,
+        "<": actual < value,
+        "<=": actual <= value,
+        ">": actual > value,
+        ">=": actual >= value,
+    }[operator]
+
+
+def parse_multipart(
+    content_type: str, body: bytes
+) -> List[Tuple[Dict[str, str], bytes]]:
+    """
+    Split a multipart body into the headers and the body of each part.
+    """
+    match = re.search(r'boundary="?([^";]+)"?', content_type)
+    if not match:
+        raise DriveError(400, "badContent", "Missing multipart boundary")
+    delimiter = b"--" + match.group(1).encode()
+    parts = []
+    for part in body.split(delimiter)[1:]:
+        if part.startswith(b"--"):
+            break
+        part = part[2:] if part.startswith(b"\r\n") else part[1:]
+        # The headers end with the first blank line, the content can hold anything
+        ends = [
+            (part.find(separator), separator)
+            for separator in (b"\r\n\r\n", b"\n\n")
+            if separator in part
+        ]
+        header_end, separator = min(ends) if ends else (len(part), b"")
+        header_block = part[:header_end]
+        content = part[header_end + len(separator) :]
+        if content.endswith(b"\r\n"):
+            content = content[:-2]
+        elif content.endswith(b"\n"):
+            content = content[:-1]
+        headers = {}
+        for line in header_block.decode().splitlines():
+            if ":" in line:
+                key, value = line.split(":", 1)
+                headers[key.strip().lower()] = value.strip()
+        parts.append((headers, content))
+    return parts
+
+
+class StoredFile:
+    """
+    A file of the stand-in: its resource, its content and its permissions.
+    """
+
+    def __init__(self, resource: dict, keep_content: bool):
+        self.resource = resource
+        self.content = bytearray() if keep_content else None
+        self.size = 0
+        self.md5 = hashlib.md5()
+        self.sha256 = hashlib.sha256()
+        self.permissions: List[dict] = []
+
+    def append(self, data: bytes) -> None:
+        if self.content is not None:
+            self.content += data
+        self.size += len(data)
+        self.md5.update(data)
+        self.sha256.update(data)
+
+    def seal(self) -> None:
+        """
+        Set the size and checksums of the resource once its content is complete.
+        """
+        if self.resource["mimeType"] == FOLDER_MIME_TYPE:
+            return
+        self.resource["size"] = str(self.size)
+        self.resource["md5Checksum"] = self.md5.hexdigest()
+        self.resource["sha256Checksum"] = self.sha256.hexdigest()
+
+
+class UploadSession:
+    def __init__(self, stored_file: StoredFile, total_size: Optional[int], fields):
+        self.file = stored_file
+        self.total_size = total_size
+        self.fields = fields
+        self.completed = False
+
+
+class FakeDrive:
+    """
+    In-memory stand-in of the Google Drive v3 API, for benchmarks and manual tests.
+
+    It implements what the service uses: about, files.list (a subset of the query
+    language), files.create, files.get (with alt=media and ranges), files.update,
+    files.delete, multipart and resumable uploads, permissions, the changes feed
+    and batch requests.
+    Requests fail at random with error_rate, with one of fault_statuses; an upload
+    chunk failing that way keeps part of its data, like an interrupted connection.
+
+    Parameters
+    ----------
+    user_email : str, optional
+        The email address of the authenticated user.
+    storage_limit : int, optional
+        The storage quota, in bytes. Default is 15 GB.
+    keep_content : bool, optional
+        Whether the content of the files is kept, so that they can be downloaded.
+        Their size and checksums are always computed. Default is True.
+    error_rate : float, optional
+        The probability for a request to fail. Default is 0.
+    fault_statuses : Iterable[int], optional
+        The statuses of the failed requests, picked at random.
+        Default is (429, 500, 503).
+    retry_after : float, optional
+        The Retry-After header of the 429 responses, in seconds. Default is none.
+    seed : int, optional
+        Seed of the faults, to replay the same run.
+    """
+
+    def __init__(
+        self,
+        user_email: str = "backup@fake-drive.local",
+        storage_limit: int = 15 * 1024**3,
+        keep_content: bool = True,
+        error_rate: float = 0.0,
+        fault_statuses: Iterable[int] = (429, 500, 503),
+        retry_after: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        if not 0 <= error_rate <= 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.user_email = user_email
+        self.storage_limit = storage_limit
+        self.keep_content = keep_content
+        self.error_rate = error_rate
+        self.fault_statuses = list(fault_statuses)
+        self.retry_after = retry_after
+        self.files: Dict[str, StoredFile] = {}
+        self._sessions: Dict[str, UploadSession] = {}
+        # IDs of the changed files, in order: a page token is a position in it
+        self._changes: List[str] = []
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self.calls = Counter()
+        self.faults = Counter()
+
+    # Direct access, e.g. to seed a benchmark
+
+    def create_file(
+        self,
+        name: str,
+        parent_id: Optional[str] = None,
+        content: bytes = b"",
+        mime_type: str = "application/octet-stream",
+        modified_time: Optional[str] = None,
+    ) -> str:
+        """
+        Create a file, or a folder with FOLDER_MIME_TYPE, and return its ID.
+        """
+        stored_file = self._new_file(
+            {
+                "name": name,
+                "mimeType": mime_type,
+                "parents": [parent_id] if parent_id else [],
+                **({"modifiedTime": modified_time} if modified_time else {}),
+            }
+        )
+        stored_file.append(content)
+        stored_file.seal()
+        with self._lock:
+            self._store(stored_file)
+        return stored_file.resource["id"]
+
+    def create_folder_path(self, path: List[str]) -> str:
+        """
+        Create the folders of a path from the root, and return the ID of the last one.
+        """
+        parent_id = None
+        for name in path:
+            parent_id = self.create_file(name, parent_id, mime_type=FOLDER_MIME_TYPE)
+        return parent_id
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        Requests received and faults injected, by endpoint.
+        """
+        with self._lock:
+            return {
+                endpoint: {"calls": calls, "faults": self.faults[endpoint]}
+                for endpoint, calls in sorted(self.calls.items())
+            }
+
+    # API
+
+    def handle(
+        self, method: str, url: str, headers: Dict[str, str], body: bytes
+    ) -> FakeResponse:
+        """
+        Answer a request of the API. Header names are lower case.
+        """
+        split_url = urlsplit(url)
+        path = split_url.path.strip("/")
+        query = dict(parse_qsl(split_url.query))
+        endpoint, handler, arguments = self._route(method, path)
+        with self._lock:
+            self.calls[endpoint] += 1
+        try:
+            if handler is None:
+                raise DriveError(404, "notFound", f"No endpoint {method} /{path}")
+            fault = self._draw_fault(endpoint)
+            if fault is not None and handler != self._send_chunk:
+                raise fault
+            return handler(query, headers, body, fault=fault, **arguments)
+        except DriveError as error:
+            error_headers = {"Content-Type": "application/json; charset=UTF-8"}
+            if error.status == 429 and self.retry_after is not None:
+                error_headers["Retry-After"] = str(self.retry_after)
+            return FakeResponse(error.status, error_headers, error.to_json())
+
+    def handle_batch(self, headers: Dict[str, str], body: bytes) -> FakeResponse:
+        """
+        Answer a batch request, each of its requests being handled on its own.
+        """
+        with self._lock:
+            self.calls["batch"] += 1
+        boundary = f"batch_{uuid.uuid4().hex}"
+        parts = []
+        for part_headers, content in parse_multipart(
+            headers.get("content-type", ""), body
+        ):
+            request_line, _, request = content.decode().partition("\n")
+            method, url, _ = request_line.strip().split(" ", 2)
+            message = Parser().parsestr(request.replace("\r\n", "\n"))
+            response = self.handle(
+                method,
+                url,
+                {key.lower(): value for key, value in message.items()},
+                (message.get_payload() or "").encode(),
+            )
+            content_id = part_headers.get("content-id", "<>")[1:-1]
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {response.status} {_reason(response.status)}\r\n"
+                + "".join(
+                    f"{key}: {value}\r\n" for key, value in response.headers.items()
+                )
+                + f"Content-Length: {len(response.body)}\r\n\r\n"
+                + response.body.decode()
+                + "\r\n"
+            )
+        return FakeResponse(
+            200,
+            {"Content-Type": f"multipart/mixed; boundary={boundary}"},
+            ("".join(parts) + f"--{boundary}--\r\n").encode(),
+        )
+
+    def _route(self, method: str, path: str) -> Tuple[str, Optional[callable], dict]:
+        for route_method, pattern, endpoint, handler in (
+            ("GET", r"drive/v3/about", "drive.about.get", self._about),
+            (
+                "GET",
+                r"drive/v3/changes/startPageToken",
+                "drive.changes.getStartPageToken",
+                self._start_page_token,
+            ),
+            ("GET", r"drive/v3/changes", "drive.changes.list", self._list_changes),
+            ("GET", r"drive/v3/files", "drive.files.list", self._list_files),
+            ("POST", r"drive/v3/files", "drive.files.create", self._create_file),
+            (
+                "GET",
+                r"drive/v3/files/(?P<file_id>[^/]+)",
+                "drive.files.get",
+                self._get_file,
+            ),
+            (
+                "PATCH",
+                r"drive/v3/files/(?P<file_id>[^/]+)",
+                "drive.files.update",
+                self._update_file,
+            ),
+            (
+                "DELETE",
+                r"drive/v3/files/(?P<file_id>[^/]+)",
+                "drive.files.delete",
+                self._delete_file,
+            ),
+            (
+                "GET",
+                r"drive/v3/files/(?P<file_id>[^/]+)/permissions",
+                "drive.permissions.list",
+                self._list_permissions,
+            ),
+            (
+                "POST",
+                r"drive/v3/files/(?P<file_id>[^/]+)/permissions",
+                "drive.permissions.create",
+                self._create_permission,
+            ),
+            (
+                "PATCH",
+                r"drive/v3/files/(?P<file_id>[^/]+)/permissions/(?P<permission_id>[^/]+)",
+                "drive.permissions.update",
+                self._update_permission,
+            ),
+            (
+                "DELETE",
+                r"drive/v3/files/(?P<file_id>[^/]+)/permissions/(?P<permission_id>[^/]+)",
+                "drive.permissions.delete",
+                self._delete_permission,
+            ),
+            (
+                "POST",
+                r"upload/drive/v3/files",
+                "drive.files.create.upload",
+                self._upload,
+            ),
+            (
+                "PUT",
+                r"upload/drive/v3/files",
+                "drive.files.create.upload",
+                self._send_chunk,
+            ),
+        ):
+            match = re.fullmatch(pattern, path)
+            if match and method == route_method:
+                # E.g. the ID of a permission, which is its email address here
+                return (
+                    endpoint,
+                    handler,
+                    {name: unquote(value) for name, value in match.groupdict().items()},
+                )
+        return f"{method} /{path}", None, {}
+
+    def _draw_fault(self, endpoint: str) -> Optional[DriveError]:
+        with self._lock:
+            if not self.fault_statuses or self._random.random() >= self.error_rate:
+                return None
+            status = self._random.choice(self.fault_statuses)
+            self.faults[endpoint] += 1
+        reason = FAULT_REASONS.get(status, "backendError")
+        return DriveError(status, reason, f"Injected fault: {reason}")
+
+    def _about(self, query, headers, body, fault=None) -> FakeResponse:
+        with self._lock:
+            usage = sum(stored_file.size for stored_file in self.files.values())
+        about = {
+            "kind": "drive#about",
+            "user": {
+                "kind": "drive#user",
+                "displayName": self.user_email.split("@")[0],
+                "emailAddress": self.user_email,
+            },
+            "storageQuota": {
+                "limit": str(self.storage_limit),
+                "usage": str(usage),
+                "usageInDrive": str(usage),
+                "usageInDriveTrash": "0",
+            },
+        }
+        return self._json(select_fields(about, _fields(query, "*")))
+
+    def _start_page_token(self, query, headers, body, fault=None) -> FakeResponse:
+        with self._lock:
+            result = {
+                "kind": "drive#startPageToken",
+                "startPageToken": str(len(self._changes)),
+            }
+        return self._json(select_fields(result, _fields(query, "*")))
+
+    def _list_changes(self, query, headers, body, fault=None) -> FakeResponse:
+        page_token = query.get("pageToken", "")
+        if not page_token.isdigit():
+            raise DriveError(400, "invalid", f"Invalid pageToken: {page_token}")
+        offset = int(page_token)
+        page_size = min(int(query.get("pageSize", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        with self._lock:
+            if offset > len(self._changes):
+                raise DriveError(404, "notFound", f"Invalid pageToken: {page_token}")
+            changes = []
+            for file_id in self._changes[offset : offset + page_size]:
+                stored_file = self.files.get(file_id)
+                change = {
+                    "kind": "drive#change",
+                    "changeType": "file",
+                    "fileId": file_id,
+                    "removed": stored_file is None,
+                }
+                if stored_file is not None:
+                    change["file"] = dict(stored_file.resource)
+                changes.append(change)
+            result = {"kind": "drive#changeList", "changes": changes}
+            if offset + page_size < len(self._changes):
+                result["nextPageToken"] = str(offset + page_size)
+            else:
+                result["newStartPageToken"] = str(len(self._changes))
+        return self._json(select_fields(result, _fields(query, "*")))
+
+    def _list_files(self, query, headers, body, fault=None) -> FakeResponse:
+        predicate = compile_query(query.get("q", "trashed = false"))
+        page_size = min(int(query.get("pageSize", DEFAULT_PAGE_SIZE)), MAX_PAGE_SIZE)
+        offset = int(query.get("pageToken") or 0)
+        with self._lock:
+            matching = [
+                dict(stored_file.resource)
+                for stored_file in self.files.values()
+                if predicate(stored_file.resource)
+            ]
+        result = {
+            "kind": "drive#fileList",
+            "incompleteSearch": False,
+            "files": matching[offset : offset + page_size],
+        }
+        if offset + page_size < len(matching):
+            result["nextPageToken"] = str(offset + page_size)
+        return self._json(select_fields(result, _fields(query, DEFAULT_LIST_FIELDS)))
+
+    def _create_file(self, query, headers, body, fault=None) -> FakeResponse:
+        stored_file = self._new_file(json.loads(body or b"{}"))
+        stored_file.seal()
+        with self._lock:
+            self._store(stored_file)
+        return self._file_response(stored_file, query)
+
+    def _get_file(self, query, headers, body, file_id, fault=None) -> FakeResponse:
+        stored_file = self._file(file_id)
+        if query.get("alt") != "media":
+            return self._file_response(stored_file, query)
+        if stored_file.content is None:
+            raise DriveError(403, "fileNotDownloadable", "Content is not kept")
+        content = bytes(stored_file.content)
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", headers.get("range", ""))
+        if not match:
+            return FakeResponse(
+                200, {"Content-Type": "application/octet-stream"}, content
+            )
+        if match.group(1):
+            start = int(match.group(1))
+            end = min(int(match.group(2) or len(content) - 1), len(content) - 1)
+        else:
+            start, end = max(len(content) - int(match.group(2)), 0), len(content) - 1
+        if start >= len(content):
+            raise DriveError(416, "requestedRangeNotSatisfiable", "Invalid range")
+        return FakeResponse(
+            206,
+            {
+                "Content-Type": "application/octet-stream",
+                "Content-Range": f"bytes {start}-{end}/{len(content)}",
+            },
+            content[start : end + 1],
+        )
+
+    def _update_file(self, query, headers, body, file_id, fault=None) -> FakeResponse:
+        stored_file = self._file(file_id)
+        metadata = json.loads(body or b"{}")
+        with self._lock:
+            for key in ("name", "trashed", "description", "appProperties"):
+                if key in metadata:
+                    stored_file.resource[key] = metadata[key]
+            parents = stored_file.resource["parents"]
+            for parent in query.get("removeParents", "").split(","):
+                if parent in parents:
+                    parents.remove(parent)
+            parents.extend(
+                parent for parent in query.get("addParents", "").split(",") if parent
+            )
+            stored_file.resource["modifiedTime"] = now_rfc3339()
+            self._changes.append(file_id)
+        return self._file_response(stored_file, query)
+
+    def _delete_file(self, query, headers, body, file_id, fault=None) -> FakeResponse:
+        self._file(file_id)
+        with self._lock:
+            # Deleting a folder deletes its content
+            to_delete = [file_id]
+            while to_delete:
+                deleted_id = to_delete.pop()
+                self.files.pop(deleted_id, None)
+                self._changes.append(deleted_id)
+                to_delete.extend(
+                    child_id
+                    for child_id, child in self.files.items()
+                    if deleted_id in child.resource["parents"]
+                )
+        return FakeResponse(204, {}, b"")
+
+    def _list_permissions(
+        self, query, headers, body, file_id, fault=None
+    ) -> FakeResponse:
+        stored_file = self._file(file_id)
+        with self._lock:
+            result = {
+                "kind": "drive#permissionList",
+                "permissions": [
+                    dict(permission) for permission in stored_file.permissions
+                ],
+            }
+        return self._json(
+            select_fields(
+                result,
+                _fields(query, f"kind, permissions({DEFAULT_PERMISSION_FIELDS})"),
+            )
+        )
+
+    def _create_permission(
+        self, query, headers, body, file_id, fault=None
+    ) -> FakeResponse:
+        stored_file = self._file(file_id)
+        permission = json.loads(body or b"{}")
+        if permission.get("type") not in ("user", "group", "domain", "anyone"):
+            raise DriveError(400, "invalid", "Invalid permission type")
+        if permission.get("type") in ("user", "group") and not permission.get(
+            "emailAddress"
+        ):
+            raise DriveError(400, "required", "Permission emailAddress is required")
+        permission_id = (
+            "anyoneWithLink"
+            if permission["type"] == "anyone"
+            else permission.get("emailAddress") or permission.get("domain")
+        )
+        with self._lock:
+            # Sharing again with someone updates their role
+            stored_file.permissions = [
+                existing
+                for existing in stored_file.permissions
+                if existing["id"] != permission_id
+            ]
+            permission = {"kind": "drive#permission", "id": permission_id, **permission}
+            stored_file.permissions.append(permission)
+        return self._json(
+            select_fields(permission, _fields(query, DEFAULT_PERMISSION_FIELDS))
+        )
+
+    def _update_permission(
+        self, query, headers, body, file_id, permission_id, fault=None
+    ) -> FakeResponse:
+        permission = self._permission(file_id, permission_id)
+        with self._lock:
+            permission.update(
+                {
+                    key: value
+                    for key, value in json.loads(body or b"{}").items()
+                    if key == "role"
+                }
+            )
+        return self._json(
+            select_fields(permission, _fields(query, DEFAULT_PERMISSION_FIELDS))
+        )
+
+    def _delete_permission(
+        self, query, headers, body, file_id, permission_id, fault=None
+    ) -> FakeResponse:
+        permission = self._permission(file_id, permission_id)
+        if permission["role"] == "owner":
+            raise DriveError(403, "cannotRemoveOwner", "The owner can not be removed")
+        with self._lock:
+            self._file(file_id).permissions.remove(permission)
+        return FakeResponse(204, {}, b"")
+
+    def _upload(self, query, headers, body, fault=None) -> FakeResponse:
+        upload_type = query.get("uploadType")
+        if upload_type == "resumable":
+            stored_file = self._new_file(json.loads(body or b"{}"))
+            total_size = headers.get("x-upload-content-length")
+            session_id = uuid.uuid4().hex
+            with self._lock:
+                self._sessions[session_id] = UploadSession(
+                    stored_file,
+                    int(total_size) if total_size else None,
+                    _fields(query, DEFAULT_FILE_FIELDS),
+                )
+            location = (
+                f"http://{headers.get('host')}/upload/drive/v3/files"
+                f"?uploadType=resumable&upload_id={session_id}"
+            )
+            return FakeResponse(200, {"Location": location}, b"")
+        if upload_type == "multipart":
+            parts = parse_multipart(headers.get("content-type", ""), body)
+            if len(parts) != 2:
+                raise DriveError(400, "badContent", "Expected metadata and media parts")
+            stored_file = self._new_file(json.loads(parts[0][1] or b"{}"))
+            stored_file.append(parts[1][1])
+        elif upload_type == "media":
+            stored_file = self._new_file({})
+            stored_file.append(body)
+        else:
+            raise DriveError(400, "invalid", f"Invalid uploadType: {upload_type}")
+        stored_file.seal()
+        with self._lock:
+            self._store(stored_file)
+        return self._file_response(stored_file, query)
+
+    def _send_chunk(self, query, headers, body, fault=None) -> FakeResponse:
+        with self._lock:
+            session = self._sessions.get(query.get("upload_id"))
+        if session is None:
+            raise DriveError(404, "notFound", "Upload session not found")
+        if session.completed:
+            # Like Drive, a finished session answers with the created file
+            return self._json(
+                select_fields(dict(session.file.resource), session.fields)
+            )
+        match = re.fullmatch(
+            r"bytes (?:(\d+)-(\d+)|\*)/(\d+|\*)", headers.get("content-range", "")
+        )
+        if not match:
+            raise DriveError(400, "badRequest", "Invalid Content-Range")
+        if match.group(3) != "*":
+            total_size = int(match.group(3))
+            if session.total_size not in (None, total_size):
+                raise DriveError(400, "badRequest", "The size of the upload changed")
+            session.total_size = total_size
+
+        with self._lock:
+            stored_file = session.file
+            if match.group(1) is not None:
+                start, end = int(match.group(1)), int(match.group(2))
+                if start > stored_file.size or len(body) != end - start + 1:
+                    raise DriveError(400, "badRequest", "Invalid Content-Range")
+                is_last = (
+                    session.total_size is not None and end + 1 == session.total_size
+                )
+                if not is_last and len(body) % UPLOAD_CHUNK_GRANULARITY:
+                    raise DriveError(
+                        400,
+                        "badRequest",
+                        "Chunks must be multiples of 256 KB, except the last one",
+                    )
+                data = body[stored_file.size - start :]
+                if fault is not None:
+                    # The connection broke while the chunk was being received
+                    kept = (
+                        len(data)
+                        // 2
+                        // UPLOAD_CHUNK_GRANULARITY
+                        * UPLOAD_CHUNK_GRANULARITY
+                    )
+                    stored_file.append(data[:kept])
+                    raise fault
+                stored_file.append(data)
+            elif fault is not None:
+                raise fault
+
+            if session.total_size is None or stored_file.size < session.total_size:
+                return FakeResponse(
+                    308,
+                    (
+                        {"Range": f"bytes=0-{stored_file.size - 1}"}
+                        if stored_file.size
+                        else {}
+                    ),
+                    b"",
+                )
+            stored_file.seal()
+            self._store(stored_file)
+            session.completed = True
+        return self._json(select_fields(dict(stored_file.resource), session.fields))
+
+    def _new_file(self, metadata: dict) -> StoredFile:
+        file_id = uuid.uuid4().hex
+        now = now_rfc3339()
+        parents = [parent for parent in metadata.get("parents") or [] if parent]
+        with self._lock:
+            for parent in parents:
+                if parent != "root" and parent not in self.files:
+                    raise DriveError(404, "notFound", f"File not found: {parent}.")
+        resource = {
+            "kind": "drive#file",
+            "id": file_id,
+            "name": metadata.get("name", "Untitled"),
+            "mimeType": metadata.get("mimeType", "application/octet-stream"),
+            "parents": parents or ["root"],
+            "trashed": False,
+            "createdTime": now,
+            "modifiedTime": metadata.get("modifiedTime", now),
+            "webViewLink": f"https://drive.fake/file/d/{file_id}/view",
+            "webContentLink": f"https://drive.fake/uc?id={file_id}&export=download",
+        }
+        stored_file = StoredFile(resource, self.keep_content)
+        stored_file.permissions.append(
+            {
+                "kind": "drive#permission",
+                "id": "owner",
+                "type": "user",
+                "role": "owner",
+                "emailAddress": self.user_email,
+            }
+        )
+        return stored_file
+
+    def _store(self, stored_file: StoredFile) -> None:
+        # The lock must be held
+        self.files[stored_file.resource["id"]] = stored_file
+        self._changes.append(stored_file.resource["id"])
+
+    def _file(self, file_id: str) -> StoredFile:
+        with self._lock:
+            stored_file = self.files.get(file_id)
+        if stored_file is None:
+            raise DriveError(404, "notFound", f"File not found: {file_id}.")
+        return stored_file
+
+    def _permission(self, file_id: str, permission_id: str) -> dict:
+        for permission in self._file(file_id).permissions:
+            if permission["id"] == permission_id:
+                return permission
+        raise DriveError(404, "notFound", f"Permission not found: {permission_id}.")
+
+    def _file_response(self, stored_file: StoredFile, query: dict) -> FakeResponse:
+        with self._lock:
+            resource = dict(stored_file.resource)
+        return self._json(select_fields(resource, _fields(query, DEFAULT_FILE_FIELDS)))
+
+    @staticmethod
+    def _json(content: dict) -> FakeResponse:
+        return FakeResponse(
+            200,
+            {"Content-Type": "application/json; charset=UTF-8"},
+            json.dumps(content).encode(),
+        )
+
+
+def _fields(query: dict, default: str) -> dict:
+    return parse_fields(query.get("fields") or default)
+
+
+def _reason(status: int) -> str:
+    return BaseHTTPRequestHandler.responses.get(status, ("Unknown",))[0]
+
+
+class FakeDriveRequestHandler(BaseHTTPRequestHandler):
+    # Keeps connections alive, as the client library does
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self) -> None:
+        server: FakeDriveServer = self.server
+        headers = {key.lower(): value for key, value in self.headers.items()}
+        body = server.receive(self.rfile, int(headers.get("content-length") or 0))
+        if server.latency:
+            time.sleep(server.latency)
+        if urlsplit(self.path).path.strip("/") == "batch/drive/v3":
+            response = server.drive.handle_batch(headers, body)
+        else:
+            response = server.drive.handle(self.command, self.path, headers, body)
+        self.send_response(response.status)
+        for key, value in response.headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(response.body)))
+        self.end_headers()
+        server.send(self.wfile, response.body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _handle
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+class FakeDriveServer(ThreadingHTTPServer):
+    """
+    HTTP server of a FakeDrive, with the latency and the bandwidth of a network.
+
+    The service sends its requests there when GOOGLE_DRIVE_API_ROOT_URL is set to
+    root_url. Upload and download bandwidths are shared by all the connections.
+
+    Parameters
+    ----------
+    drive : FakeDrive
+        The stand-in answering the requests.
+    host : str, optional
+        Default is 127.0.0.1.
+    port : int, optional
+        Default is 0, any free port.
+    latency : float, optional
+        Added to every request, in seconds. Default is 0.
+    upload_bandwidth : float, optional
+        Bytes per second received from the clients. Default is unlimited.
+    download_bandwidth : float, optional
+        Bytes per second sent to the clients. Default is unlimited.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        drive: FakeDrive,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        upload_bandwidth: Optional[float] = None,
+        download_bandwidth: Optional[float] = None,
+    ):
+        super().__init__((host, port), FakeDriveRequestHandler)
+        self.drive = drive
+        self.latency = latency
+        # A tenth of a second of burst, so transfers are smooth
+        self._upload_bucket = TokenBucket(
+            upload_bandwidth, upload_bandwidth / 10 if upload_bandwidth else None
+        )
+        self._download_bucket = TokenBucket(
+            download_bandwidth, download_bandwidth / 10 if download_bandwidth else None
+        )
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def root_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def receive(self, stream, length: int) -> bytes:
+        pieces = []
+        while length > 0:
+            piece = stream.read(min(length, TRANSFER_PIECE_SIZE))
+            if not piece:
+                break
+            self._upload_bucket.acquire(len(piece))
+            pieces.append(piece)
+            length -= len(piece)
+        body = b"".join(pieces)
+        self.bytes_received += len(body)
+        return body
+
+    def send(self, stream, body: bytes) -> None:
+        for start in range(0, len(body), TRANSFER_PIECE_SIZE):
+            piece = body[start : start + TRANSFER_PIECE_SIZE]
+            self._download_bucket.acquire(len(piece))
+            stream.write(piece)
+        self.bytes_sent += len(body)
+
+    def start(self) -> "FakeDriveServer":
+        """
+        Serve in a background thread.
+        """
+        self._thread = threading.Thread(
+            target=self.serve_forever, name="fake-drive", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "FakeDriveServer":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="Serve a local stand-in of the Google Drive v3 API."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="Seconds added to every request"
+    )
+    parser.add_argument("--upload-mbps", type=float, help="Upload bandwidth, in MB/s")
+    parser.add_argument(
+        "--download-mbps", type=float, help="Download bandwidth, in MB/s"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="Probability of a request to fail"
+    )
+    parser.add_argument(
+        "--fault-statuses",
+        default="429,500,503",
+        help="Statuses of the failed requests, comma separated",
+    )
+    parser.add_argument(
+        "--retry-after", type=float, help="Retry-After of 429 responses"
+    )
+    parser.add_argument(
+        "--discard-content",
+        action="store_true",
+        help="Only keep the size and checksums of the files",
+    )
+    parser.add_argument("--seed", type=int)
+    arguments = parser.parse_args(argv)
+
+    drive = FakeDrive(
+        keep_content=not arguments.discard_content,
+        error_rate=arguments.error_rate,
+        fault_statuses=[int(status) for status in arguments.fault_statuses.split(",")],
+        retry_after=arguments.retry_after,
+        seed=arguments.seed,
+    )
+    server = FakeDriveServer(
+        drive,
+        arguments.host,
+        arguments.port,
+        latency=arguments.latency,
+        upload_bandwidth=arguments.upload_mbps and arguments.upload_mbps * 1024**2,
+        download_bandwidth=arguments.download_mbps
+        and arguments.download_mbps * 1024**2,
+    )
+    print(f"Serving a fake Google Drive API at {server.root_url}")
+    print(f"Run the backup with GOOGLE_DRIVE_API_ROOT_URL={server.root_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print(json.dumps(drive.stats(), indent=2))
+    print(f"Received {server.bytes_received} bytes, sent {server.bytes_sent} bytes")
+
+
+if __name__ == "__main__":
+    main()
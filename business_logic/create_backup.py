@@ -1,80 +1,749 @@
+import hashlib
+import json
 import os
-import re
-import shutil
 import tempfile
-import zipfile
+import time
+import zlib
 
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import BinaryIO, Callable, Iterator, Optional
+
+from business_logic.file_index import FileIndex
+from business_logic.scan_planner import plan_scans
 from models.files_to_backup import FilesToBackup
+from utils.checksum import Checksums, HashingWriter, write_checksums
+from utils.compression import (
+    StoreCodec,
+    get_codec,
+    is_auto,
+    is_worth_compressing,
+    resolve_compression,
+)
+from utils.encryption import Encryption, EncryptingWriter
+from utils.logger import get_logger
+from utils.metrics import get_run_metrics
+from utils.priority import lower_priority
+from utils.ring_buffer import RingBuffer
+from utils.throttle import Throttle, read_latency
+from utils.volume_writer import VolumeWriter
+from utils.zip import ZipEntry, ZipStreamWriter
+
+# Large files are split in blocks compressed independently, so they can be spread over workers
+BLOCK_SIZE = 16 * 1024 * 1024
+# Each deflate block is primed with the tail of the previous one to keep the compression ratio
+DICTIONARY_SIZE = 32 * 1024
+# Describes the backup (full or incremental) and the files deleted since the previous one
+MANIFEST_NAME = "MANIFEST.json"
+# Compressed data of a file written several times is kept in memory up to this size
+SPOOL_MEMORY_SIZE = 64 * 1024 * 1024
+
+
+class BlockTask:
+    """
+    A block of a source file to compress, in archive order.
+    """
+
+    def __init__(self, member: "ArchiveMember", offset: int, length: int, last: bool):
+        self.member = member
+        self.offset = offset
+        self.length = length
+        self.last = last
+
+
+class CompressedBlock:
+    """
+    The result of compress_block.
+    """
+
+    def __init__(
+        self,
+        data: bytes,
+        crc: int,
+        size: int,
+        method: int,
+        digest: bytes,
+        read_time: float = 0.0,
+    ):
+        self.data = data
+        self.crc = crc
+        self.size = size
+        self.method = method
+        # SHA-256 of the uncompressed block, the content hash of a file hashes these digests
+        self.digest = digest
+        # Seconds spent reading the block, the disk latency the throttling adapts to
+        self.read_time = read_time
+
+
+class ArchiveMember:
+    """
+    A source file, the name it will have inside the archive and how to compress it.
+    """
+
+    def __init__(
+        self, src_path: str, arcname: str, stat: os.stat_result, compression: str
+    ):
+        self.src_path = src_path
+        self.arcname = arcname
+        self.stat = stat
+        self.compression = compression
+        # Other members of the same file and compression, written from its blocks
+        self.copies: list[ArchiveMember] = []
+        self._block_digests = hashlib.sha256()
+
+    def add_block_digest(self, digest: bytes) -> None:
+        self._block_digests.update(digest)
 
+    def content_hash(self) -> str:
+        """
+        The hash of the content of the file, computed from its blocks digests
+        so that it does not depend on which process compressed which block.
+        """
+        return self._block_digests.hexdigest()
 
-def create_backup(path_to_backup: FilesToBackup):
+    def blocks(self) -> Iterator[BlockTask]:
+        """
+        Split the file in blocks of BLOCK_SIZE, an empty file still yields one block.
+        """
+        size = self.stat.st_size
+        offset = 0
+        while True:
+            length = min(BLOCK_SIZE, size - offset)
+            last = offset + length >= size
+            yield BlockTask(self, offset, length, last)
+            if last:
+                return
+            offset += length
+
+
+def compress_block(
+    src_path: str, offset: int, length: int, last: bool, compression: str
+) -> CompressedBlock:
+    """
+    Read and compress one block of a file.
+
+    Compressed blocks of a file can simply be concatenated, see Codec. An "auto"
+    compression is only left unresolved for single block files: the block is stored
+    when compressing it does not save enough. This function runs in worker processes
+    and must stay picklable.
+
+    Returns
+    -------
+    CompressedBlock
+        The compressed data with the CRC-32, size and digest of the uncompressed data.
+    """
+    codec = get_codec(compression)
+    start_time = time.monotonic()
+    with open(src_path, "rb") as src:
+        dictionary = b""
+        if codec.uses_dictionary:
+            dictionary_start = max(0, offset - DICTIONARY_SIZE)
+            src.seek(dictionary_start)
+            dictionary = src.read(offset - dictionary_start)
+        else:
+            src.seek(offset)
+        data = src.read(length)
+    read_time = time.monotonic() - start_time
+
+    compressed = codec.compress_block(data, dictionary, last)
+    if is_auto(compression) and not is_worth_compressing(data, len(compressed)):
+        compressed, codec = data, get_codec(StoreCodec.name)
+    return CompressedBlock(
+        compressed,
+        zlib.crc32(data),
+        len(data),
+        codec.method,
+        hashlib.sha256(data).digest(),
+        read_time,
+    )
+
+
+class BlockSpool:
     """
-    Creates a backup of files in the specified directory that match a given regex pattern.
+    The compressed blocks of a member, kept to write its copies without reading and
+    compressing the file again. Spilled to a temporary file past SPOOL_MEMORY_SIZE.
+    """
+
+    def __init__(self):
+        self._file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_SIZE)
+        self._blocks: list[tuple[int, int, int]] = []
+
+    def add(self, block: CompressedBlock) -> None:
+        self._file.write(block.data)
+        self._blocks.append((len(block.data), block.crc, block.size))
+
+    def replay(self) -> Iterator[tuple[bytes, int, int]]:
+        """
+        Yields the data, CRC-32 and uncompressed size of each block, in order.
+        """
+        self._file.seek(0)
+        for length, crc, size in self._blocks:
+            yield self._file.read(length), crc, size
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def iter_file_members(
+    paths_to_backup: list[FilesToBackup],
+) -> Iterator[list[ArchiveMember]]:
+    """
+    Yields the files selected by the paths to backup as they are found, each one with
+    a member for every path to backup selecting it.
+
+    Paths to backup sharing a folder are scanned together, so a folder is scanned once
+    however many paths to backup filter it. Subdirectories are scanned when a path is
+    recursive.
 
     Parameters
     ----------
-    path_to_backup : FilesToBackup
-        An object containing the path of the folder to backup, the regex to filter files,
-        the name for the output zip file, and optionally, the Google Drive destination path.
+    paths_to_backup : list[FilesToBackup]
+        The paths to backup.
 
     Raises
     ------
     TypeError
-        If path_to_backup is not a FilesToBackup object.
+        If a path to backup is not a FilesToBackup object.
     FileNotFoundError
-        If the specified folder path does not exist.
+        If a folder to backup does not exist.
 
     Returns
     -------
-    str
-        The path of the created zip archive.
+    Iterator[list[ArchiveMember]]
+        The members of each file, named under a directory named after the zip name of
+        their path to backup, followed by their path relative to the folder.
+    """
+    logger = get_logger("backup2gdrive")
+    for group in plan_scans(paths_to_backup):
+        zip_names = ", ".join(
+            f"'{path_to_backup.zip_name}/'" for path_to_backup in group.paths_to_backup
+        )
+        logger.info(f"Archiving files from {group.folder_path} into {zip_names}")
+        for file, routes in get_run_metrics().timed_iter("scan", group.scan()):
+            compressions = {}
+            members = []
+            for path_to_backup in routes:
+                if path_to_backup.compression not in compressions:
+                    compressions[path_to_backup.compression] = resolve_compression(
+                        path_to_backup.compression, file.path, file.stat.st_size
+                    )
+                members.append(
+                    ArchiveMember(
+                        file.path,
+                        f"{path_to_backup.zip_name}/{file.relative_path}",
+                        file.stat,
+                        compressions[path_to_backup.compression],
+                    )
+                )
+            yield members
+
+
+def share_compressed_data(members: list[ArchiveMember]) -> list[ArchiveMember]:
+    """
+    Makes the members of a file with the same compression copies of the first one,
+    so the file is read and compressed once for all of them.
+
+    Returns
+    -------
+    list[ArchiveMember]
+        The members to compress, the others being their copies.
     """
-    if not isinstance(path_to_backup, FilesToBackup):
-        raise TypeError("path_to_backup must be a FilesToBackup object")
-
-    if not os.path.exists(path_to_backup.folder_path):
-        raise FileNotFoundError(f"Folder {path_to_backup.folder_path} does not exist")
-
-    # Group all files that match the regex in a temp folder
-    temp_folder = tempfile.TemporaryDirectory()
-    files = [
-        f
-        for f in os.listdir(path_to_backup.folder_path)
-        if re.match(path_to_backup.filter_file, f)
-    ]
-    for file in files:
-        shutil.copy2(os.path.join(path_to_backup.folder_path, file), temp_folder.name)
-
-    # Then zip the temp folder
-    fullpath_output_zip = os.path.join(
-        path_to_backup.folder_path, path_to_backup.zip_name
+    compressed = {}
+    for member in members:
+        if member.compression in compressed:
+            compressed[member.compression].copies.append(member)
+        else:
+            compressed[member.compression] = member
+    return list(compressed.values())
+
+
+def _compressed_blocks(
+    tasks: Iterator[BlockTask],
+    executor: Optional[Executor],
+    window: int,
+    throttle: Optional[Throttle] = None,
+) -> Iterator[tuple[BlockTask, CompressedBlock]]:
+    """
+    Compress blocks, in a pool if one is given, and yield them back in submission order.
+    At most `window` blocks are in flight, which bounds the memory used by the pipeline.
+    A block is only read once the throttle allows it, and its read time is recorded
+    as the disk latency of the throttle.
+    """
+
+    def completed(
+        task: BlockTask, block: CompressedBlock
+    ) -> tuple[BlockTask, CompressedBlock]:
+        if throttle is not None:
+            throttle.record_latency(read_latency(block.read_time, block.size))
+        return task, block
+
+    if executor is None:
+        for task in tasks:
+            if throttle is not None:
+                throttle.acquire(task.length)
+            yield completed(
+                task,
+                compress_block(
+                    task.member.src_path,
+                    task.offset,
+                    task.length,
+                    task.last,
+                    task.member.compression,
+                ),
+            )
+        return
+
+    pending = deque()
+    for task in tasks:
+        if throttle is not None:
+            throttle.acquire(task.length)
+        pending.append(
+            (
+                task,
+                executor.submit(
+                    compress_block,
+                    task.member.src_path,
+                    task.offset,
+                    task.length,
+                    task.last,
+                    task.member.compression,
+                ),
+            )
+        )
+        if len(pending) >= window:
+            done_task, future = pending.popleft()
+            yield completed(done_task, future.result())
+    while pending:
+        done_task, future = pending.popleft()
+        yield completed(done_task, future.result())
+
+
+def create_backup(
+    paths_to_backup: list[FilesToBackup],
+    archive: ZipStreamWriter,
+    executor: Optional[Executor] = None,
+    window: int = 1,
+    index: Optional[FileIndex] = None,
+    throttle: Optional[Throttle] = None,
+) -> int:
+    """
+    Streams the files of every path to backup into an archive. Each path is grouped
+    under a directory named after its zip name.
+
+    Each matching file is read once and compressed straight into the archive, without
+    any intermediate copy. When an executor is given, blocks are compressed concurrently
+    and written in a deterministic order: paths, then files, then blocks.
+
+    Parameters
+    ----------
+    paths_to_backup : list[FilesToBackup]
+        The paths to backup.
+    archive : ZipStreamWriter
+        The archive to write the files into.
+    executor : Executor, optional
+        The pool compressing the blocks, blocks are compressed inline when None.
+    window : int, optional
+        The maximum number of blocks compressed ahead of the writer. Default is 1.
+    index : FileIndex, optional
+        The state of the previous backups. When given, archived files are recorded in
+        it and, for incremental runs, unchanged files are skipped.
+    throttle : Throttle, optional
+        The throttle of the files read, e.g. not to slow down a database on the
+        same disk. Reads are not limited when None.
+
+    Returns
+    -------
+    int
+        The number of archived files.
+    """
+
+    def tasks() -> Iterator[BlockTask]:
+        for members in iter_file_members(paths_to_backup):
+            if index is not None:
+                members = [
+                    member
+                    for member in members
+                    if index.should_archive(member.arcname, member.stat)
+                ]
+            for member in share_compressed_data(members):
+                yield from member.blocks()
+
+    archived_count = 0
+    entry: Optional[ZipEntry] = None
+    spool: Optional[BlockSpool] = None
+    try:
+        for task, block in _compressed_blocks(tasks(), executor, window, throttle):
+            member = task.member
+            if task.offset == 0:
+                entry = archive.open_entry(
+                    member.arcname,
+                    block.method,
+                    member.stat.st_mtime,
+                    member.stat.st_mode,
+                    member.stat.st_size,
+                )
+                if member.copies:
+                    spool = BlockSpool()
+            archive.write_block(entry, block.data, block.crc, block.size)
+            member.add_block_digest(block.digest)
+            if spool is not None:
+                spool.add(block)
+            if not task.last:
+                continue
+
+            archive.close_entry(entry)
+            for written in [member, *member.copies]:
+                if written is not member:
+                    entry = archive.open_entry(
+                        written.arcname,
+                        entry.method,
+                        written.stat.st_mtime,
+                        written.stat.st_mode,
+                        written.stat.st_size,
+                    )
+                    for data, crc, size in spool.replay():
+                        archive.write_block(entry, data, crc, size)
+                    archive.close_entry(entry)
+                if index is not None:
+                    index.record(written.arcname, written.stat, member.content_hash())
+                get_run_metrics().add("archive", bytes_in=entry.file_size, files=1)
+                archived_count += 1
+            if spool is not None:
+                spool.close()
+                spool = None
+    finally:
+        if spool is not None:
+            spool.close()
+
+    return archived_count
+
+
+def write_manifest(archive: ZipStreamWriter, index: FileIndex) -> None:
+    """
+    Write the manifest of an indexed backup: whether it is a full or an incremental
+    backup and, for the latter, the files deleted since the previous backup. Restoring
+    means extracting the last full backup, then every incremental one in order while
+    removing their deleted files.
+    """
+    manifest = {
+        "type": "full" if index.full else "incremental",
+        "deleted": [] if index.full else index.deleted_paths(),
+    }
+    archive.write_bytes(
+        MANIFEST_NAME, json.dumps(manifest, indent=2).encode("utf-8"), time.time()
     )
 
-    archived = shutil.make_archive(fullpath_output_zip, "zip", temp_folder.name)
-    temp_folder.cleanup()
 
-    return archived
+def write_backup(
+    paths_to_backup: list[FilesToBackup],
+    output: BinaryIO,
+    workers: int = 1,
+    index: Optional[FileIndex] = None,
+    executor: Optional[Executor] = None,
+    throttle: Optional[Throttle] = None,
+    low_priority: bool = False,
+    encryption: Optional[Encryption] = None,
+) -> int:
+    """
+    Writes the backup archive of all the paths to backup in a single pass to a
+    writable file object. The output is written sequentially and never seeked.
+
+    Parameters
+    ----------
+    paths_to_backup : list[FilesToBackup]
+        The paths to backup, each one grouped under its zip name inside the archive.
+
+    output : BinaryIO
+        The file object receiving the archive.
+
+    workers : int, optional
+        The number of processes compressing in parallel, 1 compresses inline. Default is 1.
 
+    index : FileIndex, optional
+        The state of the previous backups, see create_backup. A manifest is added to
+        the archive when given.
 
-def regroup_backups(list_of_backups: list[str], destination_path: str) -> None:
+    executor : Executor, optional
+        A pool compressing the blocks shared with other backups, instead of a pool
+        of workers processes. workers still bounds the blocks compressed ahead.
+
+    throttle : Throttle, optional
+        The throttle of the files read, see create_backup.
+
+    low_priority : bool, optional
+        Whether the files are read and compressed by processes with a low CPU and
+        I/O priority, even with a single worker, unless an executor is given.
+        Default is False.
+
+    encryption : Encryption, optional
+        The key encrypting the archive with AES-256-GCM, see utils.encryption,
+        and the number of threads encrypting its chunks. Not encrypted when None.
+
+    Returns
+    -------
+    int
+        The number of archived files.
     """
-    Regroups a list of backup zip files into a single zip file.
+    owns_executor = executor is None and (workers > 1 or low_priority)
+    if owns_executor:
+        executor = ProcessPoolExecutor(
+            max_workers=workers, initializer=lower_priority if low_priority else None
+        )
+    encrypting_output = (
+        EncryptingWriter(output, encryption.key, encryption.workers)
+        if encryption is not None
+        else None
+    )
+    try:
+        with get_run_metrics().span("archive") as span:
+            with ZipStreamWriter(encrypting_output or output) as archive:
+                archived_count = create_backup(
+                    paths_to_backup,
+                    archive,
+                    executor,
+                    window=2 * workers,
+                    index=index,
+                    throttle=throttle,
+                )
+                if index is not None:
+                    write_manifest(archive, index)
+            if encrypting_output is not None:
+                encrypting_output.close()
+            span.add(bytes_out=archive.bytes_written)
+    finally:
+        if owns_executor:
+            executor.shutdown(cancel_futures=True)
+        if encrypting_output is not None:
+            encrypting_output.abort()
+    return archived_count
+
+
+def build_backup(
+    paths_to_backup: list[FilesToBackup],
+    destination_path: str,
+    workers: int = 1,
+    index: Optional[FileIndex] = None,
+    executor: Optional[Executor] = None,
+    throttle: Optional[Throttle] = None,
+    low_priority: bool = False,
+    encryption: Optional[Encryption] = None,
+) -> str:
+    """
+    Builds the backup archive of all the paths to backup in a single pass.
+
+    The archive is written next to its destination with a ".part" suffix and only
+    renamed once complete, so an interrupted run never leaves a truncated backup behind.
+    Its checksums, computed while it is written, are saved next to it in a sidecar
+    file, see utils.checksum.
 
     Parameters
     ----------
-    list_of_backups : list[str]
-        A list of paths to backup zip files.
+    paths_to_backup : list[FilesToBackup]
+        The paths to backup, each one grouped under its zip name inside the archive.
 
     destination_path : str
         The path to the destination zip file.
 
+    workers : int, optional
+        The number of processes compressing in parallel, 1 compresses inline. Default is 1.
+
+    index : FileIndex, optional
+        The state of the previous backups, see create_backup. A manifest is added to
+        the archive when given.
+
+    executor : Executor, optional
+        A pool compressing the blocks shared with other backups, instead of a pool
+        of workers processes. workers still bounds the blocks compressed ahead.
+
+    throttle : Throttle, optional
+        The throttle of the files read, see create_backup.
+
+    low_priority : bool, optional
+        Whether the files are read and compressed by processes with a low CPU and
+        I/O priority, even with a single worker, unless an executor is given.
+        Default is False.
+
+    encryption : Encryption, optional
+        The key encrypting the archive, see write_backup.
+
+    Returns
+    -------
+    str
+        The path of the created zip archive.
+    """
+    logger = get_logger("backup2gdrive")
+    partial_path = f"{destination_path}.part"
+    try:
+        with open(partial_path, "wb") as output:
+            hashing_output = HashingWriter(output)
+            archived_count = write_backup(
+                paths_to_backup,
+                hashing_output,
+                workers,
+                index,
+                executor,
+                throttle,
+                low_priority,
+                encryption,
+            )
+        write_checksums(destination_path, hashing_output.checksums())
+        os.replace(partial_path, destination_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    logger.info(f"Archived {archived_count} files into {destination_path}")
+    return destination_path
+
+
+def build_split_backup(
+    paths_to_backup: list[FilesToBackup],
+    destination_path: str,
+    volume_size: int,
+    on_volume_complete: Callable[[str, int, Checksums], None],
+    workers: int = 1,
+    index: Optional[FileIndex] = None,
+    executor: Optional[Executor] = None,
+    throttle: Optional[Throttle] = None,
+    low_priority: bool = False,
+    encryption: Optional[Encryption] = None,
+) -> int:
+    """
+    Builds the backup archive of all the paths to backup in a single pass, split in
+    volumes of volume_size bytes named destination_path.001, destination_path.002...
+
+    Each volume is handed to on_volume_complete as soon as it is complete, while the
+    next ones are being written. Concatenating the volumes gives back the archive.
+
+    Parameters
+    ----------
+    paths_to_backup : list[FilesToBackup]
+        The paths to backup, each one grouped under its zip name inside the archive.
+
+    destination_path : str
+        The path of the archive, volumes are suffixed with their number.
+
+    volume_size : int
+        The size of each volume in bytes, the last one can be smaller.
+
+    on_volume_complete : Callable[[str, int, Checksums], None]
+        Called with the path, the number and the checksums of each complete volume.
+
+    workers : int, optional
+        The number of processes compressing in parallel, 1 compresses inline. Default is 1.
+
+    index : FileIndex, optional
+        The state of the previous backups, see create_backup.
+
+    executor : Executor, optional
+        A pool compressing the blocks shared with other backups, instead of a pool
+        of workers processes. workers still bounds the blocks compressed ahead.
+
+    throttle : Throttle, optional
+        The throttle of the files read, see create_backup.
+
+    low_priority : bool, optional
+        Whether the files are read and compressed by processes with a low CPU and
+        I/O priority, even with a single worker, unless an executor is given.
+        Default is False.
+
+    encryption : Encryption, optional
+        The key encrypting the archive, see write_backup.
+
+    Returns
+    -------
+    int
+        The number of volumes.
+    """
+    logger = get_logger("backup2gdrive")
+    with VolumeWriter(destination_path, volume_size, on_volume_complete) as output:
+        archived_count = write_backup(
+            paths_to_backup,
+            output,
+            workers,
+            index,
+            executor,
+            throttle,
+            low_priority,
+            encryption,
+        )
+
+    logger.info(
+        f"Archived {archived_count} files into {output.volume_count} volumes "
+        f"of {destination_path}"
+    )
+    return output.volume_count
+
+
+def stream_backup(
+    paths_to_backup: list[FilesToBackup],
+    output: RingBuffer,
+    workers: int = 1,
+    index: Optional[FileIndex] = None,
+    executor: Optional[Executor] = None,
+    throttle: Optional[Throttle] = None,
+    low_priority: bool = False,
+    encryption: Optional[Encryption] = None,
+) -> Checksums:
+    """
+    Writes the backup archive of all the paths to backup into a ring buffer, drained
+    at the same time by another thread, e.g. uploading it. Nothing is written to disk.
+
+    The buffer is closed once the archive is complete. If archiving fails, the buffer
+    is aborted so the reading side never takes a truncated archive for a complete one.
+
+    Parameters
+    ----------
+    paths_to_backup : list[FilesToBackup]
+        The paths to backup, each one grouped under its zip name inside the archive.
+
+    output : RingBuffer
+        The buffer receiving the archive.
+
+    workers : int, optional
+        The number of processes compressing in parallel, 1 compresses inline. Default is 1.
+
+    index : FileIndex, optional
+        The state of the previous backups, see create_backup.
+
+    executor : Executor, optional
+        A pool compressing the blocks shared with other backups, instead of a pool
+        of workers processes. workers still bounds the blocks compressed ahead.
+
+    throttle : Throttle, optional
+        The throttle of the files read, see create_backup.
+
+    low_priority : bool, optional
+        Whether the files are read and compressed by processes with a low CPU and
+        I/O priority, even with a single worker, unless an executor is given.
+        Default is False.
+
+    encryption : Encryption, optional
+        The key encrypting the archive, see write_backup.
+
     Returns
     -------
-    None
+    Checksums
+        The checksums of the archive, computed while it was written.
     """
-    with zipfile.ZipFile(destination_path, "w") as zip_file:
-        for backup in list_of_backups:
-            zip_file.write(backup, os.path.basename(backup))
+    logger = get_logger("backup2gdrive")
+    hashing_output = HashingWriter(output)
+    try:
+        archived_count = write_backup(
+            paths_to_backup,
+            hashing_output,
+            workers,
+            index,
+            executor,
+            throttle,
+            low_priority,
+            encryption,
+        )
+    except BaseException as error:
+        output.abort(error)
+        raise
+    output.close()
 
-    for backup in list_of_backups:
-        os.remove(backup)
+    logger.info(f"Archived {archived_count} files")
+    return hashing_output.checksums()
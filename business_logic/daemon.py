@@ -0,0 +1,211 @@
+import json
+import os
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from models.config import Config
+from typing import Callable, Dict, List
+from utils.cron import CronSchedule
+from utils.logger import get_logger
+
+# Longest wait of the scheduling loop, so changes of the system clock are noticed
+MAX_SLEEP_SECONDS = 60
+# A run starting later than this after its scheduled time is a missed run
+MISSED_RUN_DELAY = timedelta(minutes=1)
+
+
+class ScheduledProject:
+    """
+    Scheduling state of a project: its next run, and whether a run is queued,
+    running, or due again once the running one is over.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        self.schedule = CronSchedule(config.schedule)
+        self.next_run = self.schedule.next_after(datetime.now())
+        self.queued = False
+        self.running = False
+        self.pending = False
+
+
+class BackupDaemon:
+    """
+    Runs the backups of the projects on their cron schedules, in a long running
+    process which keeps its Google Drive session between runs.
+
+    Runs of different projects go on at the same time, up to max_concurrent_runs,
+    and are queued in the order they are due. A project has at most one run queued
+    and one running: a run due while the previous one is still queued is merged
+    with it, and a run due while the previous one is running is queued once it is
+    over with the `once` catch up policy, skipped with `skip`.
+    Runs missed while the daemon was stopped are caught up the same way on start,
+    from the times of the last runs saved in the state file.
+    """
+
+    def __init__(
+        self,
+        configs: List[Config],
+        run_project: Callable[[Config], None],
+        state_path: str,
+        max_concurrent_runs: int = 1,
+    ):
+        self.run_project = run_project
+        self.state_path = state_path
+        self.logger = get_logger("backup2gdrive")
+        self._projects: Dict[str, ScheduledProject] = {}
+        for config in configs:
+            if config.schedule is None:
+                self.logger.warning(
+                    f"Project {config.project_name} has no schedule, "
+                    "it is not backed up by the daemon"
+                )
+                continue
+            project = ScheduledProject(config)
+            first_run = project.next_run
+            second_run = project.schedule.next_after(first_run)
+            timestamp_format = config.backup_timestamp_format
+            if first_run.strftime(timestamp_format) == second_run.strftime(
+                timestamp_format
+            ):
+                self.logger.warning(
+                    f"Consecutive backups of {config.project_name} have the same name "
+                    "and the later ones are skipped, add the time to "
+                    "backupTimestampFormat, e.g. %Y%m%d_%H%M"
+                )
+            self._projects[config.project_name] = project
+        if not self._projects:
+            raise ValueError("No project has a schedule")
+        self._state = self._load_state()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._runner = ThreadPoolExecutor(
+            max_workers=max_concurrent_runs, thread_name_prefix="backup-run"
+        )
+
+    def run(self) -> None:
+        """
+        Run the backups as they are due, until stop is called. The running backups
+        are completed before returning, the queued ones are dropped.
+        """
+        self.logger.info(
+            "Daemon started: "
+            + ", ".join(
+                f"{name} next at {project.next_run:%Y-%m-%d %H:%M}"
+                for name, project in self._projects.items()
+            )
+        )
+        self._catch_up_missed_runs()
+        try:
+            while not self._stop.is_set():
+                now = datetime.now()
+                for project in self._projects.values():
+                    if project.next_run > now:
+                        continue
+                    if (
+                        now - project.next_run > MISSED_RUN_DELAY
+                        and project.config.catch_up == "skip"
+                    ):
+                        # E.g. the machine was asleep
+                        self.logger.info(
+                            f"Skipping the missed run of {project.config.project_name}"
+                        )
+                    else:
+                        self._trigger(project)
+                    project.next_run = project.schedule.next_after(now)
+                next_run = min(project.next_run for project in self._projects.values())
+                self._stop.wait(
+                    min(max((next_run - now).total_seconds(), 0), MAX_SLEEP_SECONDS)
+                )
+        finally:
+            self._stop.set()
+            self.logger.info("Daemon stopping, waiting for the running backups...")
+            self._runner.shutdown(wait=True, cancel_futures=True)
+            self.logger.info("Daemon stopped.")
+
+    def stop(self) -> None:
+        """
+        Ask the daemon to stop, e.g. from a signal handler.
+        """
+        self._stop.set()
+
+    def _catch_up_missed_runs(self) -> None:
+        now = datetime.now()
+        for name, project in self._projects.items():
+            last_run = self._state.get(name, {}).get("lastRun")
+            if last_run is None:
+                continue
+            missed_run = project.schedule.next_after(datetime.fromisoformat(last_run))
+            if missed_run > now:
+                continue
+            if project.config.catch_up == "once":
+                self.logger.info(
+                    f"Catching up the run of {name} missed at {missed_run}"
+                )
+                self._trigger(project)
+            else:
+                self.logger.info(f"Skipping the run of {name} missed at {missed_run}")
+
+    def _trigger(self, project: ScheduledProject) -> None:
+        name = project.config.project_name
+        with self._lock:
+            if project.queued:
+                self.logger.info(f"A backup of {name} is already queued")
+                return
+            if project.running:
+                if project.config.catch_up == "once":
+                    self.logger.info(
+                        f"A backup of {name} is running, another one follows it"
+                    )
+                    project.pending = True
+                else:
+                    self.logger.warning(
+                        f"A backup of {name} is still running, skipping this run"
+                    )
+                return
+            project.queued = True
+        self._runner.submit(self._run, project)
+
+    def _run(self, project: ScheduledProject) -> None:
+        name = project.config.project_name
+        with self._lock:
+            project.queued = False
+            project.running = True
+        started_at = datetime.now()
+        success = False
+        self.logger.info(f"Starting the backup of {name}...")
+        try:
+            self.run_project(project.config)
+            success = True
+            self.logger.info(f"Backup of {name} completed successfully.")
+        except Exception:
+            self.logger.exception(f"Backup of {name} failed")
+        finally:
+            with self._lock:
+                project.running = False
+                pending, project.pending = project.pending, False
+                state = self._state.setdefault(name, {})
+                state["lastRun"] = started_at.isoformat()
+                if success:
+                    state["lastSuccess"] = started_at.isoformat()
+                self._save_state()
+        if pending and not self._stop.is_set():
+            self._trigger(project)
+
+    def _load_state(self) -> Dict[str, dict]:
+        if not os.path.exists(self.state_path):
+            return {}
+        try:
+            with open(self.state_path, "r") as state_file:
+                return json.load(state_file)
+        except json.JSONDecodeError:
+            self.logger.warning(f"Ignoring the invalid state file {self.state_path}")
+            return {}
+
+    def _save_state(self) -> None:
+        # The lock must be held
+        temporary_path = f"{self.state_path}.tmp"
+        with open(temporary_path, "w") as state_file:
+            json.dump(self._state, state_file, indent=2)
+        os.replace(temporary_path, self.state_path)
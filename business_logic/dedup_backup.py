@@ -0,0 +1,396 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import zlib
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple, TYPE_CHECKING
+
+from business_logic.create_backup import iter_file_members
+from models.files_to_backup import FilesToBackup
+from utils.chunker import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, iter_chunks
+from utils.compression import is_worth_compressing
+from utils.human_readable_bytes import human_readable_bytes
+from utils.logger import get_logger
+from utils.metrics import bind_run_metrics, get_run_metrics, timed_phase
+from utils.throttle import Throttle, ThrottledReader
+
+if TYPE_CHECKING:
+    # The Google API client is only imported once Google Drive is needed
+    from business_logic.gdrive_service import GoogleDriveService
+
+# Name of the folder holding the chunks, inside the backups destination folder
+CHUNKS_FOLDER_NAME = "chunks"
+
+# First byte of a chunk object on Google Drive, telling how the chunk is encoded
+CHUNK_STORED = b"\x00"
+CHUNK_ZLIB = b"\x01"
+
+# Chunks smaller than MIN_CHUNK_SIZE, i.e. small files and the ends of files, are
+# grouped in packs of about this size, each one uploaded as a single file
+PACK_SIZE = MAX_CHUNK_SIZE
+# Prefix of the names of the packs, followed by the SHA-256 of their content
+PACK_PREFIX = "pack-"
+
+
+def encode_chunk(chunk: bytes) -> bytes:
+    """
+    Compress a chunk with zlib unless it does not save enough, and prefix it with
+    its encoding.
+    """
+    compressed = zlib.compress(chunk, 6)
+    if is_worth_compressing(chunk, len(compressed)):
+        return CHUNK_ZLIB + compressed
+    return CHUNK_STORED + chunk
+
+
+def decode_chunk(data: bytes) -> bytes:
+    """
+    Decode a chunk object downloaded from Google Drive.
+    """
+    encoding, payload = data[:1], data[1:]
+    if encoding == CHUNK_ZLIB:
+        return zlib.decompress(payload)
+    if encoding == CHUNK_STORED:
+        return payload
+    raise ValueError(f"Unknown chunk encoding {encoding!r}")
+
+
+class ChunkIndex:
+    """
+    Local index of the chunks already stored on Google Drive, keyed by their SHA-256.
+    It tells which chunks need to be uploaded without querying Google Drive, where
+    each chunk is stored, and when it was last referenced by a backup so unused
+    chunks can be removed.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._connection = sqlite3.connect(db_path)
+        # A chunk stored as its own file has no pack, and its offset is 0
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chunks (
+                id TEXT PRIMARY KEY,
+                drive_id TEXT NOT NULL,
+                pack TEXT,
+                pack_offset INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                last_used TEXT NOT NULL
+            )
+            """
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS chunks_drive_id ON chunks (drive_id)"
+        )
+        self._connection.commit()
+
+    def contains(self, chunk_id: str) -> bool:
+        return (
+            self._connection.execute(
+                "SELECT 1 FROM chunks WHERE id = ?", (chunk_id,)
+            ).fetchone()
+            is not None
+        )
+
+    def add(
+        self,
+        drive_id: str,
+        chunks: List[Tuple[str, int, int]],
+        pack: Optional[str] = None,
+    ) -> None:
+        """
+        Record chunks stored in a file of Google Drive: a single chunk, or the chunks
+        of the pack named `pack`, given as (id, offset in the file, size).
+        """
+        today = date.today().isoformat()
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (chunk_id, drive_id, pack, offset, size, today)
+                for chunk_id, offset, size in chunks
+            ],
+        )
+        # Committed right away: the chunks are on Google Drive whatever happens next
+        self._connection.commit()
+
+    def pack_locations(self, chunk_ids: List[str]) -> Dict[str, list]:
+        """
+        The [pack, offset, size] of the chunks stored in packs, by chunk id.
+        """
+        locations = {}
+        for chunk_id in set(chunk_ids):
+            row = self._connection.execute(
+                "SELECT pack, pack_offset, size FROM chunks"
+                " WHERE id = ? AND pack IS NOT NULL",
+                (chunk_id,),
+            ).fetchone()
+            if row is not None:
+                locations[chunk_id] = list(row)
+        return locations
+
+    def touch(self, chunk_ids: List[str]) -> None:
+        """
+        Mark chunks as referenced by today's backup.
+        """
+        today = date.today().isoformat()
+        self._connection.executemany(
+            "UPDATE chunks SET last_used = ? WHERE id = ?",
+            [(today, chunk_id) for chunk_id in chunk_ids],
+        )
+        self._connection.commit()
+
+    def unused_files(self, days: int) -> List[Tuple[str, str]]:
+        """
+        The (drive_id, name) of the files of Google Drive none of whose chunks has
+        been referenced by a backup for `days` days. A pack is only unused once all
+        its chunks are.
+        """
+        cutoff = (date.today() - timedelta(days=days)).isoformat()
+        return self._connection.execute(
+            "SELECT drive_id, COALESCE(pack, MIN(id)) FROM chunks"
+            " GROUP BY drive_id HAVING MAX(last_used) < ?",
+            (cutoff,),
+        ).fetchall()
+
+    def remove_files(self, drive_ids: List[str]) -> None:
+        """
+        Forget the chunks stored in files deleted from Google Drive.
+        """
+        self._connection.executemany(
+            "DELETE FROM chunks WHERE drive_id = ?",
+            [(drive_id,) for drive_id in drive_ids],
+        )
+        self._connection.commit()
+
+    def close(self) -> None:
+        self._connection.close()
+
+
+class ChunkStore:
+    """
+    Content-addressed chunk store in a Google Drive folder, a chunk being uploaded
+    only if it is not already known. A chunk is stored as a file named after its
+    SHA-256, unless it is smaller than MIN_CHUNK_SIZE: small chunks are appended to
+    a pack, uploaded as a single file of about PACK_SIZE named after the SHA-256 of
+    its content, so backing up many small files costs few requests.
+
+    Files are uploaded by `concurrency` threads while the next chunks are read.
+    When uploads fall behind, put blocks while twice as many files are being
+    uploaded or waiting for a thread, which bounds the memory used. The chunks of a
+    file are added to the index once it is uploaded, from the thread calling put or
+    flush, the index not being shared between threads.
+    """
+
+    def __init__(
+        self,
+        service: "GoogleDriveService",
+        index: ChunkIndex,
+        folder_id: str,
+        concurrency: int = 1,
+    ):
+        self.service = service
+        self.index = index
+        self.folder_id = folder_id
+        self.uploaded_count = 0
+        self.uploaded_bytes = 0
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="chunk-upload"
+        )
+        self._pending_slots = threading.BoundedSemaphore(2 * concurrency)
+        # Uploads not indexed yet, with their chunks and the name of their pack
+        self._uploads: List[
+            Tuple[Future, List[Tuple[str, int, int]], Optional[str]]
+        ] = []
+        # Chunks uploaded or being uploaded by this store, maybe not indexed yet
+        self._queued_ids = set()
+        self._pack = bytearray()
+        self._pack_chunks: List[Tuple[str, int, int]] = []
+
+    def put(self, chunk: bytes) -> str:
+        """
+        Store a chunk if it is not already stored.
+
+        Parameters
+        ----------
+        chunk : bytes
+            The content of the chunk.
+
+        Returns
+        -------
+        str
+            The id of the chunk, its SHA-256.
+        """
+        chunk_id = hashlib.sha256(chunk).hexdigest()
+        if chunk_id in self._queued_ids or self.index.contains(chunk_id):
+            return chunk_id
+        self._queued_ids.add(chunk_id)
+        data = encode_chunk(chunk)
+        if len(chunk) >= MIN_CHUNK_SIZE:
+            self._upload(chunk_id, data, [(chunk_id, 0, len(data))])
+        else:
+            self._pack_chunks.append((chunk_id, len(self._pack), len(data)))
+            self._pack += data
+            if len(self._pack) >= PACK_SIZE:
+                self._upload_pack()
+        return chunk_id
+
+    def flush(self) -> None:
+        """
+        Upload the pack being filled, and wait for every upload to be indexed.
+        """
+        self._upload_pack()
+        self._index_uploads(wait=True)
+
+    def close(self) -> None:
+        """
+        Cancel the uploads that did not start yet and wait for the running ones.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _upload_pack(self) -> None:
+        if not self._pack_chunks:
+            return
+        data = bytes(self._pack)
+        name = f"{PACK_PREFIX}{hashlib.sha256(data).hexdigest()}"
+        self._upload(name, data, self._pack_chunks, pack=name)
+        self._pack = bytearray()
+        self._pack_chunks = []
+
+    def _upload(
+        self,
+        name: str,
+        data: bytes,
+        chunks: List[Tuple[str, int, int]],
+        pack: Optional[str] = None,
+    ) -> None:
+        self._index_uploads(wait=False)
+        self._pending_slots.acquire()
+        future = self._executor.submit(bind_run_metrics(self._send), name, data)
+        self._uploads.append((future, chunks, pack))
+
+    def _send(self, name: str, data: bytes) -> str:
+        try:
+            return self.service.upload_bytes(name, data, self.folder_id)
+        finally:
+            self._pending_slots.release()
+
+    def _index_uploads(self, wait: bool) -> None:
+        """
+        Add the chunks of the finished uploads to the index, or of every upload once
+        finished when wait is True, then raise the error of a failed upload if any.
+        """
+        error = None
+        uploads = []
+        for future, chunks, pack in self._uploads:
+            if not wait and not future.done():
+                uploads.append((future, chunks, pack))
+                continue
+            try:
+                drive_id = future.result()
+            except Exception as upload_error:
+                error = error or upload_error
+                continue
+            self.index.add(drive_id, chunks, pack)
+            self.uploaded_count += len(chunks)
+            self.uploaded_bytes += sum(size for _, _, size in chunks)
+        self._uploads = uploads
+        if error is not None:
+            raise error
+
+    def collect_garbage(self, days_to_keep: int) -> int:
+        """
+        Delete the chunks that no backup younger than days_to_keep references, by
+        batches. Such backups have been removed by the retention, so their chunks
+        are unused. A pack is deleted once none of its chunks is used.
+
+        Returns
+        -------
+        int
+            The number of deleted files, chunks or packs.
+        """
+        unused_files = self.index.unused_files(days_to_keep)
+        deleted_ids = self.service.delete_files(
+            [{"id": drive_id, "name": name} for drive_id, name in unused_files]
+        )
+        self.index.remove_files(deleted_ids)
+        return len(deleted_ids)
+
+
+@timed_phase("chunking")
+def create_dedup_backup(
+    paths_to_backup: List[FilesToBackup],
+    store: ChunkStore,
+    manifest_path: str,
+    throttle: Optional[Throttle] = None,
+) -> str:
+    """
+    Back up the paths as content-defined chunks in a chunk store, and write the
+    manifest describing the backup.
+
+    Files are split with a content-defined chunker, so only the chunks holding data
+    that changed since the previous backups are uploaded. The manifest lists, for
+    every file, its chunks in order; restoring a file means downloading its chunks
+    from the chunks folder and concatenating them.
+
+    Parameters
+    ----------
+    paths_to_backup : List[FilesToBackup]
+        The paths to backup.
+    store : ChunkStore
+        The chunk store.
+    manifest_path : str
+        The path of the manifest file to write.
+    throttle : Throttle, optional
+        The throttle of the files read, reads are not limited when None.
+
+    Returns
+    -------
+    str
+        The path of the manifest file.
+    """
+    logger = get_logger("backup2gdrive")
+    files = []
+    for members in iter_file_members(paths_to_backup):
+        # A file selected by several paths to backup is chunked once
+        with open(members[0].src_path, "rb") as src:
+            reader = ThrottledReader(src, throttle) if throttle is not None else src
+            chunk_ids = [store.put(chunk) for chunk in iter_chunks(reader)]
+        store.index.touch(chunk_ids)
+        get_run_metrics().add(
+            "chunking", bytes_in=members[0].stat.st_size, files=len(members)
+        )
+        for member in members:
+            files.append(
+                {
+                    "path": member.arcname,
+                    "size": member.stat.st_size,
+                    "mtime": member.stat.st_mtime,
+                    "mode": member.stat.st_mode,
+                    "chunks": chunk_ids,
+                }
+            )
+
+    store.flush()
+    packed_chunks = store.index.pack_locations(
+        [chunk_id for file in files for chunk_id in file["chunks"]]
+    )
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(
+            {
+                "type": "dedup",
+                "chunksFolder": CHUNKS_FOLDER_NAME,
+                "packedChunks": packed_chunks,
+                "files": files,
+            },
+            manifest_file,
+        )
+
+    get_run_metrics().add("chunking", bytes_out=store.uploaded_bytes)
+    logger.info(
+        f"Uploaded {store.uploaded_count} new chunks "
+        f"({human_readable_bytes(store.uploaded_bytes)}) to Google Drive"
+    )
+    return manifest_path
@@ -0,0 +1,232 @@
+import sqlite3
+import threading
+
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+FOLDER_MIME_TYPE = "application/vnd.google-apps.folder"
+# Fields of the file resources kept in the mirror
+MIRROR_FILE_FIELDS = "id, name, mimeType, parents, size, modifiedTime, trashed"
+
+
+class DriveMirror:
+    """
+    Local mirror of the metadata of the Google Drive files under the backup folders,
+    so that existence checks, the retention and the reports need no API call.
+
+    The content of a folder is listed once, when it is first tracked. The mirror is
+    then kept current with the changes feed of Google Drive: the changes since the
+    saved page token are applied at the start of each run, a single request when
+    nothing else changed. Besides the content of the tracked folders, the mirror
+    keeps the folders of the destination paths, so a deleted one is noticed too.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # Used by the threads uploading volumes as well
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                parent_id TEXT,
+                mime_type TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                modified_time TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS files_by_parent ON files (parent_id, name);
+            CREATE TABLE IF NOT EXISTS tracked_folders (
+                id TEXT PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+
+    @property
+    def page_token(self) -> Optional[str]:
+        """
+        The page token of the changes feed the mirror is current with.
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM meta WHERE key = 'page_token'"
+            ).fetchone()
+        return row[0] if row else None
+
+    def is_tracked(self, folder_id: str) -> bool:
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "SELECT 1 FROM tracked_folders WHERE id = ?", (folder_id,)
+                ).fetchone()
+                is not None
+            )
+
+    def contains(self, file_id: str) -> bool:
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "SELECT 1 FROM files WHERE id = ?", (file_id,)
+                ).fetchone()
+                is not None
+            )
+
+    def track(self, folder_id: str, children: List[dict]) -> None:
+        """
+        Start mirroring the content of a folder, listed by the caller after the
+        page token was saved so no change is missed.
+        """
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR IGNORE INTO tracked_folders VALUES (?)", (folder_id,)
+            )
+            for child in children:
+                if not child.get("trashed", False):
+                    self._upsert(child)
+
+    def add(self, resource: dict) -> None:
+        """
+        Mirror a file wherever it is, e.g. a folder of a destination path.
+        """
+        with self._lock, self._connection:
+            self._upsert(resource)
+
+    def record(self, resource: dict) -> None:
+        """
+        Mirror a file created by the service, e.g. an uploaded backup, when it is in
+        a tracked folder. The changes feed would bring it at the next run otherwise.
+        """
+        with self._lock, self._connection:
+            if self._tracks_parent(resource):
+                self._upsert(resource)
+
+    def remove(self, file_ids: List[str]) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM files WHERE id = ?", [(file_id,) for file_id in file_ids]
+            )
+
+    def apply_changes(self, changes: List[dict], page_token: str) -> None:
+        """
+        Apply a page of the changes feed, then save the token of the next one.
+
+        Removed and trashed files are removed from the mirror. The other files are
+        only mirrored when they are in a tracked folder or already mirrored, e.g.
+        a folder of a destination path or a backup moved to another folder.
+        """
+        with self._lock, self._connection:
+            for change in changes:
+                resource = change.get("file")
+                file_id = change.get("fileId") or (resource or {}).get("id")
+                if change.get("removed") or not resource or resource.get("trashed"):
+                    self._delete(file_id)
+                elif (
+                    self._tracks_parent(resource)
+                    or self._connection.execute(
+                        "SELECT 1 FROM files WHERE id = ?", (file_id,)
+                    ).fetchone()
+                ):
+                    self._upsert(resource)
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('page_token', ?)", (page_token,)
+            )
+
+    def reset(self, page_token: str) -> None:
+        """
+        Forget everything, e.g. when the saved page token has expired: the folders
+        are listed again when next used.
+        """
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM files")
+            self._connection.execute("DELETE FROM tracked_folders")
+            self._connection.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('page_token', ?)", (page_token,)
+            )
+
+    def exists(self, name: str, parent_id: str) -> bool:
+        with self._lock:
+            return (
+                self._connection.execute(
+                    "SELECT 1 FROM files WHERE parent_id = ? AND name = ?",
+                    (parent_id, name),
+                ).fetchone()
+                is not None
+            )
+
+    def files_modified_before(
+        self, parent_id: str, cutoff: datetime
+    ) -> List[Tuple[str, str]]:
+        """
+        The ID and name of the files of a folder, not its subfolders, last modified
+        before cutoff, an aware datetime.
+        """
+        with self._lock:
+            return self._connection.execute(
+                "SELECT id, name FROM files WHERE parent_id = ? AND mime_type != ? "
+                "AND modified_time < ? ORDER BY modified_time",
+                (parent_id, FOLDER_MIME_TYPE, _rfc3339(cutoff)),
+            ).fetchall()
+
+    def folder_usage(self, parent_id: str) -> Tuple[int, int]:
+        """
+        The number and total size of the files of a folder, not its subfolders.
+        """
+        with self._lock:
+            count, size = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files "
+                "WHERE parent_id = ? AND mime_type != ?",
+                (parent_id, FOLDER_MIME_TYPE),
+            ).fetchone()
+        return count, size
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _tracks_parent(self, resource: dict) -> bool:
+        # The lock must be held
+        return any(
+            self._connection.execute(
+                "SELECT 1 FROM tracked_folders WHERE id = ?", (parent_id,)
+            ).fetchone()
+            for parent_id in resource.get("parents") or []
+        )
+
+    def _upsert(self, resource: dict) -> None:
+        # The lock must be held
+        parents = resource.get("parents") or [None]
+        self._connection.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                resource["id"],
+                resource.get("name", ""),
+                parents[0],
+                resource.get("mimeType", ""),
+                int(resource.get("size", 0)),
+                _normalize_time(resource.get("modifiedTime", "")),
+            ),
+        )
+
+    def _delete(self, file_id: str) -> None:
+        # The lock must be held. The content of a deleted tracked folder is gone too
+        self._connection.execute("DELETE FROM files WHERE id = ?", (file_id,))
+        self._connection.execute("DELETE FROM files WHERE parent_id = ?", (file_id,))
+        self._connection.execute("DELETE FROM tracked_folders WHERE id = ?", (file_id,))
+
+
+def _rfc3339(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _normalize_time(value: str) -> str:
+    """
+    An RFC 3339 UTC time of Google Drive with microseconds, so that times compare
+    as strings, e.g. "2024-11-25T10:00:00.123Z" and "2024-11-25T10:00:00Z".
+    """
+    if not value:
+        return value
+    return _rfc3339(datetime.fromisoformat(value.replace("Z", "+00:00")))
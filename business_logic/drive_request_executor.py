@@ -0,0 +1,350 @@
+import httplib2
+import json
+import random
+import threading
+import time
+
+from contextlib import nullcontext
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar, TYPE_CHECKING
+from utils.logger import get_logger
+from utils.metrics import get_run_metrics
+from utils.throttle import Throttle
+from utils.token_bucket import TokenBucket
+
+if TYPE_CHECKING:
+    from business_logic.shared_limits import ProjectLimits
+
+T = TypeVar("T")
+
+DEFAULT_REQUESTS_PER_SECOND = 10
+DEFAULT_MAX_CONCURRENT_REQUESTS = 8
+DEFAULT_MAX_RETRIES = 6
+# Exponential backoff: 1s, 2s, 4s... with full jitter, never more than 64s
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 64.0
+# Reasons of the 403 errors Google Drive returns when a quota is exceeded
+RATE_LIMIT_REASONS = ("rateLimitExceeded", "userRateLimitExceeded")
+# Network errors worth retrying
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, httplib2.ServerNotFoundError)
+
+
+def is_retryable(error: Exception, idempotent: bool = True) -> bool:
+    """
+    Whether a failed request may succeed when sent again: 429 responses and 403
+    responses telling a rate limit is exceeded, and for idempotent requests 5xx
+    responses and network errors, see may_have_succeeded.
+    """
+    if idempotent and may_have_succeeded(error):
+        return True
+    if not isinstance(error, HttpError):
+        return False
+    status = error.resp.status
+    if status == 429:
+        return True
+    return status == 403 and error_reason(error) in RATE_LIMIT_REASONS
+
+
+def may_have_succeeded(error: Exception) -> bool:
+    """
+    Whether a request may have been carried out despite its error: 5xx responses
+    and network errors. Sending again a request that is not idempotent, like the
+    creation of a file, could then do it twice.
+    """
+    if isinstance(error, TRANSIENT_ERRORS):
+        return True
+    return isinstance(error, HttpError) and error.resp.status >= 500
+
+
+def is_idempotent(request: HttpRequest) -> bool:
+    """
+    Whether sending a request twice has the same effect as sending it once: every
+    method of the Google Drive API but POST, which creates resources.
+    """
+    return request.method != "POST"
+
+
+def error_reason(error: HttpError) -> Optional[str]:
+    """
+    The reason of an error response of the Google Drive API, e.g. "rateLimitExceeded".
+    """
+    try:
+        content = json.loads(error.content)
+        return content["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return None
+
+
+class EndpointStats:
+    """
+    Counters of the requests sent to an endpoint of the Google Drive API.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def record(self, latency: float) -> None:
+        self.calls += 1
+        self.total_latency += latency
+        self.max_latency = max(self.max_latency, latency)
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "failures": self.failures,
+            "averageLatency": self.total_latency / self.calls if self.calls else 0.0,
+            "maxLatency": self.max_latency,
+        }
+
+
+class DriveRequestExecutor:
+    """
+    Sends every Google Drive API request of a service.
+
+    Requests are spread by a token bucket so bursts (deletions, sharing...) run at
+    the rate allowed by the quota, at most `max_concurrent_requests` at a time.
+    Requests failing with a retryable error are sent again after an exponential
+    backoff with full jitter, honouring the Retry-After header when there is one.
+    A request creating a resource is only sent again after a server or network
+    error when it comes with a lookup of the resource, not found. Latency and
+    retries are counted for each endpoint.
+    """
+
+    def __init__(
+        self,
+        http_factory: Callable[[], httplib2.Http],
+        requests_per_second: Optional[float] = DEFAULT_REQUESTS_PER_SECOND,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        shared_limits: Optional["ProjectLimits"] = None,
+        upload_throttle: Optional[Throttle] = None,
+    ):
+        self.http_factory = http_factory
+        self.max_retries = max_retries
+        # Upload bandwidth of the project, e.g. lower during business hours
+        self.upload_throttle = upload_throttle
+        # Limits shared with the other projects backed up by the process
+        self.shared_limits = shared_limits
+        self.logger = get_logger("backup2gdrive")
+        self._rate_limiter = TokenBucket(requests_per_second)
+        self._concurrency = threading.BoundedSemaphore(max_concurrent_requests)
+        self._stats: Dict[str, EndpointStats] = {}
+        self._stats_lock = threading.Lock()
+
+    def execute(
+        self,
+        request: HttpRequest,
+        endpoint: Optional[str] = None,
+        upload_size: int = 0,
+        lookup: Optional[Callable[[], Optional[dict]]] = None,
+    ):
+        """
+        Send an API request, e.g. `service.files().list(...)`, and return its response.
+        See call for lookup, used by the requests creating a resource.
+        """
+        return self.call(
+            lambda: request.execute(http=self.http_factory()),
+            endpoint or request.methodId,
+            upload_size=upload_size,
+            idempotent=is_idempotent(request),
+            lookup=lookup,
+        )
+
+    def call(
+        self,
+        send: Callable[[], T],
+        endpoint: str,
+        cost: int = 1,
+        upload_size: int = 0,
+        idempotent: bool = True,
+        lookup: Optional[Callable[[], Optional[T]]] = None,
+    ) -> T:
+        """
+        Send a request through the rate limiter, retrying it on retryable errors.
+
+        Parameters
+        ----------
+        send : Callable[[], T]
+            Sends the request once and returns its response.
+        endpoint : str
+            The name of the endpoint the stats of the request are counted in.
+        cost : int, optional
+            The number of API requests sent at once, e.g. the size of a batch.
+        upload_size : int, optional
+            The number of bytes uploaded by the request, counted in the upload
+            bandwidth of the project and in the one shared with the other projects.
+        idempotent : bool, optional
+            Whether the request can be sent again after a server or network error,
+            which it may have been carried out despite. Default is True.
+        lookup : Callable[[], Optional[T]], optional
+            For a request that is not idempotent, finds what it would have created,
+            returning None when it does not exist. After a server or network error,
+            the request is then only sent again when lookup finds nothing, and the
+            response of lookup is returned otherwise.
+
+        Returns
+        -------
+        T
+            The response of the request.
+        """
+        attempt = 0
+        while True:
+            self._rate_limiter.acquire(cost)
+            if upload_size and self.upload_throttle is not None:
+                self.upload_throttle.acquire(upload_size)
+            if self.shared_limits is not None:
+                self.shared_limits.acquire_requests(cost)
+                if upload_size:
+                    self.shared_limits.acquire_upload(upload_size)
+            start_time = time.monotonic()
+            try:
+                with self._concurrency, (
+                    self.shared_limits.drive_request_slot()
+                    if self.shared_limits is not None
+                    else nullcontext()
+                ):
+                    response = send()
+            except Exception as error:
+                latency = time.monotonic() - start_time
+                if (
+                    not is_retryable(error, idempotent or lookup is not None)
+                    or attempt >= self.max_retries
+                ):
+                    self._count(endpoint, latency, failures=1)
+                    raise
+                attempt += 1
+                self._count(endpoint, latency, retries=1)
+                delay = self.backoff_delay(error, attempt)
+                self.logger.warning(
+                    f"{endpoint} failed ({error}), retry {attempt}/{self.max_retries} "
+                    f"in {delay:.1f}s"
+                )
+                time.sleep(delay)
+                if not idempotent and may_have_succeeded(error):
+                    existing = lookup()
+                    if existing is not None:
+                        self.logger.info(f"{endpoint} succeeded despite the error")
+                        return existing
+                continue
+            self._count(endpoint, time.monotonic() - start_time)
+            return response
+
+    def execute_batch(
+        self,
+        new_batch: Callable,
+        requests: List[Tuple[str, HttpRequest]],
+        endpoint: str,
+    ) -> Dict[str, Tuple[Optional[dict], Optional[Exception]]]:
+        """
+        Send requests in a single batch request. The requests of the batch failing
+        with a retryable error are sent again in a new batch after a backoff, the
+        ones creating a resource only when they were rate limited.
+
+        Parameters
+        ----------
+        new_batch : Callable
+            Creates an empty batch request, e.g. `service.new_batch_http_request`.
+        requests : List[Tuple[str, HttpRequest]]
+            The requests of the batch with their unique ID.
+        endpoint : str
+            The name of the endpoint the stats of the batch are counted in.
+
+        Returns
+        -------
+        Dict[str, Tuple[Optional[dict], Optional[Exception]]]
+            The response or the error of each request, by request ID.
+        """
+        results = {}
+
+        def on_response(request_id: str, response, exception):
+            results[request_id] = (response, exception)
+
+        pending = list(requests)
+        attempt = 0
+        while pending:
+            batch = new_batch(callback=on_response)
+            for request_id, request in pending:
+                batch.add(request, request_id=request_id)
+            self.call(
+                lambda: batch.execute(http=self.http_factory()),
+                endpoint,
+                cost=len(pending),
+                idempotent=all(is_idempotent(request) for _, request in pending),
+            )
+
+            failed = [
+                (request_id, request)
+                for request_id, request in pending
+                if results[request_id][1] is not None
+                and is_retryable(results[request_id][1], is_idempotent(request))
+            ]
+            if not failed or attempt >= self.max_retries:
+                break
+            attempt += 1
+            self._count(endpoint, retries=len(failed))
+            delay = self.backoff_delay(results[failed[0][0]][1], attempt)
+            self.logger.warning(
+                f"{len(failed)} requests of a {endpoint} batch failed, "
+                f"retry {attempt}/{self.max_retries} in {delay:.1f}s"
+            )
+            time.sleep(delay)
+            pending = failed
+        return results
+
+    def backoff_delay(self, error: Exception, attempt: int) -> float:
+        """
+        The delay before the given retry (from 1) of a request failing with error:
+        its Retry-After header, or an exponential backoff with full jitter.
+        """
+        if isinstance(error, HttpError):
+            retry_after = error.resp.get("retry-after")
+            if retry_after and retry_after.isdigit():
+                return float(retry_after)
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+    def _count(
+        self,
+        endpoint: str,
+        latency: Optional[float] = None,
+        retries: int = 0,
+        failures: int = 0,
+    ) -> None:
+        with self._stats_lock:
+            stats = self._stats.setdefault(endpoint, EndpointStats())
+            if latency is not None:
+                stats.record(latency)
+            stats.retries += retries
+            stats.failures += failures
+        if latency is not None:
+            get_run_metrics().record_api_call(latency, retries, failures)
+
+    def stats(self) -> Dict[str, dict]:
+        """
+        The calls, retries, failures and latencies of each endpoint.
+        """
+        with self._stats_lock:
+            return {
+                endpoint: stats.to_dict() for endpoint, stats in self._stats.items()
+            }
+
+    def reset_stats(self) -> None:
+        """
+        Forget the stats counted so far, e.g. when a new run starts.
+        """
+        with self._stats_lock:
+            self._stats = {}
+
+    def log_stats(self) -> None:
+        for endpoint, stats in sorted(self.stats().items()):
+            self.logger.info(
+                f"{endpoint}: {stats['calls']} calls, {stats['retries']} retries, "
+                f"{stats['failures']} failures, "
+                f"{stats['averageLatency'] * 1000:.0f} ms average latency, "
+                f"{stats['maxLatency'] * 1000:.0f} ms max latency"
+            )
@@ -0,0 +1,158 @@
+import os
+import sqlite3
+import threading
+
+from datetime import date, timedelta
+from typing import List, Optional
+
+
+class FileIndex:
+    """
+    Persistent state of the files stored by the previous backups, used to build
+    incremental backups.
+
+    Files are keyed by their name inside the archive and tracked by size, mtime,
+    inode and content hash. Changes made during a run are kept in an open SQLite
+    transaction and only committed once the backup has been uploaded, so a failed
+    run never loses track of changed files. The index can be used from another
+    thread than the one which opened it, e.g. the archiver of the stream output
+    mode.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self.full = True
+        # Used by the thread archiving in stream output mode as well
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._connection.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                content_hash TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            """
+        )
+
+    def last_full_backup(self) -> Optional[date]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM meta WHERE key = 'last_full_backup'"
+            ).fetchone()
+        return date.fromisoformat(row[0]) if row else None
+
+    def needs_full_backup(self, full_backup_every: int) -> bool:
+        """
+        Whether the next backup must be a full one.
+
+        Parameters
+        ----------
+        full_backup_every : int
+            The maximum number of days between two full backups.
+
+        Returns
+        -------
+        bool
+            True if no full backup was made in the last full_backup_every days.
+        """
+        last_full_backup = self.last_full_backup()
+        return last_full_backup is None or date.today() - last_full_backup >= timedelta(
+            days=full_backup_every
+        )
+
+    def begin_run(self, full: bool) -> None:
+        """
+        Start tracking the files of a new backup.
+
+        Parameters
+        ----------
+        full : bool
+            Whether every file is archived, or only the new and changed ones.
+        """
+        self.full = full
+        with self._lock:
+            self._connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS seen (path TEXT PRIMARY KEY)"
+            )
+            self._connection.execute("DELETE FROM seen")
+
+    def should_archive(self, path: str, stat: os.stat_result) -> bool:
+        """
+        Mark a file as still present and tell whether it must be archived.
+
+        Parameters
+        ----------
+        path : str
+            The name of the file inside the archive.
+        stat : os.stat_result
+            The current stat of the file.
+
+        Returns
+        -------
+        bool
+            True for a full backup, or if the file is new or changed since the last backup.
+        """
+        with self._lock:
+            self._connection.execute("INSERT OR IGNORE INTO seen VALUES (?)", (path,))
+            if self.full:
+                return True
+            row = self._connection.execute(
+                "SELECT size, mtime_ns, inode FROM files WHERE path = ?", (path,)
+            ).fetchone()
+        return row != (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+    def record(self, path: str, stat: os.stat_result, content_hash: str) -> None:
+        """
+        Record the state of an archived file.
+        """
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, stat.st_ino, content_hash),
+            )
+
+    def deleted_paths(self) -> List[str]:
+        """
+        Files stored by previous backups that were not seen during this run.
+        """
+        with self._lock:
+            return [
+                row[0]
+                for row in self._connection.execute(
+                    "SELECT path FROM files WHERE path NOT IN (SELECT path FROM seen) "
+                    "ORDER BY path"
+                )
+            ]
+
+    def commit(self) -> None:
+        """
+        Persist the state of the run, once its backup is safely stored.
+        """
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM files WHERE path NOT IN (SELECT path FROM seen)"
+            )
+            if self.full:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO meta VALUES ('last_full_backup', ?)",
+                    (date.today().isoformat(),),
+                )
+            self._connection.commit()
+
+    def rollback(self) -> None:
+        """
+        Forget the state of the run, the next backup will archive the same changes again.
+        """
+        with self._lock:
+            self._connection.rollback()
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
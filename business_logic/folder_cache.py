@@ -0,0 +1,54 @@
+import json
+import os
+import threading
+
+from typing import List, Optional
+
+
+class FolderCache:
+    """
+    Persistent cache of the Google Drive folder IDs of resolved folder paths.
+
+    Folder IDs never change once created, so a path resolved by a previous run
+    only needs a cheap check that its leaf folder still exists.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._folders: dict = {}
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r") as cache_file:
+                    self._folders = json.load(cache_file)
+            except json.JSONDecodeError:
+                self._folders = {}
+
+    @staticmethod
+    def _key(folder_path: List[str]) -> str:
+        return json.dumps(list(folder_path))
+
+    def get(self, folder_path: List[str]) -> Optional[List[str]]:
+        """
+        The IDs of every folder of the path, from the main folder to the leaf one.
+        """
+        with self._lock:
+            return self._folders.get(self._key(folder_path))
+
+    def set(self, folder_path: List[str], folder_ids: List[str]) -> None:
+        with self._lock:
+            self._folders[self._key(folder_path)] = folder_ids
+            self._save()
+
+    def invalidate(self, folder_path: List[str]) -> None:
+        with self._lock:
+            self._folders.pop(self._key(folder_path), None)
+            self._save()
+
+    def _save(self) -> None:
+        if not self.cache_path:
+            return
+        temporary_path = f"{self.cache_path}.tmp"
+        with open(temporary_path, "w") as cache_file:
+            json.dump(self._folders, cache_file, indent=2)
+        os.replace(temporary_path, self.cache_path)
@@ -1,28 +1,134 @@
+import io
+import json
 import os
+import threading
+import time
 
+from business_logic.drive_request_executor import (
+    DEFAULT_MAX_CONCURRENT_REQUESTS,
+    DEFAULT_MAX_RETRIES,
+    DEFAULT_REQUESTS_PER_SECOND,
+    DriveRequestExecutor,
+    may_have_succeeded,
+)
+from business_logic.drive_mirror import MIRROR_FILE_FIELDS, DriveMirror
+from business_logic.folder_cache import FolderCache
+from business_logic.permission_cache import ANYONE, PermissionCache, role_rank
 from datetime import datetime, timedelta, timezone
-from googleapiclient.discovery import build, MediaFileUpload
+from googleapiclient.discovery import build_from_document, MediaFileUpload
+from googleapiclient.discovery_cache import get_static_doc
+from utils.checksum import (
+    ChecksumMismatchError,
+    Checksums,
+    checksums_document,
+    checksums_path,
+    read_checksums,
+)
 from utils.human_readable_bytes import human_readable_bytes
 from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaIoBaseUpload, build_http
+from google.auth.credentials import AnonymousCredentials
 from google.oauth2.service_account import Credentials
-from typing import List, Optional
+from google_auth_httplib2 import AuthorizedHttp
+from typing import BinaryIO, Dict, List, Optional, TYPE_CHECKING
+from urllib.parse import urlencode
 from utils.logger import get_logger
+from utils.metrics import get_run_metrics, timed_phase
+from utils.throttle import Throttle
+
+if TYPE_CHECKING:
+    from business_logic.shared_limits import ProjectLimits
+
+# Resumable uploads send the file in chunks of this size (a multiple of 256 KB)
+DEFAULT_UPLOAD_CHUNK_SIZE = 32 * 1024 * 1024
+# Fields of the file resources returned by the uploads
+UPLOADED_FILE_FIELDS = (
+    "id, name, mimeType, parents, size, modifiedTime, md5Checksum, webViewLink, "
+    "webContentLink"
+)
+# Minimum delay between two upload progress logs
+UPLOAD_PROGRESS_LOG_INTERVAL = 10
+# Maximum page size of files.list
+LIST_PAGE_SIZE = 1000
+# Maximum number of requests in a batch request
+DELETE_BATCH_SIZE = 100
+# Folder paths are walked one at a time, so that the services of projects backed up
+# at the same time never both create a parent folder they share
+_folder_walk_lock = threading.Lock()
+
+
+class _HttpLease:
+    """
+    HTTP client used by a thread, given back to the idle ones when the thread ends
+    and its thread local data is deleted.
+    """
+
+    def __init__(self, http: AuthorizedHttp, idle_https: List[AuthorizedHttp]):
+        self.http = http
+        self._idle_https = idle_https
+
+    def __del__(self):
+        self._idle_https.append(self.http)
 
 
 class GoogleDriveService:
-    def __init__(self, users_emails: List[str]):
+    def __init__(
+        self,
+        users_emails: List[str],
+        upload_chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE,
+        folder_cache_path: Optional[str] = None,
+        requests_per_second: Optional[float] = DEFAULT_REQUESTS_PER_SECOND,
+        max_concurrent_requests: int = DEFAULT_MAX_CONCURRENT_REQUESTS,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        shared_limits: Optional["ProjectLimits"] = None,
+        folder_cache: Optional[FolderCache] = None,
+        upload_throttle: Optional[Throttle] = None,
+        metadata_mirror: Optional[DriveMirror] = None,
+        users_roles: Optional[Dict[str, str]] = None,
+        permission_cache: Optional[PermissionCache] = None,
+    ):
         """
         Initialize the GoogleDriveService class.
 
         Sets up the necessary scopes for Google Drive API access, initializes
         a logger for the service, and creates a Google Drive API service instance.
+        The services of projects backed up by the same process share their limits
+        and a folder cache, instead of reading it from folder_cache_path. Uploads
+        are throttled by upload_throttle when given. With a metadata_mirror, the
+        backups folders are read from the mirror instead of being queried.
+        The main folder is shared with the users as readers, or with their role in
+        users_roles, and the permissions known to be set are cached in
+        permission_cache when given.
         """
         if not isinstance(users_emails, list) or not users_emails:
             raise ValueError("users_emails must be a non-empty list")
         self.SCOPES = ["https://www.googleapis.com/auth/drive"]
         self.logger = get_logger("backup2gdrive")
+        # httplib2 connections are not thread safe, each thread gets its own. They
+        # are kept open when the thread ends, for the threads of the next run
+        self._thread_local = threading.local()
+        self._idle_https: List[AuthorizedHttp] = []
+        # Every request goes through the executor, which rate limits and retries them
+        self.request_executor = DriveRequestExecutor(
+            self._http,
+            requests_per_second=requests_per_second,
+            max_concurrent_requests=max_concurrent_requests,
+            max_retries=max_retries,
+            shared_limits=shared_limits,
+            upload_throttle=upload_throttle,
+        )
         self.service = self._create_service()
         self.users_emails = users_emails
+        self.users_roles = users_roles or {email: "reader" for email in users_emails}
+        self.permission_cache = permission_cache
+        self.upload_chunk_size = upload_chunk_size
+        self.folder_cache = folder_cache or FolderCache(folder_cache_path)
+        # Folder paths whose cached IDs have been checked during this run
+        self._valid_folder_paths = set()
+        # The mirror is brought up to date with the changes feed once per run
+        self.metadata_mirror = metadata_mirror
+        self._mirror_synced = False
+        self._mirror_lock = threading.Lock()
 
     def check_storage_usage(self, storage_quota: dict) -> float:
         """
@@ -49,26 +155,226 @@ class GoogleDriveService:
     def _create_service(self):
         """
         Authenticate with a service account and return a Google Drive API service instance.
+
+        GOOGLE_DRIVE_API_ROOT_URL sends the requests to another server than Google's,
+        e.g. the local stand-in of the benchmarks. They are then sent without
+        credentials when there is no service account file.
         """
-        service_account_path = os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON_PATH", None)
-        credentials = Credentials.from_service_account_file(
-            filename=service_account_path or "config/google-service-account.json",
-            scopes=self.SCOPES,
+        service_account_path = (
+            os.environ.get("GOOGLE_SERVICE_ACCOUNT_JSON_PATH", None)
+            or "config/google-service-account.json"
         )
-        drive_service = build("drive", "v3", credentials=credentials)
-        about_info = drive_service.about().get(fields="user").execute()
-        self.user_email = about_info.get("user").get("emailAddress")
+        root_url = os.environ.get("GOOGLE_DRIVE_API_ROOT_URL", None)
+        if root_url and not os.path.exists(service_account_path):
+            credentials = AnonymousCredentials()
+        else:
+            credentials = Credentials.from_service_account_file(
+                filename=service_account_path,
+                scopes=self.SCOPES,
+            )
+        self.credentials = credentials
+        # The discovery document bundled with the client library is used,
+        # nothing is fetched nor cached on disk
+        document = json.loads(get_static_doc("drive", "v3"))
+        if root_url:
+            # API, upload and batch URLs all derive from the root URL
+            document["rootUrl"] = root_url.rstrip("/") + "/"
+        # Endpoint creating the resumable upload sessions of streamed files
+        self.upload_url = f"{document['rootUrl']}upload/{document['servicePath']}files"
+        drive_service = build_from_document(document, credentials=credentials)
+        about = self.request_executor.execute(
+            drive_service.about().get(fields="user, storageQuota")
+        )
+        self.user_email = about.get("user").get("emailAddress")
         self.logger.info(f"Authenticated as {self.user_email}")
-
-        about = drive_service.about().get(fields="storageQuota").execute()
         self.check_storage_usage(about.get("storageQuota"))
 
         return drive_service
 
+    def _http(self) -> AuthorizedHttp:
+        """
+        The authorized HTTP client of the current thread, so requests can be sent
+        concurrently from several threads.
+        """
+        if not hasattr(self._thread_local, "http"):
+            try:
+                # Reuse the open connections of a thread that has ended
+                http = self._idle_https.pop()
+            except IndexError:
+                # Unlike a bare httplib2.Http, build_http does not take the 308
+                # responses of resumable uploads for redirects
+                http = AuthorizedHttp(self.credentials, http=build_http())
+            self._thread_local.http = _HttpLease(http, self._idle_https)
+        return self._thread_local.http.http
+
+    def begin_run(self) -> None:
+        """
+        Prepare the service for a new run when it is kept between runs, e.g. by the
+        daemon: cached folder IDs are checked again and API stats start from zero.
+        """
+        self._valid_folder_paths.clear()
+        self._mirror_synced = False
+        self.request_executor.reset_stats()
+
+    def _synced_mirror(self) -> Optional[DriveMirror]:
+        """
+        The metadata mirror, once the changes made since its page token are applied
+        to it. None when the service has no mirror.
+        """
+        mirror = self.metadata_mirror
+        if mirror is None:
+            return None
+        with self._mirror_lock:
+            if not self._mirror_synced:
+                self._sync_mirror(mirror)
+                self._mirror_synced = True
+        return mirror
+
+    @timed_phase("mirror_sync")
+    def _sync_mirror(self, mirror: DriveMirror) -> None:
+        page_token = mirror.page_token
+        if page_token is None:
+            mirror.reset(self._start_page_token())
+        else:
+            self._apply_changes(mirror, page_token)
+
+    def _start_page_token(self) -> str:
+        return self.request_executor.execute(
+            self.service.changes().getStartPageToken(fields="startPageToken")
+        )["startPageToken"]
+
+    def _apply_changes(self, mirror: DriveMirror, page_token: str) -> None:
+        """
+        Apply the changes of the feed since page_token, page after page.
+        """
+        change_count = 0
+        while page_token:
+            try:
+                results = self.request_executor.execute(
+                    self.service.changes().list(
+                        pageToken=page_token,
+                        pageSize=LIST_PAGE_SIZE,
+                        spaces="drive",
+                        includeRemoved=True,
+                        fields=(
+                            "nextPageToken, newStartPageToken, "
+                            f"changes(fileId, removed, file({MIRROR_FILE_FIELDS}))"
+                        ),
+                    )
+                )
+            except HttpError as error:
+                if error.resp.status not in (400, 404, 410):
+                    raise
+                # The page token has expired, the folders are listed again
+                self.logger.warning(f"Rebuilding the metadata mirror: {error}")
+                mirror.reset(self._start_page_token())
+                return
+            changes = results.get("changes", [])
+            change_count += len(changes)
+            page_token = results.get("nextPageToken")
+            mirror.apply_changes(
+                changes, page_token or results.get("newStartPageToken")
+            )
+        self.logger.info(f"Applied {change_count} Google Drive changes to the mirror")
+
+    def _tracked_folder(self, folder_id: str) -> Optional[DriveMirror]:
+        """
+        The synced metadata mirror, with the content of a folder listed in it the
+        first time. None when the service has no mirror.
+        """
+        mirror = self._synced_mirror()
+        if mirror is None or mirror.is_tracked(folder_id):
+            return mirror
+        children = []
+        page_token = None
+        while True:
+            results = self.request_executor.execute(
+                self.service.files().list(
+                    q=f"'{folder_id}' in parents and trashed = false",
+                    spaces="drive",
+                    pageSize=LIST_PAGE_SIZE,
+                    pageToken=page_token,
+                    fields=f"nextPageToken, files({MIRROR_FILE_FIELDS})",
+                )
+            )
+            children.extend(results.get("files", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+        mirror.track(folder_id, children)
+        return mirror
+
+    @timed_phase("folder_resolution")
     def create_folder_structure(self, gdrive_destination_path: List[str]) -> List[str]:
         """
         Create the specified folder structure on Google Drive.
         Returns a list of folder IDs corresponding to the created folder hierarchy.
+
+        The IDs are cached on disk: a path resolved by a previous run only costs a
+        single request checking that its leaf folder still exists. The whole path is
+        walked again only when the cached IDs are stale.
+        """
+        path_key = tuple(gdrive_destination_path)
+        folder_ids = self.folder_cache.get(gdrive_destination_path)
+        if folder_ids and (
+            path_key in self._valid_folder_paths or self._folder_exists(folder_ids[-1])
+        ):
+            self._valid_folder_paths.add(path_key)
+            return folder_ids
+
+        if folder_ids:
+            self.logger.info(
+                f"Cached folder IDs of {'/'.join(gdrive_destination_path)} are stale"
+            )
+        with _folder_walk_lock:
+            folder_ids = self._walk_folder_structure(gdrive_destination_path)
+        self.folder_cache.set(gdrive_destination_path, folder_ids)
+        self._valid_folder_paths.add(path_key)
+        return folder_ids
+
+    def invalidate_folder_structure(self, gdrive_destination_path: List[str]) -> None:
+        """
+        Forget the cached folder IDs of a path, walked again on its next resolution,
+        and the cached sharing of its main folder.
+        """
+        folder_ids = self.folder_cache.get(gdrive_destination_path)
+        if folder_ids:
+            self._invalidate_permissions(folder_ids[0])
+        self.folder_cache.invalidate(gdrive_destination_path)
+        self._valid_folder_paths.discard(tuple(gdrive_destination_path))
+
+    def _folder_exists(self, folder_id: str, use_mirror: bool = True) -> bool:
+        """
+        Check that a folder has not been deleted or trashed.
+        A folder is also trashed when one of its parents is.
+        A folder in the metadata mirror exists, the changes feed would have removed it,
+        unless use_mirror is False: Google Drive is then asked in any case, e.g. when
+        it already answered that the folder is missing.
+        """
+        mirror = self._synced_mirror()
+        if use_mirror and mirror is not None and mirror.contains(folder_id):
+            return True
+        try:
+            folder = self.request_executor.execute(
+                self.service.files().get(fileId=folder_id, fields=MIRROR_FILE_FIELDS)
+            )
+        except HttpError as error:
+            if error.resp.status == 404:
+                if mirror is not None:
+                    mirror.remove([folder_id])
+                return False
+            raise
+        if folder.get("trashed", False):
+            if mirror is not None:
+                mirror.remove([folder_id])
+            return False
+        if mirror is not None:
+            mirror.add(folder)
+        return True
+
+    def _walk_folder_structure(self, gdrive_destination_path: List[str]) -> List[str]:
+        """
+        Find or create the folders of the path one by one, from the root.
         """
         folder_ids = []
         parent_id = None  # Start at root
@@ -79,22 +385,24 @@ class GoogleDriveService:
             if parent_id:  # Add parent constraint if not root
                 query += f" and '{parent_id}' in parents"
 
-            try:
-                results = (
-                    self.service.files()
-                    .list(q=query, fields="files(id, name)")
-                    .execute()
+            def find_folder(query: str = query) -> Optional[dict]:
+                results = self.request_executor.execute(
+                    self.service.files().list(q=query, fields="files(id, name)")
                 )
                 folders = results.get("files", [])
+                return folders[0] if folders else None
+
+            try:
+                folder = find_folder()
             except HttpError as error:
                 self.logger.error(
                     f"Error searching for folder '{folder_name}': {error}"
                 )
                 raise
 
-            if folders:
+            if folder:
                 # Folder exists, use its ID
-                folder_id = folders[0]["id"]
+                folder_id = folder["id"]
                 self.logger.info(f"Folder '{folder_name}' exists with ID: {folder_id}")
             else:
                 # Folder doesn't exist, create it
@@ -106,10 +414,10 @@ class GoogleDriveService:
                     else [],  # Root or a parent folder
                 }
                 try:
-                    folder = (
-                        self.service.files()
-                        .create(body=file_metadata, fields="id")
-                        .execute()
+                    # Looked up after a server error, so it is not created twice
+                    folder = self.request_executor.execute(
+                        self.service.files().create(body=file_metadata, fields="id"),
+                        lookup=find_folder,
                     )
                     folder_id = folder["id"]
                     self.logger.info(
@@ -128,70 +436,310 @@ class GoogleDriveService:
 
         return folder_ids
 
-    def remove_old_files(self, days_old: int = 30) -> int:
+    @timed_phase("retention")
+    def remove_old_files(self, parent_folder_id: str, days_old: int = 30) -> int:
         """
-        Remove old backup files from Google Drive.
+        Remove old backup files from a Google Drive folder.
+
+        The age cutoff and the folder are part of the query, so only the files to
+        delete are listed, page after page, or read from the metadata mirror. They
+        are then deleted by batches of DELETE_BATCH_SIZE requests sent in a single
+        HTTP round trip. The backups left are counted in the run report.
+
+        Parameters
+        ----------
+        parent_folder_id : str
+            The ID of the folder holding the backups. Files in its subfolders are kept.
+        days_old : int, optional
+            Files last modified more than days_old days ago are removed. Default is 30.
+
+        Returns
+        -------
+        int
+            The number of removed files.
         """
-        # Get all files in the root folder
-        results = (
-            self.service.files()
-            .list(
-                q="mimeType != 'application/vnd.google-apps.folder' and trashed = false",
-                spaces="drive",
-                fields="files(id, name, modifiedTime)",
-            )
-            .execute()
-        )
-        files = results.get("files", [])
+        cutoff = datetime.now(timezone.utc) - timedelta(days=days_old)
+        mirror = self._tracked_folder(parent_folder_id)
+        if mirror is not None:
+            old_files = [
+                {"id": file_id, "name": name}
+                for file_id, name in mirror.files_modified_before(
+                    parent_folder_id, cutoff
+                )
+            ]
+        else:
+            old_files = self._list_old_files(parent_folder_id, cutoff)
 
-        # Filter out files older than the specified number of days
-        filtered_files = [
-            file
-            for file in files
-            if (
-                datetime.now(timezone.utc)
-                - datetime.fromisoformat(file["modifiedTime"])
-            )
-            > timedelta(days=days_old)
-        ]
+        deleted_ids = self.delete_files(old_files)
 
-        # Delete the filtered files
-        for file in filtered_files:
-            self.service.files().delete(fileId=file["id"]).execute()
-            self.logger.info(f"Deleted file '{file['name']}'")
+        get_run_metrics().add("retention", files=len(deleted_ids))
+        if mirror is not None:
+            stored_count, stored_size = mirror.folder_usage(parent_folder_id)
+            get_run_metrics().set_stored_backups(stored_count, stored_size)
+            self.logger.info(
+                f"{stored_count} backups ({human_readable_bytes(stored_size)}) "
+                "kept on Google Drive"
+            )
+        return len(deleted_ids)
 
-        return len(filtered_files)
+    def _list_old_files(self, parent_folder_id: str, cutoff: datetime) -> List[dict]:
+        """
+        List the files of a folder, not its subfolders, last modified before cutoff.
+        """
+        query = (
+            f"'{parent_folder_id}' in parents"
+            " and mimeType != 'application/vnd.google-apps.folder'"
+            " and trashed = false"
+            f" and modifiedTime < '{cutoff.strftime('%Y-%m-%dT%H:%M:%SZ')}'"
+        )
+        old_files = []
+        page_token = None
+        while True:
+            results = self.request_executor.execute(
+                self.service.files().list(
+                    q=query,
+                    spaces="drive",
+                    pageSize=LIST_PAGE_SIZE,
+                    pageToken=page_token,
+                    fields="nextPageToken, files(id, name)",
+                )
+            )
+            old_files.extend(results.get("files", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                break
+        return old_files
 
+    @timed_phase("folder_resolution")
     def file_exists(self, file_name: str, parent_folder_id: str) -> bool:
         """
-        Check if a file with the given name already exists in the specified folder.
+        Check if a file with the given name already exists in the specified folder,
+        in the metadata mirror when there is one.
         """
         if not parent_folder_id:
             self.logger.error(
                 "Parent folder ID is None. Ensure the folder structure is created properly."
             )
             raise ValueError("Parent folder ID is None.")
+        mirror = self._tracked_folder(parent_folder_id)
+        if mirror is not None:
+            return mirror.exists(file_name, parent_folder_id)
         query = (
             f"name='{file_name}' and '{parent_folder_id}' in parents and trashed=false"
         )
-        results = self.service.files().list(q=query, fields="files(id, name)").execute()
+        results = self.request_executor.execute(
+            self.service.files().list(q=query, fields="files(id, name)")
+        )
         files = results.get("files", [])
         if files:
             return True
         return False
 
+    @timed_phase("upload")
+    def upload_bytes(self, name: str, data: bytes, parent_folder_id: str) -> str:
+        """
+        Upload in-memory data as a file in the given folder, in a single request.
+
+        Returns
+        -------
+        str
+            The ID of the created file.
+        """
+        media = MediaIoBaseUpload(
+            io.BytesIO(data), mimetype="application/octet-stream", resumable=False
+        )
+        try:
+            # Looked up after a server error, so it is not uploaded twice
+            uploaded_file = self.request_executor.execute(
+                self.service.files().create(
+                    body={"name": name, "parents": [parent_folder_id]},
+                    media_body=media,
+                    fields="id",
+                ),
+                upload_size=len(data),
+                lookup=lambda: self._find_file(name, parent_folder_id),
+            )
+        except HttpError as error:
+            self.logger.error(f"An error occurred while uploading '{name}': {error}")
+            raise
+        get_run_metrics().add("upload", bytes_out=len(data), files=1)
+        return uploaded_file["id"]
+
+    def _find_file(self, name: str, parent_folder_id: str) -> Optional[dict]:
+        """
+        A file of a folder with the given name, None when there is none.
+        """
+        query = f"name='{name}' and '{parent_folder_id}' in parents and trashed=false"
+        files = self.request_executor.execute(
+            self.service.files().list(q=query, fields="files(id, name)")
+        ).get("files", [])
+        return files[0] if files else None
+
+    def delete_file(self, file_id: str) -> None:
+        """
+        Delete a file from Google Drive.
+        """
+        self.request_executor.execute(self.service.files().delete(fileId=file_id))
+
+    def delete_files(self, files: List[dict]) -> List[str]:
+        """
+        Delete files from Google Drive by batches of DELETE_BATCH_SIZE requests, each
+        batch sent in a single HTTP round trip. Files failing to be deleted are logged.
+
+        Parameters
+        ----------
+        files : List[dict]
+            The files to delete, with their "id" and "name".
+
+        Returns
+        -------
+        List[str]
+            The IDs of the deleted files.
+        """
+        deleted_ids = []
+        for start in range(0, len(files), DELETE_BATCH_SIZE):
+            end = min(start + DELETE_BATCH_SIZE, len(files))
+            results = self.request_executor.execute_batch(
+                self.service.new_batch_http_request,
+                [
+                    (
+                        str(position),
+                        self.service.files().delete(fileId=files[position]["id"]),
+                    )
+                    for position in range(start, end)
+                ],
+                "drive.files.delete",
+            )
+            for request_id, (_, exception) in results.items():
+                name = files[int(request_id)]["name"]
+                # A file already gone, e.g. deleted by a retried batch, is deleted
+                if exception is not None and not (
+                    isinstance(exception, HttpError) and exception.resp.status == 404
+                ):
+                    self.logger.error(f"Error deleting file '{name}': {exception}")
+                else:
+                    deleted_ids.append(files[int(request_id)]["id"])
+                    self.logger.info(f"Deleted file '{name}'")
+        if self.metadata_mirror is not None:
+            self.metadata_mirror.remove(deleted_ids)
+        return deleted_ids
+
+    def check_uploaded_checksum(self, uploaded_file: dict, md5: Optional[str]) -> None:
+        """
+        Compare the MD5 checksum Google Drive computed for an uploaded file with md5,
+        the one of the data sent, when given. A file not matching is deleted.
+
+        Raises
+        ------
+        ChecksumMismatchError
+            When the checksums differ.
+        """
+        if md5 is None:
+            return
+        name = uploaded_file.get("name")
+        stored_md5 = uploaded_file.get("md5Checksum")
+        if stored_md5 is None:
+            self.logger.warning(f"No checksum returned for '{name}', it is not checked")
+            return
+        if stored_md5 != md5:
+            self.delete_file(uploaded_file["id"])
+            if self.metadata_mirror is not None:
+                self.metadata_mirror.remove([uploaded_file["id"]])
+            raise ChecksumMismatchError(
+                f"'{name}' is corrupted on Google Drive and was deleted: "
+                f"MD5 {stored_md5} instead of {md5}"
+            )
+        self.logger.info(f"Checksum of '{name}' verified")
+
+    def upload_checksums(
+        self, archive_name: str, checksums: Checksums, parent_folder_id: str
+    ) -> str:
+        """
+        Upload the sidecar file holding the checksums of an archive next to it.
+
+        Returns
+        -------
+        str
+            The ID of the created file.
+        """
+        return self.upload_bytes(
+            os.path.basename(checksums_path(archive_name)),
+            checksums_document(archive_name, checksums),
+            parent_folder_id,
+        )
+
+    def list_files(self, parent_folder_id: str) -> List[dict]:
+        """
+        List the files of a folder, not its subfolders, with their size and the MD5
+        checksum computed by Google Drive.
+        """
+        query = (
+            f"'{parent_folder_id}' in parents"
+            " and mimeType != 'application/vnd.google-apps.folder'"
+            " and trashed = false"
+        )
+        files = []
+        page_token = None
+        while True:
+            results = self.request_executor.execute(
+                self.service.files().list(
+                    q=query,
+                    spaces="drive",
+                    pageSize=LIST_PAGE_SIZE,
+                    pageToken=page_token,
+                    fields="nextPageToken, files(id, name, size, md5Checksum)",
+                )
+            )
+            files.extend(results.get("files", []))
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return files
+
+    def download(
+        self, file_id: str, start: int = 0, end: Optional[int] = None
+    ) -> bytes:
+        """
+        Download the content of a file, or the bytes from start to end included with
+        a ranged request.
+        """
+        request = self.service.files().get_media(fileId=file_id)
+        if start or end is not None:
+            request.headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+        return self.request_executor.execute(request, "drive.files.get.media")
+
+    def prepare_folder(self, gdrive_destination_path: List[str]) -> str:
+        """
+        Create the specified folder structure on Google Drive and share its main
+        folder with the users, and with anyone with the link as a reader: the files
+        uploaded under it inherit these permissions, so they need no request of
+        their own.
+
+        Returns
+        -------
+        str
+            The ID of the folder receiving the backups.
+        """
+        folders_parents_ids = self.create_folder_structure(gdrive_destination_path)
+
+        # Share the main folder with the users, unless it already is
+        self.reconcile_permissions(
+            folders_parents_ids[0], {**self.users_roles, ANYONE: "reader"}
+        )
+
+        return folders_parents_ids[-1]
+
     def upload_file(
-        self, file_name: str, gdrive_destination_path: List[str]
+        self,
+        file_name: str,
+        gdrive_destination_path: List[str],
+        parent_folder_id: Optional[str] = None,
     ) -> Optional[str]:
         """
         Upload a file to Google Drive into the specified folder structure.
+        The structure is not prepared again when its parent_folder_id is given.
         """
-        folders_parents_ids = self.create_folder_structure(gdrive_destination_path)
-        parent_folder_id = folders_parents_ids[-1]
-
-        # Share the main folder with the specified user
-        for user_email in self.users_emails:
-            self.share_resource(folders_parents_ids[0], user_email)
+        if parent_folder_id is None:
+            parent_folder_id = self.prepare_folder(gdrive_destination_path)
 
         # Check if the file already exists in the target folder
         if self.file_exists(os.path.basename(file_name), parent_folder_id):
@@ -200,100 +748,535 @@ class GoogleDriveService:
             )
             return None
 
+        # The checksums of an archive are checked, then uploaded next to it
+        checksums = read_checksums(file_name)
+        md5 = checksums.md5 if checksums is not None else None
+        try:
+            uploaded_file = self.upload_to_folder(file_name, parent_folder_id, md5=md5)
+        except HttpError as error:
+            # The cached folder may have been deleted since it was resolved
+            if error.resp.status != 404 or self._folder_exists(
+                parent_folder_id, use_mirror=False
+            ):
+                raise
+            self.logger.warning(
+                f"Folder {'/'.join(gdrive_destination_path)} no longer exists, "
+                "resolving it again"
+            )
+            self.invalidate_folder_structure(gdrive_destination_path)
+            parent_folder_id = self.prepare_folder(gdrive_destination_path)
+            uploaded_file = self.upload_to_folder(file_name, parent_folder_id, md5=md5)
+        if checksums is not None:
+            self.upload_checksums(
+                os.path.basename(file_name), checksums, parent_folder_id
+            )
+        return uploaded_file.get("id")
+
+    @timed_phase("upload")
+    def upload_to_folder(
+        self, file_name: str, parent_folder_id: str, md5: Optional[str] = None
+    ) -> dict:
+        """
+        Upload a file into a Google Drive folder and make it readable by anyone with
+        the link. Safe to call from several threads at once. When the MD5 checksum
+        of the file is given, it is compared with the one computed by Google Drive,
+        see check_uploaded_checksum.
+
+        Returns
+        -------
+        dict
+            The uploaded file resource.
+        """
         try:
             file_metadata = {
                 "name": os.path.basename(file_name),
                 "parents": [parent_folder_id],
             }
-            media = MediaFileUpload(file_name, resumable=True)
-            uploaded_file = (
-                self.service.files()
-                .create(
-                    body=file_metadata,
-                    media_body=media,
-                    fields="id, name, parents, webViewLink, webContentLink",  # project
-                )
-                .execute()
-            )
+            uploaded_file = self._resumable_upload(file_name, file_metadata)
+            if self.metadata_mirror is not None:
+                self.metadata_mirror.record(uploaded_file)
             self.logger.info(str(uploaded_file))
-            self.logger.info(f"File '{file_name}' uploaded successfully. ID: {
-                             uploaded_file.get('id')}")
-
-            self.set_file_permissions(uploaded_file.get("id"))
-            return uploaded_file.get("id")
+            self.logger.info(
+                f"File '{file_name}' uploaded successfully. ID: {uploaded_file.get('id')}"
+            )
+            self.check_uploaded_checksum(uploaded_file, md5)
+            return uploaded_file
 
         except HttpError as error:
             self.logger.error(f"An error occurred during upload: {error}")
             raise
 
-    def set_file_permissions(self, file_id: str):
-        """Set file permissions to 'Anyone with the link'."""
-        try:
-            # Set permissions to make it public
-            permission = {
-                "type": "anyone",
-                "role": "reader",  # Or 'writer' depending on your requirement
+    def _resumable_upload(self, file_name: str, file_metadata: dict) -> dict:
+        """
+        Upload a file chunk by chunk through a resumable upload session.
+
+        The session URI and the acknowledged offset are saved next to the file after
+        every chunk, so an upload interrupted by a crash or a network failure resumes
+        from the last acknowledged byte on the next run instead of starting over.
+
+        Parameters
+        ----------
+        file_name : str
+            The path of the file to upload.
+        file_metadata : dict
+            The metadata of the file to create on Google Drive.
+
+        Returns
+        -------
+        dict
+            The created file resource.
+        """
+        state_path = f"{file_name}.upload.json"
+        stat = os.stat(file_name)
+        media = MediaFileUpload(
+            file_name, chunksize=self.upload_chunk_size, resumable=True
+        )
+        request = self.service.files().create(
+            body=file_metadata,
+            media_body=media,
+            fields=UPLOADED_FILE_FIELDS,
+        )
+
+        response = None
+        state = self._load_upload_state(state_path, stat)
+        if state:
+            try:
+                # Ask the saved session which bytes it stored before the interruption
+                probe, content = self.request_executor.call(
+                    lambda: self._send_upload_request(
+                        state["uri"],
+                        "PUT",
+                        b"",
+                        {"Content-Range": f"bytes */{stat.st_size}"},
+                    ),
+                    "drive.files.create.upload",
+                )
+            except HttpError as error:
+                if error.resp.status not in (404, 410):
+                    raise
+                # The saved session expired, start a new one
+                self.logger.warning(
+                    f"Upload session of '{file_name}' expired, restarting the upload"
+                )
+                os.remove(state_path)
+                return self._resumable_upload(file_name, file_metadata)
+            request.resumable_uri = state["uri"]
+            if probe.status in (200, 201):
+                # The last chunk was stored, only its response was lost
+                response = json.loads(content)
+                request.resumable_progress = stat.st_size
+            else:
+                request.resumable_progress = self._acknowledged_offset(probe)
+            self.logger.info(
+                f"Resuming upload of '{file_name}' from byte "
+                f"{request.resumable_progress}"
+            )
+
+        start_time = time.monotonic()
+        start_progress = request.resumable_progress
+        last_log_time = start_time
+        while response is None:
+            try:
+                # A failed chunk leaves the request in error state: the retry first
+                # asks the server for the acknowledged offset
+                status, response = self.request_executor.call(
+                    lambda: request.next_chunk(http=self._http()),
+                    "drive.files.create.upload",
+                    upload_size=min(
+                        self.upload_chunk_size,
+                        stat.st_size - request.resumable_progress,
+                    ),
+                )
+            except HttpError as error:
+                if state and error.resp.status in (404, 410):
+                    # The saved session expired, start a new one
+                    self.logger.warning(
+                        f"Upload session of '{file_name}' expired, restarting the upload"
+                    )
+                    os.remove(state_path)
+                    return self._resumable_upload(file_name, file_metadata)
+                raise
+            state = {
+                "uri": request.resumable_uri,
+                "progress": request.resumable_progress,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
             }
-            self.service.permissions().create(fileId=file_id, body=permission).execute()
-            self.logger.info(f"Permissions for file {
-                             file_id} set to 'Anyone with the link'")
-        except HttpError as error:
-            self.logger.error(f"An error occurred while setting permissions: {error}")
-            raise
+            with open(state_path, "w") as state_file:
+                json.dump(state, state_file)
+            get_run_metrics().progress(
+                "upload",
+                file=os.path.basename(file_name),
+                sent=request.resumable_progress,
+                total=stat.st_size,
+            )
 
-    def share_resource(
-        self, resource_id: str, email_address: str, role: str = "reader"
-    ):
+            now = time.monotonic()
+            if status and now - last_log_time >= UPLOAD_PROGRESS_LOG_INTERVAL:
+                last_log_time = now
+                throughput = (status.resumable_progress - start_progress) / (
+                    now - start_time
+                )
+                self.logger.info(
+                    f"Uploading '{os.path.basename(file_name)}': "
+                    f"{status.progress() * 100:.1f}% "
+                    f"({human_readable_bytes(status.resumable_progress)} / "
+                    f"{human_readable_bytes(status.total_size)}), "
+                    f"{human_readable_bytes(throughput)}/s"
+                )
+
+        os.remove(state_path)
+        get_run_metrics().add(
+            "upload", bytes_out=stat.st_size - start_progress, files=1
+        )
+        elapsed = time.monotonic() - start_time
+        self.logger.info(
+            f"Uploaded {human_readable_bytes(stat.st_size - start_progress)} in "
+            f"{elapsed:.1f}s"
+        )
+        return response
+
+    def _load_upload_state(self, state_path: str, stat: os.stat_result) -> dict:
+        """
+        Load the state of an interrupted upload of a file, if the file did not change since.
+        """
+        if not os.path.exists(state_path):
+            return {}
+        try:
+            with open(state_path, "r") as state_file:
+                state = json.load(state_file)
+        except json.JSONDecodeError:
+            state = {}
+        if (
+            not state.get("uri")
+            or state.get("size") != stat.st_size
+            or state.get("mtime_ns") != stat.st_mtime_ns
+        ):
+            os.remove(state_path)
+            return {}
+        return state
+
+    @timed_phase("upload")
+    def upload_stream(
+        self, stream: BinaryIO, file_name: str, parent_folder_id: str
+    ) -> dict:
         """
-        Share a Google Drive resource with a specific user by email.
+        Upload data read from a stream while it is being produced, e.g. an archive
+        being compressed, into a Google Drive folder, and make it readable by anyone
+        with the link.
+
+        The upload session is created before the size of the file is known: chunks
+        are sent with an open ended range as soon as they are read, the size being
+        given with the last chunk once the stream ends. Unlike files, a stream can
+        not be resumed by a later run.
+
+        Parameters
+        ----------
+        stream : BinaryIO
+            The stream to upload. Its read(size) must block until size bytes are
+            available, fewer bytes meaning the end of the stream.
+        file_name : str
+            The name of the file to create on Google Drive.
+        parent_folder_id : str
+            The ID of the folder receiving the file.
+
+        Returns
+        -------
+        dict
+            The created file resource.
+        """
+        session_uri = self._start_upload_session(
+            {"name": file_name, "parents": [parent_folder_id]}
+        )
+        start_time = time.monotonic()
+        last_log_time = start_time
+        offset = 0
+        uploaded_file = None
+        while uploaded_file is None:
+            chunk = stream.read(self.upload_chunk_size)
+            # Only the last chunk can be smaller, it may even be empty
+            total_size = (
+                offset + len(chunk) if len(chunk) < self.upload_chunk_size else None
+            )
+            uploaded_file = self._send_stream_chunk(
+                session_uri, chunk, offset, total_size
+            )
+            offset += len(chunk)
+            get_run_metrics().progress(
+                "upload", file=file_name, sent=offset, total=None
+            )
+
+            now = time.monotonic()
+            if now - last_log_time >= UPLOAD_PROGRESS_LOG_INTERVAL:
+                last_log_time = now
+                self.logger.info(
+                    f"Uploading '{file_name}': {human_readable_bytes(offset)} sent, "
+                    f"{human_readable_bytes(offset / (now - start_time))}/s"
+                )
+
+        get_run_metrics().add("upload", bytes_out=offset, files=1)
+        elapsed = time.monotonic() - start_time
+        self.logger.info(
+            f"File '{file_name}' uploaded successfully. ID: {uploaded_file.get('id')}, "
+            f"{human_readable_bytes(offset)} in {elapsed:.1f}s"
+        )
+        if self.metadata_mirror is not None:
+            self.metadata_mirror.record(uploaded_file)
+        return uploaded_file
+
+    def _start_upload_session(self, file_metadata: dict) -> str:
+        """
+        Create a resumable upload session for a file of unknown size.
+
+        Returns
+        -------
+        str
+            The URI of the session, receiving the chunks of the file.
+        """
+        query = urlencode({"uploadType": "resumable", "fields": UPLOADED_FILE_FIELDS})
+        # Retried like an idempotent request: a session creates no file until the
+        # last chunk is sent to it, an extra one expires unused
+        response, _ = self.request_executor.call(
+            lambda: self._send_upload_request(
+                f"{self.upload_url}?{query}",
+                "POST",
+                json.dumps(file_metadata),
+                {
+                    "Content-Type": "application/json; charset=UTF-8",
+                    "X-Upload-Content-Type": "application/octet-stream",
+                },
+            ),
+            "drive.files.create.upload",
+        )
+        return response["location"]
+
+    def _send_stream_chunk(
+        self, session_uri: str, chunk: bytes, offset: int, total_size: Optional[int]
+    ) -> Optional[dict]:
+        """
+        Send a chunk of a streamed file starting at offset, total_size being given
+        with the last chunk only. A failed chunk is sent again from the offset
+        acknowledged by the server.
+
+        Returns
+        -------
+        Optional[dict]
+            The created file resource once the last chunk is stored, None before.
+        """
+        size = "*" if total_size is None else str(total_size)
+        acknowledged = offset
+        failed = False
+
+        def send():
+            nonlocal acknowledged, failed
+            if failed:
+                # Ask the server which bytes it stored before the failure
+                response, content = self._send_upload_request(
+                    session_uri, "PUT", b"", {"Content-Range": f"bytes */{size}"}
+                )
+                if response.status in (200, 201):
+                    return response, content
+                acknowledged = self._acknowledged_offset(response)
+            failed = True
+            data = chunk[acknowledged - offset :]
+            content_range = (
+                f"bytes {acknowledged}-{acknowledged + len(data) - 1}/{size}"
+                if data
+                else f"bytes */{size}"
+            )
+            result = self._send_upload_request(
+                session_uri, "PUT", data, {"Content-Range": content_range}
+            )
+            failed = False
+            return result
+
+        while True:
+            response, content = self.request_executor.call(
+                send, "drive.files.create.upload", upload_size=len(chunk)
+            )
+            if response.status in (200, 201):
+                return json.loads(content)
+            acknowledged = self._acknowledged_offset(response)
+            if acknowledged >= offset + len(chunk):
+                return None
+            # Part of the chunk was not stored, send it again
+
+    def _send_upload_request(self, uri: str, method: str, body, headers: dict) -> tuple:
+        """
+        Send a request of the resumable upload protocol, raising HttpError on error
+        responses. 308 means the session expects more data.
+        """
+        response, content = self._http().request(
+            uri,
+            method,
+            body=body,
+            headers={"Content-Length": str(len(body)), **headers},
+        )
+        if response.status >= 400:
+            raise HttpError(response, content, uri=uri)
+        return response, content
+
+    @staticmethod
+    def _acknowledged_offset(response) -> int:
+        """
+        The number of bytes stored by a resumable upload session, from the Range
+        header of a 308 response, e.g. "bytes=0-1048575".
+        """
+        stored_range = response.get("range")
+        if not stored_range:
+            return 0
+        return int(stored_range.rsplit("-", 1)[1]) + 1
+
+    @timed_phase("sharing")
+    def reconcile_permissions(
+        self, resource_id: str, users_roles: Dict[str, str]
+    ) -> int:
+        """
+        Share a Google Drive resource with users, each one with their role.
+
+        The permissions of the resource are listed once, and the missing ones are
+        created, or raised to the role of the user, in a single batch request. A
+        role is never lowered nor a permission removed, e.g. one given by hand. The
+        result is cached, so a resource already shared the same way costs no
+        request until it is checked again, after RECHECK_INTERVAL. A permission
+        failing to be created with a server error may exist anyway: rather than
+        being created again, the permissions are listed again and only the missing
+        ones are retried.
 
         Parameters
         ----------
         resource_id : str
             The ID of the Google Drive resource to share (file/folder).
-        email_address : str
-            The email address of the user to share the resource with.
-        role : str, optional
-            The permission role to be granted to the user. Default is 'reader'.
+        users_roles : Dict[str, str]
+            The role of each user, by email: 'reader', 'commenter' or 'writer'.
+            ANYONE stands for anyone with the link.
 
         Returns
         -------
-        None
-            This function does not return anything, but logs the sharing action
-            or any errors encountered during the process.
+        int
+            The number of permissions created or updated.
+            Errors left after the retries are logged and raised.
         """
-        try:
-            # Check if the user already has access
-            permissions = (
-                self.service.permissions()
-                .list(fileId=resource_id, fields="permissions(emailAddress, role)")
-                .execute()
-            )
-            for permission in permissions.get("permissions", []):
-                print(permission.get("emailAddress"))
-                if str(permission.get("emailAddress")).lower() == email_address.lower():
-                    self.logger.info(
-                        f"Resource {resource_id} already shared with {email_address}."
+        if self.permission_cache is not None and self.permission_cache.is_shared(
+            resource_id, users_roles
+        ):
+            return 0
+
+        # Creations failing with a server error may have been carried out anyway:
+        # instead of being sent again, they are checked by listing once more
+        for attempt in range(self.request_executor.max_retries + 1):
+            current_permissions = self._list_permissions(resource_id)
+            changes = []
+            for email_address, role in users_roles.items():
+                permission = current_permissions.get(email_address.lower())
+                if permission is None:
+                    request = self.service.permissions().create(
+                        fileId=resource_id,
+                        body=(
+                            {"type": "anyone", "role": role}
+                            if email_address == ANYONE
+                            else {
+                                "type": "user",
+                                "role": role,
+                                "emailAddress": email_address,
+                            }
+                        ),
+                        fields="id",
                     )
-                    return
-
-            # Set the permissions
-            permission = {
-                # Type of user (can be user, group, domain, or anyone)
-                "type": "user",
-                # 'reader' (view), 'writer' (edit), or 'owner' (transfer ownership)
-                "role": role,
-                "emailAddress": email_address,  # The email address to share the file with
-            }
+                elif role_rank(permission["role"]) < role_rank(role):
+                    request = self.service.permissions().update(
+                        fileId=resource_id,
+                        permissionId=permission["id"],
+                        body={"role": role},
+                        fields="id",
+                    )
+                else:
+                    continue
+                changes.append((email_address, role, request))
 
-            # Create a permission object and apply it
-            self.service.permissions().create(
-                fileId=resource_id, body=permission, fields="id"
-            ).execute()
-            self.logger.info(
-                f"Resource {resource_id} shared with {email_address} as {role}."
+            errors = []
+            if changes:
+                results = self.request_executor.execute_batch(
+                    self.service.new_batch_http_request,
+                    [
+                        (str(position), change[2])
+                        for position, change in enumerate(changes)
+                    ],
+                    "drive.permissions.batch",
+                )
+                for request_id, (_, exception) in results.items():
+                    email_address, role, _ = changes[int(request_id)]
+                    if exception is not None:
+                        self.logger.error(
+                            f"An error occurred while sharing {resource_id} with "
+                            f"{email_address}: {exception}"
+                        )
+                        errors.append(exception)
+                    else:
+                        self.logger.info(
+                            f"Resource {resource_id} shared with {email_address} "
+                            f"as {role}."
+                        )
+            if not errors:
+                break
+            if attempt == self.request_executor.max_retries or not all(
+                may_have_succeeded(error) for error in errors
+            ):
+                self._invalidate_permissions(resource_id)
+                raise errors[0]
+            delay = self.request_executor.backoff_delay(errors[0], attempt + 1)
+            self.logger.warning(
+                f"Listing the permissions of {resource_id} again in {delay:.1f}s to "
+                "check the failed ones."
             )
+            time.sleep(delay)
 
-        except HttpError as error:
-            self.logger.error(f"An error occurred: {error}")
-            return None
+        if self.permission_cache is not None:
+            roles = {
+                email_address: permission["role"]
+                for email_address, permission in current_permissions.items()
+            }
+            for email_address, role, _ in changes:
+                roles[email_address.lower()] = role
+            self.permission_cache.set_shared(resource_id, roles)
+        return len(changes)
+
+    def _list_permissions(self, resource_id: str) -> Dict[str, dict]:
+        """
+        The permissions given to users on a Google Drive resource, by lowercase
+        email, and to anyone with the link, by ANYONE.
+        """
+        permissions = {}
+        page_token = None
+        try:
+            while True:
+                results = self.request_executor.execute(
+                    self.service.permissions().list(
+                        fileId=resource_id,
+                        pageToken=page_token,
+                        fields=(
+                            "nextPageToken, permissions(id, type, emailAddress, role)"
+                        ),
+                    )
+                )
+                for permission in results.get("permissions", []):
+                    if permission.get("type") == "anyone":
+                        permissions[ANYONE] = permission
+                    elif permission.get("emailAddress"):
+                        permissions[permission["emailAddress"].lower()] = permission
+                page_token = results.get("nextPageToken")
+                if not page_token:
+                    break
+        except HttpError:
+            # e.g. the resource was deleted, or access to it was lost
+            self._invalidate_permissions(resource_id)
+            raise
+        return permissions
+
+    def _invalidate_permissions(self, resource_id: str) -> None:
+        """
+        Forget the cached sharing of a resource, read again from Google Drive on its
+        next reconciliation.
+        """
+        if self.permission_cache is not None:
+            self.permission_cache.invalidate(resource_id)
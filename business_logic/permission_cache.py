@@ -0,0 +1,81 @@
+import json
+import os
+import threading
+
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+# Roles of Google Drive from the lowest to the highest, a role including the lower ones
+ROLES = ("reader", "commenter", "writer", "fileOrganizer", "organizer", "owner")
+# Reconciled permissions are checked against Google Drive again after this delay, so
+# a permission removed by hand is granted again
+RECHECK_INTERVAL = timedelta(days=1)
+# Stands for anyone with the link among the users, e.g. {"anyone": "reader"}, as it
+# can not be an email address
+ANYONE = "anyone"
+
+
+def role_rank(role: str) -> int:
+    return ROLES.index(role) if role in ROLES else -1
+
+
+class PermissionCache:
+    """
+    Persistent cache of the roles the users are known to have on Google Drive
+    resources, e.g. the main folder of a destination path, so an unchanged run
+    needs no permission request.
+    """
+
+    def __init__(self, cache_path: Optional[str] = None):
+        self.cache_path = cache_path
+        self._lock = threading.Lock()
+        self._resources: dict = {}
+        if cache_path and os.path.exists(cache_path):
+            try:
+                with open(cache_path, "r") as cache_file:
+                    self._resources = json.load(cache_file)
+            except json.JSONDecodeError:
+                self._resources = {}
+
+    def is_shared(self, resource_id: str, users_roles: Dict[str, str]) -> bool:
+        """
+        Whether every user had at least their role on the resource when it was last
+        reconciled, less than RECHECK_INTERVAL ago.
+        """
+        with self._lock:
+            entry = self._resources.get(resource_id)
+        if entry is None:
+            return False
+        if datetime.now() - datetime.fromisoformat(entry["checkedAt"]) > (
+            RECHECK_INTERVAL
+        ):
+            return False
+        return all(
+            role_rank(entry["roles"].get(email.lower(), "")) >= role_rank(role)
+            for email, role in users_roles.items()
+        )
+
+    def set_shared(self, resource_id: str, users_roles: Dict[str, str]) -> None:
+        """
+        Record the roles of the users having access to the resource, as just read
+        from Google Drive and reconciled.
+        """
+        with self._lock:
+            self._resources[resource_id] = {
+                "roles": {email.lower(): role for email, role in users_roles.items()},
+                "checkedAt": datetime.now().isoformat(),
+            }
+            self._save()
+
+    def invalidate(self, resource_id: str) -> None:
+        with self._lock:
+            self._resources.pop(resource_id, None)
+            self._save()
+
+    def _save(self) -> None:
+        if not self.cache_path:
+            return
+        temporary_path = f"{self.cache_path}.tmp"
+        with open(temporary_path, "w") as cache_file:
+            json.dump(self._resources, cache_file, indent=2)
+        os.replace(temporary_path, self.cache_path)
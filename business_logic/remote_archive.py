@@ -0,0 +1,327 @@
+import json
+import re
+import threading
+
+from collections import deque
+from concurrent.futures import Executor
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple, TYPE_CHECKING
+from utils.compression import decompress_chunks
+from utils.encryption import HEADER_SIZE, ArchiveCipher, is_encrypted
+from utils.zip import (
+    END_OF_CENTRAL_DIRECTORY_SIZE,
+    LOCAL_FILE_HEADER_SIZE,
+    MAX_COMMENT_SIZE,
+    ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIZE,
+    ZIP64_END_OF_CENTRAL_DIRECTORY_SIZE,
+    ZipEntry,
+    find_central_directory,
+    local_header_size,
+    parse_central_directory,
+)
+
+if TYPE_CHECKING:
+    # The Google API client is only imported once Google Drive is needed
+    from business_logic.gdrive_service import GoogleDriveService
+
+# Suffix of the manifest listing the volumes of a split archive, after its name
+VOLUMES_MANIFEST_SUFFIX = ".volumes.json"
+# Size of the ranged downloads reading the data of the members
+READ_SIZE = 8 * 1024 * 1024
+# The last bytes of an archive always hold its end of central directory records
+TAIL_SIZE = (
+    MAX_COMMENT_SIZE
+    + END_OF_CENTRAL_DIRECTORY_SIZE
+    + ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIZE
+    + ZIP64_END_OF_CENTRAL_DIRECTORY_SIZE
+)
+# The archives written by backup2gdrive have no comment, so the end of the archive
+# is read first and TAIL_SIZE bytes only when it holds no end of central directory.
+# Most central directories fit in it, so listing an archive costs a single download
+# after the one of its header
+FIRST_TAIL_SIZE = 16 * 1024
+# Room left for the extra field of a local header, read with the start of the data
+LOCAL_EXTRA_ALLOWANCE = 64
+
+
+class ArchivePart(NamedTuple):
+    """
+    A file of an archive on Google Drive: the whole archive, or one of its volumes.
+    """
+
+    file_id: str
+    size: int
+
+
+class RemoteArchive:
+    """
+    A zip archive stored on Google Drive, as a single file or as the volumes of a
+    split archive, read with ranged downloads without downloading it whole.
+
+    The central directory is read from the end of the archive, then the data of
+    a member is read from the offset of its local header, a range spanning several
+    volumes being read from each of them. Safe to read from several threads at once.
+
+    An encrypted archive, see utils.encryption, is recognized by its header and
+    read with the key: offsets and sizes are the ones of the decrypted archive, and
+    a range is read from the frames holding it, decrypted on the way.
+    """
+
+    def __init__(
+        self,
+        service: "GoogleDriveService",
+        parts: List[ArchivePart],
+        key: Optional[bytes] = None,
+    ):
+        if not parts:
+            raise ValueError("An archive has at least one part")
+        self.service = service
+        self.parts = parts
+        self.key = key
+        # Size of the archive as stored, encrypted or not
+        self.stored_size = sum(part.size for part in parts)
+        self.bytes_read = 0
+        self._lock = threading.Lock()
+        self._entries: Optional[List[ZipEntry]] = None
+        self._cipher: Optional[ArchiveCipher] = None
+        self._header_read = False
+
+    @property
+    def cipher(self) -> Optional[ArchiveCipher]:
+        """
+        The cipher of an encrypted archive, None for a plain one. Costs a download
+        of its header the first time.
+
+        Raises
+        ------
+        ValueError
+            When the archive is encrypted and there is no key.
+        """
+        if not self._header_read:
+            header = b"".join(self._iter_stored(0, HEADER_SIZE, HEADER_SIZE, None, 0))
+            if is_encrypted(header):
+                if self.key is None:
+                    raise ValueError(
+                        "The archive is encrypted, no encryption key given"
+                    )
+                self._cipher = ArchiveCipher.from_header(self.key, header)
+            self._header_read = True
+        return self._cipher
+
+    @property
+    def size(self) -> int:
+        """
+        The size of the archive, once decrypted.
+        """
+        if self.cipher is None:
+            return self.stored_size
+        return self.cipher.plaintext_size(self.stored_size)
+
+    def read(self, offset: int, length: int) -> bytes:
+        """
+        Read length bytes from offset, fewer at the end of the archive.
+        """
+        return b"".join(self.iter_range(offset, length, length))
+
+    def iter_range(
+        self,
+        offset: int,
+        length: int,
+        read_size: int = READ_SIZE,
+        executor: Optional[Executor] = None,
+        read_ahead: int = 0,
+    ) -> Iterator[bytes]:
+        """
+        Read length bytes from offset, by ranged downloads of up to read_size bytes.
+        With an executor, the next read_ahead downloads are sent while the data
+        already read is consumed.
+        """
+        cipher = self.cipher
+        if cipher is None:
+            yield from self._iter_stored(
+                offset, length, read_size, executor, read_ahead
+            )
+            return
+        end = min(offset + length, self.size)
+        if end <= offset:
+            return
+        # Whole frames are downloaded, at least one per download
+        first_frame = offset // cipher.chunk_size
+        last_frame = (end - 1) // cipher.chunk_size
+        stored_offset = HEADER_SIZE + first_frame * cipher.frame_size
+        stored_end = min(
+            HEADER_SIZE + (last_frame + 1) * cipher.frame_size, self.stored_size
+        )
+        frames = self._iter_stored(
+            stored_offset,
+            stored_end - stored_offset,
+            max(read_size // cipher.chunk_size, 1) * cipher.frame_size,
+            executor,
+            read_ahead,
+        )
+        position = first_frame * cipher.chunk_size
+        for chunk in cipher.decrypt_frames(
+            frames, first_frame, cipher.frame_count(self.stored_size)
+        ):
+            start = max(offset - position, 0)
+            stop = min(end - position, len(chunk))
+            position += len(chunk)
+            if start < stop:
+                yield chunk[start:stop]
+
+    def _iter_stored(
+        self,
+        offset: int,
+        length: int,
+        read_size: int,
+        executor: Optional[Executor],
+        read_ahead: int,
+    ) -> Iterator[bytes]:
+        # Reads the archive as stored, see iter_range
+        ranges = self._ranges(offset, length, read_size)
+        if executor is None or read_ahead < 1:
+            for file_id, start, end in ranges:
+                yield self._download(file_id, start, end)
+            return
+        pending = deque()
+        for file_id, start, end in ranges:
+            pending.append(executor.submit(self._download, file_id, start, end))
+            if len(pending) > read_ahead:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def _ranges(
+        self, offset: int, length: int, read_size: int
+    ) -> Iterator[Tuple[str, int, int]]:
+        # The file ID, first and last bytes of each download
+        end = min(offset + length, self.stored_size)
+        part_start = 0
+        for part in self.parts:
+            part_end = part_start + part.size
+            position = max(offset, part_start)
+            while position < min(end, part_end):
+                read_end = min(position + read_size, end, part_end)
+                yield part.file_id, position - part_start, read_end - part_start - 1
+                position = read_end
+            part_start = part_end
+
+    def _download(self, file_id: str, start: int, end: int) -> bytes:
+        data = self.service.download(file_id, start, end)
+        with self._lock:
+            self.bytes_read += len(data)
+        return data
+
+    def entries(self) -> List[ZipEntry]:
+        """
+        The members of the archive, read from its central directory.
+        """
+        if self._entries is None:
+            tail_offset = max(self.size - FIRST_TAIL_SIZE, 0)
+            tail = self.read(tail_offset, self.size - tail_offset)
+            try:
+                directory_offset, directory_size = find_central_directory(
+                    tail, self.size
+                )
+            except ValueError:
+                if tail_offset == 0:
+                    raise
+                tail_offset = max(self.size - TAIL_SIZE, 0)
+                tail = self.read(tail_offset, self.size - tail_offset)
+                directory_offset, directory_size = find_central_directory(
+                    tail, self.size
+                )
+            if directory_offset >= tail_offset:
+                start = directory_offset - tail_offset
+                directory = tail[start : start + directory_size]
+            else:
+                directory = self.read(directory_offset, directory_size)
+            self._entries = parse_central_directory(directory)
+        return self._entries
+
+    def iter_member(
+        self,
+        entry: ZipEntry,
+        read_size: int = READ_SIZE,
+        executor: Optional[Executor] = None,
+        read_ahead: int = 0,
+    ) -> Iterator[bytes]:
+        """
+        Read and decompress the content of a member, chunk by chunk, see iter_range.
+        The local header is read with the start of the data, so a small member
+        costs a single download.
+        """
+        first_read = self.read(
+            entry.header_offset,
+            LOCAL_FILE_HEADER_SIZE
+            + len(entry.arcname.encode("utf-8"))
+            + LOCAL_EXTRA_ALLOWANCE
+            + min(entry.compress_size, read_size),
+        )
+        header_size = local_header_size(first_read)
+        data_offset = entry.header_offset + header_size
+        head = first_read[header_size : header_size + entry.compress_size]
+
+        def chunks() -> Iterator[bytes]:
+            yield head
+            yield from self.iter_range(
+                data_offset + len(head),
+                entry.compress_size - len(head),
+                read_size,
+                executor,
+                read_ahead,
+            )
+
+        yield from decompress_chunks(entry.method, chunks())
+
+
+def archive_names(files: List[dict], name_pattern: re.Pattern) -> List[str]:
+    """
+    The names of the archives among the files of a folder whose name starts with
+    name_pattern, see backup_name_pattern, in order: the zip files, and the split
+    archives listed by their volumes manifest.
+    """
+    names = set()
+    for stored_file in files:
+        name = stored_file["name"]
+        if not name_pattern.match(name):
+            continue
+        if name.endswith(".zip"):
+            names.add(name)
+        elif name.endswith(f".zip{VOLUMES_MANIFEST_SUFFIX}"):
+            names.add(name.removesuffix(VOLUMES_MANIFEST_SUFFIX))
+    return sorted(names)
+
+
+def open_archive(
+    service: "GoogleDriveService",
+    files: Dict[str, dict],
+    name: str,
+    key: Optional[bytes] = None,
+) -> RemoteArchive:
+    """
+    Open an archive of a folder whose files are given by name, a split archive
+    being read from the volumes listed by its manifest. key decrypts an
+    encrypted archive.
+
+    Raises
+    ------
+    FileNotFoundError
+        When the archive, or one of its volumes, is not in the folder.
+    """
+    if name in files:
+        stored_file = files[name]
+        return RemoteArchive(
+            service,
+            [ArchivePart(stored_file["id"], int(stored_file.get("size", 0)))],
+            key,
+        )
+    manifest_file = files.get(f"{name}{VOLUMES_MANIFEST_SUFFIX}")
+    if manifest_file is None:
+        raise FileNotFoundError(f"No archive named '{name}'")
+    manifest = json.loads(service.download(manifest_file["id"]))
+    parts = []
+    for volume in manifest["volumes"]:
+        if volume["name"] not in files:
+            raise FileNotFoundError(f"Volume '{volume['name']}' of '{name}' is missing")
+        parts.append(ArchivePart(files[volume["name"]]["id"], volume["size"]))
+    return RemoteArchive(service, parts, key)
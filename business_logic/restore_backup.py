@@ -0,0 +1,117 @@
+import fnmatch
+import os
+import zlib
+
+from business_logic.remote_archive import RemoteArchive
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from utils.human_readable_bytes import human_readable_bytes
+from utils.logger import get_logger
+from utils.zip import ZipEntry
+
+# Downloads sent ahead of the decompression of each member
+READ_AHEAD = 2
+
+
+def select_members(entries: List[ZipEntry], patterns: List[str]) -> List[ZipEntry]:
+    """
+    The members whose name matches one of the glob patterns, e.g. "mysql/*.sql",
+    every member without pattern.
+    """
+    if not patterns:
+        return list(entries)
+    return [
+        entry
+        for entry in entries
+        if any(fnmatch.fnmatchcase(entry.arcname, pattern) for pattern in patterns)
+    ]
+
+
+def member_path(output_dir: str, arcname: str) -> str:
+    """
+    The path a member is restored to, under output_dir.
+
+    Raises
+    ------
+    ValueError
+        When the name of the member would escape output_dir, e.g. "../x".
+    """
+    path = os.path.normpath(os.path.join(output_dir, arcname))
+    if os.path.isabs(arcname) or os.path.commonpath(
+        [path, os.path.normpath(output_dir)]
+    ) != os.path.normpath(output_dir):
+        raise ValueError(f"'{arcname}' is outside of the restore folder")
+    return path
+
+
+class BackupRestorer:
+    """
+    Restores members of an archive stored on Google Drive to a local folder,
+    downloading only their compressed data.
+
+    Members are restored by `parallel` threads at once, each one streaming its
+    member to disk through the decompression while the next ranges of the member
+    are downloaded. A member is written next to its destination with a ".part"
+    suffix, renamed once its CRC-32 and size are checked, then given back its
+    modification time and permissions.
+    """
+
+    def __init__(self, archive: RemoteArchive, output_dir: str, parallel: int = 4):
+        if parallel < 1:
+            raise ValueError("parallel must be positive")
+        self.archive = archive
+        self.output_dir = output_dir
+        self.parallel = parallel
+        self.logger = get_logger("backup2gdrive")
+
+    def restore(self, entries: List[ZipEntry]) -> int:
+        """
+        Restore members of the archive.
+
+        Returns
+        -------
+        int
+            The number of bytes restored.
+        """
+        # Members and their downloads get separate pools, so that members waiting
+        # for their downloads never hold every thread
+        with ThreadPoolExecutor(
+            max_workers=self.parallel, thread_name_prefix="restore"
+        ) as members, ThreadPoolExecutor(
+            max_workers=self.parallel * READ_AHEAD, thread_name_prefix="download"
+        ) as downloads:
+            futures = [
+                members.submit(self._restore_member, entry, downloads)
+                for entry in entries
+            ]
+            return sum(future.result() for future in futures)
+
+    def _restore_member(self, entry: ZipEntry, downloads: ThreadPoolExecutor) -> int:
+        path = member_path(self.output_dir, entry.arcname)
+        if entry.arcname.endswith("/"):
+            os.makedirs(path, exist_ok=True)
+            return 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial_path = f"{path}.part"
+        crc = 0
+        size = 0
+        try:
+            with open(partial_path, "wb") as output:
+                for data in self.archive.iter_member(
+                    entry, executor=downloads, read_ahead=READ_AHEAD
+                ):
+                    crc = zlib.crc32(data, crc)
+                    size += len(data)
+                    output.write(data)
+            if crc != entry.crc or size != entry.file_size:
+                raise ValueError(f"'{entry.arcname}' is corrupted in the archive")
+            os.replace(partial_path, path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        os.utime(path, (entry.mtime, entry.mtime))
+        if entry.mode & 0o777:
+            os.chmod(path, entry.mode & 0o777)
+        self.logger.info(f"Restored {path} ({human_readable_bytes(size)})")
+        return size
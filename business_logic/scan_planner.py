@@ -0,0 +1,115 @@
+import os
+
+from typing import Iterator, List, Optional, Tuple
+
+from models.files_to_backup import FilesToBackup
+from utils.file_discovery import DiscoveredFile, FileMatcher, iter_files
+
+
+class ScanGroup:
+    """
+    The paths to backup sharing a folder, scanned once for all of them.
+
+    A file is routed to every path to backup selecting it. A directory is only
+    pruned when no path to backup needs it, and it is scanned as deep as the deepest
+    path to backup requires.
+    """
+
+    def __init__(self, folder_path: str, follow_symlinks: bool):
+        self.folder_path = folder_path
+        self.follow_symlinks = follow_symlinks
+        self.paths_to_backup: List[FilesToBackup] = []
+        self._matchers: List[FileMatcher] = []
+        self._max_depths: List[Optional[int]] = []
+
+    def add(self, path_to_backup: FilesToBackup) -> None:
+        self.paths_to_backup.append(path_to_backup)
+        self._matchers.append(
+            FileMatcher(path_to_backup.filter_file, path_to_backup.exclude)
+        )
+        self._max_depths.append(
+            path_to_backup.max_depth if path_to_backup.recursive else 0
+        )
+
+    @property
+    def max_depth(self) -> Optional[int]:
+        if any(max_depth is None for max_depth in self._max_depths):
+            return None
+        return max(self._max_depths)
+
+    def is_excluded(self, relative_path: str) -> bool:
+        depth = relative_path.count("/") + 1
+        return all(
+            (max_depth is not None and depth > max_depth)
+            or _is_excluded_tree(matcher, relative_path)
+            for matcher, max_depth in zip(self._matchers, self._max_depths)
+        )
+
+    def matches(self, name: str, relative_path: str) -> bool:
+        return bool(self.routes(name, relative_path))
+
+    def routes(self, name: str, relative_path: str) -> List[FilesToBackup]:
+        """
+        The paths to backup selecting a file, in the order of the config. A file in a
+        directory excluded by a path to backup is not routed to it, even though the
+        directory is scanned for another one.
+        """
+        depth = relative_path.count("/")
+        directory = relative_path.rpartition("/")[0]
+        return [
+            path_to_backup
+            for path_to_backup, matcher, max_depth in zip(
+                self.paths_to_backup, self._matchers, self._max_depths
+            )
+            if (max_depth is None or depth <= max_depth)
+            and matcher.matches(name, relative_path)
+            and not (directory and _is_excluded_tree(matcher, directory))
+        ]
+
+    def scan(self) -> Iterator[Tuple[DiscoveredFile, List[FilesToBackup]]]:
+        """
+        Yields each selected file of the folder with the paths to backup selecting it.
+        """
+        for file in iter_files(
+            self.folder_path, self, self.max_depth, self.follow_symlinks
+        ):
+            name = file.relative_path.rsplit("/", 1)[-1]
+            yield file, self.routes(name, file.relative_path)
+
+
+def _is_excluded_tree(matcher: FileMatcher, relative_path: str) -> bool:
+    """
+    Whether a directory or one of its parents is excluded by a matcher, which would
+    not have scanned it when scanning the folder on its own.
+    """
+    parts = relative_path.split("/")
+    return any(
+        matcher.is_excluded("/".join(parts[:end])) for end in range(1, len(parts) + 1)
+    )
+
+
+def plan_scans(paths_to_backup: List[FilesToBackup]) -> List[ScanGroup]:
+    """
+    Groups the paths to backup by folder, so that each folder is scanned once however
+    many paths to backup filter its files.
+
+    Parameters
+    ----------
+    paths_to_backup : List[FilesToBackup]
+        The paths to backup.
+
+    Returns
+    -------
+    List[ScanGroup]
+        The folders to scan, in the order they first appear in paths_to_backup.
+    """
+    groups = {}
+    for path_to_backup in paths_to_backup:
+        if not isinstance(path_to_backup, FilesToBackup):
+            raise TypeError("path_to_backup must be a FilesToBackup object")
+        folder_path = os.path.normpath(path_to_backup.folder_path)
+        key = (os.path.normcase(folder_path), path_to_backup.follow_symlinks)
+        if key not in groups:
+            groups[key] = ScanGroup(folder_path, path_to_backup.follow_symlinks)
+        groups[key].add(path_to_backup)
+    return list(groups.values())
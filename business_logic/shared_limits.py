@@ -0,0 +1,115 @@
+import threading
+
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+from models.limits import Limits
+from typing import Dict, Iterator, Optional
+from utils.fair_share import FairRateLimiter, FairShare, FairShareExecutor
+from utils.priority import lower_priority
+
+
+class SharedLimits:
+    """
+    Budgets shared by the projects backed up at the same time in one process: the
+    upload bandwidth, the Google Drive requests and the compression processes.
+
+    Each budget is shared in fair share order between the projects using it, so a
+    project with many files, volumes or workers can not starve the others.
+    """
+
+    def __init__(self, limits: Limits):
+        self.limits = limits
+        self.upload_bandwidth = (
+            FairRateLimiter(limits.upload_mb_per_second * 1024 * 1024)
+            if limits.upload_mb_per_second
+            else None
+        )
+        self.drive_requests = (
+            FairRateLimiter(limits.drive_requests_per_second)
+            if limits.drive_requests_per_second
+            else None
+        )
+        self.drive_slots = (
+            FairShare(limits.drive_max_concurrent_requests)
+            if limits.drive_max_concurrent_requests
+            else None
+        )
+        # A task waits in the queue of the pool for each worker, so that workers
+        # never wait for the next submission
+        self.compression_slots = FairShare(2 * limits.compression_workers)
+        # The pools of the projects with a low priority and of the other ones, by
+        # priority. Both share the compression slots
+        self._compression_pools: Dict[bool, ProcessPoolExecutor] = {}
+        self._lock = threading.Lock()
+
+    def compression_pool(self, low_priority: bool = False) -> ProcessPoolExecutor:
+        """
+        The processes compressing the archives, with a low CPU and I/O priority or
+        not, started on first use.
+        """
+        with self._lock:
+            if low_priority not in self._compression_pools:
+                self._compression_pools[low_priority] = ProcessPoolExecutor(
+                    max_workers=self.limits.compression_workers,
+                    initializer=lower_priority if low_priority else None,
+                )
+            return self._compression_pools[low_priority]
+
+    def for_project(self, project_name: str) -> "ProjectLimits":
+        return ProjectLimits(self, project_name)
+
+    def close(self) -> None:
+        with self._lock:
+            for pool in self._compression_pools.values():
+                pool.shutdown(cancel_futures=True)
+            self._compression_pools = {}
+
+
+class ProjectLimits:
+    """
+    The share of a project of the shared limits.
+    """
+
+    def __init__(self, shared_limits: SharedLimits, project_name: str):
+        self.shared_limits = shared_limits
+        self.project_name = project_name
+
+    def acquire_requests(self, cost: int = 1) -> None:
+        """
+        Wait for the turn of the project to send cost Google Drive requests.
+        """
+        if self.shared_limits.drive_requests is not None:
+            self.shared_limits.drive_requests.acquire(self.project_name, cost)
+
+    def acquire_upload(self, size: int) -> None:
+        """
+        Wait for the turn of the project to upload size bytes.
+        """
+        if self.shared_limits.upload_bandwidth is not None:
+            self.shared_limits.upload_bandwidth.acquire(self.project_name, size)
+
+    @contextmanager
+    def drive_request_slot(self) -> Iterator[None]:
+        """
+        Hold one of the Google Drive requests in flight while sending one.
+        """
+        slots = self.shared_limits.drive_slots
+        with slots.slot(self.project_name) if slots is not None else nullcontext():
+            yield
+
+    def compression_executor(
+        self, workers: int, low_priority: bool = False
+    ) -> Optional[Executor]:
+        """
+        The pool compressing the archive of a project configured with workers
+        processes, at most workers blocks at once, None when it compresses inline.
+        A project with a low priority always compresses in the low priority pool.
+        """
+        if workers <= 1 and not low_priority:
+            return None
+        return FairShareExecutor(
+            self.shared_limits.compression_pool(low_priority),
+            self.shared_limits.compression_slots,
+            self.project_name,
+            max_tasks=workers,
+        )
@@ -0,0 +1,68 @@
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from models.config import Config
+from models.throttle_window import ThrottleWindow
+from utils.throttle import Throttle
+
+MB = 1024 * 1024
+
+
+def scheduled_rate(
+    mb_per_second: Optional[float], windows: List[ThrottleWindow], attribute: str
+) -> Callable[[], Optional[float]]:
+    """
+    The schedule of a rate, in bytes per second: the rate of the first window
+    containing the current time which sets attribute, else mb_per_second.
+    None means unlimited.
+    """
+
+    def rate() -> Optional[float]:
+        now = datetime.now().time()
+        for window in windows:
+            window_mb_per_second = getattr(window, attribute)
+            if window_mb_per_second is not None and window.contains(now):
+                return window_mb_per_second * MB
+        return mb_per_second * MB if mb_per_second else None
+
+    return rate
+
+
+def disk_read_throttle(config: Config) -> Optional[Throttle]:
+    """
+    The throttle of the files read by the archiver of a project, adapting its rate
+    to the disk latency when a threshold is set. None when the reads are unlimited.
+    """
+    if config.disk_read_mb_per_second is None and not any(
+        window.disk_read_mb_per_second for window in config.throttle_windows
+    ):
+        return None
+    return Throttle(
+        scheduled_rate(
+            config.disk_read_mb_per_second,
+            config.throttle_windows,
+            "disk_read_mb_per_second",
+        ),
+        latency_threshold=(
+            config.disk_latency_threshold_ms / 1000
+            if config.disk_latency_threshold_ms
+            else None
+        ),
+    )
+
+
+def upload_throttle(config: Config) -> Optional[Throttle]:
+    """
+    The throttle of the bytes uploaded by a project, None when they are unlimited.
+    """
+    if config.upload_mb_per_second is None and not any(
+        window.upload_mb_per_second for window in config.throttle_windows
+    ):
+        return None
+    return Throttle(
+        scheduled_rate(
+            config.upload_mb_per_second,
+            config.throttle_windows,
+            "upload_mb_per_second",
+        )
+    )
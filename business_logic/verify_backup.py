@@ -0,0 +1,152 @@
+import json
+import random
+import re
+import zlib
+
+from business_logic.remote_archive import (
+    VOLUMES_MANIFEST_SUFFIX,
+    ArchivePart,
+    RemoteArchive,
+)
+from googleapiclient.errors import HttpError
+from typing import Dict, List, Optional, TYPE_CHECKING
+from utils.checksum import CHECKSUMS_SUFFIX, parse_checksums
+from utils.logger import get_logger
+from utils.metrics import timed_phase
+
+if TYPE_CHECKING:
+    from business_logic.gdrive_service import GoogleDriveService
+
+# Members larger than this are not sampled, so a spot check downloads little
+MAX_SAMPLED_MEMBER_SIZE = 64 * 1024 * 1024
+
+
+class BackupVerifier:
+    """
+    Spot checks the archives of a project stored on Google Drive, without
+    downloading them whole.
+
+    The MD5 checksum Google Drive computed for each archive, or each of its volumes,
+    is compared with the one computed while the archive was written, read from its
+    sidecar file or its volumes manifest. The central directory of the archive is
+    then read with ranged downloads, and a random sample of its members is
+    downloaded and decompressed, their CRC-32 and size being checked.
+    """
+
+    def __init__(
+        self,
+        service: "GoogleDriveService",
+        sample_size: int,
+        rng: Optional[random.Random] = None,
+        key: Optional[bytes] = None,
+    ):
+        self.service = service
+        self.sample_size = sample_size
+        self.rng = rng or random.Random()
+        # Decrypts the encrypted archives, whose content is only checked with it
+        self.key = key
+        self.logger = get_logger("backup2gdrive")
+
+    @timed_phase("verify")
+    def verify_folder(
+        self, parent_folder_id: str, name_pattern: re.Pattern
+    ) -> List[str]:
+        """
+        Verify the archives of a folder whose name starts with name_pattern, see
+        backup_name_pattern.
+
+        Returns
+        -------
+        List[str]
+            The problems found, empty when every archive is sound.
+        """
+        files = {
+            stored_file["name"]: stored_file
+            for stored_file in self.service.list_files(parent_folder_id)
+            if name_pattern.match(stored_file["name"])
+        }
+        problems = []
+        for name, stored_file in sorted(files.items()):
+            if name.endswith(".zip"):
+                problems.extend(self._verify_archive(stored_file, files))
+            elif name.endswith(f".zip{VOLUMES_MANIFEST_SUFFIX}"):
+                problems.extend(self._verify_split_archive(stored_file, files))
+        return problems
+
+    def _verify_archive(self, stored_file: dict, files: Dict[str, dict]) -> List[str]:
+        name = stored_file["name"]
+        problems = []
+        sidecar = files.get(f"{name}{CHECKSUMS_SUFFIX}")
+        if sidecar is None:
+            self.logger.warning(
+                f"'{name}' has no checksums, only its content is checked"
+            )
+        else:
+            checksums = parse_checksums(self.service.download(sidecar["id"]))
+            problems.extend(
+                self._compare(name, stored_file, checksums.size, checksums.md5)
+            )
+        parts = [ArchivePart(stored_file["id"], int(stored_file.get("size", 0)))]
+        problems.extend(
+            self._spot_check(name, RemoteArchive(self.service, parts, self.key))
+        )
+        return problems
+
+    def _verify_split_archive(
+        self, manifest_file: dict, files: Dict[str, dict]
+    ) -> List[str]:
+        manifest = json.loads(self.service.download(manifest_file["id"]))
+        name = manifest["name"]
+        problems = []
+        parts = []
+        for volume in manifest["volumes"]:
+            stored_volume = files.get(volume["name"])
+            if stored_volume is None:
+                problems.append(f"'{name}': volume '{volume['name']}' is missing")
+                continue
+            problems.extend(
+                self._compare(
+                    volume["name"], stored_volume, volume["size"], volume.get("md5")
+                )
+            )
+            parts.append(ArchivePart(stored_volume["id"], volume["size"]))
+        if problems:
+            return problems
+        return self._spot_check(name, RemoteArchive(self.service, parts, self.key))
+
+    def _compare(
+        self, name: str, stored_file: dict, size: int, md5: Optional[str]
+    ) -> List[str]:
+        problems = []
+        if int(stored_file.get("size", -1)) != size:
+            problems.append(
+                f"'{name}' is {stored_file.get('size')} bytes instead of {size}"
+            )
+        stored_md5 = stored_file.get("md5Checksum")
+        if md5 is not None and stored_md5 is not None and stored_md5 != md5:
+            problems.append(f"'{name}' has the MD5 {stored_md5} instead of {md5}")
+        return problems
+
+    def _spot_check(self, name: str, archive: RemoteArchive) -> List[str]:
+        try:
+            entries = archive.entries()
+            candidates = [
+                entry
+                for entry in entries
+                if entry.compress_size <= MAX_SAMPLED_MEMBER_SIZE
+            ]
+            sample = self.rng.sample(candidates, min(self.sample_size, len(candidates)))
+            for entry in sample:
+                crc = 0
+                size = 0
+                for data in archive.iter_member(entry):
+                    crc = zlib.crc32(data, crc)
+                    size += len(data)
+                if crc != entry.crc or size != entry.file_size:
+                    return [f"'{name}': member '{entry.arcname}' is corrupted"]
+        except (ValueError, zlib.error, HttpError) as error:
+            return [f"'{name}' can not be read: {error}"]
+        self.logger.info(
+            f"Verified '{name}': {len(sample)} of its {len(entries)} files checked"
+        )
+        return []
@@ -0,0 +1,206 @@
+import glob
+import json
+import os
+import re
+import threading
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, TYPE_CHECKING
+
+from utils.checksum import Checksums
+from utils.logger import get_logger
+from utils.metrics import bind_run_metrics
+
+if TYPE_CHECKING:
+    # The Google API client is only imported once Google Drive is needed
+    from business_logic.gdrive_service import GoogleDriveService
+
+# Volumes of a split archive and the state of their uploads, e.g.
+# BACKUP_<PROJECT>_<date>.zip.001 and BACKUP_<PROJECT>_<date>.zip.001.upload.json
+VOLUME_FILE_PATTERN = re.compile(r"(?P<archive>.+\.zip)\.\d{3,}(\.upload\.json)?")
+
+
+class VolumeUploader:
+    """
+    Uploads the volumes of a split archive to a Google Drive folder as soon as they
+    are complete, several at once, while the next volumes are still being written.
+
+    Uploaded volumes are removed from the disk. When uploads fall behind, submitting
+    a new volume blocks until one of the pending volumes is uploaded, which bounds the
+    disk used by the volumes waiting for their upload.
+    """
+
+    def __init__(
+        self, service: "GoogleDriveService", parent_folder_id: str, concurrency: int
+    ):
+        self.service = service
+        self.parent_folder_id = parent_folder_id
+        self.logger = get_logger("backup2gdrive")
+        self._executor = ThreadPoolExecutor(
+            max_workers=concurrency, thread_name_prefix="volume-upload"
+        )
+        self._pending_slots = threading.BoundedSemaphore(2 * concurrency)
+        self._futures: List[Future] = []
+        self._volume_paths: List[str] = []
+
+    def submit(
+        self, volume_path: str, volume_number: int, checksums: Checksums
+    ) -> None:
+        """
+        Queue a complete volume for upload, its MD5 checksum being compared with the
+        one computed by Google Drive.
+        Meant to be used as the on_volume_complete callback of a VolumeWriter.
+        """
+        self._volume_paths.append(volume_path)
+        self._raise_failure()
+        self._pending_slots.acquire()
+        self.logger.info(f"Volume {volume_number} complete, queuing its upload")
+        self._futures.append(
+            self._executor.submit(
+                bind_run_metrics(self._upload), volume_path, checksums
+            )
+        )
+
+    def _upload(self, volume_path: str, checksums: Checksums) -> dict:
+        try:
+            uploaded_file = self.service.upload_to_folder(
+                volume_path, self.parent_folder_id, md5=checksums.md5
+            )
+            os.remove(volume_path)
+            return {
+                "name": os.path.basename(volume_path),
+                "id": uploaded_file.get("id"),
+                **checksums.to_dict(),
+            }
+        finally:
+            self._pending_slots.release()
+
+    def _raise_failure(self) -> None:
+        for future in self._futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+
+    def wait(self) -> List[dict]:
+        """
+        Wait for every queued upload.
+
+        Returns
+        -------
+        List[dict]
+            The name, ID, size and checksums of the uploaded volumes, in order.
+        """
+        try:
+            return [future.result() for future in self._futures]
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def abort(self) -> None:
+        """
+        Cancel the uploads that did not start yet and wait for the running ones.
+        The volumes already uploaded are deleted from Google Drive, being useless
+        without the rest of the archive, and the ones left on the disk are removed.
+        """
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        uploaded_volumes = []
+        for position, volume_path in enumerate(self._volume_paths):
+            future = self._futures[position] if position < len(self._futures) else None
+            if future is None or future.cancelled() or future.exception() is not None:
+                remove_volume_files(volume_path)
+            else:
+                uploaded_volumes.append(future.result())
+        try:
+            self.service.delete_files(uploaded_volumes)
+        except Exception as error:
+            # Retention removes them once they are old enough
+            self.logger.warning(f"Uploaded volumes could not be deleted: {error}")
+
+
+def write_volumes_manifest(
+    manifest_path: str, archive_name: str, volume_size: int, volumes: List[dict]
+) -> str:
+    """
+    Write the manifest listing the volumes of a split archive, in order, with their
+    checksums. The archive is rebuilt by concatenating the volumes.
+
+    Returns
+    -------
+    str
+        The path of the manifest file.
+    """
+    with open(manifest_path, "w") as manifest_file:
+        json.dump(
+            {
+                "name": archive_name,
+                "size": sum(volume["size"] for volume in volumes),
+                "volumeSize": volume_size,
+                "volumes": volumes,
+            },
+            manifest_file,
+            indent=2,
+        )
+    return manifest_path
+
+
+def remove_volume_files(volume_path: str) -> None:
+    """
+    Remove a volume and the state of its upload from the disk, when they exist.
+    """
+    for path in (volume_path, f"{volume_path}.upload.json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def interrupted_volumes(
+    backups_dir: str, name_pattern: re.Pattern
+) -> Dict[str, List[str]]:
+    """
+    The files left on the disk by split archives whose backup was interrupted, e.g.
+    by a crash: volumes not uploaded yet, the last one possibly incomplete, and the
+    state of their uploads. They can not be resumed without the rest of the archive.
+    Only the files whose name starts with name_pattern are considered, see
+    backup_name_pattern.
+
+    Returns
+    -------
+    Dict[str, List[str]]
+        The paths of the files left, by archive name.
+    """
+    leftovers: Dict[str, List[str]] = {}
+    for path in sorted(glob.glob(os.path.join(backups_dir, "BACKUP_*.zip.*"))):
+        name = os.path.basename(path)
+        match = VOLUME_FILE_PATTERN.fullmatch(name)
+        if match and name_pattern.match(name):
+            leftovers.setdefault(match.group("archive"), []).append(path)
+    return leftovers
+
+
+def discard_interrupted_volumes(
+    service: "GoogleDriveService",
+    parent_folder_id: str,
+    leftovers: Dict[str, List[str]],
+) -> int:
+    """
+    Remove the files left by interrupted split archives, see interrupted_volumes,
+    and the volumes of these archives uploaded to Google Drive when their manifest
+    was not.
+
+    Returns
+    -------
+    int
+        The number of volumes deleted from Google Drive.
+    """
+    stored_files = service.list_files(parent_folder_id)
+    stored_names = {stored_file["name"] for stored_file in stored_files}
+    orphan_volumes = []
+    for archive_name, paths in leftovers.items():
+        for path in paths:
+            os.remove(path)
+        if f"{archive_name}.volumes.json" in stored_names:
+            continue
+        orphan_volumes.extend(
+            stored_file
+            for stored_file in stored_files
+            if (match := VOLUME_FILE_PATTERN.fullmatch(stored_file["name"]))
+            and match.group("archive") == archive_name
+        )
+    return len(service.delete_files(orphan_volumes))
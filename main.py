@@ -1,14 +1,676 @@
-from utils.fetch_config import fetch_config
-from business_logic.create_backup import create_backup, regroup_backups
-from business_logic.gdrive_service import GoogleDriveService
+from utils.fetch_config import fetch_configs, fetch_limits
+from utils.human_readable_bytes import human_readable_bytes
+from business_logic.create_backup import (
+    build_backup,
+    build_split_backup,
+    stream_backup,
+)
+from business_logic.dedup_backup import (
+    CHUNKS_FOLDER_NAME,
+    ChunkIndex,
+    ChunkStore,
+    create_dedup_backup,
+)
+from business_logic.drive_mirror import DriveMirror
+from business_logic.file_index import FileIndex
+from business_logic.folder_cache import FolderCache
+from business_logic.permission_cache import PermissionCache
+from business_logic.shared_limits import ProjectLimits, SharedLimits
+from business_logic.throttling import disk_read_throttle, upload_throttle
+from business_logic.volume_upload import (
+    VolumeUploader,
+    discard_interrupted_volumes,
+    interrupted_volumes,
+    write_volumes_manifest,
+)
+from models.config import Config
+from models.limits import Limits
+from utils.backup_names import backup_name_pattern
+from utils.encryption import Encryption, load_key
 from utils.logger import setup_logger
+from utils.metrics import (
+    JsonLinesProgressWriter,
+    RunMetrics,
+    bind_run_metrics,
+    get_run_metrics,
+    use_run_metrics,
+    write_json_report,
+    write_prometheus_textfile,
+)
+from utils.ring_buffer import RingBuffer
 from logging import Logger, INFO, DEBUG
-from typing import List
-from datetime import date
+from datetime import datetime
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, TYPE_CHECKING
+import argparse
+import glob
 import os
+import signal
+
+if TYPE_CHECKING:
+    from business_logic.gdrive_service import GoogleDriveService
+
+
+def create_google_drive_service(
+    config: Config,
+    backups_dir: str,
+    shared_limits: Optional[ProjectLimits] = None,
+    folder_cache: Optional[FolderCache] = None,
+    permission_cache: Optional[PermissionCache] = None,
+) -> "GoogleDriveService":
+    # Imported here: the Google API client is only loaded once Google Drive is needed
+    from business_logic.gdrive_service import GoogleDriveService
+
+    google_drive_service = GoogleDriveService(
+        config.users_emails,
+        upload_chunk_size=config.upload_chunk_size_mb * 1024 * 1024,
+        folder_cache_path=os.path.join(backups_dir, "gdrive_folders.json"),
+        requests_per_second=config.drive_requests_per_second,
+        max_concurrent_requests=config.drive_max_concurrent_requests,
+        max_retries=config.drive_max_retries,
+        shared_limits=shared_limits,
+        folder_cache=folder_cache,
+        upload_throttle=upload_throttle(config),
+        metadata_mirror=(
+            DriveMirror(
+                os.path.join(backups_dir, f"{config.project_name.upper()}_drive.sqlite")
+            )
+            if config.drive_mirror
+            else None
+        ),
+        users_roles=config.users_roles,
+        permission_cache=permission_cache
+        or PermissionCache(os.path.join(backups_dir, "gdrive_permissions.json")),
+    )
+    get_run_metrics().attach_api_stats(google_drive_service.request_executor.stats)
+    return google_drive_service
+
+
+# Creates the Google Drive service of a run from its config and backups folder
+DriveServiceFactory = Callable[[Config, str], "GoogleDriveService"]
+
+
+def shared_drive_service_factory(
+    shared_limits: SharedLimits, backups_dir: str
+) -> DriveServiceFactory:
+    """
+    Creates the Google Drive services of the projects backed up by the process,
+    which share the limits and the folder and permission caches. The service of a project is kept
+    for its next runs, with its credentials, open connections and checked folders.
+    """
+    folder_cache = FolderCache(os.path.join(backups_dir, "gdrive_folders.json"))
+    permission_cache = PermissionCache(
+        os.path.join(backups_dir, "gdrive_permissions.json")
+    )
+    drive_services: Dict[str, "GoogleDriveService"] = {}
+
+    def drive_service_factory(config: Config, backups_dir: str) -> "GoogleDriveService":
+        google_drive_service = drive_services.get(config.project_name)
+        if google_drive_service is None:
+            google_drive_service = create_google_drive_service(
+                config,
+                backups_dir,
+                shared_limits.for_project(config.project_name),
+                folder_cache,
+                permission_cache,
+            )
+            drive_services[config.project_name] = google_drive_service
+            return google_drive_service
+        google_drive_service.begin_run()
+        get_run_metrics().attach_api_stats(google_drive_service.request_executor.stats)
+        return google_drive_service
+
+    return drive_service_factory
+
+
+def backup_timestamp(config: Config) -> str:
+    """
+    The date of the backups of the run in their names, more precise with a
+    backupTimestampFormat including the time.
+    """
+    return datetime.now().strftime(config.backup_timestamp_format)
+
+
+def archive_encryption(config: Config) -> Optional[Encryption]:
+    """
+    The encryption of the archives of a project, None when they are not encrypted.
+
+    Raises
+    ------
+    ValueError
+        When the archives are encrypted and there is no valid key.
+    """
+    if not config.encryption:
+        return None
+    return Encryption(load_key(config.encryption_key_file), config.encryption_workers)
+
+
+def run_archive_backup(
+    config: Config,
+    backups_dir: str,
+    logger: Logger,
+    drive_service_factory: DriveServiceFactory = create_google_drive_service,
+    compression_executor: Optional[Executor] = None,
+) -> None:
+    """
+    Archive the paths to backup in a zip file and upload it to Google Drive.
+
+    The Google Drive session is opened in the background, and the destination folder
+    resolved, while the archive is being built.
+    """
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="gdrive") as drive_thread:
+        drive_session = drive_thread.submit(
+            bind_run_metrics(drive_service_factory), config, backups_dir
+        )
+
+        # Finish the uploads interrupted during previous runs
+        name_pattern = backup_name_pattern(
+            config.project_name, config.backup_timestamp_format
+        )
+        for state_path in glob.glob(os.path.join(backups_dir, "*.zip.upload.json")):
+            if not name_pattern.match(os.path.basename(state_path)):
+                continue
+            pending_filepath = state_path.removesuffix(".upload.json")
+            if os.path.exists(pending_filepath):
+                logger.info("Resuming interrupted upload of %s...", pending_filepath)
+                drive_session.result().upload_file(
+                    pending_filepath, config.g_drive_destination_path
+                )
+
+        # Remove what split backups interrupted during previous runs left, their
+        # archive being written again
+        leftovers = interrupted_volumes(backups_dir, name_pattern)
+        if leftovers:
+            logger.info(
+                "Removing the volumes of the interrupted backups %s...",
+                ", ".join(leftovers),
+            )
+            google_drive_service = drive_session.result()
+            discard_interrupted_volumes(
+                google_drive_service,
+                google_drive_service.prepare_folder(config.g_drive_destination_path),
+                leftovers,
+            )
+
+        # Create the backup archive
+        index = None
+        backup_suffix = ""
+        if config.full_backup_every:
+            index = FileIndex(
+                os.path.join(backups_dir, f"{config.project_name.upper()}_index.sqlite")
+            )
+            full_backup = index.needs_full_backup(config.full_backup_every)
+            index.begin_run(full_backup)
+            backup_suffix = "" if full_backup else "_INCR"
+            logger.info(
+                "Creating a %s backup...", "full" if full_backup else "incremental"
+            )
+
+        backup_date = backup_timestamp(config)
+        backups_filepath = os.path.join(
+            backups_dir,
+            f"BACKUP_{config.project_name.upper()}_{backup_date}{backup_suffix}.zip",
+        )
+        if config.volume_size_mb:
+            google_drive_service = drive_session.result()
+            uploaded_file_id = upload_split_backup(
+                config,
+                google_drive_service,
+                backups_filepath,
+                index,
+                logger,
+                compression_executor,
+            )
+        elif config.output_mode == "stream":
+            google_drive_service = drive_session.result()
+            uploaded_file_id = upload_streamed_backup(
+                config,
+                google_drive_service,
+                os.path.basename(backups_filepath),
+                index,
+                logger,
+                compression_executor,
+            )
+        else:
+            parent_folder_future = drive_thread.submit(
+                bind_run_metrics(
+                    lambda: drive_session.result().prepare_folder(
+                        config.g_drive_destination_path
+                    )
+                )
+            )
+            build_backup(
+                config.paths_to_backup,
+                backups_filepath,
+                workers=config.workers,
+                index=index,
+                executor=compression_executor,
+                throttle=disk_read_throttle(config),
+                low_priority=config.low_priority,
+                encryption=archive_encryption(config),
+            )
+            google_drive_service = drive_session.result()
+            parent_folder_id = parent_folder_future.result()
+
+            # Remove old backups
+            logger.info("Removing old backups...")
+            removed_backups_count = google_drive_service.remove_old_files(
+                parent_folder_id, days_old=config.days_to_keep
+            )
+            logger.info(f"Removed {removed_backups_count} old backups.")
+
+            # Upload new backups
+            logger.info("Uploading backups to Google Drive...")
+            uploaded_file_id = google_drive_service.upload_file(
+                backups_filepath,
+                config.g_drive_destination_path,
+                parent_folder_id=parent_folder_id,
+            )
+
+    # The index only moves forward once its backup is stored on Google Drive
+    if index is not None:
+        if uploaded_file_id:
+            index.commit()
+        else:
+            index.rollback()
+        index.close()
+
+    google_drive_service.request_executor.log_stats()
+
+
+def upload_split_backup(
+    config: Config,
+    google_drive_service: "GoogleDriveService",
+    backups_filepath: str,
+    index: Optional[FileIndex],
+    logger: Logger,
+    compression_executor: Optional[Executor] = None,
+) -> Optional[str]:
+    """
+    Archive the paths to backup in volumes uploaded while the next ones are written,
+    then upload the manifest listing them.
+
+    Returns
+    -------
+    Optional[str]
+        The ID of the uploaded manifest, None if the backup already exists.
+    """
+    parent_folder_id = google_drive_service.prepare_folder(
+        config.g_drive_destination_path
+    )
+    manifest_filepath = f"{backups_filepath}.volumes.json"
+    if google_drive_service.file_exists(
+        os.path.basename(manifest_filepath), parent_folder_id
+    ):
+        logger.info(
+            "Skipping backup, %s already exists in Google Drive.", manifest_filepath
+        )
+        return None
+
+    logger.info("Archiving and uploading volumes to Google Drive...")
+    volume_size = config.volume_size_mb * 1024 * 1024
+    uploader = VolumeUploader(
+        google_drive_service, parent_folder_id, config.upload_concurrency
+    )
+    try:
+        build_split_backup(
+            config.paths_to_backup,
+            backups_filepath,
+            volume_size,
+            uploader.submit,
+            workers=config.workers,
+            index=index,
+            executor=compression_executor,
+            throttle=disk_read_throttle(config),
+            low_priority=config.low_priority,
+            encryption=archive_encryption(config),
+        )
+        volumes = uploader.wait()
+    except BaseException:
+        uploader.abort()
+        raise
+
+    # Remove old backups
+    logger.info("Removing old backups...")
+    removed_backups_count = google_drive_service.remove_old_files(
+        parent_folder_id, days_old=config.days_to_keep
+    )
+    logger.info(f"Removed {removed_backups_count} old backups.")
+
+    write_volumes_manifest(
+        manifest_filepath, os.path.basename(backups_filepath), volume_size, volumes
+    )
+    return google_drive_service.upload_to_folder(
+        manifest_filepath, parent_folder_id
+    ).get("id")
+
+
+def upload_streamed_backup(
+    config: Config,
+    google_drive_service: "GoogleDriveService",
+    backup_name: str,
+    index: Optional[FileIndex],
+    logger: Logger,
+    compression_executor: Optional[Executor] = None,
+) -> Optional[str]:
+    """
+    Archive the paths to backup into a bounded in-memory buffer uploaded to Google
+    Drive at the same time, without writing the archive to disk. The checksums of
+    the archive, computed on the way, are checked then uploaded next to it.
+
+    Returns
+    -------
+    Optional[str]
+        The ID of the uploaded archive, None if the backup already exists.
+    """
+    parent_folder_id = google_drive_service.prepare_folder(
+        config.g_drive_destination_path
+    )
+    if google_drive_service.file_exists(backup_name, parent_folder_id):
+        logger.info("Skipping backup, %s already exists in Google Drive.", backup_name)
+        return None
+
+    logger.info("Archiving and uploading %s to Google Drive...", backup_name)
+    buffer = RingBuffer(config.stream_buffer_mb * 1024 * 1024)
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="archiver") as archiver:
+        archiving = archiver.submit(
+            bind_run_metrics(stream_backup),
+            config.paths_to_backup,
+            buffer,
+            workers=config.workers,
+            index=index,
+            executor=compression_executor,
+            throttle=disk_read_throttle(config),
+            low_priority=config.low_priority,
+            encryption=archive_encryption(config),
+        )
+        try:
+            uploaded_file = google_drive_service.upload_stream(
+                buffer, backup_name, parent_folder_id
+            )
+        except BaseException as error:
+            # Unblocks the archiver if it is waiting for room in the buffer
+            buffer.abort(error)
+            raise
+        checksums = archiving.result()
+    google_drive_service.check_uploaded_checksum(uploaded_file, checksums.md5)
+    google_drive_service.upload_checksums(backup_name, checksums, parent_folder_id)
+
+    # Remove old backups
+    logger.info("Removing old backups...")
+    removed_backups_count = google_drive_service.remove_old_files(
+        parent_folder_id, days_old=config.days_to_keep
+    )
+    logger.info(f"Removed {removed_backups_count} old backups.")
+
+    return uploaded_file.get("id")
+
+
+def run_dedup_backup(
+    config: Config,
+    backups_dir: str,
+    logger: Logger,
+    drive_service_factory: DriveServiceFactory = create_google_drive_service,
+) -> None:
+    """
+    Upload the new chunks of the paths to backup to Google Drive, then the manifest
+    of the backup.
+    """
+    google_drive_service = drive_service_factory(config, backups_dir)
+    folder_ids = google_drive_service.create_folder_structure(
+        [*config.g_drive_destination_path, CHUNKS_FOLDER_NAME]
+    )
+    chunks_folder_id = folder_ids[-1]
+
+    # Remove old backups, chunks are removed once no backup references them
+    logger.info("Removing old backups...")
+    removed_backups_count = google_drive_service.remove_old_files(
+        folder_ids[-2], days_old=config.days_to_keep
+    )
+    logger.info(f"Removed {removed_backups_count} old backups.")
+
+    # Upload new chunks, then the manifest of the backup
+    logger.info("Uploading new chunks to Google Drive...")
+    chunk_index = ChunkIndex(
+        os.path.join(backups_dir, f"{config.project_name.upper()}_chunks.sqlite")
+    )
+    chunk_store = ChunkStore(
+        google_drive_service,
+        chunk_index,
+        chunks_folder_id,
+        config.upload_concurrency,
+    )
+    backup_date = backup_timestamp(config)
+    try:
+        manifest_filepath = create_dedup_backup(
+            config.paths_to_backup,
+            chunk_store,
+            os.path.join(
+                backups_dir, f"BACKUP_{config.project_name.upper()}_{backup_date}.json"
+            ),
+            throttle=disk_read_throttle(config),
+        )
+    finally:
+        chunk_store.close()
+    google_drive_service.upload_file(manifest_filepath, config.g_drive_destination_path)
+
+    removed_chunks_count = chunk_store.collect_garbage(config.days_to_keep)
+    logger.info(f"Removed {removed_chunks_count} unused chunks and packs.")
+    chunk_index.close()
+
+    google_drive_service.request_executor.log_stats()
+
+
+def write_run_report(
+    config: Config, metrics: RunMetrics, success: bool, logger: Logger
+) -> None:
+    """
+    Write the report of the run: as JSON, and for Prometheus when configured.
+    """
+    report = metrics.report(config.project_name, success)
+    for phase, stats in report["phases"].items():
+        logger.info(
+            "Phase %s: %.1fs, %d files, %s in, %s out, %d API calls",
+            phase,
+            stats["duration"],
+            stats["files"],
+            human_readable_bytes(stats["bytesIn"]),
+            human_readable_bytes(stats["bytesOut"]),
+            stats["apiCalls"],
+        )
+    write_json_report(report, config.run_report_path)
+    if config.prometheus_textfile_path:
+        write_prometheus_textfile(report, config.prometheus_textfile_path)
+
+
+def run_backup(
+    config: Config,
+    backups_dir: str,
+    logger: Logger,
+    drive_service_factory: DriveServiceFactory = create_google_drive_service,
+    compression_executor: Optional[Executor] = None,
+) -> None:
+    """
+    Back up a project, then write the report of the run, whether it succeeded or not.
+    """
+    metrics = get_run_metrics()
+    logger.debug("Config fetched: %s", str(config))
+    logger.info("Starting backup process of %s...", config.project_name)
+
+    if config.progress_events_path:
+        metrics.add_progress_listener(
+            JsonLinesProgressWriter(config.progress_events_path)
+        )
+
+    success = False
+    try:
+        if config.backup_mode == "dedup":
+            run_dedup_backup(config, backups_dir, logger, drive_service_factory)
+        else:
+            run_archive_backup(
+                config,
+                backups_dir,
+                logger,
+                drive_service_factory,
+                compression_executor,
+            )
+        success = True
+    finally:
+        write_run_report(config, metrics, success, logger)
+
+
+def project_runner(
+    shared_limits: SharedLimits, backups_dir: str, logger: Logger
+) -> Callable[[Config], None]:
+    """
+    Backs up a project among several backed up by the process at the same time: its
+    run has metrics of its own, and shares the limits with the other ones.
+    """
+    drive_service_factory = shared_drive_service_factory(shared_limits, backups_dir)
+
+    def run_project(config: Config, metrics: Optional[RunMetrics] = None) -> None:
+        with use_run_metrics(metrics or RunMetrics()):
+            run_backup(
+                config,
+                backups_dir,
+                logger,
+                drive_service_factory,
+                shared_limits.for_project(config.project_name).compression_executor(
+                    config.workers, config.low_priority
+                ),
+            )
+
+    return run_project
+
+
+def run_projects(
+    configs: List[Config], limits: Limits, backups_dir: str, logger: Logger
+) -> List[str]:
+    """
+    Back up the projects once, maxConcurrentProjects at a time.
+
+    Returns
+    -------
+    List[str]
+        The names of the projects whose backup failed.
+    """
+    shared_limits = SharedLimits(limits)
+    try:
+        run_project = project_runner(shared_limits, backups_dir, logger)
+        if len(configs) == 1:
+            # The run of a single project is the run of the process: its report
+            # includes reading the config, and its errors stop the process
+            run_project(configs[0], get_run_metrics())
+            return []
+        with ThreadPoolExecutor(
+            max_workers=limits.max_concurrent_projects, thread_name_prefix="project"
+        ) as runner:
+            futures = {
+                config.project_name: runner.submit(run_project, config)
+                for config in configs
+            }
+        failed_projects = []
+        for project_name, future in futures.items():
+            if future.exception() is not None:
+                logger.error(
+                    "Backup of %s failed: %s",
+                    project_name,
+                    future.exception(),
+                    exc_info=future.exception(),
+                )
+                failed_projects.append(project_name)
+        return failed_projects
+    finally:
+        shared_limits.close()
+
+
+def verify_projects(
+    configs: List[Config], backups_dir: str, logger: Logger
+) -> List[str]:
+    """
+    Spot check the archives of the projects stored on Google Drive.
+
+    Returns
+    -------
+    List[str]
+        The names of the projects with a corrupted or unreadable archive.
+    """
+    # Imported here: the verification is only needed with --verify
+    from business_logic.verify_backup import BackupVerifier
+
+    failed_projects = []
+    for config in configs:
+        if config.backup_mode == "dedup":
+            logger.warning(
+                "Skipping %s, the backups in dedup mode are not verified",
+                config.project_name,
+            )
+            continue
+        logger.info("Verifying the backups of %s...", config.project_name)
+        try:
+            encryption = archive_encryption(config)
+        except (FileNotFoundError, ValueError) as e:
+            logger.error("Invalid encryption key of %s: %s", config.project_name, e)
+            failed_projects.append(config.project_name)
+            continue
+        google_drive_service = create_google_drive_service(config, backups_dir)
+        parent_folder_id = google_drive_service.create_folder_structure(
+            config.g_drive_destination_path
+        )[-1]
+        problems = BackupVerifier(
+            google_drive_service,
+            config.verify_sample_size,
+            key=encryption.key if encryption is not None else None,
+        ).verify_folder(
+            parent_folder_id,
+            backup_name_pattern(config.project_name, config.backup_timestamp_format),
+        )
+        for problem in problems:
+            logger.error(problem)
+        if problems:
+            failed_projects.append(config.project_name)
+    return failed_projects
+
+
+def run_daemon(
+    configs: List[Config], limits: Limits, backups_dir: str, logger: Logger
+) -> None:
+    """
+    Back up the projects on their schedules until SIGTERM or SIGINT, at most
+    maxConcurrentProjects at a time.
+    """
+    # Imported here: the scheduler is only needed in daemon mode
+    from business_logic.daemon import BackupDaemon
+
+    shared_limits = SharedLimits(limits)
+    try:
+        daemon = BackupDaemon(
+            configs,
+            project_runner(shared_limits, backups_dir, logger),
+            os.path.join(backups_dir, "daemon_state.json"),
+            max_concurrent_runs=limits.max_concurrent_projects,
+        )
+        for signal_number in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signal_number, lambda *_: daemon.stop())
+        daemon.run()
+    finally:
+        shared_limits.close()
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Backup files to Google Drive.")
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running and back up each project on its schedule",
+    )
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="Spot check the backups stored on Google Drive instead of backing up",
+    )
+    arguments = parser.parse_args()
+
     # Setup logger
     logger: Logger = setup_logger(
         name="backup2gdrive",
@@ -18,9 +680,13 @@ def main():
 
     logger.info("Starting Backup2GDrive script. \nFetch config...")
 
+    metrics = get_run_metrics()
+
     # Fetch config
     try:
-        config = fetch_config()
+        with metrics.span("config"):
+            configs = fetch_configs()
+            limits = fetch_limits()
     except FileNotFoundError as e:
         logger.error("File not found: %s", e)
         exit(1)
@@ -29,36 +695,32 @@ def main():
         exit(2)
 
     logger.info("Config fetched successfully.")
-    logger.debug("Config fetched: %s", str(config))
-    logger.info("Starting backup process...")
-
-    # Create backups
-    archived_filepaths: List[str] = []
-    for path_to_backup in config.paths_to_backup:
-        archived_filepaths.append(create_backup(path_to_backup))
+    logger.debug("Limits fetched: %s", str(limits))
 
-    # Regroup backups
     backups_dir = os.path.join(os.getcwd(), "backups")
-    backups_filepath = os.path.join(
-        backups_dir,
-        f"BACKUP_{config.project_name.upper()}_{
-                                    date.today().strftime('%Y%m%d')}.zip",
-    )
     if not os.path.exists(backups_dir):
         os.makedirs(backups_dir)
-    regroup_backups(archived_filepaths, backups_filepath)
 
-    google_drive_service = GoogleDriveService(config.users_emails)
-    # Remove old backups
-    logger.info("Removing old backups...")
-    removed_backups_count = google_drive_service.remove_old_files(
-        days_old=config.days_to_keep
-    )
-    logger.info(f"Removed {removed_backups_count} old backups.")
+    if arguments.verify:
+        failed_projects = verify_projects(configs, backups_dir, logger)
+        if failed_projects:
+            logger.error("Verification failed for %s", ", ".join(failed_projects))
+            exit(4)
+        logger.info("Verification completed successfully.")
+        return
+
+    if arguments.daemon:
+        try:
+            run_daemon(configs, limits, backups_dir, logger)
+        except ValueError as e:
+            logger.error("Invalid config file: %s", e)
+            exit(2)
+        return
 
-    # Upload new backups
-    logger.info("Uploading backups to Google Drive...")
-    google_drive_service.upload_file(backups_filepath, config.g_drive_destination_path)
+    failed_projects = run_projects(configs, limits, backups_dir, logger)
+    if failed_projects:
+        logger.error("Backup failed for %s", ", ".join(failed_projects))
+        exit(3)
 
     logger.info("Backup process completed successfully.")
 
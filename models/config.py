@@ -1,4 +1,9 @@
 from models.files_to_backup import FilesToBackup
+from models.throttle_window import ThrottleWindow
+from utils.validate import validate_schedule
+
+# Roles the users can be given on the main folder
+USER_ROLES = ("reader", "commenter", "writer")
 
 
 class Config:
@@ -23,6 +28,150 @@ class Config:
         if "usersEmails" in config and not isinstance(config["usersEmails"], list):
             raise TypeError("usersEmails must be a list")
 
+        for user in config.get("usersEmails", []):
+            if isinstance(user, dict):
+                if not isinstance(user.get("email"), str):
+                    raise TypeError("usersEmails entries must have an email")
+                if user.get("role", "reader") not in USER_ROLES:
+                    raise ValueError(f"usersEmails roles must be one of {USER_ROLES}")
+            elif not isinstance(user, str):
+                raise TypeError("usersEmails entries must be emails or dictionaries")
+
+        if "workers" in config and (
+            not isinstance(config["workers"], int) or config["workers"] < 1
+        ):
+            raise TypeError("workers must be a positive integer")
+
+        if "fullBackupEvery" in config and (
+            not isinstance(config["fullBackupEvery"], int)
+            or config["fullBackupEvery"] < 1
+        ):
+            raise TypeError("fullBackupEvery must be a positive integer")
+
+        if "uploadChunkSizeMb" in config and (
+            not isinstance(config["uploadChunkSizeMb"], int)
+            or config["uploadChunkSizeMb"] < 1
+        ):
+            raise TypeError("uploadChunkSizeMb must be a positive integer")
+
+        for key in ("volumeSizeMb", "uploadConcurrency"):
+            if key in config and (not isinstance(config[key], int) or config[key] < 1):
+                raise TypeError(f"{key} must be a positive integer")
+
+        if "driveRequestsPerSecond" in config and (
+            not isinstance(config["driveRequestsPerSecond"], (int, float))
+            or config["driveRequestsPerSecond"] <= 0
+        ):
+            raise TypeError("driveRequestsPerSecond must be a positive number")
+
+        if "driveMaxConcurrentRequests" in config and (
+            not isinstance(config["driveMaxConcurrentRequests"], int)
+            or config["driveMaxConcurrentRequests"] < 1
+        ):
+            raise TypeError("driveMaxConcurrentRequests must be a positive integer")
+
+        if "driveMaxRetries" in config and (
+            not isinstance(config["driveMaxRetries"], int)
+            or config["driveMaxRetries"] < 0
+        ):
+            raise TypeError("driveMaxRetries must be a non-negative integer")
+
+        if "streamBufferMb" in config and (
+            not isinstance(config["streamBufferMb"], int)
+            or config["streamBufferMb"] < 1
+        ):
+            raise TypeError("streamBufferMb must be a positive integer")
+
+        if config.get("outputMode", "file") not in ("file", "stream"):
+            raise ValueError("outputMode must be either file or stream")
+
+        if config.get("outputMode") == "stream" and (
+            "volumeSizeMb" in config or config.get("backupMode") == "dedup"
+        ):
+            raise ValueError(
+                "outputMode stream is only supported in archive backupMode, "
+                "without volumeSizeMb"
+            )
+
+        for key in ("runReportPath", "prometheusTextfilePath", "progressEventsPath"):
+            if key in config and not isinstance(config[key], str):
+                raise TypeError(f"{key} must be a string")
+
+        if "schedule" in config and not validate_schedule(config["schedule"]):
+            raise ValueError("schedule must be a valid cron expression")
+
+        if config.get("catchUp", "once") not in ("once", "skip"):
+            raise ValueError("catchUp must be either once or skip")
+
+        if "backupTimestampFormat" in config and (
+            not isinstance(config["backupTimestampFormat"], str)
+            or not config["backupTimestampFormat"]
+        ):
+            raise TypeError("backupTimestampFormat must be a non-empty string")
+
+        for key in (
+            "diskReadMbPerSecond",
+            "uploadMbPerSecond",
+            "diskLatencyThresholdMs",
+        ):
+            if key in config and (
+                not isinstance(config[key], (int, float)) or config[key] <= 0
+            ):
+                raise TypeError(f"{key} must be a positive number")
+
+        if "throttleWindows" in config and (
+            not isinstance(config["throttleWindows"], list)
+            or not all(isinstance(window, dict) for window in config["throttleWindows"])
+        ):
+            raise TypeError("throttleWindows must be a list of dictionaries")
+
+        if "verifySampleSize" in config and (
+            not isinstance(config["verifySampleSize"], int)
+            or config["verifySampleSize"] < 1
+        ):
+            raise TypeError("verifySampleSize must be a positive integer")
+
+        if "encryptionKeyFile" in config and not isinstance(
+            config["encryptionKeyFile"], str
+        ):
+            raise TypeError("encryptionKeyFile must be a string")
+
+        if "encryptionWorkers" in config and (
+            not isinstance(config["encryptionWorkers"], int)
+            or config["encryptionWorkers"] < 1
+        ):
+            raise TypeError("encryptionWorkers must be a positive integer")
+
+        for key in ("lowPriority", "driveMirror", "encryption"):
+            if key in config and not isinstance(config[key], bool):
+                raise TypeError(f"{key} must be a boolean")
+
+        if "diskLatencyThresholdMs" in config and not (
+            "diskReadMbPerSecond" in config
+            or any(
+                "diskReadMbPerSecond" in window
+                for window in config.get("throttleWindows", [])
+            )
+        ):
+            # The adaptive throttling backs off from a disk read rate
+            raise ValueError(
+                "diskLatencyThresholdMs requires diskReadMbPerSecond, "
+                "or throttleWindows setting it"
+            )
+
+        if config.get("backupMode", "archive") not in ("archive", "dedup"):
+            raise ValueError("backupMode must be either archive or dedup")
+
+        if config.get("encryption") and config.get("backupMode") == "dedup":
+            raise ValueError("encryption is only supported in archive backupMode")
+
+        if "fullBackupEvery" in config and config.get("backupMode") == "dedup":
+            raise ValueError("fullBackupEvery is only supported in archive backupMode")
+
+        if config.get("fullBackupEvery", 0) > config.get("daysToKeep", 7):
+            # Incremental backups are useless once their full backup has been removed
+            raise ValueError("fullBackupEvery must not be greater than daysToKeep")
+
         self.project_name = config["projectName"]
         self.paths_to_backup = [
             self._map_path_to_backup(path_to_backup)
@@ -30,7 +179,61 @@ class Config:
         ]
         self.g_drive_destination_path = config["gDriveDestinationPath"]
         self.days_to_keep = config.get("daysToKeep", 7)
-        self.users_emails = config.get("usersEmails", [])
+        # Role of each user on the main folder, by email
+        self.users_roles = {}
+        for user in config.get("usersEmails", []):
+            if isinstance(user, dict):
+                self.users_roles[user["email"]] = user.get("role", "reader")
+            else:
+                self.users_roles[user] = "reader"
+        self.users_emails = list(self.users_roles)
+        self.workers = config.get("workers", 1)
+        self.backup_mode = config.get("backupMode", "archive")
+        self.upload_chunk_size_mb = config.get("uploadChunkSizeMb", 32)
+        # The archive is split in volumes uploaded concurrently when a volume size is set
+        self.volume_size_mb = config.get("volumeSizeMb", None)
+        self.upload_concurrency = config.get("uploadConcurrency", 4)
+        # In stream mode the archive is uploaded while written, without a local file
+        self.output_mode = config.get("outputMode", "file")
+        self.stream_buffer_mb = config.get("streamBufferMb", 64)
+        # Incremental backups are enabled when a full backup period (in days) is set
+        self.full_backup_every = config.get("fullBackupEvery", None)
+        # Google Drive API requests are rate limited and retried with a backoff
+        self.drive_requests_per_second = config.get("driveRequestsPerSecond", 10)
+        self.drive_max_concurrent_requests = config.get("driveMaxConcurrentRequests", 8)
+        self.drive_max_retries = config.get("driveMaxRetries", 6)
+        # Where the report of the run is written, and its optional Prometheus version
+        self.run_report_path = config.get("runReportPath", "logs/run_report.json")
+        self.prometheus_textfile_path = config.get("prometheusTextfilePath", None)
+        # Progress events of long phases are appended to this file when set
+        self.progress_events_path = config.get("progressEventsPath", None)
+        # Cron expression of the runs in daemon mode, and what to do with missed runs
+        self.schedule = config.get("schedule", None)
+        self.catch_up = config.get("catchUp", "once")
+        # Date in the backup names, more precise when backing up several times a day
+        self.backup_timestamp_format = config.get("backupTimestampFormat", "%Y%m%d")
+        # Disk reads and uploads of the project are throttled when a rate is set, the
+        # first window containing the current time overrides the rates it sets
+        self.disk_read_mb_per_second = config.get("diskReadMbPerSecond", None)
+        self.upload_mb_per_second = config.get("uploadMbPerSecond", None)
+        self.throttle_windows = [
+            self._map_throttle_window(window)
+            for window in config.get("throttleWindows", [])
+        ]
+        # The disk read rate backs off while reads are slower than this, per MB
+        self.disk_latency_threshold_ms = config.get("diskLatencyThresholdMs", None)
+        # The archiver reads and compresses with a low CPU and I/O priority
+        self.low_priority = config.get("lowPriority", False)
+        # The backups folders are read from a local mirror kept current with the
+        # changes feed of Google Drive, instead of being queried on every run
+        self.drive_mirror = config.get("driveMirror", True)
+        # Number of files of each archive checked by `--verify`
+        self.verify_sample_size = config.get("verifySampleSize", 3)
+        # The archives are encrypted with AES-256-GCM while written, with the key of
+        # the BACKUP2GDRIVE_ENCRYPTION_KEY environment variable or of the key file
+        self.encryption = config.get("encryption", False)
+        self.encryption_key_file = config.get("encryptionKeyFile", None)
+        self.encryption_workers = config.get("encryptionWorkers", 1)
 
     def _map_path_to_backup(self, path_to_backup: dict):
         """
@@ -53,6 +256,32 @@ class Config:
             g_drive_destination_path=path_to_backup.get(
                 "gDriveDestinationPath", None
             ),  # gDriveDestinationPath is optional
+            compression=path_to_backup.get("compression", "deflate"),
+            exclude=path_to_backup.get("exclude", None),
+            recursive=path_to_backup.get("recursive", False),
+            max_depth=path_to_backup.get("maxDepth", None),
+            follow_symlinks=path_to_backup.get("followSymlinks", False),
+        )
+
+    def _map_throttle_window(self, window: dict) -> ThrottleWindow:
+        """
+        Maps a dictionary representing a throttle window to a ThrottleWindow object.
+
+        Parameters
+        ----------
+        window : dict
+           The dictionary representing a throttle window.
+
+        Returns
+        -------
+        ThrottleWindow
+           The ThrottleWindow object.
+        """
+        return ThrottleWindow(
+            start=window["from"],
+            end=window["to"],
+            disk_read_mb_per_second=window.get("diskReadMbPerSecond", None),
+            upload_mb_per_second=window.get("uploadMbPerSecond", None),
         )
 
     def to_dict(self):
@@ -65,4 +294,4 @@ class Config:
         }
 
     def __str__(self):
-        return f"Config(project_name={self.project_name}, paths_to_backup={[str(p) for p in self.paths_to_backup]}, g_drive_destination_path={self.g_drive_destination_path}), days_to_keep={self.days_to_keep}, users_emails={self.users_emails})"
+        return f"Config(project_name={self.project_name}, paths_to_backup={[str(p) for p in self.paths_to_backup]}, g_drive_destination_path={self.g_drive_destination_path}), days_to_keep={self.days_to_keep}, users_roles={self.users_roles}, workers={self.workers}, backup_mode={self.backup_mode}, upload_chunk_size_mb={self.upload_chunk_size_mb}, volume_size_mb={self.volume_size_mb}, upload_concurrency={self.upload_concurrency}, output_mode={self.output_mode}, stream_buffer_mb={self.stream_buffer_mb}, full_backup_every={self.full_backup_every}, drive_requests_per_second={self.drive_requests_per_second}, drive_max_concurrent_requests={self.drive_max_concurrent_requests}, drive_max_retries={self.drive_max_retries}, run_report_path={self.run_report_path}, prometheus_textfile_path={self.prometheus_textfile_path}, progress_events_path={self.progress_events_path}, schedule={self.schedule}, catch_up={self.catch_up}, backup_timestamp_format={self.backup_timestamp_format}, disk_read_mb_per_second={self.disk_read_mb_per_second}, upload_mb_per_second={self.upload_mb_per_second}, throttle_windows={[str(w) for w in self.throttle_windows]}, disk_latency_threshold_ms={self.disk_latency_threshold_ms}, low_priority={self.low_priority}, drive_mirror={self.drive_mirror}, verify_sample_size={self.verify_sample_size}, encryption={self.encryption}, encryption_key_file={self.encryption_key_file}, encryption_workers={self.encryption_workers})"
@@ -1,4 +1,11 @@
-from utils.validate import validate_path, validate_regex, validate_filename
+from typing import List, Optional
+
+from utils.validate import (
+    validate_compression,
+    validate_path,
+    validate_regex,
+    validate_filename,
+)
 
 
 class FilesToBackup:
@@ -8,6 +15,11 @@ class FilesToBackup:
         filter_file: str,
         zip_name: str,
         g_drive_destination_path: str,
+        compression: str = "deflate",
+        exclude: Optional[List[str]] = None,
+        recursive: bool = False,
+        max_depth: Optional[int] = None,
+        follow_symlinks: bool = False,
     ):
         if not validate_path(folder_path):
             raise ValueError("folder_path must be a valid folder path")
@@ -23,16 +35,53 @@ class FilesToBackup:
                     "g_drive_destination_path must be a valid string folder path"
                 )
 
+        if not validate_compression(compression):
+            raise ValueError(
+                "compression must be auto, store, deflate or zstd, optionally followed "
+                "by ':<level>'"
+            )
+
+        if exclude is not None and (
+            not isinstance(exclude, list)
+            or not all(validate_regex(pattern) for pattern in exclude)
+        ):
+            raise ValueError("exclude must be a list of valid regexes")
+
+        if not isinstance(recursive, bool):
+            raise TypeError("recursive must be a boolean")
+
+        if max_depth is not None and (
+            not isinstance(max_depth, int)
+            or isinstance(max_depth, bool)
+            or max_depth < 0
+        ):
+            raise TypeError("max_depth must be a non-negative integer")
+
+        if not isinstance(follow_symlinks, bool):
+            raise TypeError("follow_symlinks must be a boolean")
+
         self.folder_path = folder_path
         self.filter_file = filter_file
         self.zip_name = zip_name
+        self.compression = compression
+        self.exclude = exclude or []
+        # Only the folder itself is scanned unless recursive, max_depth then limits
+        # how deep subfolders are scanned
+        self.recursive = recursive
+        self.max_depth = max_depth
+        self.follow_symlinks = follow_symlinks
 
     def to_dict(self):
         return {
             "folderPath": self.folder_path,
             "filterFile": self.filter_file,
             "zipName": self.zip_name,
+            "compression": self.compression,
+            "exclude": self.exclude,
+            "recursive": self.recursive,
+            "maxDepth": self.max_depth,
+            "followSymlinks": self.follow_symlinks,
         }
 
     def __str__(self):
-        return f"FilesToBackup(folder_path={self.folder_path}, filter_file={self.filter_file}, zip_name={self.zip_name})"
+        return f"FilesToBackup(folder_path={self.folder_path}, filter_file={self.filter_file}, zip_name={self.zip_name}, compression={self.compression}, exclude={self.exclude}, recursive={self.recursive}, max_depth={self.max_depth}, follow_symlinks={self.follow_symlinks})"
@@ -0,0 +1,40 @@
+import os
+
+
+class Limits:
+    """
+    Limits shared by the projects of a config file backed up by the same process.
+    Unset limits leave each project to its own settings.
+    """
+
+    def __init__(self, limits: dict):
+        if not isinstance(limits, dict):
+            raise TypeError("limits must be a dictionary")
+
+        for key in ("maxConcurrentProjects", "compressionWorkers"):
+            if key in limits and (not isinstance(limits[key], int) or limits[key] < 1):
+                raise TypeError(f"{key} must be a positive integer")
+
+        for key in ("uploadMbPerSecond", "driveRequestsPerSecond"):
+            if key in limits and (
+                not isinstance(limits[key], (int, float)) or limits[key] <= 0
+            ):
+                raise TypeError(f"{key} must be a positive number")
+
+        if "driveMaxConcurrentRequests" in limits and (
+            not isinstance(limits["driveMaxConcurrentRequests"], int)
+            or limits["driveMaxConcurrentRequests"] < 1
+        ):
+            raise TypeError("driveMaxConcurrentRequests must be a positive integer")
+
+        self.max_concurrent_projects = limits.get("maxConcurrentProjects", 4)
+        # Processes compressing the archives of the projects whose workers exceed 1
+        self.compression_workers = limits.get("compressionWorkers", os.cpu_count() or 1)
+        self.upload_mb_per_second = limits.get("uploadMbPerSecond", None)
+        self.drive_requests_per_second = limits.get("driveRequestsPerSecond", None)
+        self.drive_max_concurrent_requests = limits.get(
+            "driveMaxConcurrentRequests", None
+        )
+
+    def __str__(self):
+        return f"Limits(max_concurrent_projects={self.max_concurrent_projects}, compression_workers={self.compression_workers}, upload_mb_per_second={self.upload_mb_per_second}, drive_requests_per_second={self.drive_requests_per_second}, drive_max_concurrent_requests={self.drive_max_concurrent_requests})"
@@ -0,0 +1,44 @@
+from datetime import datetime, time
+from typing import Optional
+
+from utils.validate import validate_time_of_day
+
+
+class ThrottleWindow:
+    """
+    A time of day window with its own disk read and upload rates, in MB per second.
+    A window ending before it starts wraps past midnight, e.g. from 22:00 to 06:00.
+    """
+
+    def __init__(
+        self,
+        start: str,
+        end: str,
+        disk_read_mb_per_second: Optional[float] = None,
+        upload_mb_per_second: Optional[float] = None,
+    ):
+        if not validate_time_of_day(start) or not validate_time_of_day(end):
+            raise ValueError("from and to must be times of day in HH:MM format")
+
+        if start == end:
+            raise ValueError("from and to must be different times of day")
+
+        for name, rate in (
+            ("diskReadMbPerSecond", disk_read_mb_per_second),
+            ("uploadMbPerSecond", upload_mb_per_second),
+        ):
+            if rate is not None and (not isinstance(rate, (int, float)) or rate <= 0):
+                raise TypeError(f"{name} must be a positive number")
+
+        self.start = datetime.strptime(start, "%H:%M").time()
+        self.end = datetime.strptime(end, "%H:%M").time()
+        self.disk_read_mb_per_second = disk_read_mb_per_second
+        self.upload_mb_per_second = upload_mb_per_second
+
+    def contains(self, moment: time) -> bool:
+        if self.start < self.end:
+            return self.start <= moment < self.end
+        return moment >= self.start or moment < self.end
+
+    def __str__(self):
+        return f"ThrottleWindow(start={self.start:%H:%M}, end={self.end:%H:%M}, disk_read_mb_per_second={self.disk_read_mb_per_second}, upload_mb_per_second={self.upload_mb_per_second})"
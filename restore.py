@@ -0,0 +1,172 @@
+from utils.backup_names import backup_name_pattern
+from utils.encryption import decrypt_file
+from utils.fetch_config import fetch_configs
+from utils.human_readable_bytes import human_readable_bytes
+from business_logic.remote_archive import archive_names, open_archive
+from business_logic.restore_backup import BackupRestorer, select_members
+from main import archive_encryption, create_google_drive_service
+from utils.logger import setup_logger
+from logging import Logger, INFO, DEBUG
+from datetime import datetime
+import argparse
+import os
+import zlib
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Restore files from a backup stored on Google Drive."
+    )
+    parser.add_argument("--project", required=True, help="Name of the project")
+    parser.add_argument(
+        "--backup",
+        help="Name of the archive to restore from, the latest one by default",
+    )
+    parser.add_argument(
+        "--list-backups",
+        action="store_true",
+        help="List the archives of the project instead of restoring",
+    )
+    parser.add_argument(
+        "--list",
+        action="store_true",
+        help="List the files of the archive instead of restoring",
+    )
+    parser.add_argument(
+        "--decrypt",
+        metavar="ARCHIVE",
+        help="Decrypt an encrypted archive already downloaded into --output instead",
+    )
+    parser.add_argument(
+        "--output",
+        default="restored",
+        help="Folder the files are restored to, restored by default",
+    )
+    parser.add_argument(
+        "--parallel",
+        type=int,
+        default=4,
+        help="Number of files restored at once, 4 by default",
+    )
+    parser.add_argument(
+        "patterns",
+        nargs="*",
+        help="Glob patterns of the files to restore, e.g. 'mysql/*.sql', all by default",
+    )
+    arguments = parser.parse_args()
+
+    logger: Logger = setup_logger(
+        name="backup2gdrive",
+        log_file="logs/backup2gdrive.log",
+        level=DEBUG if str(os.environ.get("ENV")).upper() == "DEV" else INFO,
+    )
+
+    try:
+        configs = fetch_configs()
+    except FileNotFoundError as e:
+        logger.error("File not found: %s", e)
+        exit(1)
+    except ValueError as e:
+        logger.error("Invalid config file: %s", e)
+        exit(2)
+
+    config = next(
+        (
+            config
+            for config in configs
+            if config.project_name.upper() == arguments.project.upper()
+        ),
+        None,
+    )
+    if config is None:
+        logger.error("No project named %s in the config file", arguments.project)
+        exit(2)
+    if config.backup_mode == "dedup":
+        logger.error("The backups in dedup mode can not be restored by this script")
+        exit(2)
+    try:
+        encryption = archive_encryption(config)
+    except (FileNotFoundError, ValueError) as e:
+        logger.error("Invalid encryption key: %s", e)
+        exit(2)
+    key = encryption.key if encryption is not None else None
+
+    if arguments.decrypt:
+        os.makedirs(arguments.output, exist_ok=True)
+        decrypted_path = os.path.join(
+            arguments.output, os.path.basename(arguments.decrypt)
+        )
+        try:
+            decrypt_file(key, arguments.decrypt, decrypted_path)
+        except ValueError as e:
+            logger.error("%s can not be decrypted: %s", arguments.decrypt, e)
+            exit(6)
+        logger.info("Decrypted %s to %s.", arguments.decrypt, decrypted_path)
+        return
+
+    backups_dir = os.path.join(os.getcwd(), "backups")
+    if not os.path.exists(backups_dir):
+        os.makedirs(backups_dir)
+
+    google_drive_service = create_google_drive_service(config, backups_dir)
+    parent_folder_id = google_drive_service.create_folder_structure(
+        config.g_drive_destination_path
+    )[-1]
+    files = {
+        stored_file["name"]: stored_file
+        for stored_file in google_drive_service.list_files(parent_folder_id)
+    }
+    names = archive_names(
+        list(files.values()),
+        backup_name_pattern(config.project_name, config.backup_timestamp_format),
+    )
+    if arguments.list_backups:
+        for name in names:
+            print(name)
+        return
+    if not names:
+        logger.error("No backup of %s on Google Drive", config.project_name)
+        exit(5)
+
+    name = arguments.backup or names[-1]
+    try:
+        archive = open_archive(google_drive_service, files, name, key)
+        entries = select_members(archive.entries(), arguments.patterns)
+    except FileNotFoundError as e:
+        logger.error("Backup not found: %s", e)
+        exit(5)
+    except (ValueError, zlib.error) as e:
+        logger.error("Backup %s can not be read: %s", name, e)
+        exit(6)
+
+    if arguments.list:
+        for entry in entries:
+            print(
+                f"{datetime.fromtimestamp(entry.mtime).isoformat(' ', 'seconds')}"
+                f" {entry.file_size:>12} {entry.arcname}"
+            )
+        return
+    if not entries:
+        logger.error("No file of %s matches %s", name, " ".join(arguments.patterns))
+        exit(5)
+
+    logger.info("Restoring %d files from %s...", len(entries), name)
+    try:
+        restored_size = BackupRestorer(
+            archive, arguments.output, arguments.parallel
+        ).restore(entries)
+    except (ValueError, zlib.error) as e:
+        logger.error("Restore failed: %s", e)
+        exit(6)
+    logger.info(
+        "Restored %d files (%s) to %s, downloading %s of the %s archive.",
+        len(entries),
+        human_readable_bytes(restored_size),
+        arguments.output,
+        human_readable_bytes(archive.bytes_read),
+        human_readable_bytes(archive.size),
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import unittest
+
+from utils.backup_names import backup_name_pattern
+
+
+class BackupNamePatternTest(unittest.TestCase):
+    def test_backups_of_the_project_match(self):
+        pattern = backup_name_pattern("foo", "%Y%m%d")
+
+        for name in (
+            "BACKUP_FOO_20260101.zip",
+            "BACKUP_FOO_20260101_INCR.zip",
+            "BACKUP_FOO_20260101.zip.001.upload.json",
+            "BACKUP_FOO_20260101.json",
+        ):
+            self.assertTrue(pattern.match(name), name)
+
+    def test_backups_of_a_project_sharing_the_prefix_do_not_match(self):
+        foo = backup_name_pattern("foo", "%Y%m%d")
+        foo_bar = backup_name_pattern("foo_bar", "%Y%m%d")
+
+        self.assertFalse(foo.match("BACKUP_FOO_BAR_20260101.zip.upload.json"))
+        self.assertFalse(foo.match("BACKUP_FOO_2026_20260101.zip"))
+        self.assertTrue(foo_bar.match("BACKUP_FOO_BAR_20260101.zip.upload.json"))
+        self.assertFalse(foo_bar.match("BACKUP_FOO_20260101.zip"))
+
+    def test_timestamp_follows_the_format(self):
+        pattern = backup_name_pattern("foo", "%Y-%m-%d_%H%M")
+
+        self.assertTrue(pattern.match("BACKUP_FOO_2026-01-01_1230.zip"))
+        self.assertFalse(pattern.match("BACKUP_FOO_20260101.zip"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fake_drive_server import FakeDrive, FakeDriveServer
+from business_logic.create_backup import build_backup
+from business_logic.gdrive_service import GoogleDriveService
+from business_logic.verify_backup import BackupVerifier
+from models.files_to_backup import FilesToBackup
+from utils.backup_names import backup_name_pattern
+from utils.checksum import ChecksumMismatchError, checksums_path, read_checksums
+
+ARCHIVE_NAME = "BACKUP_PROJECT_20261017.zip"
+
+
+class CorruptingFakeDrive(FakeDrive):
+    """
+    A FakeDrive flipping a bit of the content of the zip files it receives, as
+    a corruption on the way to Google Drive would.
+    """
+
+    def _new_file(self, metadata: dict):
+        stored_file = super()._new_file(metadata)
+        if stored_file.resource["name"].endswith(".zip"):
+            append = stored_file.append
+
+            def corrupted_append(data: bytes) -> None:
+                if data and not stored_file.size:
+                    data = bytes([data[0] ^ 1]) + data[1:]
+                append(data)
+
+            stored_file.append = corrupted_append
+        return stored_file
+
+
+class ChecksumTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        folder = os.path.join(self.directory.name, "data")
+        os.makedirs(folder)
+        for number in range(5):
+            with open(os.path.join(folder, f"{number}.sql"), "wb") as file:
+                file.write(f"INSERT INTO backups VALUES ({number});\n".encode() * 2000)
+        self.archive_path = build_backup(
+            [FilesToBackup(f"{folder}/", r".*\.sql", "data", None, "store")],
+            os.path.join(self.directory.name, ARCHIVE_NAME),
+        )
+
+        self.drive = (
+            CorruptingFakeDrive()
+            if "corrupted" in self._testMethodName
+            else FakeDrive()
+        )
+        self.server = FakeDriveServer(self.drive).start()
+        environment = mock.patch.dict(
+            os.environ, {"GOOGLE_DRIVE_API_ROOT_URL": self.server.root_url}
+        )
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.service = GoogleDriveService(["reader@example.com"])
+        self.service.request_executor.backoff_delay = lambda error, attempt: 0
+        self.folder_id = self.service.prepare_folder(["backups"])
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def stored_file(self, name: str):
+        (stored_file,) = [
+            stored_file
+            for stored_file in self.drive.files.values()
+            if stored_file.resource["name"] == name
+        ]
+        return stored_file
+
+    def verify(self) -> list:
+        return BackupVerifier(self.service, sample_size=5).verify_folder(
+            self.folder_id, backup_name_pattern("project", "%Y%m%d")
+        )
+
+    def test_checksums_are_the_ones_of_the_written_archive(self):
+        with open(self.archive_path, "rb") as archive_file:
+            data = archive_file.read()
+
+        checksums = read_checksums(self.archive_path)
+
+        self.assertEqual(checksums.size, len(data))
+        self.assertEqual(checksums.md5, hashlib.md5(data).hexdigest())
+        self.assertEqual(checksums.sha256, hashlib.sha256(data).hexdigest())
+
+    def test_sound_upload_is_verified(self):
+        self.service.upload_file(self.archive_path, ["backups"], self.folder_id)
+
+        sidecar = self.stored_file(os.path.basename(checksums_path(self.archive_path)))
+        with open(checksums_path(self.archive_path), "rb") as checksums_file:
+            self.assertEqual(bytes(sidecar.content), checksums_file.read())
+        self.assertEqual(self.verify(), [])
+
+    def test_corrupted_upload_is_detected_and_deleted(self):
+        with self.assertRaises(ChecksumMismatchError):
+            self.service.upload_file(self.archive_path, ["backups"], self.folder_id)
+
+        self.assertEqual(
+            [
+                stored_file.resource["name"]
+                for stored_file in self.drive.files.values()
+                if stored_file.resource["name"].startswith("BACKUP_")
+            ],
+            [],
+        )
+
+    def test_verify_detects_a_checksum_mismatch(self):
+        self.service.upload_file(self.archive_path, ["backups"], self.folder_id)
+        self.stored_file(ARCHIVE_NAME).resource["md5Checksum"] = "0" * 32
+
+        (problem,) = self.verify()
+
+        self.assertIn(f"'{ARCHIVE_NAME}' has the MD5 {'0' * 32}", problem)
+
+    def test_verify_detects_a_damaged_member(self):
+        self.service.upload_file(self.archive_path, ["backups"], self.folder_id)
+        # Corrupted once stored, its checksums still match the ones of the upload
+        stored_file = self.stored_file(ARCHIVE_NAME)
+        stored_file.content[200] ^= 1
+
+        (problem,) = self.verify()
+
+        self.assertIn("is corrupted", problem)
+
+
+if __name__ == "__main__":
+    unittest.main()
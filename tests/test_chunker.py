@@ -0,0 +1,49 @@
+import base64
+import hashlib
+import io
+import random
+import unittest
+
+from utils.chunker import MAX_CHUNK_SIZE, MIN_CHUNK_SIZE, iter_chunks
+
+
+def chunk_hashes(data: bytes) -> list:
+    return [hashlib.sha256(chunk).digest() for chunk in iter_chunks(io.BytesIO(data))]
+
+
+class ChunkerTest(unittest.TestCase):
+    def setUp(self):
+        generator = random.Random(0)
+        # A dump with extended inserts: lines of about 1 MB
+        self.dump = b"".join(
+            b"INSERT INTO `t` VALUES "
+            + base64.b64encode(generator.randbytes(768 * 1024))
+            + b";\n"
+            for _ in range(48)
+        )
+        self.binary = generator.randbytes(32 * 1024 * 1024).replace(b"\n", b"")
+
+    def test_chunks_rebuild_the_data_within_the_size_bounds(self):
+        chunks = list(iter_chunks(io.BytesIO(self.binary)))
+
+        self.assertEqual(b"".join(chunks), self.binary)
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), MIN_CHUNK_SIZE)
+            self.assertLessEqual(len(chunk), MAX_CHUNK_SIZE)
+        # Cut points are found without any newline, before the maximum size
+        self.assertGreater(len(chunks), len(self.binary) // MAX_CHUNK_SIZE + 1)
+
+    def test_chunks_are_reused_after_an_insertion_in_long_lines(self):
+        original = chunk_hashes(self.dump)
+        edited = chunk_hashes(
+            self.dump[:1000] + b"(37, 'inserted row'), " + self.dump[1000:]
+        )
+
+        shared = set(original) & set(edited)
+        # Only the chunk holding the insertion changes
+        self.assertGreaterEqual(len(shared), len(edited) - 1)
+        self.assertGreater(len(edited), len(self.dump) // MAX_CHUNK_SIZE + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
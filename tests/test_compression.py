@@ -0,0 +1,239 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+import zipfile
+import zlib
+
+from business_logic.create_backup import compress_block
+from concurrent.futures import ThreadPoolExecutor
+from utils.compression import (
+    AUTO_SAMPLE_SIZE,
+    decompress_chunks,
+    get_codec,
+    resolve_compression,
+)
+from utils.zip import (
+    ZIP_DEFLATED,
+    ZIP_MAX_ENTRIES,
+    ZIP_STORED,
+    ZIP_ZSTANDARD,
+    ZipStreamWriter,
+    find_central_directory,
+    local_header_size,
+    parse_central_directory,
+)
+
+BLOCK_SIZE = 256 * 1024
+
+
+def compressible_data(size: int) -> bytes:
+    generator = random.Random(size)
+    words = [b"backup", b"drive", b"table", b"INSERT", b"VALUES", b"(1, 'a')"]
+    data = b" ".join(generator.choice(words) for _ in range(size // 4))
+    return data[:size]
+
+
+class CodecTest(unittest.TestCase):
+    """
+    The blocks compressed independently by a codec decode as a single stream once
+    concatenated.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "dump.sql")
+        self.data = compressible_data(3 * BLOCK_SIZE + 1000)
+        with open(self.path, "wb") as file:
+            file.write(self.data)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def compressed_blocks(self, compression: str) -> list:
+        offsets = range(0, len(self.data), BLOCK_SIZE)
+        # Blocks are compressed in parallel, and written in order
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            return list(
+                executor.map(
+                    lambda offset: compress_block(
+                        self.path,
+                        offset,
+                        min(BLOCK_SIZE, len(self.data) - offset),
+                        offset + BLOCK_SIZE >= len(self.data),
+                        compression,
+                    ),
+                    offsets,
+                )
+            )
+
+    def test_blocks_round_trip(self):
+        for compression, method in (
+            ("store", ZIP_STORED),
+            ("deflate", ZIP_DEFLATED),
+            ("deflate:1", ZIP_DEFLATED),
+            ("deflate:9", ZIP_DEFLATED),
+            ("zstd", ZIP_ZSTANDARD),
+            ("zstd:19", ZIP_ZSTANDARD),
+        ):
+            with self.subTest(compression=compression):
+                blocks = self.compressed_blocks(compression)
+
+                self.assertEqual(len(blocks), 4)
+                self.assertTrue(all(block.method == method for block in blocks))
+                restored = b"".join(
+                    decompress_chunks(method, (block.data for block in blocks))
+                )
+                self.assertEqual(restored, self.data)
+                if method != ZIP_STORED:
+                    compressed_size = sum(len(block.data) for block in blocks)
+                    self.assertLess(compressed_size, len(self.data) / 2)
+
+    def test_invalid_settings_are_rejected(self):
+        for compression in ("lzma", "deflate:0", "deflate:x", "store:1", "zstd:23"):
+            with self.subTest(compression=compression):
+                with self.assertRaises(ValueError):
+                    get_codec(compression)
+
+
+class AutoCompressionTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name: str, data: bytes) -> str:
+        path = os.path.join(self.directory.name, name)
+        with open(path, "wb") as file:
+            file.write(data)
+        return path
+
+    def resolve(self, compression: str, path: str) -> str:
+        return resolve_compression(compression, path, os.path.getsize(path))
+
+    def test_compressible_sample_is_compressed(self):
+        path = self.write("dump.sql", compressible_data(2 * AUTO_SAMPLE_SIZE))
+
+        self.assertEqual(self.resolve("auto", path), "deflate")
+        self.assertEqual(self.resolve("auto:zstd", path), "zstd")
+
+    def test_incompressible_sample_is_stored(self):
+        path = self.write("data.bin", os.urandom(2 * AUTO_SAMPLE_SIZE))
+
+        self.assertEqual(self.resolve("auto", path), "store")
+
+    def test_compressed_extensions_are_stored_without_sampling(self):
+        path = self.write("photo.JPG", compressible_data(2 * AUTO_SAMPLE_SIZE))
+
+        self.assertEqual(self.resolve("auto", path), "store")
+
+    def test_small_file_is_decided_on_its_whole_content(self):
+        incompressible = self.write("small.bin", os.urandom(1000))
+        compressible = self.write("small.txt", compressible_data(1000))
+
+        self.assertEqual(self.resolve("auto", incompressible), "auto")
+        stored = compress_block(incompressible, 0, 1000, True, "auto")
+        compressed = compress_block(compressible, 0, 1000, True, "auto")
+        self.assertEqual(stored.method, ZIP_STORED)
+        with open(incompressible, "rb") as file:
+            self.assertEqual(stored.data, file.read())
+        self.assertEqual(compressed.method, ZIP_DEFLATED)
+        self.assertLess(len(compressed.data), 1000)
+
+    def test_explicit_setting_is_kept(self):
+        path = self.write("data.bin", os.urandom(2 * AUTO_SAMPLE_SIZE))
+
+        self.assertEqual(self.resolve("deflate:9", path), "deflate:9")
+
+
+class ZipStreamWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.data = compressible_data(3 * BLOCK_SIZE + 1000)
+
+    def test_zip64_member_written_in_blocks_reads_back(self):
+        output = io.BytesIO()
+        blocks = [
+            self.data[offset : offset + BLOCK_SIZE]
+            for offset in range(0, len(self.data), BLOCK_SIZE)
+        ]
+        codec = get_codec("deflate")
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            compressed = list(
+                executor.map(
+                    lambda index: codec.compress_block(
+                        blocks[index],
+                        blocks[index - 1][-32 * 1024 :] if index else b"",
+                        index == len(blocks) - 1,
+                    ),
+                    range(len(blocks)),
+                )
+            )
+
+        with ZipStreamWriter(output) as archive:
+            # Announced larger than the zip64 limit, so written with zip64 records
+            entry = archive.open_entry(
+                "dump.sql", ZIP_DEFLATED, 1767225600, 0o100644, 5 * 1024**3
+            )
+            for block, data in zip(blocks, compressed):
+                # The CRC-32 of the member is combined from those of its blocks
+                archive.write_block(entry, data, zlib.crc32(block), len(block))
+            archive.close_entry(entry)
+            archive.write_bytes("MANIFEST.json", b"{}", 1767225600)
+
+        self.assertTrue(entry.zip64)
+        self.assertEqual(entry.crc, zlib.crc32(self.data))
+        with zipfile.ZipFile(output) as archive:
+            self.assertIsNone(archive.testzip())
+            self.assertEqual(archive.read("dump.sql"), self.data)
+            self.assertEqual(archive.read("MANIFEST.json"), b"{}")
+
+    def test_archive_with_too_many_entries_for_zip32_reads_back(self):
+        output = io.BytesIO()
+        with ZipStreamWriter(output) as archive:
+            for number in range(ZIP_MAX_ENTRIES + 1):
+                archive.write_bytes(f"{number}.txt", str(number).encode(), 1767225600)
+
+        with zipfile.ZipFile(output) as archive:
+            names = archive.namelist()
+            self.assertEqual(len(names), ZIP_MAX_ENTRIES + 1)
+            self.assertEqual(archive.read(names[-1]), str(ZIP_MAX_ENTRIES).encode())
+
+    def test_zstd_member_reads_back(self):
+        output = io.BytesIO()
+        codec = get_codec("zstd")
+        with ZipStreamWriter(output) as archive:
+            entry = archive.open_entry(
+                "dump.sql", ZIP_ZSTANDARD, 1767225600, 0o100644, len(self.data)
+            )
+            for offset in range(0, len(self.data), BLOCK_SIZE):
+                block = self.data[offset : offset + BLOCK_SIZE]
+                archive.write_block(
+                    entry,
+                    codec.compress_block(block, b"", False),
+                    zlib.crc32(block),
+                    len(block),
+                )
+            archive.close_entry(entry)
+        archive_bytes = output.getvalue()
+
+        # zipfile does not decompress method 93, the restore reads it this way
+        offset, size = find_central_directory(archive_bytes, len(archive_bytes))
+        (member,) = parse_central_directory(archive_bytes[offset : offset + size])
+        data_start = member.header_offset + local_header_size(
+            archive_bytes[member.header_offset :]
+        )
+        restored = b"".join(
+            decompress_chunks(
+                member.method,
+                [archive_bytes[data_start : data_start + member.compress_size]],
+            )
+        )
+        self.assertEqual(member.method, ZIP_ZSTANDARD)
+        self.assertEqual(member.crc, zlib.crc32(self.data))
+        self.assertEqual(restored, self.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
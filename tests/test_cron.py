@@ -0,0 +1,85 @@
+import unittest
+from datetime import datetime
+
+from utils.cron import CronSchedule
+
+
+class NextAfterTest(unittest.TestCase):
+    def assertNextAfter(self, expression: str, moment: datetime, expected: datetime):
+        self.assertEqual(CronSchedule(expression).next_after(moment), expected)
+
+    def test_next_time_is_strictly_after(self):
+        self.assertNextAfter(
+            "*/15 * * * *",
+            datetime(2026, 10, 17, 10, 7, 30),
+            datetime(2026, 10, 17, 10, 15),
+        )
+        self.assertNextAfter(
+            "*/15 * * * *",
+            datetime(2026, 10, 17, 10, 15),
+            datetime(2026, 10, 17, 10, 30),
+        )
+        self.assertNextAfter(
+            "*/15 * * * *",
+            datetime(2026, 10, 17, 10, 14, 59, 999999),
+            datetime(2026, 10, 17, 10, 15),
+        )
+
+    def test_macros_roll_over_the_day_month_and_year(self):
+        self.assertNextAfter(
+            "@hourly", datetime(2026, 10, 17, 23, 30), datetime(2026, 10, 18, 0, 0)
+        )
+        self.assertNextAfter(
+            "@daily", datetime(2026, 12, 31, 23, 59), datetime(2027, 1, 1, 0, 0)
+        )
+        self.assertNextAfter(
+            "@monthly", datetime(2026, 1, 31, 12, 0), datetime(2026, 2, 1, 0, 0)
+        )
+        self.assertNextAfter(
+            "@yearly", datetime(2026, 10, 17, 12, 0), datetime(2027, 1, 1, 0, 0)
+        )
+
+    def test_days_of_week_and_names(self):
+        # 2026-10-17 is a Saturday
+        self.assertNextAfter(
+            "30 9 * * mon-fri",
+            datetime(2026, 10, 17, 10, 0),
+            datetime(2026, 10, 19, 9, 30),
+        )
+        # 7 is Sunday, as 0
+        self.assertNextAfter(
+            "0 3 * * 7", datetime(2026, 10, 17, 10, 0), datetime(2026, 10, 18, 3, 0)
+        )
+        self.assertNextAfter(
+            "0 12 1 jan,jul *",
+            datetime(2026, 10, 17, 10, 0),
+            datetime(2027, 1, 1, 12, 0),
+        )
+
+    def test_day_of_month_or_day_of_week(self):
+        # Either the 13th or a Friday, as with cron
+        self.assertNextAfter(
+            "0 0 13 * fri", datetime(2026, 10, 17, 10, 0), datetime(2026, 10, 23, 0, 0)
+        )
+        self.assertNextAfter(
+            "0 0 13 * fri", datetime(2026, 11, 10, 10, 0), datetime(2026, 11, 13, 0, 0)
+        )
+
+    def test_rare_date_is_found(self):
+        self.assertNextAfter(
+            "0 0 29 2 *", datetime(2026, 3, 1, 0, 0), datetime(2028, 2, 29, 0, 0)
+        )
+
+    def test_schedule_never_matching_is_an_error(self):
+        with self.assertRaises(ValueError):
+            CronSchedule("0 0 30 2 *").next_after(datetime(2026, 10, 17))
+
+    def test_invalid_expressions_are_rejected(self):
+        for expression in ("* * * *", "60 * * * *", "*/0 * * * *", "0 0 * foo *"):
+            with self.subTest(expression=expression):
+                with self.assertRaises(ValueError):
+                    CronSchedule(expression)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import json
+import os
+import tempfile
+import unittest
+import uuid
+
+from business_logic.dedup_backup import (
+    PACK_PREFIX,
+    ChunkIndex,
+    ChunkStore,
+    create_dedup_backup,
+    decode_chunk,
+)
+from models.files_to_backup import FilesToBackup
+
+
+class FakeDriveService:
+    """
+    The part of GoogleDriveService used by the chunk store, keeping the files in
+    memory.
+    """
+
+    def __init__(self):
+        self.files = {}
+
+    def upload_bytes(self, name, data, parent_folder_id):
+        drive_id = uuid.uuid4().hex
+        self.files[drive_id] = (name, data)
+        return drive_id
+
+    def delete_files(self, files):
+        for stored_file in files:
+            del self.files[stored_file["id"]]
+        return [stored_file["id"] for stored_file in files]
+
+
+class DedupBackupTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.directory.name, "data")
+        os.makedirs(self.folder)
+        self.contents = {f"small{number}.txt": os.urandom(1000) for number in range(20)}
+        self.contents["large.bin"] = os.urandom(3 * 1024 * 1024)
+        for name, content in self.contents.items():
+            with open(os.path.join(self.folder, name), "wb") as file:
+                file.write(content)
+        self.service = FakeDriveService()
+        self.index = ChunkIndex(os.path.join(self.directory.name, "chunks.sqlite"))
+
+    def tearDown(self):
+        self.index.close()
+        self.directory.cleanup()
+
+    def backup(self) -> dict:
+        store = ChunkStore(self.service, self.index, "chunks", concurrency=4)
+        manifest_path = os.path.join(self.directory.name, "manifest.json")
+        try:
+            create_dedup_backup(
+                [FilesToBackup(f"{self.folder}/", ".*", "data", None)],
+                store,
+                manifest_path,
+            )
+        finally:
+            store.close()
+        with open(manifest_path) as manifest_file:
+            return json.load(manifest_file)
+
+    def stored_file(self, name: str) -> bytes:
+        return next(
+            data for stored, data in self.service.files.values() if stored == name
+        )
+
+    def restore(self, manifest: dict, chunk_ids: list) -> bytes:
+        content = b""
+        for chunk_id in chunk_ids:
+            if chunk_id in manifest["packedChunks"]:
+                pack, offset, size = manifest["packedChunks"][chunk_id]
+                data = self.stored_file(pack)[offset : offset + size]
+            else:
+                data = self.stored_file(chunk_id)
+            content += decode_chunk(data)
+        return content
+
+    def test_small_chunks_are_packed(self):
+        manifest = self.backup()
+
+        names = sorted(name for name, _ in self.service.files.values())
+        packs = [name for name in names if name.startswith(PACK_PREFIX)]
+        # The 20 small files and the end of the large one share a single pack
+        self.assertEqual(len(packs), 1)
+        self.assertLess(len(names), 5)
+        for file in manifest["files"]:
+            self.assertEqual(
+                self.restore(manifest, file["chunks"]),
+                self.contents[os.path.basename(file["path"])],
+            )
+
+        # Nothing is uploaded again by the next backup
+        uploaded_count = len(self.service.files)
+        self.backup()
+        self.assertEqual(len(self.service.files), uploaded_count)
+
+    def test_pack_is_deleted_once_all_its_chunks_are_unused(self):
+        manifest = self.backup()
+        store = ChunkStore(self.service, self.index, "chunks")
+        used_chunk = next(
+            file["chunks"][0]
+            for file in manifest["files"]
+            if file["path"].endswith("small0.txt")
+        )
+        self.index._connection.execute("UPDATE chunks SET last_used = '2000-01-01'")
+        self.index.touch([used_chunk])
+
+        deleted_count = store.collect_garbage(days_to_keep=7)
+        store.close()
+
+        names = [name for name, _ in self.service.files.values()]
+        self.assertTrue(self.index.contains(used_chunk))
+        self.assertEqual(names, [manifest["packedChunks"][used_chunk][0]])
+        self.assertGreater(deleted_count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
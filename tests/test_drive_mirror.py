@@ -0,0 +1,176 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+from benchmarks.fake_drive_server import FakeDrive, FakeDriveServer
+from business_logic.drive_mirror import FOLDER_MIME_TYPE, DriveMirror
+from business_logic.gdrive_service import GoogleDriveService
+
+
+def resource(file_id: str, parent_id: str, name: str = None, **fields) -> dict:
+    return {
+        "id": file_id,
+        "name": name or file_id,
+        "parents": [parent_id],
+        "mimeType": "application/zip",
+        "size": "100",
+        "modifiedTime": "2026-10-01T10:00:00Z",
+        **fields,
+    }
+
+
+class ApplyChangesTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "mirror.sqlite")
+        self.mirror = DriveMirror(self.db_path)
+        self.mirror.reset("1")
+        self.mirror.track("backups", [resource("old", "backups")])
+
+    def tearDown(self):
+        self.mirror.close()
+        self.directory.cleanup()
+
+    def test_files_of_tracked_folders_are_mirrored(self):
+        self.mirror.apply_changes(
+            [
+                {"fileId": "new", "file": resource("new", "backups")},
+                {"fileId": "other", "file": resource("other", "photos")},
+            ],
+            "2",
+        )
+
+        self.assertTrue(self.mirror.exists("new", "backups"))
+        self.assertFalse(self.mirror.contains("other"))
+        self.assertEqual(self.mirror.folder_usage("backups"), (2, 200))
+
+    def test_removed_and_trashed_files_are_removed(self):
+        self.mirror.apply_changes(
+            [{"fileId": "new", "file": resource("new", "backups")}], "2"
+        )
+
+        self.mirror.apply_changes(
+            [
+                {"fileId": "old", "removed": True},
+                {"fileId": "new", "file": resource("new", "backups", trashed=True)},
+            ],
+            "3",
+        )
+
+        self.assertFalse(self.mirror.contains("old"))
+        self.assertFalse(self.mirror.contains("new"))
+        self.assertEqual(self.mirror.folder_usage("backups"), (0, 0))
+
+    def test_renamed_and_moved_files_are_updated(self):
+        self.mirror.apply_changes(
+            [{"fileId": "old", "file": resource("old", "archives", name="renamed")}],
+            "2",
+        )
+
+        # Already mirrored, so followed out of the tracked folder
+        self.assertTrue(self.mirror.contains("old"))
+        self.assertFalse(self.mirror.exists("old", "backups"))
+        self.assertTrue(self.mirror.exists("renamed", "archives"))
+
+    def test_deleted_tracked_folder_is_forgotten(self):
+        self.mirror.apply_changes([{"fileId": "backups", "removed": True}], "2")
+
+        self.assertFalse(self.mirror.is_tracked("backups"))
+        self.assertFalse(self.mirror.contains("old"))
+        # Its new files are not mirrored any more
+        self.mirror.apply_changes(
+            [{"fileId": "new", "file": resource("new", "backups")}], "3"
+        )
+        self.assertFalse(self.mirror.contains("new"))
+
+    def test_page_token_is_saved_with_the_changes(self):
+        self.mirror.apply_changes(
+            [{"fileId": "new", "file": resource("new", "backups")}], "7"
+        )
+        self.mirror.close()
+
+        self.mirror = DriveMirror(self.db_path)
+        self.assertEqual(self.mirror.page_token, "7")
+        self.assertTrue(self.mirror.exists("new", "backups"))
+
+    def test_modified_times_compare_whatever_their_precision(self):
+        self.mirror.apply_changes(
+            [
+                {
+                    "fileId": "precise",
+                    "file": resource(
+                        "precise", "backups", modifiedTime="2026-10-01T10:00:00.500Z"
+                    ),
+                },
+                {
+                    "fileId": "folder",
+                    "file": resource("folder", "backups", mimeType=FOLDER_MIME_TYPE),
+                },
+            ],
+            "2",
+        )
+
+        cutoff = datetime(2026, 10, 1, 10, 0, 0, 250000, tzinfo=timezone.utc)
+        self.assertEqual(
+            self.mirror.files_modified_before("backups", cutoff), [("old", "old")]
+        )
+
+
+class MirrorSyncTest(unittest.TestCase):
+    """
+    A service with a mirror, used by two runs, the backups folder changing between
+    them.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.drive = FakeDrive()
+        self.server = FakeDriveServer(self.drive).start()
+        environment = mock.patch.dict(
+            os.environ, {"GOOGLE_DRIVE_API_ROOT_URL": self.server.root_url}
+        )
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.mirror_path = os.path.join(self.directory.name, "mirror.sqlite")
+        self.folder_id = self.drive.create_folder_path(["backups"])
+        self.drive.create_file("kept.zip", self.folder_id, b"1")
+        self.deleted_id = self.drive.create_file("deleted.zip", self.folder_id, b"2")
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def run_service(self, check) -> None:
+        mirror = DriveMirror(self.mirror_path)
+        try:
+            service = GoogleDriveService(["reader@example.com"], metadata_mirror=mirror)
+            check(service)
+        finally:
+            mirror.close()
+
+    def test_changes_made_between_runs_are_applied(self):
+        self.run_service(
+            lambda service: self.assertTrue(
+                service.file_exists("deleted.zip", self.folder_id)
+            )
+        )
+        self.drive.handle("DELETE", f"/drive/v3/files/{self.deleted_id}", {}, b"")
+        self.drive.create_file("added.zip", self.folder_id, b"3")
+        self.drive.calls.clear()
+
+        def check(service):
+            self.assertFalse(service.file_exists("deleted.zip", self.folder_id))
+            self.assertTrue(service.file_exists("added.zip", self.folder_id))
+            self.assertTrue(service.file_exists("kept.zip", self.folder_id))
+
+        self.run_service(check)
+
+        # The folder is not listed again, the changes feed is read once
+        self.assertEqual(self.drive.calls["drive.changes.list"], 1)
+        self.assertEqual(self.drive.calls["drive.files.list"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import httplib2
+import unittest
+
+from business_logic.drive_request_executor import DriveRequestExecutor
+from googleapiclient.errors import HttpError
+
+
+def http_error(status: int) -> HttpError:
+    return HttpError(httplib2.Response({"status": status}), b"{}")
+
+
+class FlakyRequest:
+    """
+    Fails with the given errors, then succeeds, counting the times it is sent.
+    """
+
+    def __init__(self, *errors: Exception):
+        self.errors = list(errors)
+        self.sent = 0
+
+    def __call__(self) -> dict:
+        self.sent += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return {"id": "created"}
+
+
+class DriveRequestExecutorRetryTest(unittest.TestCase):
+    """
+    Requests creating a resource are not sent again after an error they may have
+    succeeded despite, unless what they create is looked up first.
+    """
+
+    def setUp(self):
+        self.executor = DriveRequestExecutor(httplib2.Http, requests_per_second=None)
+        self.executor.backoff_delay = lambda error, attempt: 0
+
+    def test_idempotent_request_is_retried_after_server_error(self):
+        request = FlakyRequest(http_error(503), ConnectionError())
+        self.assertEqual(self.executor.call(request, "get"), {"id": "created"})
+        self.assertEqual(request.sent, 3)
+
+    def test_creation_is_not_retried_after_server_error(self):
+        request = FlakyRequest(http_error(500))
+        with self.assertRaises(HttpError):
+            self.executor.call(request, "create", idempotent=False)
+        self.assertEqual(request.sent, 1)
+
+    def test_creation_is_retried_when_rate_limited(self):
+        request = FlakyRequest(http_error(429))
+        self.assertEqual(
+            self.executor.call(request, "create", idempotent=False), {"id": "created"}
+        )
+        self.assertEqual(request.sent, 2)
+
+    def test_creation_found_by_lookup_is_not_sent_again(self):
+        request = FlakyRequest(http_error(502))
+        response = self.executor.call(
+            request, "create", idempotent=False, lookup=lambda: {"id": "existing"}
+        )
+        self.assertEqual(response, {"id": "existing"})
+        self.assertEqual(request.sent, 1)
+
+    def test_creation_not_found_by_lookup_is_sent_again(self):
+        request = FlakyRequest(TimeoutError())
+        response = self.executor.call(
+            request, "create", idempotent=False, lookup=lambda: None
+        )
+        self.assertEqual(response, {"id": "created"})
+        self.assertEqual(request.sent, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import io
+import os
+import tempfile
+import unittest
+
+from utils.encryption import (
+    HEADER_SIZE,
+    KEY_SIZE,
+    TAG_SIZE,
+    ArchiveCipher,
+    EncryptingWriter,
+    decrypt_file,
+    decrypt_stream,
+)
+
+CHUNK_SIZE = 1024
+FRAME_SIZE = CHUNK_SIZE + TAG_SIZE
+
+
+def pieces(data: bytes, size: int) -> list:
+    return [data[start : start + size] for start in range(0, len(data), size)]
+
+
+class EncryptionTest(unittest.TestCase):
+    """
+    The framed AES-GCM format: an archive decrypts back as a whole or from any
+    frame, and any change to its frames is detected.
+    """
+
+    def setUp(self):
+        self.key = os.urandom(KEY_SIZE)
+        # Enough for several batches, ending with a partial chunk
+        self.data = os.urandom(40 * CHUNK_SIZE + 100)
+
+    def encrypt(self, data: bytes, workers: int = 4) -> bytes:
+        output = io.BytesIO()
+        with EncryptingWriter(output, self.key, workers, CHUNK_SIZE) as writer:
+            # Written in pieces that do not match the chunks
+            for piece in pieces(data, 3000):
+                writer.write(piece)
+        return output.getvalue()
+
+    def decrypt(self, encrypted: bytes) -> bytes:
+        return b"".join(decrypt_stream(self.key, pieces(encrypted, 777)))
+
+    def frames(self, encrypted: bytes) -> list:
+        return pieces(encrypted[HEADER_SIZE:], FRAME_SIZE)
+
+    def test_round_trip(self):
+        for data in (self.data, self.data[: 8 * CHUNK_SIZE], b""):
+            for workers in (1, 4):
+                with self.subTest(size=len(data), workers=workers):
+                    encrypted = self.encrypt(data, workers)
+
+                    self.assertEqual(self.decrypt(encrypted), data)
+                    cipher = ArchiveCipher.from_header(self.key, encrypted)
+                    self.assertEqual(cipher.plaintext_size(len(encrypted)), len(data))
+
+    def test_frames_decrypt_on_their_own(self):
+        encrypted = self.encrypt(self.data)
+        cipher = ArchiveCipher.from_header(self.key, encrypted)
+        frame_count = cipher.frame_count(len(encrypted))
+
+        # E.g. the frames of a member, read with a ranged download
+        start = HEADER_SIZE + 10 * FRAME_SIZE
+        decrypted = b"".join(
+            cipher.decrypt_frames(
+                pieces(encrypted[start:], 500), first_frame=10, frame_count=frame_count
+            )
+        )
+
+        self.assertEqual(decrypted, self.data[10 * CHUNK_SIZE :])
+
+    def test_tampered_frame_is_rejected(self):
+        encrypted = bytearray(self.encrypt(self.data))
+        encrypted[HEADER_SIZE + 3 * FRAME_SIZE + 5] ^= 1
+
+        with self.assertRaises(ValueError):
+            self.decrypt(bytes(encrypted))
+
+    def test_tampered_header_is_rejected(self):
+        encrypted = bytearray(self.encrypt(self.data))
+        # The salt, authenticated with every frame
+        encrypted[HEADER_SIZE - 1] ^= 1
+
+        with self.assertRaises(ValueError):
+            self.decrypt(bytes(encrypted))
+
+    def test_reordered_frames_are_rejected(self):
+        encrypted = self.encrypt(self.data)
+        frames = self.frames(encrypted)
+        frames[2], frames[3] = frames[3], frames[2]
+
+        with self.assertRaises(ValueError):
+            self.decrypt(encrypted[:HEADER_SIZE] + b"".join(frames))
+
+    def test_stream_truncated_before_its_final_frame_is_rejected(self):
+        encrypted = self.encrypt(self.data)
+        frames = self.frames(encrypted)
+
+        # Cut between two frames, the last whole frame is not a final one
+        with self.assertRaises(ValueError):
+            self.decrypt(encrypted[:HEADER_SIZE] + b"".join(frames[:-1]))
+
+    def test_aborted_archive_has_no_final_frame(self):
+        output = io.BytesIO()
+        with self.assertRaises(RuntimeError):
+            with EncryptingWriter(output, self.key, 4, CHUNK_SIZE) as writer:
+                writer.write(self.data)
+                raise RuntimeError("archiving failed")
+
+        with self.assertRaises(ValueError):
+            self.decrypt(output.getvalue())
+
+    def test_wrong_key_is_rejected(self):
+        encrypted = self.encrypt(self.data)
+
+        with self.assertRaises(ValueError):
+            b"".join(decrypt_stream(os.urandom(KEY_SIZE), [encrypted]))
+
+    def test_failed_decryption_leaves_no_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            encrypted_path = os.path.join(directory, "backup.zip")
+            with open(encrypted_path, "wb") as encrypted_file:
+                encrypted_file.write(self.encrypt(self.data)[:-1])
+            decrypted_path = os.path.join(directory, "decrypted.zip")
+
+            with self.assertRaises(ValueError):
+                decrypt_file(self.key, encrypted_path, decrypted_path)
+
+            self.assertEqual(os.listdir(directory), ["backup.zip"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,112 @@
+import threading
+import time
+import unittest
+
+from utils.fair_share import FairRateLimiter, FairShare
+
+
+class FairShareTest(unittest.TestCase):
+    """
+    The order a single slot is granted in to the requests queued by several owners.
+    """
+
+    def setUp(self):
+        self.shares = FairShare(1)
+        self.granted = []
+        self.threads = []
+
+    def tearDown(self):
+        for thread in self.threads:
+            thread.join(timeout=5)
+
+    def queue(self, owner: str, cost: float = 1) -> None:
+        """
+        Queue a request of owner, once the previous ones are.
+        """
+
+        def take_turn():
+            with self.shares.slot(owner, cost):
+                self.granted.append(owner)
+
+        queued = len(self.shares._waiting) + 1
+        thread = threading.Thread(target=take_turn)
+        thread.start()
+        self.threads.append(thread)
+        while len(self.shares._waiting) < queued:
+            time.sleep(0.001)
+
+    def grant_queued(self) -> list:
+        self.shares.release()
+        for thread in self.threads:
+            thread.join(timeout=5)
+        return self.granted
+
+    def test_busy_owners_take_turns(self):
+        self.shares.acquire("holder")
+        for _ in range(6):
+            self.queue("a")
+        for _ in range(2):
+            self.queue("b")
+
+        self.assertEqual(self.grant_queued(), list("ababaaaa"))
+
+    def test_costly_requests_wait_longer(self):
+        self.shares.acquire("holder")
+        for _ in range(2):
+            self.queue("a", cost=4)
+        for _ in range(5):
+            self.queue("b")
+
+        self.assertEqual(self.grant_queued(), list("abbbbab"))
+
+    def test_idle_owner_does_not_bank_its_idle_time(self):
+        for _ in range(5):
+            with self.shares.slot("a"):
+                pass
+        self.shares.acquire("holder")
+        for _ in range(3):
+            self.queue("a")
+        for _ in range(3):
+            self.queue("b")
+
+        # b starts level with a, instead of being ahead by the 5 slots a used alone
+        self.assertEqual(self.grant_queued(), list("bababa"))
+
+    def test_free_slots_are_granted_at_once(self):
+        shares = FairShare(3)
+        for owner in "aab":
+            shares.acquire(owner)
+
+        self.assertEqual(shares._in_use, 3)
+
+
+class FairRateLimiterTest(unittest.TestCase):
+    def test_rate_is_shared_equally_whatever_the_concurrency(self):
+        limiter = FairRateLimiter(20000)
+        # Spend the initial burst
+        limiter.acquire("warm up", 20000)
+        amounts = {"a": 0, "b": 0}
+        stop = threading.Event()
+
+        def upload(owner: str):
+            while not stop.is_set():
+                limiter.acquire(owner, 500)
+                amounts[owner] += 500
+
+        # a uploads four times as many files at once as b
+        threads = [threading.Thread(target=upload, args=(owner,)) for owner in "aaaab"]
+        for thread in threads:
+            thread.start()
+        time.sleep(1)
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=5)
+
+        total = amounts["a"] + amounts["b"]
+        self.assertGreater(total, 10000)
+        self.assertLess(total, 30000)
+        self.assertAlmostEqual(amounts["b"] / total, 0.5, delta=0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from utils.file_discovery import FileMatcher, iter_files
+
+
+class FileDiscoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.folder = self.directory.name
+        for relative_path in (
+            "dump.sql",
+            "notes.txt",
+            "logs/app.sql",
+            "logs/2026/old.sql",
+            "cache/tmp.sql",
+            "data/a/b/deep.sql",
+        ):
+            path = os.path.join(self.folder, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as file:
+                file.write(relative_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def discover(self, matcher: FileMatcher, **kwargs) -> list:
+        return sorted(
+            file.relative_path for file in iter_files(self.folder, matcher, **kwargs)
+        )
+
+    def test_include_pattern_matches_file_names(self):
+        self.assertEqual(
+            self.discover(FileMatcher(r".*\.sql")),
+            ["dump.sql"],
+        )
+        self.assertEqual(
+            self.discover(FileMatcher(r".*\.sql"), max_depth=None),
+            [
+                "cache/tmp.sql",
+                "data/a/b/deep.sql",
+                "dump.sql",
+                "logs/2026/old.sql",
+                "logs/app.sql",
+            ],
+        )
+
+    def test_max_depth_limits_the_subdirectories_scanned(self):
+        self.assertEqual(
+            self.discover(FileMatcher(r".*\.sql"), max_depth=1),
+            ["cache/tmp.sql", "dump.sql", "logs/app.sql"],
+        )
+
+    def test_excluded_paths_and_directories_are_skipped(self):
+        matcher = FileMatcher(r".*\.sql", exclude=[r"cache$", r"logs/\d+$", r"dump"])
+
+        with mock.patch(
+            "utils.file_discovery.os.scandir", side_effect=os.scandir
+        ) as scandir:
+            discovered = self.discover(matcher, max_depth=None)
+
+        self.assertEqual(discovered, ["data/a/b/deep.sql", "logs/app.sql"])
+        # Excluded directories are not scanned at all
+        scanned = {
+            os.path.relpath(call.args[0], self.folder) for call in scandir.mock_calls
+        }
+        self.assertEqual(scanned, {".", "logs", "data", "data/a", "data/a/b"})
+
+    def test_directory_symbolic_links_are_followed_once(self):
+        os.symlink(self.folder, os.path.join(self.folder, "data", "loop"))
+        matcher = FileMatcher(r"deep\.sql")
+
+        self.assertEqual(self.discover(matcher, max_depth=None), ["data/a/b/deep.sql"])
+        self.assertEqual(
+            self.discover(matcher, max_depth=None, follow_symlinks=True),
+            ["data/a/b/deep.sql"],
+        )
+
+    def test_stat_is_the_one_of_the_file(self):
+        (file,) = iter_files(self.folder, FileMatcher(r"notes\.txt"))
+
+        self.assertEqual(file.path, os.path.join(self.folder, "notes.txt"))
+        self.assertEqual(file.stat.st_size, len("notes.txt"))
+
+    def test_missing_folder_is_an_error(self):
+        with self.assertRaises(FileNotFoundError):
+            list(iter_files(os.path.join(self.folder, "missing"), FileMatcher(".*")))
+
+
+if __name__ == "__main__":
+    unittest.main()
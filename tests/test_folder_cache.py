@@ -0,0 +1,97 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fake_drive_server import FakeDrive, FakeDriveServer
+from business_logic.gdrive_service import GoogleDriveService
+
+PATH = ["backups", "project"]
+
+
+class FolderCacheTest(unittest.TestCase):
+    """
+    The folder IDs cached by a run, used by the next runs while the folders exist.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.drive = FakeDrive()
+        self.server = FakeDriveServer(self.drive).start()
+        environment = mock.patch.dict(
+            os.environ, {"GOOGLE_DRIVE_API_ROOT_URL": self.server.root_url}
+        )
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.cache_path = os.path.join(self.directory.name, "folders.json")
+        self.folder_ids = self.new_service().create_folder_structure(PATH)
+        self.drive.calls.clear()
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def new_service(self) -> GoogleDriveService:
+        """
+        A service as created by a run, sharing the cache of the previous runs.
+        """
+        service = GoogleDriveService(
+            ["reader@example.com"], folder_cache_path=self.cache_path
+        )
+        service.request_executor.backoff_delay = lambda error, attempt: 0
+        return service
+
+    def delete(self, folder_id: str) -> None:
+        self.drive.handle("DELETE", f"/drive/v3/files/{folder_id}", {}, b"")
+
+    def test_cached_path_costs_a_single_check(self):
+        service = self.new_service()
+
+        self.assertEqual(service.create_folder_structure(PATH), self.folder_ids)
+        self.assertEqual(service.create_folder_structure(PATH), self.folder_ids)
+        # The leaf folder is checked once per run, nothing is listed or created
+        self.assertEqual(self.drive.calls["drive.files.get"], 1)
+        self.assertEqual(self.drive.calls["drive.files.list"], 0)
+        self.assertEqual(self.drive.calls["drive.files.create"], 0)
+
+    def test_deleted_folder_is_created_again(self):
+        self.delete(self.folder_ids[-1])
+
+        folder_ids = self.new_service().create_folder_structure(PATH)
+
+        self.assertEqual(folder_ids[0], self.folder_ids[0])
+        self.assertNotEqual(folder_ids[-1], self.folder_ids[-1])
+        self.assertIn(folder_ids[-1], self.drive.files)
+        self.assertEqual(self.drive.calls["drive.files.create"], 1)
+        # The cache of the next runs is updated
+        self.assertEqual(self.new_service().folder_cache.get(PATH), folder_ids)
+
+    def test_trashed_folder_is_stale(self):
+        self.drive.files[self.folder_ids[-1]].resource["trashed"] = True
+
+        folder_ids = self.new_service().create_folder_structure(PATH)
+
+        self.assertNotEqual(folder_ids[-1], self.folder_ids[-1])
+        self.assertFalse(self.drive.files[folder_ids[-1]].resource["trashed"])
+
+    def test_upload_recovers_from_a_folder_deleted_during_the_run(self):
+        service = self.new_service()
+        self.assertEqual(service.prepare_folder(PATH), self.folder_ids[-1])
+        # Deleted after being checked, the upload answers 404
+        self.delete(self.folder_ids[-1])
+        path = os.path.join(self.directory.name, "BACKUP_PROJECT_20260101.zip")
+        with open(path, "wb") as file:
+            file.write(b"zip")
+
+        file_id = service.upload_file(path, PATH, parent_folder_id=self.folder_ids[-1])
+
+        folder_ids = service.folder_cache.get(PATH)
+        self.assertNotEqual(folder_ids[-1], self.folder_ids[-1])
+        self.assertEqual(
+            self.drive.files[file_id].resource["parents"], [folder_ids[-1]]
+        )
+        self.assertEqual(self.drive.files[file_id].content, b"zip")
+
+
+if __name__ == "__main__":
+    unittest.main()
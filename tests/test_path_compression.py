@@ -0,0 +1,109 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+
+from business_logic.create_backup import create_backup
+from concurrent.futures import ThreadPoolExecutor
+from models.files_to_backup import FilesToBackup
+from utils.compression import AUTO_SAMPLE_SIZE, decompress_chunks
+from utils.zip import (
+    ZIP_DEFLATED,
+    ZIP_STORED,
+    ZIP_ZSTANDARD,
+    ZipStreamWriter,
+    find_central_directory,
+    local_header_size,
+    parse_central_directory,
+)
+
+
+class PathCompressionTest(unittest.TestCase):
+    """
+    The compression of each path to backup, auto choosing it for every file, in a
+    single archive.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.directory.name, "data")
+        os.makedirs(self.folder)
+        generator = random.Random(3)
+        words = [b"INSERT", b"INTO", b"backups", b"VALUES", b"(1, 'a');\n"]
+        self.contents = {
+            "dump.sql": b" ".join(generator.choice(words) for _ in range(300000)),
+            "data.bin": os.urandom(2 * AUTO_SAMPLE_SIZE),
+            "photo.jpg": b"jpg" * AUTO_SAMPLE_SIZE,
+        }
+        for name, content in self.contents.items():
+            with open(os.path.join(self.folder, name), "wb") as file:
+                file.write(content)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def archive(self, paths_to_backup: list) -> dict:
+        """
+        The members of the archive of the paths to backup, by name, with their
+        compression method and content.
+        """
+        output = io.BytesIO()
+        with ZipStreamWriter(output) as archive:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                create_backup(paths_to_backup, archive, executor, window=4)
+        data = output.getvalue()
+
+        offset, size = find_central_directory(data, len(data))
+        members = {}
+        for member in parse_central_directory(data[offset : offset + size]):
+            start = member.header_offset + local_header_size(
+                data[member.header_offset :]
+            )
+            content = b"".join(
+                decompress_chunks(
+                    member.method, [data[start : start + member.compress_size]]
+                )
+            )
+            members[member.arcname] = (member.method, content)
+        return members
+
+    def test_each_path_has_its_compression(self):
+        members = self.archive(
+            [
+                FilesToBackup(f"{self.folder}/", ".*", "auto", None, "auto"),
+                FilesToBackup(f"{self.folder}/", r".*\.sql", "store", None, "store"),
+                FilesToBackup(f"{self.folder}/", r".*\.sql", "zstd", None, "zstd:9"),
+            ]
+        )
+
+        self.assertEqual(
+            {name: method for name, (method, _) in members.items()},
+            {
+                "auto/dump.sql": ZIP_DEFLATED,
+                # Incompressible, found by sampling
+                "auto/data.bin": ZIP_STORED,
+                # Compressed already, from its extension
+                "auto/photo.jpg": ZIP_STORED,
+                "store/dump.sql": ZIP_STORED,
+                "zstd/dump.sql": ZIP_ZSTANDARD,
+            },
+        )
+        for name, (_, content) in members.items():
+            self.assertEqual(content, self.contents[os.path.basename(name)], name)
+
+    def test_file_of_several_paths_with_the_same_compression(self):
+        members = self.archive(
+            [
+                FilesToBackup(f"{self.folder}/", r".*\.sql", "first", None, "deflate"),
+                FilesToBackup(f"{self.folder}/", r".*\.sql", "second", None, "deflate"),
+            ]
+        )
+
+        self.assertEqual(set(members), {"first/dump.sql", "second/dump.sql"})
+        self.assertEqual(members["first/dump.sql"], members["second/dump.sql"])
+        self.assertEqual(members["first/dump.sql"][1], self.contents["dump.sql"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from benchmarks.fake_drive_server import DriveError, FakeDrive, FakeDriveServer
+from business_logic.gdrive_service import GoogleDriveService
+from business_logic.permission_cache import ANYONE, PermissionCache
+from utils.metrics import RunMetrics, use_run_metrics
+
+USERS_ROLES = {"reader@example.com": "reader", "writer@example.com": "writer"}
+
+
+class LossyFakeDrive(FakeDrive):
+    """
+    A FakeDrive creating the first permission it is asked for, then answering
+    with a server error, as when the response is lost.
+    """
+
+    lost_responses = 0
+
+    def _create_permission(self, *args, **kwargs):
+        response = super()._create_permission(*args, **kwargs)
+        if not self.lost_responses:
+            self.lost_responses += 1
+            raise DriveError(500, "backendError", "Response lost")
+        return response
+
+
+class PermissionReconciliationTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.drive = LossyFakeDrive() if "lost" in self._testMethodName else FakeDrive()
+        self.server = FakeDriveServer(self.drive).start()
+        environment = mock.patch.dict(
+            os.environ, {"GOOGLE_DRIVE_API_ROOT_URL": self.server.root_url}
+        )
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.cache_path = os.path.join(self.directory.name, "permissions.json")
+        self.service = self.new_service()
+        self.folder_id = self.drive.create_folder_path(["backups"])
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def new_service(self) -> GoogleDriveService:
+        """
+        A service as created by a run, sharing the cache of the previous runs.
+        """
+        service = GoogleDriveService(
+            list(USERS_ROLES),
+            users_roles=USERS_ROLES,
+            permission_cache=PermissionCache(self.cache_path),
+        )
+        service.request_executor.backoff_delay = lambda error, attempt: 0
+        return service
+
+    def permission_calls(self) -> int:
+        return sum(
+            calls
+            for endpoint, calls in self.drive.calls.items()
+            if endpoint.startswith("drive.permissions")
+        )
+
+    def roles(self, file_id: str) -> dict:
+        return {
+            permission["id"]: permission["role"]
+            for permission in self.drive.files[file_id].permissions
+        }
+
+    def test_missing_permissions_are_created_and_lower_roles_raised(self):
+        self.service.reconcile_permissions(
+            self.folder_id, {"writer@example.com": "reader"}
+        )
+
+        changes = self.service.reconcile_permissions(
+            self.folder_id, {**USERS_ROLES, ANYONE: "reader"}
+        )
+
+        self.assertEqual(changes, 3)
+        self.assertEqual(
+            self.roles(self.folder_id),
+            {
+                "owner": "owner",
+                "writer@example.com": "writer",
+                "reader@example.com": "reader",
+                "anyoneWithLink": "reader",
+            },
+        )
+        self.assertEqual(self.drive.calls["drive.permissions.list"], 2)
+        self.assertEqual(self.drive.calls["batch"], 2)
+
+    def test_unchanged_run_makes_no_permission_request(self):
+        self.service.upload_bytes(
+            "first", b"1", self.service.prepare_folder(["backups"])
+        )
+        calls = self.permission_calls()
+
+        service = self.new_service()
+        parent_folder_id = service.prepare_folder(["backups"])
+        service.upload_bytes("second", b"2", parent_folder_id)
+        path = os.path.join(self.directory.name, "backup.zip")
+        with open(path, "wb") as file:
+            file.write(b"zip")
+        service.upload_file(path, ["backups"])
+
+        self.assertEqual(self.permission_calls(), calls)
+        # The files inherit the sharing of the folder
+        self.assertEqual(self.roles(self.folder_id)["anyoneWithLink"], "reader")
+
+    def test_invalidated_sharing_is_listed_again(self):
+        self.service.prepare_folder(["backups"])
+        self.drive.files[self.folder_id].permissions.clear()
+
+        self.service.invalidate_folder_structure(["backups"])
+        self.service.prepare_folder(["backups"])
+
+        self.assertEqual(self.drive.calls["drive.permissions.list"], 2)
+        self.assertIn("reader@example.com", self.roles(self.folder_id))
+
+    def test_permission_whose_response_was_lost_is_not_created_twice(self):
+        changes = self.service.reconcile_permissions(self.folder_id, {ANYONE: "reader"})
+
+        # Listed again instead of being created again
+        self.assertEqual(changes, 0)
+        self.assertEqual(self.drive.calls["drive.permissions.create"], 1)
+        self.assertEqual(self.drive.calls["drive.permissions.list"], 2)
+        self.assertEqual(
+            self.roles(self.folder_id), {"owner": "owner", "anyoneWithLink": "reader"}
+        )
+        self.assertTrue(
+            PermissionCache(self.cache_path).is_shared(
+                self.folder_id, {ANYONE: "reader"}
+            )
+        )
+
+    def test_reconciliation_time_is_counted_once(self):
+        metrics = RunMetrics()
+        start = time.monotonic()
+
+        with use_run_metrics(metrics):
+            self.service.reconcile_permissions(self.folder_id, USERS_ROLES)
+
+        elapsed = time.monotonic() - start
+        sharing = metrics.report("project", True)["phases"]["sharing"]
+        self.assertLessEqual(sharing["busyTime"], elapsed)
+
+
+if __name__ == "__main__":
+    unittest.main()
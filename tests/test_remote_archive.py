@@ -0,0 +1,211 @@
+import os
+import random
+import tempfile
+import threading
+import unittest
+import zipfile
+import zlib
+
+from business_logic.create_backup import build_backup
+from business_logic.remote_archive import (
+    FIRST_TAIL_SIZE,
+    ArchivePart,
+    RemoteArchive,
+)
+from business_logic.restore_backup import BackupRestorer, member_path, select_members
+from models.files_to_backup import FilesToBackup
+from utils.encryption import HEADER_SIZE, KEY_SIZE, Encryption
+from utils.zip import local_header_size
+
+
+class InMemoryDrive:
+    """
+    The part of GoogleDriveService read by RemoteArchive, keeping the ranges
+    downloaded.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.downloads = []
+        self._lock = threading.Lock()
+
+    def download(self, file_id: str, start: int = 0, end: int = None) -> bytes:
+        content = self.files[file_id]
+        end = len(content) - 1 if end is None else min(end, len(content) - 1)
+        with self._lock:
+            self.downloads.append((file_id, start, end))
+        return content[start : end + 1]
+
+
+class RemoteArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        folder = os.path.join(self.directory.name, "data")
+        os.makedirs(os.path.join(folder, "logs"))
+        generator = random.Random(24)
+        self.contents = {
+            "big.bin": generator.randbytes(3 * 1024 * 1024),
+            "dump.sql": b"INSERT INTO backups VALUES (1);\n" * 20000,
+            "notes.txt": b"notes",
+            "logs/app.log": b"started\n" * 1000,
+        }
+        for name, content in self.contents.items():
+            with open(os.path.join(folder, name), "wb") as file:
+                file.write(content)
+        os.utime(os.path.join(folder, "notes.txt"), (1767225600, 1767225600))
+        self.paths_to_backup = [
+            FilesToBackup(f"{folder}/", ".*", "data", None, "auto", recursive=True)
+        ]
+        self.drive = InMemoryDrive()
+        self.output_dir = os.path.join(self.directory.name, "restored")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def archive(self, volume_sizes=(), encryption=None) -> RemoteArchive:
+        """
+        The archive of the paths to backup stored on the in-memory drive, as
+        volumes of volume_sizes bytes followed by one with the rest.
+        """
+        path = build_backup(
+            self.paths_to_backup,
+            os.path.join(self.directory.name, "BACKUP_P_20261017.zip"),
+            encryption=encryption,
+        )
+        with open(path, "rb") as archive_file:
+            self.archive_data = archive_file.read()
+        parts = []
+        offset = 0
+        for number, size in enumerate(
+            [*volume_sizes, len(self.archive_data) - sum(volume_sizes)]
+        ):
+            self.drive.files[str(number)] = self.archive_data[offset : offset + size]
+            parts.append(ArchivePart(str(number), size))
+            offset += size
+        return RemoteArchive(
+            self.drive, parts, encryption.key if encryption is not None else None
+        )
+
+    def test_directory_is_listed_with_the_tail_of_the_archive(self):
+        archive = self.archive()
+
+        entries = archive.entries()
+
+        with zipfile.ZipFile(
+            os.path.join(self.directory.name, "BACKUP_P_20261017.zip")
+        ) as zip_file:
+            self.assertEqual([entry.arcname for entry in entries], zip_file.namelist())
+        # The header telling whether it is encrypted, then its tail
+        self.assertEqual(
+            self.drive.downloads,
+            [
+                ("0", 0, HEADER_SIZE - 1),
+                ("0", archive.size - FIRST_TAIL_SIZE, archive.size - 1),
+            ],
+        )
+
+    def test_member_is_read_from_its_range_only(self):
+        archive = self.archive()
+        (entry,) = select_members(archive.entries(), ["data/notes.txt"])
+        self.drive.downloads.clear()
+        bytes_read = archive.bytes_read
+
+        self.assertEqual(b"".join(archive.iter_member(entry)), b"notes")
+        # Its local header and data, in a single download
+        ((_, start, end),) = self.drive.downloads
+        self.assertEqual(start, entry.header_offset)
+        self.assertLess(archive.bytes_read - bytes_read, 200)
+
+    def test_large_member_is_read_by_ranges(self):
+        archive = self.archive()
+        (entry,) = select_members(archive.entries(), ["data/big.bin"])
+        self.drive.downloads.clear()
+
+        data = b"".join(archive.iter_member(entry, read_size=1024 * 1024))
+
+        self.assertEqual(data, self.contents["big.bin"])
+        # The first range is read with the local header
+        self.assertEqual(len(self.drive.downloads), 3)
+
+    def test_members_spanning_volumes_are_read(self):
+        # Volumes cutting through members and the central directory
+        archive = self.archive(volume_sizes=(1024 * 1024, 1024 * 1024 + 7, 2048))
+
+        for entry in archive.entries():
+            with self.subTest(member=entry.arcname):
+                name = entry.arcname.removeprefix("data/")
+                self.assertEqual(
+                    b"".join(archive.iter_member(entry, read_size=300000)),
+                    self.contents[name],
+                )
+        self.assertEqual(
+            {file_id for file_id, _, _ in self.drive.downloads}, set("0123")
+        )
+
+    def test_selected_members_are_restored(self):
+        archive = self.archive(volume_sizes=(1500000,))
+        entries = select_members(archive.entries(), ["data/*.txt", "data/logs/*"])
+
+        restored_size = BackupRestorer(archive, self.output_dir, parallel=3).restore(
+            entries
+        )
+
+        self.assertEqual(
+            restored_size, len(b"notes") + len(self.contents["logs/app.log"])
+        )
+        restored = {}
+        for folder, _, names in os.walk(self.output_dir):
+            for name in names:
+                path = os.path.join(folder, name)
+                with open(path, "rb") as file:
+                    restored[os.path.relpath(path, self.output_dir)] = file.read()
+        self.assertEqual(
+            restored,
+            {
+                "data/notes.txt": b"notes",
+                "data/logs/app.log": self.contents["logs/app.log"],
+            },
+        )
+        self.assertEqual(
+            os.stat(os.path.join(self.output_dir, "data", "notes.txt")).st_mtime,
+            1767225600,
+        )
+        # The big member is not downloaded
+        self.assertLess(archive.bytes_read, 1024 * 1024)
+
+    def test_encrypted_archive_is_restored_from_the_frames_read(self):
+        key = os.urandom(KEY_SIZE)
+        archive = self.archive(encryption=Encryption(key))
+        entries = select_members(archive.entries(), ["data/dump.sql"])
+
+        BackupRestorer(archive, self.output_dir).restore(entries)
+
+        with open(os.path.join(self.output_dir, "data", "dump.sql"), "rb") as file:
+            self.assertEqual(file.read(), self.contents["dump.sql"])
+        self.assertLess(archive.bytes_read, len(self.archive_data) / 10)
+
+    def test_corrupted_member_is_not_restored(self):
+        archive = self.archive()
+        (entry,) = select_members(archive.entries(), ["data/logs/app.log"])
+        stored = bytearray(self.drive.files["0"])
+        # A byte of the member data, after its local header
+        data_offset = entry.header_offset + local_header_size(
+            stored[entry.header_offset :]
+        )
+        stored[data_offset + entry.compress_size // 2] ^= 1
+        self.drive.files["0"] = bytes(stored)
+
+        with self.assertRaises((ValueError, zlib.error)):
+            BackupRestorer(archive, self.output_dir).restore([entry])
+
+        self.assertEqual(os.listdir(os.path.join(self.output_dir, "data", "logs")), [])
+
+    def test_member_names_escaping_the_restore_folder_are_rejected(self):
+        for arcname in ("../outside.txt", "data/../../outside.txt", "/etc/passwd"):
+            with self.subTest(arcname=arcname):
+                with self.assertRaises(ValueError):
+                    member_path(self.output_dir, arcname)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fake_drive_server import FakeDrive, FakeDriveServer
+from business_logic.gdrive_service import GoogleDriveService
+
+CHUNK_SIZE = 256 * 1024
+
+
+class ResumableUploadTest(unittest.TestCase):
+    """
+    An upload interrupted by a crash resumes from the offset the saved session
+    acknowledges, whatever the saved progress says.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server = FakeDriveServer(FakeDrive()).start()
+        environment = mock.patch.dict(
+            os.environ, {"GOOGLE_DRIVE_API_ROOT_URL": self.server.root_url}
+        )
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.service = GoogleDriveService(
+            ["reader@example.com"], upload_chunk_size=CHUNK_SIZE
+        )
+        self.path = os.path.join(self.directory.name, "backup.zip")
+        self.content = os.urandom(3 * CHUNK_SIZE + 100)
+        with open(self.path, "wb") as file:
+            file.write(self.content)
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def interrupt_upload(self, sent: int, saved_progress: int) -> None:
+        """
+        Send the first bytes of the file to a new session, and save its state.
+        """
+        session_uri = self.service._start_upload_session({"name": "backup.zip"})
+        total_size = len(self.content) if sent == len(self.content) else None
+        self.service._send_stream_chunk(session_uri, self.content[:sent], 0, total_size)
+        stat = os.stat(self.path)
+        with open(f"{self.path}.upload.json", "w") as state_file:
+            json.dump(
+                {
+                    "uri": session_uri,
+                    "progress": saved_progress,
+                    "size": stat.st_size,
+                    "mtime_ns": stat.st_mtime_ns,
+                },
+                state_file,
+            )
+
+    def stored_content(self, file_id: str) -> bytes:
+        return self.service.service.files().get_media(fileId=file_id).execute()
+
+    def test_upload_resumes_from_the_acknowledged_offset(self):
+        self.interrupt_upload(sent=2 * CHUNK_SIZE, saved_progress=CHUNK_SIZE)
+        bytes_received = self.server.bytes_received
+
+        uploaded = self.service._resumable_upload(self.path, {"name": "backup.zip"})
+
+        self.assertEqual(self.stored_content(uploaded["id"]), self.content)
+        # Only the bytes the session did not store are sent
+        self.assertEqual(
+            self.server.bytes_received - bytes_received,
+            len(self.content) - 2 * CHUNK_SIZE,
+        )
+        self.assertFalse(os.path.exists(f"{self.path}.upload.json"))
+
+    def test_completed_upload_is_not_sent_again(self):
+        self.interrupt_upload(sent=len(self.content), saved_progress=CHUNK_SIZE)
+        bytes_received = self.server.bytes_received
+
+        uploaded = self.service._resumable_upload(self.path, {"name": "backup.zip"})
+
+        self.assertEqual(self.stored_content(uploaded["id"]), self.content)
+        self.assertEqual(self.server.bytes_received, bytes_received)
+
+
+if __name__ == "__main__":
+    unittest.main()
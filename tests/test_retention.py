@@ -0,0 +1,112 @@
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from benchmarks.fake_drive_server import (
+    FOLDER_MIME_TYPE,
+    FakeDrive,
+    FakeDriveServer,
+)
+from business_logic.gdrive_service import DELETE_BATCH_SIZE, GoogleDriveService
+
+OLD_BACKUPS = 250
+RECENT_BACKUPS = 150
+
+
+class QueryRecordingFakeDrive(FakeDrive):
+    """
+    A FakeDrive keeping the queries of the files listed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.queries = []
+
+    def _list_files(self, query, *args, **kwargs):
+        self.queries.append(query.get("q"))
+        return super()._list_files(query, *args, **kwargs)
+
+
+class RetentionTest(unittest.TestCase):
+    def setUp(self):
+        self.drive = QueryRecordingFakeDrive()
+        self.server = FakeDriveServer(self.drive).start()
+        environment = mock.patch.dict(
+            os.environ, {"GOOGLE_DRIVE_API_ROOT_URL": self.server.root_url}
+        )
+        environment.start()
+        self.addCleanup(environment.stop)
+        # Pages smaller than the old backups, so they are listed in several pages
+        page_size = mock.patch("business_logic.gdrive_service.LIST_PAGE_SIZE", 100)
+        page_size.start()
+        self.addCleanup(page_size.stop)
+        # The deletions are not spaced out by the rate limit of the quota
+        self.service = GoogleDriveService(
+            ["reader@example.com"], requests_per_second=None
+        )
+        self.service.request_executor.backoff_delay = lambda error, attempt: 0
+
+        now = datetime.now(timezone.utc)
+        self.folder_id = self.drive.create_folder_path(["backups"])
+        subfolder_id = self.drive.create_file(
+            "project", self.folder_id, mime_type=FOLDER_MIME_TYPE
+        )
+        self.old_ids = {
+            self.create_backup(f"old_{number}", self.folder_id, now - timedelta(40))
+            for number in range(OLD_BACKUPS)
+        }
+        self.kept_ids = {
+            self.create_backup(f"new_{number}", self.folder_id, now - timedelta(20))
+            for number in range(RECENT_BACKUPS)
+        }
+        # Old, but not directly in the folder
+        self.kept_ids.add(
+            self.create_backup("nested", subfolder_id, now - timedelta(40))
+        )
+
+    def tearDown(self):
+        self.server.stop()
+
+    def create_backup(self, name: str, parent_id: str, modified: datetime) -> str:
+        return self.drive.create_file(
+            name,
+            parent_id,
+            b"zip",
+            modified_time=modified.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        )
+
+    def test_only_old_backups_of_the_folder_are_removed(self):
+        removed_count = self.service.remove_old_files(self.folder_id, days_old=30)
+
+        self.assertEqual(removed_count, OLD_BACKUPS)
+        self.assertTrue(self.old_ids.isdisjoint(self.drive.files))
+        self.assertTrue(self.kept_ids.issubset(self.drive.files))
+
+    def test_cutoff_is_part_of_the_query(self):
+        self.service.remove_old_files(self.folder_id, days_old=30)
+
+        cutoff = datetime.now(timezone.utc) - timedelta(30)
+        # Only the old backups are listed, by pages of LIST_PAGE_SIZE
+        self.assertEqual(len(self.drive.queries), 3)
+        for query in self.drive.queries:
+            self.assertIn(f"'{self.folder_id}' in parents", query)
+            self.assertIn(f"modifiedTime < '{cutoff:%Y-%m-%dT%H}", query)
+
+    def test_backups_are_deleted_by_batches(self):
+        self.service.remove_old_files(self.folder_id, days_old=30)
+
+        self.assertEqual(self.drive.calls["batch"], 3)
+        self.assertEqual(self.drive.calls["drive.files.delete"], OLD_BACKUPS)
+        self.assertEqual(DELETE_BATCH_SIZE, 100)
+
+    def test_nothing_to_remove_sends_no_batch(self):
+        removed_count = self.service.remove_old_files(self.folder_id, days_old=60)
+
+        self.assertEqual(removed_count, 0)
+        self.assertEqual(len(self.drive.queries), 1)
+        self.assertEqual(self.drive.calls["batch"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
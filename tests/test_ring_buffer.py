@@ -0,0 +1,172 @@
+import os
+import random
+import threading
+import unittest
+from unittest import mock
+
+from benchmarks.fake_drive_server import FakeDrive, FakeDriveServer
+from business_logic.gdrive_service import GoogleDriveService
+from utils.ring_buffer import RingBuffer, RingBufferAborted
+
+CHUNK_SIZE = 256 * 1024
+
+
+def produce(buffer: RingBuffer, data: bytes, piece_size: int) -> threading.Thread:
+    """
+    Write data into the buffer from another thread, by pieces, then close it.
+    """
+
+    def write():
+        for start in range(0, len(data), piece_size):
+            buffer.write(data[start : start + piece_size])
+        buffer.close()
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    return thread
+
+
+class RingBufferTest(unittest.TestCase):
+    def test_data_goes_through_a_smaller_buffer(self):
+        data = random.Random(12).randbytes(100000)
+        buffer = RingBuffer(1000)
+        producer = produce(buffer, data, 333)
+
+        chunks = []
+        while chunk := buffer.read(777):
+            chunks.append(chunk)
+        producer.join()
+
+        self.assertEqual(b"".join(chunks), data)
+        # Only the last read is short
+        self.assertTrue(all(len(chunk) == 777 for chunk in chunks[:-1]))
+        self.assertEqual(len(buffer._buffer), 1000)
+
+    def test_abort_fails_both_sides(self):
+        buffer = RingBuffer(10)
+        buffer.write(b"0123456789")
+        errors = []
+
+        def write():
+            try:
+                buffer.write(b"blocked")
+            except RingBufferAborted as error:
+                errors.append(error)
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        buffer.abort(RuntimeError("archiving failed"))
+        writer.join(timeout=5)
+
+        self.assertEqual(len(errors), 1)
+        with self.assertRaisesRegex(RingBufferAborted, "archiving failed"):
+            buffer.read(1)
+
+    def test_write_after_close_is_an_error(self):
+        buffer = RingBuffer(10)
+        buffer.close()
+
+        with self.assertRaises(ValueError):
+            buffer.write(b"late")
+        self.assertEqual(buffer.read(10), b"")
+
+    def test_capacity_must_be_positive(self):
+        for capacity in (0, -1):
+            with self.subTest(capacity=capacity):
+                with self.assertRaises(ValueError):
+                    RingBuffer(capacity)
+
+
+class RecordingFakeDrive(FakeDrive):
+    """
+    A FakeDrive keeping the Content-Range of the chunks it receives.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.content_ranges = []
+
+    def _send_chunk(self, query, headers, body, fault=None):
+        self.content_ranges.append(headers.get("content-range"))
+        return super()._send_chunk(query, headers, body, fault=fault)
+
+
+class StreamUploadTest(unittest.TestCase):
+    """
+    A stream uploaded from a ring buffer while it is written, its size unknown
+    until its last chunk.
+    """
+
+    def setUp(self):
+        self.drive = RecordingFakeDrive(
+            error_rate=0.3 if "fail" in self._testMethodName else 0, seed=12
+        )
+        self.server = FakeDriveServer(self.drive).start()
+        environment = mock.patch.dict(
+            os.environ, {"GOOGLE_DRIVE_API_ROOT_URL": self.server.root_url}
+        )
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.service = GoogleDriveService(
+            ["reader@example.com"], upload_chunk_size=CHUNK_SIZE
+        )
+        self.service.request_executor.backoff_delay = lambda error, attempt: 0
+        self.folder_id = self.drive.create_folder_path(["backups"])
+        self.drive.calls.clear()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def upload(self, data: bytes) -> dict:
+        buffer = RingBuffer(CHUNK_SIZE)
+        producer = produce(buffer, data, 100000)
+        try:
+            return self.service.upload_stream(buffer, "stream.zip", self.folder_id)
+        finally:
+            producer.join()
+
+    def stored_content(self, uploaded_file: dict) -> bytes:
+        return bytes(self.drive.files[uploaded_file["id"]].content)
+
+    def test_size_is_sent_with_the_last_chunk(self):
+        data = os.urandom(2 * CHUNK_SIZE + 1000)
+
+        uploaded_file = self.upload(data)
+
+        self.assertEqual(self.stored_content(uploaded_file), data)
+        self.assertEqual(
+            self.drive.content_ranges,
+            [
+                f"bytes 0-{CHUNK_SIZE - 1}/*",
+                f"bytes {CHUNK_SIZE}-{2 * CHUNK_SIZE - 1}/*",
+                f"bytes {2 * CHUNK_SIZE}-{len(data) - 1}/{len(data)}",
+            ],
+        )
+
+    def test_stream_ending_with_a_full_chunk_is_closed_by_an_empty_one(self):
+        data = os.urandom(2 * CHUNK_SIZE)
+
+        uploaded_file = self.upload(data)
+
+        self.assertEqual(self.stored_content(uploaded_file), data)
+        self.assertEqual(self.drive.content_ranges[-1], f"bytes */{len(data)}")
+
+    def test_empty_stream_is_an_empty_file(self):
+        uploaded_file = self.upload(b"")
+
+        self.assertEqual(self.stored_content(uploaded_file), b"")
+        self.assertEqual(self.drive.content_ranges, ["bytes */0"])
+
+    def test_failed_chunks_are_sent_again_from_the_stored_offset(self):
+        data = os.urandom(8 * CHUNK_SIZE + 1000)
+
+        uploaded_file = self.upload(data)
+
+        self.assertEqual(self.stored_content(uploaded_file), data)
+        self.assertGreater(self.drive.faults["drive.files.create.upload"], 0)
+        # The server was asked what it stored, before the size was known
+        self.assertIn("bytes */*", self.drive.content_ranges)
+
+
+if __name__ == "__main__":
+    unittest.main()
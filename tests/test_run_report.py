@@ -0,0 +1,58 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fake_drive_server import FakeDrive, FakeDriveServer
+from business_logic.gdrive_service import GoogleDriveService
+from utils.metrics import RunMetrics, use_run_metrics
+
+
+class PhaseAttributionTest(unittest.TestCase):
+    """
+    The Google Drive API calls of a run, counted in the phase making them.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.drive = FakeDrive()
+        self.server = FakeDriveServer(self.drive).start()
+        environment = mock.patch.dict(
+            os.environ, {"GOOGLE_DRIVE_API_ROOT_URL": self.server.root_url}
+        )
+        environment.start()
+        self.addCleanup(environment.stop)
+        self.service = GoogleDriveService(["reader@example.com"])
+        self.folder_id = self.drive.create_folder_path(["backups"])
+        self.metrics = RunMetrics()
+
+    def tearDown(self):
+        self.server.stop()
+        self.directory.cleanup()
+
+    def phases(self) -> dict:
+        return self.metrics.report("project", True)["phases"]
+
+    def test_existence_checks_are_not_counted_as_uploads(self):
+        with use_run_metrics(self.metrics):
+            self.assertFalse(self.service.file_exists("backup.zip", self.folder_id))
+
+        phases = self.phases()
+        self.assertEqual(phases["folder_resolution"]["apiCalls"], 1)
+        self.assertNotIn("upload", phases)
+
+    def test_upload_is_counted_apart_from_its_existence_check(self):
+        path = os.path.join(self.directory.name, "backup.zip")
+        with open(path, "wb") as backup_file:
+            backup_file.write(b"backup")
+
+        with use_run_metrics(self.metrics):
+            self.service.upload_file(path, ["backups"], self.folder_id)
+
+        phases = self.phases()
+        self.assertEqual(phases["folder_resolution"]["apiCalls"], 1)
+        self.assertGreater(phases["upload"]["apiCalls"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
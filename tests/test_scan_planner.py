@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from business_logic.scan_planner import plan_scans
+from models.files_to_backup import FilesToBackup
+
+
+class ScanPlannerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.directory.name, "data")
+        for relative_path in (
+            "dump.sql",
+            "app.log",
+            "logs/app.log",
+            "logs/2026/old.log",
+            "archive/dump.sql",
+        ):
+            path = os.path.join(self.folder, relative_path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as file:
+                file.write(relative_path)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def scan(self, paths_to_backup: list) -> dict:
+        """
+        The zip names of the paths to backup each file is routed to, by relative path.
+        """
+        (group,) = plan_scans(paths_to_backup)
+        return {
+            file.relative_path: [path_to_backup.zip_name for path_to_backup in routes]
+            for file, routes in group.scan()
+        }
+
+    def test_paths_to_the_same_folder_are_grouped(self):
+        other_folder = os.path.join(self.directory.name, "other")
+        os.makedirs(other_folder)
+        paths_to_backup = [
+            FilesToBackup(f"{self.folder}/", r".*\.sql", "sql", None),
+            FilesToBackup(f"{other_folder}/", ".*", "other", None),
+            FilesToBackup(f"{self.folder}/./", r".*\.log", "logs", None),
+            FilesToBackup(
+                f"{self.folder}/", ".*", "linked", None, follow_symlinks=True
+            ),
+        ]
+
+        groups = plan_scans(paths_to_backup)
+
+        self.assertEqual(
+            [
+                (group.folder_path, [path.zip_name for path in group.paths_to_backup])
+                for group in groups
+            ],
+            [
+                (self.folder, ["sql", "logs"]),
+                (other_folder, ["other"]),
+                # Not scanned the same way
+                (self.folder, ["linked"]),
+            ],
+        )
+
+    def test_files_are_routed_to_every_path_selecting_them(self):
+        routes = self.scan(
+            [
+                FilesToBackup(f"{self.folder}/", r".*\.sql", "sql", None),
+                FilesToBackup(f"{self.folder}/", ".*", "all", None),
+                FilesToBackup(f"{self.folder}/", r".*\.log", "logs", None),
+            ]
+        )
+
+        self.assertEqual(
+            routes, {"dump.sql": ["sql", "all"], "app.log": ["all", "logs"]}
+        )
+
+    def test_each_path_keeps_its_depth_and_exclusions(self):
+        paths_to_backup = [
+            FilesToBackup(f"{self.folder}/", r".*\.sql", "top", None),
+            FilesToBackup(
+                f"{self.folder}/", r".*\.log", "logs", None, recursive=True, max_depth=1
+            ),
+            FilesToBackup(
+                f"{self.folder}/",
+                ".*",
+                "tree",
+                None,
+                exclude=[r"logs$"],
+                recursive=True,
+            ),
+        ]
+
+        with mock.patch(
+            "utils.file_discovery.os.scandir", side_effect=os.scandir
+        ) as scandir:
+            routes = self.scan(paths_to_backup)
+
+        self.assertEqual(
+            routes,
+            {
+                "dump.sql": ["top", "tree"],
+                "app.log": ["logs", "tree"],
+                # Excluded from tree, but scanned for logs
+                "logs/app.log": ["logs"],
+                "archive/dump.sql": ["tree"],
+            },
+        )
+        # The folder is scanned once, logs/2026 is deeper than logs needs and
+        # excluded from tree
+        scanned = sorted(
+            os.path.relpath(call.args[0], self.folder) for call in scandir.mock_calls
+        )
+        self.assertEqual(scanned, [".", "archive", "logs"])
+
+    def test_invalid_path_to_backup_is_rejected(self):
+        with self.assertRaises(TypeError):
+            plan_scans([self.folder])
+
+
+if __name__ == "__main__":
+    unittest.main()
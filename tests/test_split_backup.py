@@ -0,0 +1,123 @@
+import os
+import tempfile
+import unittest
+
+from business_logic.volume_upload import (
+    VolumeUploader,
+    discard_interrupted_volumes,
+    interrupted_volumes,
+)
+from utils.backup_names import backup_name_pattern
+from utils.volume_writer import VolumeWriter, volume_path
+
+
+class FakeDriveService:
+    """
+    The part of GoogleDriveService used by the volume uploads, failing the upload
+    of the files whose name is in failing_names.
+    """
+
+    def __init__(self, stored_files=(), failing_names=()):
+        self.stored_files = list(stored_files)
+        self.failing_names = set(failing_names)
+        self.deleted_ids = []
+
+    def upload_to_folder(self, file_name, parent_folder_id, md5=None):
+        name = os.path.basename(file_name)
+        if name in self.failing_names:
+            raise OSError(f"upload of {name} failed")
+        self.stored_files.append({"id": f"id-{name}", "name": name})
+        return {"id": f"id-{name}", "name": name}
+
+    def list_files(self, parent_folder_id):
+        return list(self.stored_files)
+
+    def delete_files(self, files):
+        self.deleted_ids.extend(stored_file["id"] for stored_file in files)
+        return [stored_file["id"] for stored_file in files]
+
+
+class SplitBackupCleanupTest(unittest.TestCase):
+    """
+    What a split backup leaves on the disk and on Google Drive when it is
+    interrupted, by an error or by a crash.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.base_path = os.path.join(self.directory.name, "BACKUP_P_20260102.zip")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_incomplete_volume_is_removed_on_error(self):
+        completed = []
+        with self.assertRaises(RuntimeError):
+            with VolumeWriter(
+                self.base_path, 4, lambda path, number, _: completed.append(path)
+            ) as output:
+                output.write(b"123456")
+                raise RuntimeError("archiving failed")
+
+        self.assertEqual(completed, [volume_path(self.base_path, 1)])
+        self.assertTrue(os.path.exists(volume_path(self.base_path, 1)))
+        self.assertFalse(os.path.exists(volume_path(self.base_path, 2)))
+
+    def test_abort_removes_the_volumes_of_the_failed_backup(self):
+        service = FakeDriveService(failing_names={"BACKUP_P_20260102.zip.002"})
+        uploader = VolumeUploader(service, "folder", concurrency=1)
+        with VolumeWriter(self.base_path, 4, uploader.submit) as output:
+            output.write(b"12345678")
+        state_path = f"{volume_path(self.base_path, 2)}.upload.json"
+        open(state_path, "w").close()
+
+        with self.assertRaises(OSError):
+            uploader.wait()
+        uploader.abort()
+
+        self.assertEqual(service.deleted_ids, ["id-BACKUP_P_20260102.zip.001"])
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_next_run_discards_interrupted_volumes(self):
+        for name in (
+            "BACKUP_P_20260102.zip.003",
+            "BACKUP_P_20260102.zip.002.upload.json",
+        ):
+            open(os.path.join(self.directory.name, name), "w").close()
+        # Neither the archives nor the manifests of complete backups are leftovers
+        for name in ("BACKUP_P_20260101.zip", "BACKUP_P_20260101.zip.volumes.json"):
+            open(os.path.join(self.directory.name, name), "w").close()
+        service = FakeDriveService(
+            stored_files=[
+                {"id": "0", "name": "BACKUP_P_20260101.zip.001"},
+                {"id": "1", "name": "BACKUP_P_20260101.zip.volumes.json"},
+                {"id": "2", "name": "BACKUP_P_20260102.zip.001"},
+                {"id": "3", "name": "BACKUP_P_20260102.zip.002"},
+            ]
+        )
+
+        leftovers = interrupted_volumes(
+            self.directory.name, backup_name_pattern("p", "%Y%m%d")
+        )
+        self.assertEqual(list(leftovers), ["BACKUP_P_20260102.zip"])
+        self.assertEqual(discard_interrupted_volumes(service, "folder", leftovers), 2)
+        self.assertEqual(service.deleted_ids, ["2", "3"])
+        self.assertEqual(
+            sorted(os.listdir(self.directory.name)),
+            ["BACKUP_P_20260101.zip", "BACKUP_P_20260101.zip.volumes.json"],
+        )
+
+    def test_volumes_of_a_project_with_a_longer_name_are_left_alone(self):
+        for name in ("BACKUP_P_20260102.zip.001", "BACKUP_P_Q_20260102.zip.002"):
+            open(os.path.join(self.directory.name, name), "w").close()
+
+        leftovers = interrupted_volumes(
+            self.directory.name, backup_name_pattern("p", "%Y%m%d")
+        )
+
+        # P_Q may be writing its volumes at the same time
+        self.assertEqual(list(leftovers), ["BACKUP_P_20260102.zip"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+import unittest
+from unittest import mock
+
+from benchmarks.fake_drive_server import FakeDrive, FakeDriveServer
+
+GOOGLE_CLIENT_MODULES = ("googleapiclient", "google.auth", "httplib2")
+
+
+class StartupTest(unittest.TestCase):
+    def test_google_client_is_not_imported_before_it_is_needed(self):
+        for module in ("main", "restore", "business_logic.daemon"):
+            with self.subTest(module=module):
+                result = subprocess.run(
+                    [
+                        sys.executable,
+                        "-c",
+                        f"import sys, {module}; "
+                        f"print([name for name in {GOOGLE_CLIENT_MODULES} "
+                        "if name in sys.modules])",
+                    ],
+                    cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                    capture_output=True,
+                    text=True,
+                    check=True,
+                )
+
+                self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_session_is_opened_with_a_single_request(self):
+        drive = FakeDrive()
+        with FakeDriveServer(drive) as server:
+            with mock.patch.dict(
+                os.environ, {"GOOGLE_DRIVE_API_ROOT_URL": server.root_url}
+            ):
+                from business_logic.gdrive_service import GoogleDriveService
+
+                service = GoogleDriveService(["reader@example.com"])
+
+        # The discovery document is not downloaded, the user and the quota are
+        # read together
+        self.assertEqual(dict(drive.calls), {"drive.about.get": 1})
+        self.assertEqual(service.user_email, drive.user_email)
+        self.assertEqual(service.upload_url, f"{server.root_url}upload/drive/v3/files")
+
+
+if __name__ == "__main__":
+    unittest.main()
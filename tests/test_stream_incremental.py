@@ -0,0 +1,67 @@
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+
+from business_logic.create_backup import MANIFEST_NAME, stream_backup
+from business_logic.file_index import FileIndex
+from concurrent.futures import ThreadPoolExecutor
+from models.files_to_backup import FilesToBackup
+from utils.ring_buffer import RingBuffer
+
+
+class StreamIncrementalBackupTest(unittest.TestCase):
+    """
+    The stream output mode with incremental backups: the index is opened by the
+    project thread and used by the archiver thread, see upload_streamed_backup.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.directory.name, "data")
+        os.makedirs(self.folder)
+        for name in ("a.txt", "b.txt"):
+            with open(os.path.join(self.folder, name), "w") as file:
+                file.write(name * 100)
+        self.index = FileIndex(os.path.join(self.directory.name, "index.sqlite"))
+
+    def tearDown(self):
+        self.index.close()
+        self.directory.cleanup()
+
+    def stream(self, full: bool) -> zipfile.ZipFile:
+        self.index.begin_run(full)
+        buffer = RingBuffer(64 * 1024)
+        with ThreadPoolExecutor(max_workers=1) as archiver:
+            archiving = archiver.submit(
+                stream_backup,
+                [FilesToBackup(f"{self.folder}/", ".*", "data", None)],
+                buffer,
+                index=self.index,
+            )
+            archive = bytearray()
+            while data := buffer.read(64 * 1024):
+                archive += data
+            archiving.result()
+        self.index.commit()
+        return zipfile.ZipFile(io.BytesIO(archive))
+
+    def test_incremental_backup_from_archiver_thread(self):
+        full_archive = self.stream(full=True)
+        self.assertEqual(
+            sorted(full_archive.namelist()), [MANIFEST_NAME, "data/a.txt", "data/b.txt"]
+        )
+
+        with open(os.path.join(self.folder, "b.txt"), "a") as file:
+            file.write("changed")
+        os.remove(os.path.join(self.folder, "a.txt"))
+        incremental_archive = self.stream(full=False)
+        self.assertEqual(
+            sorted(incremental_archive.namelist()), [MANIFEST_NAME, "data/b.txt"]
+        )
+        self.assertIn(b"data/a.txt", incremental_archive.read(MANIFEST_NAME))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+from datetime import datetime, time
+from unittest import mock
+
+from business_logic.throttling import MB, scheduled_rate
+from models.throttle_window import ThrottleWindow
+from utils.throttle import MIN_RATE_FRACTION, Throttle
+
+
+class ThrottleWindowTest(unittest.TestCase):
+    def test_window_contains_its_start_but_not_its_end(self):
+        window = ThrottleWindow("09:00", "18:00", disk_read_mb_per_second=10)
+
+        self.assertTrue(window.contains(time(9, 0)))
+        self.assertTrue(window.contains(time(17, 59)))
+        self.assertFalse(window.contains(time(18, 0)))
+        self.assertFalse(window.contains(time(8, 59)))
+
+    def test_window_ending_before_it_starts_wraps_past_midnight(self):
+        window = ThrottleWindow("22:00", "06:00", upload_mb_per_second=50)
+
+        self.assertTrue(window.contains(time(22, 0)))
+        self.assertTrue(window.contains(time(0, 0)))
+        self.assertTrue(window.contains(time(5, 59)))
+        self.assertFalse(window.contains(time(6, 0)))
+        self.assertFalse(window.contains(time(12, 0)))
+
+    def test_invalid_windows_are_rejected(self):
+        for start, end in (("09:00", "09:00"), ("9h", "18:00"), ("09:00", "24:00")):
+            with self.subTest(start=start, end=end):
+                with self.assertRaises(ValueError):
+                    ThrottleWindow(start, end, disk_read_mb_per_second=1)
+        with self.assertRaises(TypeError):
+            ThrottleWindow("09:00", "18:00", upload_mb_per_second=0)
+
+
+class ScheduledRateTest(unittest.TestCase):
+    def setUp(self):
+        self.windows = [
+            ThrottleWindow("09:00", "18:00", disk_read_mb_per_second=10),
+            ThrottleWindow("12:00", "14:00", disk_read_mb_per_second=20),
+            ThrottleWindow("22:00", "06:00", upload_mb_per_second=50),
+        ]
+
+    def rate_at(self, hour: int, mb_per_second, attribute: str):
+        with mock.patch("business_logic.throttling.datetime") as clock:
+            clock.now.return_value = datetime(2026, 10, 17, hour, 30)
+            return scheduled_rate(mb_per_second, self.windows, attribute)()
+
+    def test_first_window_containing_the_time_sets_the_rate(self):
+        self.assertEqual(self.rate_at(10, 100, "disk_read_mb_per_second"), 10 * MB)
+        # Both daytime windows contain 12:30, the first one wins
+        self.assertEqual(self.rate_at(12, 100, "disk_read_mb_per_second"), 10 * MB)
+
+    def test_rate_outside_of_the_windows(self):
+        self.assertEqual(self.rate_at(20, 100, "disk_read_mb_per_second"), 100 * MB)
+        self.assertIsNone(self.rate_at(20, None, "disk_read_mb_per_second"))
+
+    def test_windows_only_set_their_own_rates(self):
+        # The night window limits the uploads, not the disk reads
+        self.assertIsNone(self.rate_at(23, None, "disk_read_mb_per_second"))
+        self.assertEqual(self.rate_at(23, None, "upload_mb_per_second"), 50 * MB)
+        self.assertIsNone(self.rate_at(10, None, "upload_mb_per_second"))
+
+
+class ThrottleTest(unittest.TestCase):
+    def setUp(self):
+        interval = mock.patch("utils.throttle.SCHEDULE_CHECK_INTERVAL", 0)
+        interval.start()
+        self.addCleanup(interval.stop)
+        self.scheduled = 100 * MB
+
+    def test_rate_follows_the_schedule(self):
+        throttle = Throttle(lambda: self.scheduled)
+        self.assertEqual(throttle.rate, 100 * MB)
+
+        # A window starts
+        self.scheduled = 10 * MB
+        throttle.acquire(1)
+        self.assertEqual(throttle.rate, 10 * MB)
+
+        # The last window ends, without a rate outside of it
+        self.scheduled = None
+        throttle.acquire(1)
+        self.assertIsNone(throttle.rate)
+        self.assertEqual(throttle.acquire(1000 * MB), 0)
+
+    def test_rate_backs_off_when_the_latency_is_high(self):
+        throttle = Throttle(lambda: self.scheduled, latency_threshold=0.05)
+
+        throttle.record_latency(0.2)
+        self.assertEqual(throttle.rate, 50 * MB)
+        # Halved at most once per interval, for the reads already in flight
+        throttle.record_latency(0.2)
+        self.assertEqual(throttle.rate, 50 * MB)
+
+        with mock.patch("utils.throttle.DECREASE_INTERVAL", 0):
+            for _ in range(10):
+                throttle.record_latency(0.2)
+        self.assertEqual(throttle.rate, 100 * MB * MIN_RATE_FRACTION)
+
+        throttle.record_latency(0.01)
+        self.assertGreater(throttle.rate, 100 * MB * MIN_RATE_FRACTION)
+        self.assertLessEqual(throttle.rate, 100 * MB)
+
+    def test_new_window_starts_at_its_full_rate(self):
+        throttle = Throttle(lambda: self.scheduled, latency_threshold=0.05)
+        throttle.record_latency(0.2)
+
+        self.scheduled = 20 * MB
+        throttle.acquire(1)
+
+        self.assertEqual(throttle.rate, 20 * MB)
+
+
+if __name__ == "__main__":
+    unittest.main()
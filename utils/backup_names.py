@@ -0,0 +1,75 @@
+import re
+
+# What the strftime directives of backupTimestampFormat produce, other directives
+# matching any word
+TIMESTAMP_DIRECTIVES = {
+    "Y": r"\d{4}",
+    "y": r"\d{2}",
+    "m": r"\d{2}",
+    "d": r"\d{2}",
+    "H": r"\d{2}",
+    "I": r"\d{2}",
+    "M": r"\d{2}",
+    "S": r"\d{2}",
+    "f": r"\d{6}",
+    "j": r"\d{3}",
+    "U": r"\d{2}",
+    "W": r"\d{2}",
+    "w": r"\d",
+    "%": "%",
+}
+
+
+def timestamp_regex(timestamp_format: str) -> str:
+    """
+    A regular expression matching the timestamps written with a strftime format.
+
+    Parameters
+    ----------
+    timestamp_format : str
+        The strftime format, e.g. %Y%m%d.
+
+    Returns
+    -------
+    str
+        The regular expression, e.g. \\d{4}\\d{2}\\d{2}.
+    """
+    parts = []
+    position = 0
+    while position < len(timestamp_format):
+        character = timestamp_format[position]
+        if character == "%" and position + 1 < len(timestamp_format):
+            directive = timestamp_format[position + 1]
+            parts.append(TIMESTAMP_DIRECTIVES.get(directive, r"\w+?"))
+            position += 2
+        else:
+            parts.append(re.escape(character))
+            position += 1
+    return "".join(parts)
+
+
+def backup_name_pattern(project_name: str, timestamp_format: str) -> re.Pattern:
+    """
+    The names of the backups of a project, BACKUP_<PROJECT>_<timestamp> followed by
+    their suffix, e.g. _INCR.zip or .zip.001.
+
+    The timestamp is matched by its format, so the backups of a project are told
+    apart from those of another one whose name starts the same way, e.g. FOO and
+    FOO_BAR, whose files are in the same backups folder.
+
+    Parameters
+    ----------
+    project_name : str
+        The name of the project.
+    timestamp_format : str
+        The strftime format of the timestamps, see backupTimestampFormat.
+
+    Returns
+    -------
+    re.Pattern
+        The pattern, to match the start of the names with.
+    """
+    return re.compile(
+        f"BACKUP_{re.escape(project_name.upper())}_"
+        f"{timestamp_regex(timestamp_format)}(?=_INCR\\.|\\.)"
+    )
@@ -0,0 +1,103 @@
+import hashlib
+import json
+import os
+
+from typing import BinaryIO, NamedTuple, Optional
+
+# Suffix of the sidecar file holding the checksums of an archive, e.g.
+# BACKUP_<PROJECT>_<date>.zip.checksums.json
+CHECKSUMS_SUFFIX = ".checksums.json"
+
+
+class ChecksumMismatchError(Exception):
+    """
+    Raised when data stored on Google Drive does not match the data written.
+    """
+
+
+class Checksums(NamedTuple):
+    """
+    The size, MD5 and SHA-256 hex digests of some data, e.g. an archive.
+    """
+
+    size: int
+    md5: str
+    sha256: str
+
+    def to_dict(self) -> dict:
+        return {"size": self.size, "md5": self.md5, "sha256": self.sha256}
+
+
+class HashingWriter:
+    """
+    Write-only file object computing the MD5 and SHA-256 digests of the data going
+    through it, on its way to another file object, so the data is never read back.
+    """
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self.size = 0
+        # MD5 is only used to compare with the checksum computed by Google Drive
+        self._md5 = hashlib.md5(usedforsecurity=False)
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        self._md5.update(data)
+        self._sha256.update(data)
+        self.size += len(data)
+        return self.fileobj.write(data)
+
+    def flush(self) -> None:
+        self.fileobj.flush()
+
+    def checksums(self) -> Checksums:
+        """
+        The checksums of the data written so far.
+        """
+        return Checksums(self.size, self._md5.hexdigest(), self._sha256.hexdigest())
+
+
+def checksums_path(archive_path: str) -> str:
+    return f"{archive_path}{CHECKSUMS_SUFFIX}"
+
+
+def checksums_document(archive_name: str, checksums: Checksums) -> bytes:
+    """
+    The content of the sidecar file of an archive.
+    """
+    return json.dumps({"name": archive_name, **checksums.to_dict()}, indent=2).encode(
+        "utf-8"
+    )
+
+
+def write_checksums(archive_path: str, checksums: Checksums) -> str:
+    """
+    Write the sidecar file of an archive next to it.
+
+    Returns
+    -------
+    str
+        The path of the sidecar file.
+    """
+    path = checksums_path(archive_path)
+    with open(path, "wb") as checksums_file:
+        checksums_file.write(
+            checksums_document(os.path.basename(archive_path), checksums)
+        )
+    return path
+
+
+def read_checksums(archive_path: str) -> Optional[Checksums]:
+    """
+    The checksums of an archive read from its sidecar file, None without one.
+    """
+    path = checksums_path(archive_path)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as checksums_file:
+        return parse_checksums(checksums_file.read())
+
+
+def parse_checksums(document: bytes) -> Checksums:
+    content = json.loads(document)
+    return Checksums(content["size"], content["md5"], content["sha256"])
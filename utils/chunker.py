@@ -0,0 +1,117 @@
+import hashlib
+import math
+
+from typing import BinaryIO, Iterator
+
+MIN_CHUNK_SIZE = 2 * 1024 * 1024
+MAX_CHUNK_SIZE = 8 * 1024 * 1024
+# Chunks are cut around this size on average, whatever the content
+AVERAGE_CHUNK_SIZE = 4 * 1024 * 1024
+READ_SIZE = 4 * MAX_CHUNK_SIZE
+
+
+def _derived_bits(label: bytes, count: int) -> bytes:
+    """
+    count bytes, each 0 or 1, derived from label: being hard coded, the cut points
+    of a file stay the same from a run, and a version, to the next.
+    """
+    return bytes(byte & 1 for byte in hashlib.shake_256(label).digest(count))
+
+
+def _gear_table() -> bytes:
+    """
+    One bit per byte value, set for half of them, chosen by their SHA-256.
+    """
+    ranked = sorted(
+        range(256), key=lambda value: hashlib.sha256(bytes([value])).digest()
+    )
+    set_values = set(ranked[:128])
+    return bytes(value in set_values for value in range(256))
+
+
+# The gear table of the rolling hash. The Gear hash of a position being the sum of
+# the table entries of the preceding bytes, each shifted by its distance, with
+# one-bit entries its low N bits are exactly the entries of the last N bytes: the
+# hashes of all the positions are computed at once by bytes.translate, and cut
+# points are searched by bytes.find, both in C.
+GEAR = _gear_table()
+# Normalized chunking (FastCDC): the hash must match more bits before the average
+# size than after, so most chunks end close to it
+_CUT_BITS = round(math.log2(AVERAGE_CHUNK_SIZE - MIN_CHUNK_SIZE))
+CUT_PATTERN_BEFORE_AVERAGE = _derived_bits(b"cut point", _CUT_BITS + 2)
+CUT_PATTERN_AFTER_AVERAGE = CUT_PATTERN_BEFORE_AVERAGE[-(_CUT_BITS - 2) :]
+
+
+def find_cut_point(data: bytes, start: int, end: int) -> int:
+    """
+    Find where the chunk starting at `start` ends.
+
+    A cut point is a position whose Gear hash matches a cut pattern, i.e. whose
+    preceding bytes are mapped by GEAR to the bits of the pattern. It only depends
+    on the last few bytes, so inserting or removing data shifts the boundaries
+    along with the content instead of changing every chunk after the edit, and
+    any content has cut points: long lines or binary data as much as short lines.
+
+    Parameters
+    ----------
+    data : bytes
+        The buffered data.
+    start : int
+        The start of the chunk in data.
+    end : int
+        The end of the buffered data.
+
+    Returns
+    -------
+    int
+        The end of the chunk, at most MAX_CHUNK_SIZE after start and never before
+        MIN_CHUNK_SIZE unless the data ends before.
+    """
+    limit = min(start + MAX_CHUNK_SIZE, end)
+    average = min(start + AVERAGE_CHUNK_SIZE, limit)
+    # The hashed window of the first possible cut point starts before it
+    window_start = max(start + MIN_CHUNK_SIZE - len(CUT_PATTERN_BEFORE_AVERAGE), 0)
+    hashes = data[window_start:limit].translate(GEAR)
+    # Cut points from MIN_CHUNK_SIZE to AVERAGE_CHUNK_SIZE, then up to the limit
+    for pattern, first_cut, last_cut in (
+        (CUT_PATTERN_BEFORE_AVERAGE, start + MIN_CHUNK_SIZE, average),
+        (CUT_PATTERN_AFTER_AVERAGE, average + 1, limit),
+    ):
+        position = hashes.find(
+            pattern,
+            max(first_cut - len(pattern) - window_start, 0),
+            last_cut - window_start,
+        )
+        if position != -1:
+            return window_start + position + len(pattern)
+    return limit
+
+
+def iter_chunks(fileobj: BinaryIO) -> Iterator[bytes]:
+    """
+    Split a stream in content-defined chunks.
+
+    Parameters
+    ----------
+    fileobj : BinaryIO
+        The stream to split.
+
+    Returns
+    -------
+    Iterator[bytes]
+        The chunks, in order. Their concatenation is the content of the stream.
+    """
+    data = b""
+    start = 0
+    eof = False
+    while True:
+        while not eof and len(data) - start < MAX_CHUNK_SIZE:
+            read = fileobj.read(READ_SIZE)
+            eof = not read
+            data = data[start:] + read
+            start = 0
+        if start >= len(data):
+            return
+        cut = find_cut_point(data, start, len(data))
+        yield data[start:cut]
+        start = cut
@@ -0,0 +1,258 @@
+import os
+import threading
+import zlib
+
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from typing import Iterable, Iterator
+
+from utils.zip import ZIP_DEFLATED, ZIP_STORED, ZIP_ZSTANDARD
+
+# Sample read at the start of a file to estimate its compressibility in "auto" mode
+AUTO_SAMPLE_SIZE = 256 * 1024
+# Compression is skipped when it saves less than 10% of the sample
+AUTO_MAX_RATIO = 0.9
+# Files with these extensions are already compressed, "auto" stores them without sampling
+COMPRESSED_EXTENSIONS = {
+    ".7z",
+    ".avi",
+    ".br",
+    ".bz2",
+    ".gz",
+    ".jpeg",
+    ".jpg",
+    ".lz4",
+    ".mkv",
+    ".mov",
+    ".mp3",
+    ".mp4",
+    ".png",
+    ".rar",
+    ".tgz",
+    ".webp",
+    ".xz",
+    ".zip",
+    ".zst",
+}
+
+
+class Codec(ABC):
+    """
+    Compresses the blocks of a file for a given zip method.
+
+    Blocks of the same file are compressed independently and concatenated in the
+    archive, so every codec must produce data that decodes as a single stream once
+    concatenated.
+    """
+
+    name = ""
+    method = ZIP_STORED
+    # Whether compress_block takes advantage of the data preceding the block
+    uses_dictionary = False
+
+    @abstractmethod
+    def compress_block(self, data: bytes, dictionary: bytes, last: bool) -> bytes:
+        pass
+
+
+class StoreCodec(Codec):
+    name = "store"
+    method = ZIP_STORED
+
+    def compress_block(self, data: bytes, dictionary: bytes, last: bool) -> bytes:
+        return data
+
+
+class DeflateCodec(Codec):
+    """
+    Raw deflate, blocks are primed with the tail of the previous block and ended by a
+    sync flush so that they concatenate into one stream.
+    """
+
+    name = "deflate"
+    method = ZIP_DEFLATED
+    uses_dictionary = True
+
+    def __init__(self, level: int = 6):
+        if not 1 <= level <= 9:
+            raise ValueError("deflate level must be between 1 and 9")
+        self.level = level
+
+    def compress_block(self, data: bytes, dictionary: bytes, last: bool) -> bytes:
+        if dictionary:
+            compressor = zlib.compressobj(
+                self.level, zlib.DEFLATED, -15, zdict=dictionary
+            )
+        else:
+            compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        return compressor.compress(data) + compressor.flush(
+            zlib.Z_FINISH if last else zlib.Z_SYNC_FLUSH
+        )
+
+
+class ZstdCodec(Codec):
+    """
+    Zstandard (zip method 93), every block is an independent frame.
+    Requires the optional zstandard package.
+    """
+
+    name = "zstd"
+    method = ZIP_ZSTANDARD
+
+    def __init__(self, level: int = 3):
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression requires the zstandard package")
+        if not 1 <= level <= 22:
+            raise ValueError("zstd level must be between 1 and 22")
+        self.level = level
+        self._zstandard = zstandard
+        # Codecs are shared, e.g. by projects compressing in their own thread, and
+        # a compressor must not be used by two threads at once
+        self._local = threading.local()
+
+    def compress_block(self, data: bytes, dictionary: bytes, last: bool) -> bytes:
+        compressor = getattr(self._local, "compressor", None)
+        if compressor is None:
+            compressor = self._zstandard.ZstdCompressor(level=self.level)
+            self._local.compressor = compressor
+        return compressor.compress(data)
+
+
+CODECS = {
+    StoreCodec.name: StoreCodec,
+    DeflateCodec.name: DeflateCodec,
+    ZstdCodec.name: ZstdCodec,
+}
+
+
+@lru_cache(maxsize=None)
+def get_codec(compression: str) -> Codec:
+    """
+    Build the codec described by a compression setting such as "store", "deflate",
+    "deflate:9" or "zstd:19". "auto" settings resolve to their fallback codec.
+
+    Parameters
+    ----------
+    compression : str
+        The compression setting.
+
+    Raises
+    ------
+    ValueError
+        If the setting is unknown or its level is invalid.
+
+    Returns
+    -------
+    Codec
+        The codec.
+    """
+    if not isinstance(compression, str):
+        raise ValueError("compression must be a string")
+
+    name, _, level = compression.partition(":")
+    if name == "auto":
+        return get_codec(level or DeflateCodec.name)
+    if name not in CODECS:
+        raise ValueError(
+            f"Unknown compression '{name}', expected one of: auto, {', '.join(CODECS)}"
+        )
+    if not level:
+        return CODECS[name]()
+    if name == StoreCodec.name or not level.isdigit():
+        raise ValueError(f"Invalid compression level in '{compression}'")
+    return CODECS[name](int(level))
+
+
+def is_auto(compression: str) -> bool:
+    return compression.partition(":")[0] == "auto"
+
+
+def is_worth_compressing(sample: bytes, compressed_size: int) -> bool:
+    """
+    Whether compressing a sample saved enough to be worth the CPU.
+    """
+    return not sample or compressed_size <= len(sample) * AUTO_MAX_RATIO
+
+
+def resolve_compression(compression: str, src_path: str, size: int) -> str:
+    """
+    Resolve an "auto" compression setting for a file.
+
+    Already compressed file types are stored. Files larger than the sample are
+    sampled: the first AUTO_SAMPLE_SIZE bytes are compressed with fast deflate and the
+    file is stored when the gain is too small. Smaller files are left to "auto" so the
+    decision is made on the whole content while compressing it.
+
+    Parameters
+    ----------
+    compression : str
+        The compression setting of the path to backup.
+    src_path : str
+        The file to compress.
+    size : int
+        The size of the file.
+
+    Returns
+    -------
+    str
+        The compression setting to use for this file.
+    """
+    if not is_auto(compression):
+        return compression
+
+    if os.path.splitext(src_path)[1].lower() in COMPRESSED_EXTENSIONS:
+        return StoreCodec.name
+    if size <= AUTO_SAMPLE_SIZE:
+        return compression
+
+    with open(src_path, "rb") as src:
+        sample = src.read(AUTO_SAMPLE_SIZE)
+    if is_worth_compressing(sample, len(zlib.compress(sample, 1))):
+        return compression.partition(":")[2] or DeflateCodec.name
+    return StoreCodec.name
+
+
+def decompress_chunks(method: int, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Decompress the data of a zip member read in chunks, e.g. by ranged downloads,
+    as compressed by the codecs: a single raw deflate stream, or zstd frames.
+
+    Raises
+    ------
+    ValueError
+        When the method is not supported, zstd data is read without the zstandard
+        package, or is invalid.
+    zlib.error
+        When deflate data is invalid.
+    """
+    if method == ZIP_STORED:
+        yield from chunks
+    elif method == ZIP_DEFLATED:
+        decompressor = zlib.decompressobj(-15)
+        for chunk in chunks:
+            yield decompressor.decompress(chunk)
+        yield decompressor.flush()
+        if not decompressor.eof:
+            raise zlib.error("Truncated deflate stream")
+    elif method == ZIP_ZSTANDARD:
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd decompression requires the zstandard package")
+        # Every block of a file is a frame of its own
+        dctx = zstandard.ZstdDecompressor()
+        decompressor = dctx.decompressobj()
+        for chunk in chunks:
+            while chunk:
+                try:
+                    yield decompressor.decompress(chunk)
+                except zstandard.ZstdError as error:
+                    raise ValueError(f"Invalid zstd data: {error}") from error
+                if not decompressor.eof:
+                    break
+                chunk = decompressor.unused_data
+                decompressor = dctx.decompressobj()
+    else:
+        raise ValueError(f"Unsupported zip compression method {method}")
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from typing import List, Set
+
+# Shortcuts for the usual schedules
+MACROS = {
+    "@yearly": "0 0 1 1 *",
+    "@annually": "0 0 1 1 *",
+    "@monthly": "0 0 1 * *",
+    "@weekly": "0 0 * * 0",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@hourly": "0 * * * *",
+}
+# Minute, hour, day of month, month, day of week (0 or 7 is Sunday)
+FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+MONTH_NAMES = "jan feb mar apr may jun jul aug sep oct nov dec".split()
+DAY_NAMES = "sun mon tue wed thu fri sat".split()
+# How far next_after looks for a matching minute, e.g. for "0 0 30 2 *"
+SEARCH_LIMIT = timedelta(days=5 * 366)
+
+
+def _parse_field(field: str, minimum: int, maximum: int, names: List[str]) -> Set[int]:
+    values = set()
+    for part in field.lower().split(","):
+        step = 1
+        if "/" in part:
+            part, step_text = part.split("/", 1)
+            step = int(step_text)
+            if step < 1:
+                raise ValueError(f"Invalid step in {field}")
+        if part == "*":
+            start, end = minimum, maximum
+        else:
+            bounds = [
+                (
+                    names.index(bound) + (minimum if names is MONTH_NAMES else 0)
+                    if bound in names
+                    else int(bound)
+                )
+                for bound in part.split("-", 1)
+            ]
+            start = bounds[0]
+            # "5/10" means from 5 to the maximum, every 10
+            end = bounds[-1] if len(bounds) > 1 or step == 1 else maximum
+        if not minimum <= start <= end <= maximum:
+            raise ValueError(f"Invalid range in {field}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """
+    A cron expression: "minute hour day-of-month month day-of-week", with lists,
+    ranges, steps and month and day names, or a macro like "@hourly".
+
+    As with cron, when both the day of month and the day of week are restricted,
+    a day matches either of them. Times are local and have a minute resolution.
+    """
+
+    def __init__(self, expression: str):
+        if not isinstance(expression, str):
+            raise TypeError("expression must be a string")
+        self.expression = expression
+        fields = MACROS.get(expression.strip().lower(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(
+                f"Invalid cron expression, expected 5 fields: {expression}"
+            )
+        try:
+            parsed = [
+                _parse_field(
+                    field,
+                    minimum,
+                    maximum,
+                    MONTH_NAMES if index == 3 else DAY_NAMES if index == 4 else [],
+                )
+                for index, (field, (minimum, maximum)) in enumerate(
+                    zip(fields, FIELD_RANGES)
+                )
+            ]
+        except ValueError as error:
+            raise ValueError(f"Invalid cron expression {expression}: {error}")
+        self.minutes, self.hours, self.days, self.months, days_of_week = parsed
+        self.days_of_week = {day % 7 for day in days_of_week}
+        self._any_day = fields[2] == "*"
+        self._any_day_of_week = fields[4] == "*"
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day_of_week = (moment.weekday() + 1) % 7
+        if self._any_day or self._any_day_of_week:
+            return moment.day in self.days and day_of_week in self.days_of_week
+        return moment.day in self.days or day_of_week in self.days_of_week
+
+    def matches(self, moment: datetime) -> bool:
+        return (
+            moment.minute in self.minutes
+            and moment.hour in self.hours
+            and moment.month in self.months
+            and self._day_matches(moment)
+        )
+
+    def next_after(self, moment: datetime) -> datetime:
+        """
+        The first time matching the schedule strictly after moment.
+
+        Raises
+        ------
+        ValueError
+            If the schedule never matches, e.g. on February 30th.
+        """
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + SEARCH_LIMIT
+        while candidate <= limit:
+            if candidate.month not in self.months:
+                candidate = (candidate.replace(day=1) + timedelta(days=32)).replace(
+                    day=1, hour=0, minute=0
+                )
+            elif not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression {self.expression} never matches")
+
+    def __str__(self):
+        return self.expression
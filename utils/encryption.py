@@ -0,0 +1,392 @@
+import base64
+import os
+import struct
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional
+
+# Environment variable holding the encryption key, base64 encoded. It takes
+# precedence over the encryptionKeyFile of the projects
+ENCRYPTION_KEY_ENV = "BACKUP2GDRIVE_ENCRYPTION_KEY"
+# AES-256
+KEY_SIZE = 32
+# Marks an encrypted archive, followed by its chunk size and the salt of its key
+MAGIC = b"B2GDAES1"
+SALT_SIZE = 16
+HEADER_SIZE = len(MAGIC) + 4 + SALT_SIZE
+# Size of the GCM tag closing each frame
+TAG_SIZE = 16
+# The archive is encrypted in frames of this many bytes, and decrypted the same way,
+# so any part of it can be read without the frames before, e.g. a single member
+CHUNK_SIZE = 64 * 1024
+# Frames are encrypted by batches of this many bytes, a task of the encryption pool
+BATCH_SIZE = 16 * CHUNK_SIZE
+
+
+class Encryption(NamedTuple):
+    """
+    The key encrypting the archives of a project, and the number of threads
+    encrypting their chunks.
+    """
+
+    key: bytes
+    workers: int = 1
+
+
+def parse_key(encoded_key: str) -> bytes:
+    """
+    Decode a base64 encoded key, e.g. made with `openssl rand -base64 32`.
+
+    Raises
+    ------
+    ValueError
+        When it is not the base64 encoding of 32 bytes.
+    """
+    try:
+        key = base64.b64decode(encoded_key.strip(), validate=True)
+    except ValueError:
+        raise ValueError("The encryption key must be base64 encoded")
+    if len(key) != KEY_SIZE:
+        raise ValueError(f"The encryption key must be {KEY_SIZE} bytes long")
+    return key
+
+
+def load_key(key_file: Optional[str] = None) -> bytes:
+    """
+    The encryption key, read from the ENCRYPTION_KEY_ENV environment variable or
+    else from key_file, both holding it base64 encoded.
+
+    Raises
+    ------
+    ValueError
+        When there is no valid key.
+    """
+    encoded_key = os.environ.get(ENCRYPTION_KEY_ENV)
+    if encoded_key is None and key_file is not None:
+        with open(key_file, "r") as key_file_object:
+            encoded_key = key_file_object.read()
+    if encoded_key is None:
+        raise ValueError(
+            f"Encryption requires the {ENCRYPTION_KEY_ENV} environment variable "
+            "or encryptionKeyFile"
+        )
+    return parse_key(encoded_key)
+
+
+def is_encrypted(header: bytes) -> bool:
+    return header.startswith(MAGIC)
+
+
+class ArchiveCipher:
+    """
+    AES-256-GCM encryption of an archive in frames of chunk_size bytes.
+
+    The key of the archive is derived from the key of the project and a random salt
+    with HKDF, so nonces are never reused across archives. The nonce of a frame is
+    its number, and a flag marking the last frame, so frames can be neither
+    reordered nor dropped, nor the archive truncated. The header of the archive,
+    authenticated with every frame, holds its chunk size and salt.
+
+    Each frame is the encrypted chunk followed by its tag, every frame being
+    chunk_size + TAG_SIZE bytes long but the last one, which is shorter and can
+    hold an empty chunk. Requires the optional cryptography package.
+    """
+
+    def __init__(self, key: bytes, salt: bytes, chunk_size: int = CHUNK_SIZE):
+        try:
+            from cryptography.hazmat.primitives import hashes
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+            from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+        except ImportError:
+            raise ValueError("Encryption requires the cryptography package")
+        if len(key) != KEY_SIZE:
+            raise ValueError(f"The encryption key must be {KEY_SIZE} bytes long")
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be positive")
+        self.chunk_size = chunk_size
+        self.frame_size = chunk_size + TAG_SIZE
+        self.header = MAGIC + struct.pack("<I", chunk_size) + salt
+        archive_key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=KEY_SIZE,
+            salt=salt,
+            info=b"backup2gdrive archive",
+        ).derive(key)
+        self._aead = AESGCM(archive_key)
+
+    @classmethod
+    def new(cls, key: bytes, chunk_size: int = CHUNK_SIZE) -> "ArchiveCipher":
+        """
+        The cipher of a new archive, with a random salt.
+        """
+        return cls(key, os.urandom(SALT_SIZE), chunk_size)
+
+    @classmethod
+    def from_header(cls, key: bytes, header: bytes) -> "ArchiveCipher":
+        """
+        The cipher of an encrypted archive, from its first HEADER_SIZE bytes.
+
+        Raises
+        ------
+        ValueError
+            When the header is not the one of an encrypted archive.
+        """
+        if len(header) < HEADER_SIZE or not is_encrypted(header):
+            raise ValueError("Not an encrypted archive")
+        (chunk_size,) = struct.unpack_from("<I", header, len(MAGIC))
+        return cls(key, header[len(MAGIC) + 4 : HEADER_SIZE], chunk_size)
+
+    def frame_count(self, encrypted_size: int) -> int:
+        """
+        The number of frames of an encrypted archive of encrypted_size bytes.
+        """
+        return (encrypted_size - HEADER_SIZE) // self.frame_size + 1
+
+    def plaintext_size(self, encrypted_size: int) -> int:
+        return (
+            encrypted_size - HEADER_SIZE - self.frame_count(encrypted_size) * TAG_SIZE
+        )
+
+    def _nonce(self, index: int, final: bool) -> bytes:
+        return struct.pack(">Q3xB", index, final)
+
+    def encrypt_frame(self, index: int, chunk: bytes, final: bool) -> bytes:
+        return self._aead.encrypt(self._nonce(index, final), chunk, self.header)
+
+    def encrypt_frames(self, first_frame: int, data: bytes, final: bool) -> List[bytes]:
+        """
+        Encrypt the consecutive chunks of data starting at first_frame. Without
+        final, data is made of whole chunks. With final, the rest of data after its
+        whole chunks, possibly nothing, is the last chunk of the archive.
+
+        Returns
+        -------
+        List[bytes]
+            The frames, in order.
+        """
+        view = memoryview(data)
+        chunk_count = len(data) // self.chunk_size
+        frames = [
+            self.encrypt_frame(
+                first_frame + number,
+                view[number * self.chunk_size : (number + 1) * self.chunk_size],
+                False,
+            )
+            for number in range(chunk_count)
+        ]
+        if final:
+            frames.append(
+                self.encrypt_frame(
+                    first_frame + chunk_count,
+                    view[chunk_count * self.chunk_size :],
+                    True,
+                )
+            )
+        return frames
+
+    def decrypt_frame(self, index: int, frame: bytes, final: bool) -> bytes:
+        """
+        Raises
+        ------
+        ValueError
+            When the frame is corrupted, truncated, or encrypted with another key.
+        """
+        from cryptography.exceptions import InvalidTag
+
+        try:
+            return self._aead.decrypt(self._nonce(index, final), frame, self.header)
+        except InvalidTag:
+            raise ValueError(
+                f"Frame {index} can not be decrypted: wrong encryption key, or "
+                "corrupted or truncated archive"
+            )
+
+    def decrypt_frames(
+        self,
+        frames: Iterable[bytes],
+        first_frame: int = 0,
+        frame_count: Optional[int] = None,
+    ) -> Iterator[bytes]:
+        """
+        Decrypt consecutive frames starting at first_frame, read from chunks of any
+        size, e.g. ranged downloads. The last frame of the archive is the one at
+        frame_count - 1 when it is known, else the one the frames end with.
+
+        Raises
+        ------
+        ValueError
+            When a frame can not be decrypted, see decrypt_frame.
+        """
+        index = first_frame
+        buffer = bytearray()
+        for data in frames:
+            buffer += data
+            start = 0
+            # Without frame_count, a full frame is only known not to be the last
+            # one once more data follows it
+            while len(buffer) - start > self.frame_size or (
+                frame_count is not None and len(buffer) - start == self.frame_size
+            ):
+                yield self.decrypt_frame(
+                    index,
+                    bytes(buffer[start : start + self.frame_size]),
+                    index + 1 == frame_count,
+                )
+                start += self.frame_size
+                index += 1
+            del buffer[:start]
+        if buffer or frame_count is None:
+            yield self.decrypt_frame(
+                index, bytes(buffer), frame_count is None or index + 1 == frame_count
+            )
+
+
+class EncryptingWriter:
+    """
+    Write-only file object encrypting the data going through it, on its way to
+    another file object, see ArchiveCipher.
+
+    Data is encrypted by batches of BATCH_SIZE bytes. With several workers, the
+    batches are encrypted by a pool of threads, at most two per worker ahead of the
+    writer, and written in order. The last frame is only written by close, an
+    archive whose writing failed has no last frame and never decrypts.
+    """
+
+    def __init__(
+        self,
+        fileobj: BinaryIO,
+        key: bytes,
+        workers: int = 1,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        if workers < 1:
+            raise ValueError("workers must be positive")
+        self.fileobj = fileobj
+        self.cipher = ArchiveCipher.new(key, chunk_size)
+        self.workers = workers
+        self._batch_size = max(BATCH_SIZE // chunk_size, 1) * chunk_size
+        self._executor = (
+            ThreadPoolExecutor(max_workers=workers, thread_name_prefix="encrypt")
+            if workers > 1
+            else None
+        )
+        self._pending = deque()
+        self._buffer = bytearray()
+        self._frame_count = 0
+        self.fileobj.write(self.cipher.header)
+
+    def write(self, data: bytes) -> int:
+        if self._executor is not None and not isinstance(data, bytes):
+            # The batches encrypted in the pool must not change once written
+            data = bytes(data)
+        view = memoryview(data)
+        if self._buffer:
+            missing = self._batch_size - len(self._buffer)
+            self._buffer += view[:missing]
+            view = view[missing:]
+            if len(self._buffer) < self._batch_size:
+                return len(data)
+            self._encrypt(bytes(self._buffer), False)
+            self._buffer.clear()
+        # Whole batches are encrypted straight from the data written
+        while len(view) >= self._batch_size:
+            self._encrypt(view[: self._batch_size], False)
+            view = view[self._batch_size :]
+        self._buffer += view
+        return len(data)
+
+    def _encrypt(self, data: bytes, final: bool) -> None:
+        first_frame = self._frame_count
+        self._frame_count += len(data) // self.cipher.chunk_size + final
+        if self._executor is None:
+            self._write_frames(self.cipher.encrypt_frames(first_frame, data, final))
+            return
+        self._pending.append(
+            self._executor.submit(self.cipher.encrypt_frames, first_frame, data, final)
+        )
+        while len(self._pending) > 2 * self.workers:
+            self._write_frames(self._pending.popleft().result())
+
+    def _write_frames(self, frames: List[bytes]) -> None:
+        for frame in frames:
+            self.fileobj.write(frame)
+
+    def flush(self) -> None:
+        self.fileobj.flush()
+
+    def close(self) -> None:
+        """
+        Encrypt the rest of the data, ending with the last, possibly empty, chunk,
+        and write the pending frames.
+        """
+        self._encrypt(bytes(self._buffer), True)
+        self._buffer.clear()
+        while self._pending:
+            self._write_frames(self._pending.popleft().result())
+        self.abort()
+
+    def abort(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        self._pending.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def decrypt_stream(key: bytes, chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Decrypt a whole encrypted archive read from chunks of any size, e.g. a
+    downloaded archive read by blocks.
+
+    Raises
+    ------
+    ValueError
+        When it is not an encrypted archive, or can not be decrypted.
+    """
+    chunks = iter(chunks)
+    header = b""
+    for data in chunks:
+        header += data
+        if len(header) >= HEADER_SIZE:
+            break
+    cipher = ArchiveCipher.from_header(key, header)
+
+    def frames() -> Iterator[bytes]:
+        yield header[HEADER_SIZE:]
+        yield from chunks
+
+    yield from cipher.decrypt_frames(frames())
+
+
+def decrypt_file(key: Optional[bytes], src_path: str, destination_path: str) -> None:
+    """
+    Decrypt an encrypted archive, e.g. downloaded from Google Drive, block by block.
+    The archive is written next to its destination with a ".part" suffix and only
+    renamed once it is decrypted and authenticated.
+
+    Raises
+    ------
+    ValueError
+        When there is no key, or the archive can not be decrypted.
+    """
+    if key is None:
+        raise ValueError("No encryption key given")
+    partial_path = f"{destination_path}.part"
+    try:
+        with open(src_path, "rb") as src, open(partial_path, "wb") as output:
+            for data in decrypt_stream(key, iter(lambda: src.read(BATCH_SIZE), b"")):
+                output.write(data)
+        os.replace(partial_path, destination_path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
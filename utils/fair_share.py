@@ -0,0 +1,131 @@
+import heapq
+import itertools
+import threading
+
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+from utils.token_bucket import TokenBucket
+
+
+class FairShare:
+    """
+    Shares a number of slots between owners, e.g. the projects backed up at the same
+    time, so that none of them can starve the others.
+
+    Slots are granted in start-time fair queuing order: each request is tagged with
+    the usage of its owner, weighted by the cost of the requests, e.g. bytes, and a
+    free slot goes to the waiting request with the lowest tag. Busy owners get equal
+    shares, and the share of an idle owner goes to the others. An owner coming back
+    after being idle starts level with the busy ones instead of with the credit of
+    its idle time.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._in_use = 0
+        self._usage: Dict[str, float] = {}
+        # Tag of the last granted request
+        self._virtual_time = 0.0
+        self._waiting: List[Tuple[float, int, str]] = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+
+    def acquire(self, owner: str, cost: float = 1) -> None:
+        """
+        Take a slot for owner, waiting for its turn.
+        """
+        with self._condition:
+            tag = max(self._usage.get(owner, 0.0), self._virtual_time)
+            self._usage[owner] = tag + cost
+            request = (tag, next(self._sequence), owner)
+            heapq.heappush(self._waiting, request)
+            while self._in_use >= self.capacity or self._waiting[0] is not request:
+                self._condition.wait()
+            heapq.heappop(self._waiting)
+            self._in_use += 1
+            self._virtual_time = tag
+            # The next request may fit in another free slot
+            self._condition.notify_all()
+
+    def release(self) -> None:
+        with self._condition:
+            self._in_use -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, owner: str, cost: float = 1) -> Iterator[None]:
+        self.acquire(owner, cost)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class FairRateLimiter:
+    """
+    Token bucket shared between owners, which take their turn in fair share order,
+    e.g. an upload bandwidth shared by projects: each busy project gets an equal
+    share of the bytes per second, whatever the number of its concurrent uploads.
+    """
+
+    def __init__(self, rate: float):
+        self.rate = rate
+        self._bucket = TokenBucket(rate)
+        self._turns = FairShare(1)
+
+    def acquire(self, owner: str, amount: float = 1) -> float:
+        """
+        Take amount tokens for owner, waiting for its turn and for the tokens.
+
+        Returns
+        -------
+        float
+            The time waited for the tokens, in seconds.
+        """
+        with self._turns.slot(owner, amount):
+            return self._bucket.acquire(amount)
+
+
+class FairShareExecutor(Executor):
+    """
+    The view of an owner on a pool shared with other owners: its tasks are submitted
+    in fair share order with theirs, submit waiting for a free slot. At most
+    max_tasks of its tasks are in the pool at once, e.g. the workers of a project.
+
+    Shutting it down leaves the pool running, it belongs to whoever created it.
+    """
+
+    def __init__(
+        self,
+        pool: Executor,
+        shares: FairShare,
+        owner: str,
+        max_tasks: Optional[int] = None,
+    ):
+        self._pool = pool
+        self._shares = shares
+        self._owner = owner
+        self._tasks = threading.BoundedSemaphore(max_tasks) if max_tasks else None
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        if self._tasks is not None:
+            self._tasks.acquire()
+        self._shares.acquire(self._owner)
+        try:
+            future = self._pool.submit(fn, *args, **kwargs)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(lambda _: self._release())
+        return future
+
+    def _release(self) -> None:
+        self._shares.release()
+        if self._tasks is not None:
+            self._tasks.release()
+
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False) -> None:
+        pass
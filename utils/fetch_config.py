@@ -1,16 +1,43 @@
 import json
 import os
 from models.config import Config
+from models.limits import Limits
+from typing import List, Union
 
 
-def fetch_config() -> Config:
+def _load_config_file() -> Union[dict, list]:
     """
-    Fetches the configuration from a file named config.json in the parent directory of this file.
+    Loads config.json from the config folder, or the file set by the
+    BACKUP2GDRIVE_CONFIG_PATH environment variable.
+    """
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    config_path = os.environ.get("BACKUP2GDRIVE_CONFIG_PATH") or os.path.join(
+        current_dir, "../config/config.json"
+    )
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"Config file not found at {config_path}")
+
+    with open(config_path, "r") as config_file:
+        try:
+            return json.load(config_file)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Config file is not valid JSON: {e}")
+
+
+def fetch_configs() -> List[Config]:
+    """
+    Fetches the configurations from a file named config.json in the parent directory of this file,
+    or from the file set by the BACKUP2GDRIVE_CONFIG_PATH environment variable.
+    The file holds the config of a project, a list of configs of several projects, or
+    an object with the list of projects under "projects" and their shared "limits".
+
+    With several projects, the run report of each project defaults to
+    logs/run_report_<projectName>.json.
 
     Returns
     -------
-    Config
-        The configuration object.
+    List[Config]
+        The configuration objects, one per project.
 
     Raises
     ------
@@ -18,17 +45,58 @@ def fetch_config() -> Config:
         If the config file is not found at the expected location.
 
     ValueError
-        If the config file is not valid JSON.
+        If the config file is not valid JSON, or if two projects have the same name
+        or the same report files.
     """
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    config_path = os.path.join(current_dir, "../config/config.json")
-    if not os.path.exists(config_path):
-        raise FileNotFoundError(f"Config file not found at {config_path}")
+    content = _load_config_file()
+    if isinstance(content, dict) and "projects" in content:
+        content = content["projects"]
+    projects = content if isinstance(content, list) else [content]
+    if not projects:
+        raise ValueError("Config file must contain at least one project")
 
-    with open(config_path, "r") as config_file:
-        try:
-            config = json.load(config_file)
-        except json.JSONDecodeError as e:
-            raise ValueError(f"Config file is not valid JSON: {e}")
+    configs = [Config(project) for project in projects]
+    if len(configs) > 1:
+        for project, project_config in zip(projects, configs):
+            if "runReportPath" not in project:
+                project_config.run_report_path = (
+                    f"logs/run_report_{project_config.project_name}.json"
+                )
+
+    project_names = [config.project_name.upper() for config in configs]
+    if len(set(project_names)) != len(project_names):
+        # Their backups and local state would share the same file names
+        raise ValueError("Project names must be unique")
+    report_paths = [
+        path
+        for config in configs
+        for path in (config.run_report_path, config.prometheus_textfile_path)
+        if path
+    ]
+    if len(set(report_paths)) != len(report_paths):
+        raise ValueError("Projects must write their reports to different files")
+    return configs
+
+
+def fetch_limits() -> Limits:
+    """
+    Fetches the limits shared by the projects of the config file, set under its
+    "limits" key.
+
+    Returns
+    -------
+    Limits
+        The limits, the default ones when the file has none.
 
-    return Config(config)
+    Raises
+    ------
+    FileNotFoundError
+        If the config file is not found at the expected location.
+
+    ValueError
+        If the config file is not valid JSON.
+    """
+    content = _load_config_file()
+    if isinstance(content, dict) and "projects" in content:
+        return Limits(content.get("limits", {}))
+    return Limits({})
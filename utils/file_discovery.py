@@ -0,0 +1,125 @@
+import os
+import re
+
+from typing import Iterator, List, NamedTuple, Optional, Protocol
+from utils.logger import get_logger
+
+
+class DiscoveredFile(NamedTuple):
+    # The path relative to the scanned folder, with "/" separators
+    relative_path: str
+    path: str
+    stat: os.stat_result
+
+
+class Matcher(Protocol):
+    def is_excluded(self, relative_path: str) -> bool: ...
+
+    def matches(self, name: str, relative_path: str) -> bool: ...
+
+
+class FileMatcher:
+    """
+    The compiled patterns selecting the files of a folder to backup.
+
+    A file is selected when `include` matches its name and no `exclude` pattern
+    matches its path relative to the folder. A directory matching an exclude pattern
+    is not scanned at all. Patterns are tested with re.match, paths use "/" separators.
+    """
+
+    def __init__(self, include: str, exclude: Optional[List[str]] = None):
+        self._include = re.compile(include)
+        self._exclude = [re.compile(pattern) for pattern in exclude or []]
+
+    def is_excluded(self, relative_path: str) -> bool:
+        return any(pattern.match(relative_path) for pattern in self._exclude)
+
+    def matches(self, name: str, relative_path: str) -> bool:
+        return self._include.match(name) is not None and not self.is_excluded(
+            relative_path
+        )
+
+
+def iter_files(
+    folder_path: str,
+    matcher: Matcher,
+    max_depth: Optional[int] = 0,
+    follow_symlinks: bool = False,
+) -> Iterator[DiscoveredFile]:
+    """
+    Yields the files of a folder selected by a matcher, as they are found.
+
+    Directories are scanned one entry at a time with os.scandir and only the
+    directories being walked are kept in memory, however large the tree is. The stat
+    of each file is the one cached by its directory entry.
+
+    Parameters
+    ----------
+    folder_path : str
+        The folder to scan.
+    matcher : Matcher
+        Selects the files and prunes the excluded directories, e.g. a FileMatcher.
+    max_depth : int, optional
+        How deep subdirectories are scanned: 0 only scans the folder itself, None
+        scans the whole tree. Default is 0.
+    follow_symlinks : bool, optional
+        Whether symbolic links to directories are scanned. Symbolic links to files
+        are always followed. Default is False.
+
+    Raises
+    ------
+    FileNotFoundError
+        If the folder does not exist.
+
+    Returns
+    -------
+    Iterator[DiscoveredFile]
+        The selected files with their relative path, path and stat.
+    """
+    if not os.path.isdir(folder_path):
+        raise FileNotFoundError(f"Folder {folder_path} does not exist")
+
+    logger = get_logger("backup2gdrive")
+    # Directories already walked when following symbolic links, which can loop
+    visited = set()
+    # Each directory being walked: its entries iterator, path, relative path and depth
+    stack = []
+
+    def enter(path: str, relative_path: str, depth: int) -> None:
+        try:
+            if follow_symlinks:
+                stat = os.stat(path)
+                if (stat.st_dev, stat.st_ino) in visited:
+                    return
+                visited.add((stat.st_dev, stat.st_ino))
+            stack.append((os.scandir(path), path, relative_path, depth))
+        except OSError as error:
+            logger.warning(f"Skipping directory {path}: {error}")
+
+    enter(folder_path, "", 0)
+    while stack:
+        entries, path, relative_dir, depth = stack[-1]
+        try:
+            entry = next(entries, None)
+        except OSError as error:
+            logger.warning(f"Stopped scanning {path}: {error}")
+            entry = None
+        if entry is None:
+            entries.close()
+            stack.pop()
+            continue
+
+        relative_path = f"{relative_dir}{entry.name}"
+        try:
+            if entry.is_file():
+                if matcher.matches(entry.name, relative_path):
+                    yield DiscoveredFile(relative_path, entry.path, entry.stat())
+            elif (
+                entry.is_dir(follow_symlinks=follow_symlinks)
+                and (max_depth is None or depth < max_depth)
+                and not matcher.is_excluded(relative_path)
+            ):
+                enter(entry.path, f"{relative_path}/", depth + 1)
+        except OSError as error:
+            # The entry vanished or can not be read since it was listed
+            logger.warning(f"Skipping {entry.path}: {error}")
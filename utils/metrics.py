@@ -0,0 +1,441 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TypeVar
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+T = TypeVar("T")
+
+# Prefix of the Prometheus metrics
+METRICS_PREFIX = "backup2gdrive"
+# Minimum delay between two reads of the peak memory, which would otherwise be read
+# at the end of every span, e.g. for every scanned file
+PEAK_RSS_SAMPLING_INTERVAL = 0.1
+
+
+def peak_rss() -> Optional[int]:
+    """
+    The peak resident memory of the process, and of its terminated children, in bytes.
+    None where the platform does not tell.
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    unit = 1 if sys.platform == "darwin" else 1024
+    own_peak = unit * resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    try:
+        # On Linux ru_maxrss survives execve, so a process started by a larger one
+        # would report the peak of its parent. VmHWM is the peak of its own memory.
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    own_peak = 1024 * int(line.split()[1])
+                    break
+    except OSError:
+        pass
+    return max(own_peak, unit * resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+
+
+class PhaseStats:
+    """
+    What happened during a phase of the run. A phase can be entered several times,
+    from several threads: its busy time is the sum of the time spent in it while its
+    duration goes from its first start to its last end.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.first_start: Optional[float] = None
+        self.last_end: Optional[float] = None
+        self.busy_time = 0.0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.files = 0
+        self.api_calls = 0
+        self.api_retries = 0
+        self.api_failures = 0
+        self.api_latency = 0.0
+        self.peak_rss: Optional[int] = None
+
+    def to_dict(self) -> dict:
+        duration = (
+            self.last_end - self.first_start
+            if self.first_start is not None and self.last_end is not None
+            else 0.0
+        )
+        return {
+            "duration": duration,
+            "busyTime": self.busy_time,
+            "bytesIn": self.bytes_in,
+            "bytesOut": self.bytes_out,
+            "files": self.files,
+            "compressionRatio": (
+                self.bytes_out / self.bytes_in
+                if self.bytes_in and self.bytes_out
+                else None
+            ),
+            "throughputIn": (
+                self.bytes_in / duration if duration and self.bytes_in else None
+            ),
+            "throughputOut": (
+                self.bytes_out / duration if duration and self.bytes_out else None
+            ),
+            "apiCalls": self.api_calls,
+            "apiRetries": self.api_retries,
+            "apiFailures": self.api_failures,
+            "apiAverageLatency": (
+                self.api_latency / self.api_calls if self.api_calls else None
+            ),
+            "peakRss": self.peak_rss,
+        }
+
+
+class Span:
+    """
+    Handle of a phase being measured, counting what the phase processes.
+    """
+
+    def __init__(self, metrics: "RunMetrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def add(self, bytes_in: int = 0, bytes_out: int = 0, files: int = 0) -> None:
+        self.metrics.add(self.name, bytes_in=bytes_in, bytes_out=bytes_out, files=files)
+
+
+class RunMetrics:
+    """
+    Timings and counters of the phases of a run, reported once the run is over.
+
+    Google Drive API calls are counted in the innermost phase of the thread sending
+    them. Progress events of long phases are sent to the registered listeners.
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self._phases: Dict[str, PhaseStats] = {}
+        self._lock = threading.Lock()
+        self._thread_local = threading.local()
+        self._progress_listeners: List[Callable[[dict], None]] = []
+        self._api_stats: Optional[Callable[[], Dict[str, dict]]] = None
+        self._peak_rss: Optional[int] = None
+        self._peak_rss_read_at = float("-inf")
+        self._stored_backups: Optional[dict] = None
+
+    def _phase(self, name: str) -> PhaseStats:
+        # The lock must be held
+        if name not in self._phases:
+            self._phases[name] = PhaseStats(name)
+        return self._phases[name]
+
+    def _sampled_peak_rss(self, now: float) -> Optional[int]:
+        if now - self._peak_rss_read_at >= PEAK_RSS_SAMPLING_INTERVAL:
+            self._peak_rss_read_at = now
+            self._peak_rss = peak_rss()
+        return self._peak_rss
+
+    def _stack(self) -> List[str]:
+        if not hasattr(self._thread_local, "stack"):
+            self._thread_local.stack = []
+        return self._thread_local.stack
+
+    @contextmanager
+    def span(self, name: str) -> Iterator[Span]:
+        """
+        Measure a phase, e.g. `with metrics.span("upload") as span: span.add(...)`.
+        """
+        start = time.monotonic()
+        with self._lock:
+            phase = self._phase(name)
+            if phase.first_start is None:
+                phase.first_start = start
+        stack = self._stack()
+        stack.append(name)
+        try:
+            yield Span(self, name)
+        finally:
+            stack.pop()
+            end = time.monotonic()
+            rss = self._sampled_peak_rss(end)
+            with self._lock:
+                phase.busy_time += end - start
+                phase.last_end = max(phase.last_end or end, end)
+                if rss is not None:
+                    phase.peak_rss = max(phase.peak_rss or 0, rss)
+
+    def timed_iter(self, name: str, iterable: Iterable[T]) -> Iterator[T]:
+        """
+        Yields the items of an iterable, counting the time spent producing them in a
+        phase, and each item as a file. Meant for lazy phases like the scan, which run
+        interleaved with the phase consuming their items.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.span(name) as span:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                span.add(files=1)
+            yield item
+
+    def add(
+        self, name: str, bytes_in: int = 0, bytes_out: int = 0, files: int = 0
+    ) -> None:
+        with self._lock:
+            phase = self._phase(name)
+            phase.bytes_in += bytes_in
+            phase.bytes_out += bytes_out
+            phase.files += files
+
+    def record_api_call(
+        self, latency: float, retries: int = 0, failures: int = 0
+    ) -> None:
+        """
+        Count a Google Drive API call in the current phase of the thread.
+        """
+        stack = self._stack()
+        name = stack[-1] if stack else "other"
+        with self._lock:
+            phase = self._phase(name)
+            phase.api_calls += 1
+            phase.api_retries += retries
+            phase.api_failures += failures
+            phase.api_latency += latency
+
+    def attach_api_stats(self, api_stats: Callable[[], Dict[str, dict]]) -> None:
+        """
+        Include per endpoint API stats, e.g. DriveRequestExecutor.stats, in the report.
+        """
+        self._api_stats = api_stats
+
+    def set_stored_backups(self, files: int, size: int) -> None:
+        """
+        Report the backups kept on Google Drive once the retention is over.
+        """
+        self._stored_backups = {"files": files, "bytes": size}
+
+    def add_progress_listener(self, listener: Callable[[dict], None]) -> None:
+        self._progress_listeners.append(listener)
+
+    def progress(self, phase: str, **fields) -> None:
+        """
+        Send a progress event, e.g. the bytes uploaded so far, to the listeners.
+        """
+        if not self._progress_listeners:
+            return
+        event = {"time": time.time(), "phase": phase, **fields}
+        for listener in self._progress_listeners:
+            listener(event)
+
+    def report(self, project_name: str, success: bool) -> dict:
+        with self._lock:
+            phases = {name: phase.to_dict() for name, phase in self._phases.items()}
+        return {
+            "projectName": project_name,
+            "success": success,
+            "startedAt": self.started_at,
+            "duration": time.time() - self.started_at,
+            "peakRss": peak_rss(),
+            "phases": phases,
+            "api": self._api_stats() if self._api_stats is not None else {},
+            "storedBackups": self._stored_backups,
+        }
+
+
+def write_json_report(report: dict, path: str) -> None:
+    """
+    Write a run report as JSON.
+    """
+    _write_atomically(path, json.dumps(report, indent=2))
+
+
+def write_prometheus_textfile(report: dict, path: str) -> None:
+    """
+    Write a run report in the Prometheus text format, for the textfile collector of
+    the node exporter. The file is replaced atomically so it is never read half written.
+    """
+    project = report["projectName"].replace("\\", "\\\\").replace('"', '\\"')
+    lines = []
+
+    def metric(name: str, help_text: str, samples: List[tuple]) -> None:
+        lines.append(f"# HELP {METRICS_PREFIX}_{name} {help_text}")
+        lines.append(f"# TYPE {METRICS_PREFIX}_{name} gauge")
+        for labels, value in samples:
+            if value is None:
+                continue
+            label_text = ",".join(
+                f'{key}="{label}"'
+                for key, label in {"project": project, **labels}.items()
+            )
+            lines.append(f"{METRICS_PREFIX}_{name}{{{label_text}}} {value}")
+
+    metric(
+        "run_success", "Whether the last run succeeded", [({}, int(report["success"]))]
+    )
+    metric(
+        "run_timestamp_seconds",
+        "Start time of the last run",
+        [({}, report["startedAt"])],
+    )
+    metric(
+        "run_duration_seconds", "Duration of the last run", [({}, report["duration"])]
+    )
+    metric(
+        "peak_rss_bytes", "Peak resident memory of the run", [({}, report["peakRss"])]
+    )
+    stored_backups = report.get("storedBackups") or {}
+    metric(
+        "stored_backups",
+        "Backups kept on Google Drive",
+        [({}, stored_backups.get("files"))],
+    )
+    metric(
+        "stored_backups_bytes",
+        "Size of the backups kept on Google Drive",
+        [({}, stored_backups.get("bytes"))],
+    )
+    for key, name, help_text in (
+        ("duration", "phase_duration_seconds", "Duration of a phase"),
+        (
+            "busyTime",
+            "phase_busy_seconds",
+            "Time spent in a phase, summed over threads",
+        ),
+        ("bytesIn", "phase_bytes_in", "Bytes read by a phase"),
+        ("bytesOut", "phase_bytes_out", "Bytes written or sent by a phase"),
+        ("files", "phase_files", "Files processed by a phase"),
+        (
+            "compressionRatio",
+            "phase_compression_ratio",
+            "Bytes out divided by bytes in",
+        ),
+        ("apiCalls", "phase_api_calls", "Google Drive API calls of a phase"),
+        ("apiRetries", "phase_api_retries", "Google Drive API retries of a phase"),
+    ):
+        metric(
+            name,
+            help_text,
+            [
+                ({"phase": phase}, stats[key])
+                for phase, stats in sorted(report["phases"].items())
+            ],
+        )
+    for key, name, help_text in (
+        ("calls", "api_calls", "Google Drive API calls by endpoint"),
+        ("retries", "api_retries", "Google Drive API retries by endpoint"),
+        ("failures", "api_failures", "Google Drive API failures by endpoint"),
+        ("averageLatency", "api_latency_seconds", "Average latency by endpoint"),
+    ):
+        metric(
+            name,
+            help_text,
+            [
+                ({"endpoint": endpoint}, stats[key])
+                for endpoint, stats in sorted(report["api"].items())
+            ],
+        )
+    _write_atomically(path, "\n".join(lines) + "\n")
+
+
+def timed_phase(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """
+    Decorator measuring every call of a function as a phase of the run.
+    """
+
+    def decorator(function: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs) -> T:
+            with get_run_metrics().span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+class JsonLinesProgressWriter:
+    """
+    Progress listener appending each event as a JSON line to a file, which can be
+    followed with `tail -f` while the run goes on.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict) -> None:
+        with self._lock, open(self.path, "a") as events_file:
+            events_file.write(json.dumps(event) + "\n")
+
+
+def _write_atomically(path: str, content: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as output:
+        output.write(content)
+    os.replace(temporary_path, path)
+
+
+# Metrics of the process, and the ones of the run of the current thread when several
+# runs go on at the same time
+_run_metrics: Optional[RunMetrics] = None
+_run_metrics_lock = threading.Lock()
+_current_run_metrics: ContextVar[Optional[RunMetrics]] = ContextVar(
+    "run_metrics", default=None
+)
+
+
+def get_run_metrics() -> RunMetrics:
+    """
+    Returns the metrics of the current run: the ones used by the current thread, see
+    use_run_metrics, or else the ones of the process, created on first use.
+    """
+    global _run_metrics
+    metrics = _current_run_metrics.get()
+    if metrics is not None:
+        return metrics
+    with _run_metrics_lock:
+        if _run_metrics is None:
+            _run_metrics = RunMetrics()
+        return _run_metrics
+
+
+@contextmanager
+def use_run_metrics(metrics: RunMetrics) -> Iterator[RunMetrics]:
+    """
+    Count what the current thread does in metrics, e.g. while it backs up one of the
+    projects backed up at the same time.
+    """
+    token = _current_run_metrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current_run_metrics.reset(token)
+
+
+def bind_run_metrics(function: Callable[..., T]) -> Callable[..., T]:
+    """
+    Wrap a function submitted to another thread so that it counts in the metrics of
+    the run submitting it.
+    """
+    metrics = get_run_metrics()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs) -> T:
+        with use_run_metrics(metrics):
+            return function(*args, **kwargs)
+
+    return wrapper
@@ -0,0 +1,50 @@
+import ctypes
+import os
+import platform
+import sys
+
+# Niceness added to the processes of the archiver, 19 being the lowest priority
+NICE_INCREMENT = 10
+# Number of the ioprio_set system call, which has no wrapper in the C library
+IOPRIO_SET_SYSCALLS = {
+    "x86_64": 251,
+    "i686": 289,
+    "aarch64": 30,
+    "armv7l": 314,
+    "ppc64le": 273,
+    "s390x": 282,
+}
+IOPRIO_WHO_PROCESS = 1
+IOPRIO_CLASS_SHIFT = 13
+# Lowest level of the best effort class: served after the other processes, unlike
+# the idle class which can starve the backup on a busy disk
+IOPRIO_CLASS_BE = 2
+IOPRIO_LOWEST_LEVEL = 7
+
+
+def lower_priority() -> None:
+    """
+    Lower the CPU priority of the calling process, and on Linux its I/O priority,
+    e.g. as the initializer of the processes of the archiver.
+
+    This is a best effort: a setting the platform does not support is left as is.
+    The I/O priority is only honoured by the I/O schedulers supporting it, like BFQ.
+    """
+    try:
+        os.nice(NICE_INCREMENT)
+    except (AttributeError, OSError):
+        pass
+
+    syscall_number = IOPRIO_SET_SYSCALLS.get(platform.machine())
+    if not sys.platform.startswith("linux") or syscall_number is None:
+        return
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        libc.syscall(
+            syscall_number,
+            IOPRIO_WHO_PROCESS,
+            0,
+            (IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT) | IOPRIO_LOWEST_LEVEL,
+        )
+    except (AttributeError, OSError):
+        pass
@@ -0,0 +1,95 @@
+import threading
+
+from typing import Optional
+
+
+class RingBufferAborted(Exception):
+    """
+    Raised on one side of a ring buffer when the other side gave up.
+    """
+
+
+class RingBuffer:
+    """
+    Bounded in-memory byte pipe between a producer thread and a consumer thread.
+
+    The producer writes like in a file and blocks while the buffer is full, the
+    consumer reads and blocks until enough data is written. The memory used never
+    exceeds the capacity, whatever the amount of data going through the buffer.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity <= 0:
+            raise ValueError("capacity must be positive")
+        self.capacity = capacity
+        self._buffer = bytearray(capacity)
+        self._start = 0
+        self._size = 0
+        self._closed = False
+        self._error: Optional[BaseException] = None
+        self._condition = threading.Condition()
+
+    def write(self, data: bytes) -> int:
+        view = memoryview(data).cast("B")
+        with self._condition:
+            while view:
+                while self._size == self.capacity and self._error is None:
+                    self._condition.wait()
+                self._raise_error()
+                if self._closed:
+                    raise ValueError("write to a closed ring buffer")
+                end = (self._start + self._size) % self.capacity
+                length = min(
+                    len(view),
+                    self.capacity - self._size,
+                    self.capacity - end,
+                )
+                self._buffer[end : end + length] = view[:length]
+                self._size += length
+                view = view[length:]
+                self._condition.notify_all()
+        return len(data)
+
+    def read(self, size: int) -> bytes:
+        """
+        Read size bytes, blocking until they are written. Fewer bytes are returned
+        only once the producer closed the buffer, an empty result meaning the end.
+        """
+        chunk = bytearray()
+        with self._condition:
+            while len(chunk) < size:
+                while self._size == 0 and not self._closed and self._error is None:
+                    self._condition.wait()
+                self._raise_error()
+                if self._size == 0:
+                    break
+                length = min(size - len(chunk), self._size, self.capacity - self._start)
+                chunk += self._buffer[self._start : self._start + length]
+                self._start = (self._start + length) % self.capacity
+                self._size -= length
+                self._condition.notify_all()
+        return bytes(chunk)
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        """
+        Mark the end of the data, once read the consumer gets an empty result.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    def abort(self, error: BaseException) -> None:
+        """
+        Make the blocked and next reads and writes fail, on both sides.
+        """
+        with self._condition:
+            if self._error is None:
+                self._error = error
+            self._condition.notify_all()
+
+    def _raise_error(self) -> None:
+        if self._error is not None:
+            raise RingBufferAborted(str(self._error)) from self._error
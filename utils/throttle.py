@@ -0,0 +1,136 @@
+import threading
+import time
+
+from typing import BinaryIO, Callable, Optional
+from utils.token_bucket import TokenBucket
+
+# How often the scheduled rate is checked, e.g. for a time of day window starting
+SCHEDULE_CHECK_INTERVAL = 1.0
+# Adaptive backoff: the rate is halved when the latency crosses the threshold, at
+# most once per interval so the reads already in flight don't halve it again
+DECREASE_FACTOR = 0.5
+DECREASE_INTERVAL = 1.0
+# ...then increased by a tenth of the scheduled rate per second while it stays below
+INCREASE_PER_SECOND = 0.1
+# The adaptive rate never goes below this fraction of the scheduled rate
+MIN_RATE_FRACTION = 1 / 16
+# Reads are timed per MB, so the latency does not depend on the size of the reads
+LATENCY_UNIT = 1024 * 1024
+
+
+class Throttle:
+    """
+    Limits a throughput, e.g. the bytes read from the disk per second, with a token
+    bucket whose rate follows a schedule, e.g. lower during business hours.
+
+    When a latency threshold is set, the rate also adapts to the latency recorded by
+    the caller (additive increase, multiplicative decrease): it is halved when the
+    latency crosses the threshold, and grows back slowly up to the scheduled rate
+    while it stays below. A scheduled rate of None means unlimited, and disables the
+    adaptation until the schedule sets a rate again.
+    """
+
+    def __init__(
+        self,
+        schedule: Callable[[], Optional[float]],
+        latency_threshold: Optional[float] = None,
+    ):
+        self.schedule = schedule
+        self.latency_threshold = latency_threshold
+        self._scheduled_rate = schedule()
+        self._rate = self._scheduled_rate
+        self._bucket = TokenBucket(self._rate)
+        self._next_schedule_check = time.monotonic() + SCHEDULE_CHECK_INTERVAL
+        self._last_update = time.monotonic()
+        self._last_decrease = float("-inf")
+        self._lock = threading.Lock()
+
+    @property
+    def rate(self) -> Optional[float]:
+        """
+        The current rate, None when unlimited.
+        """
+        return self._rate
+
+    def acquire(self, amount: float) -> float:
+        """
+        Take amount from the throughput, waiting until the rate allows it.
+
+        Returns
+        -------
+        float
+            The time waited, in seconds.
+        """
+        self._follow_schedule()
+        return self._bucket.acquire(amount)
+
+    def record_latency(self, latency: float) -> None:
+        """
+        Adapt the rate to the latency of an operation, e.g. a disk read, in seconds.
+        """
+        if self.latency_threshold is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if self._scheduled_rate is not None:
+                if latency > self.latency_threshold:
+                    if now - self._last_decrease >= DECREASE_INTERVAL:
+                        self._rate = max(
+                            self._rate * DECREASE_FACTOR,
+                            self._scheduled_rate * MIN_RATE_FRACTION,
+                        )
+                        self._last_decrease = now
+                else:
+                    self._rate = min(
+                        self._rate
+                        + self._scheduled_rate
+                        * INCREASE_PER_SECOND
+                        * (now - self._last_update),
+                        self._scheduled_rate,
+                    )
+                self._bucket.set_rate(self._rate)
+            self._last_update = now
+
+    def _follow_schedule(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next_schedule_check:
+                return
+            self._next_schedule_check = now + SCHEDULE_CHECK_INTERVAL
+            scheduled_rate = self.schedule()
+            if scheduled_rate == self._scheduled_rate:
+                return
+            # A new window starts at its full rate, then adapts again
+            self._scheduled_rate = self._rate = scheduled_rate
+            self._last_update = now
+            self._bucket.set_rate(scheduled_rate)
+
+
+class ThrottledReader:
+    """
+    A readable file object whose reads take their size from a throttle. The time
+    spent reading each MB is recorded as the latency of the throttle.
+    """
+
+    def __init__(self, fileobj: BinaryIO, throttle: Throttle):
+        self.fileobj = fileobj
+        self.throttle = throttle
+
+    def read(self, size: int = -1) -> bytes:
+        start_time = time.monotonic()
+        data = self.fileobj.read(size)
+        self.throttle.record_latency(
+            read_latency(time.monotonic() - start_time, len(data))
+        )
+        # Waiting after the read paces the next one, without counting the bytes
+        # asked for beyond the end of the file
+        self.throttle.acquire(len(data))
+        return data
+
+
+def read_latency(duration: float, size: int) -> float:
+    """
+    The latency of a read of size bytes which took duration seconds: the time spent
+    per MB read, or the whole duration for smaller reads.
+    """
+    return duration * LATENCY_UNIT / max(size, LATENCY_UNIT)
@@ -0,0 +1,68 @@
+import threading
+import time
+
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+
+    Tokens are added at `rate` tokens per second, up to `capacity`. Acquiring more
+    tokens than available puts the bucket in debt: the caller waits until the debt
+    is paid back, and so do the next callers. Requests larger than the capacity, like
+    a batch of requests, are therefore allowed while keeping the average rate.
+    """
+
+    def __init__(self, rate: Optional[float], capacity: Optional[float] = None):
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate or 0, 1)
+        self._tokens = self.capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        Take tokens from the bucket, waiting until they are available.
+
+        Returns
+        -------
+        float
+            The time waited, in seconds.
+        """
+        if self.rate is None:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._last_refill) * self.rate
+            )
+            self._last_refill = now
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def set_rate(self, rate: Optional[float], capacity: Optional[float] = None) -> None:
+        """
+        Change the rate, and the capacity which defaults to one second of tokens.
+        The tokens added so far are kept, as well as the debt of the bucket.
+        """
+        if rate is not None and rate <= 0:
+            raise ValueError("rate must be positive")
+        with self._lock:
+            now = time.monotonic()
+            if self.rate is not None:
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._last_refill) * self.rate
+                )
+            self._last_refill = now
+            unlimited = self.rate is None
+            self.rate = rate
+            self.capacity = capacity if capacity is not None else max(rate or 0, 1)
+            self._tokens = (
+                self.capacity if unlimited else min(self._tokens, self.capacity)
+            )
@@ -1,5 +1,9 @@
 import re
 
+from datetime import datetime
+from utils.compression import get_codec
+from utils.cron import CronSchedule
+
 
 def validate_filename(filename: str) -> bool:
     """
@@ -57,3 +61,68 @@ def validate_path(path: str) -> bool:
         r"^(?:[a-zA-Z]:[\\/]|[\\/])?(?:[^<>:|?*\r\n]+[\\/])*[^<>:|?*\r\n]*[\\/]?$"
     )
     return isinstance(path, str) and re.match(REGEX_PATH_MULTI_OS, path) is not None
+
+
+def validate_compression(compression: str) -> bool:
+    """
+    Validate a compression setting by attempting to build its codec.
+
+    Parameters
+    ----------
+    compression : str
+        The compression setting, e.g. "store", "deflate:9", "zstd" or "auto".
+
+    Returns
+    -------
+    bool
+        True if the compression setting is valid, False otherwise.
+    """
+    try:
+        get_codec(compression)
+        return True
+    except ValueError:
+        return False
+
+
+def validate_schedule(schedule: str) -> bool:
+    """
+    Validate a cron expression by parsing it and looking for its next run.
+
+    Parameters
+    ----------
+    schedule : str
+        The cron expression to validate, e.g. "0 * * * *" or "@daily".
+
+    Returns
+    -------
+    bool
+        True if the expression is valid and matches at least once, False otherwise.
+    """
+    try:
+        CronSchedule(schedule).next_after(datetime.now())
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def validate_time_of_day(time_of_day: str) -> bool:
+    """
+    Validate a time of day in 24-hour "HH:MM" format.
+
+    Parameters
+    ----------
+    time_of_day : str
+        The time of day to validate, e.g. "08:00" or "22:30".
+
+    Returns
+    -------
+    bool
+        True if the time of day is valid, False otherwise.
+    """
+    if not isinstance(time_of_day, str):
+        return False
+    try:
+        datetime.strptime(time_of_day, "%H:%M")
+        return True
+    except ValueError:
+        return False
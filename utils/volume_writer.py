@@ -0,0 +1,87 @@
+import os
+
+from typing import Callable, Optional
+from utils.checksum import Checksums, HashingWriter
+
+
+def volume_path(base_path: str, volume_number: int) -> str:
+    """
+    The path of a volume of a split file: base_path.001, base_path.002...
+    """
+    return f"{base_path}.{volume_number:03d}"
+
+
+class VolumeWriter:
+    """
+    Write-only file object splitting its content in volumes of a fixed size.
+
+    The volumes are plain slices of the stream: concatenating them in order gives
+    back the whole file. As soon as a volume is full it is closed and handed to
+    `on_volume_complete` with its checksums, computed while it was written, which
+    can start processing it while the next volumes are still being written.
+    """
+
+    def __init__(
+        self,
+        base_path: str,
+        volume_size: int,
+        on_volume_complete: Callable[[str, int, Checksums], None],
+    ):
+        if volume_size <= 0:
+            raise ValueError("volume_size must be positive")
+        self.base_path = base_path
+        self.volume_size = volume_size
+        self.on_volume_complete = on_volume_complete
+        self.volume_count = 0
+        self._volume: Optional[HashingWriter] = None
+        self._volume_written = 0
+
+    def write(self, data: bytes) -> int:
+        view = memoryview(data)
+        while view:
+            if self._volume is None:
+                self.volume_count += 1
+                self._volume = HashingWriter(
+                    open(volume_path(self.base_path, self.volume_count), "wb")
+                )
+                self._volume_written = 0
+            length = min(len(view), self.volume_size - self._volume_written)
+            self._volume.write(view[:length])
+            self._volume_written += length
+            view = view[length:]
+            if self._volume_written == self.volume_size:
+                self._complete_volume()
+        return len(data)
+
+    def flush(self) -> None:
+        if self._volume is not None:
+            self._volume.flush()
+
+    def _complete_volume(self) -> None:
+        self._volume.fileobj.close()
+        checksums = self._volume.checksums()
+        self._volume = None
+        self.on_volume_complete(
+            volume_path(self.base_path, self.volume_count),
+            self.volume_count,
+            checksums,
+        )
+
+    def close(self) -> None:
+        """
+        Complete the last, possibly smaller, volume.
+        """
+        if self._volume is not None:
+            self._complete_volume()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._volume is not None:
+            # An incomplete stream must not be handed over, nor left on the disk
+            self._volume.fileobj.close()
+            self._volume = None
+            os.remove(volume_path(self.base_path, self.volume_count))
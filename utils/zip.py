@@ -0,0 +1,595 @@
+import struct
+import time
+import zlib
+from typing import BinaryIO, List, Tuple
+
+# Zip record signatures and fixed values (see PKWARE APPNOTE.TXT)
+LOCAL_FILE_HEADER_SIGNATURE = 0x04034B50
+DATA_DESCRIPTOR_SIGNATURE = 0x08074B50
+CENTRAL_DIRECTORY_SIGNATURE = 0x02014B50
+ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE = 0x06064B50
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE = 0x07064B50
+END_OF_CENTRAL_DIRECTORY_SIGNATURE = 0x06054B50
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_ZSTANDARD = 93
+
+ZIP64_LIMIT = (1 << 31) - 1
+ZIP_MAX_ENTRIES = 0xFFFF
+ZIP_MAX_32 = 0xFFFFFFFF
+
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+LOCAL_FILE_HEADER_SIZE = 30
+CENTRAL_DIRECTORY_HEADER_SIZE = 46
+END_OF_CENTRAL_DIRECTORY_SIZE = 22
+ZIP64_END_OF_CENTRAL_DIRECTORY_SIZE = 56
+ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIZE = 20
+# The end of central directory record is followed by a comment of up to 64 KB
+MAX_COMMENT_SIZE = 0xFFFF
+
+
+def _dos_datetime(timestamp: float) -> tuple[int, int]:
+    """
+    Convert a POSIX timestamp into the (time, date) pair used by zip headers.
+    """
+    t = time.localtime(timestamp)
+    year = max(t.tm_year, 1980)
+    dos_date = (year - 1980) << 9 | t.tm_mon << 5 | t.tm_mday
+    dos_time = t.tm_hour << 11 | t.tm_min << 5 | t.tm_sec // 2
+    return dos_time, dos_date
+
+
+def _from_dos_datetime(dos_time: int, dos_date: int) -> float:
+    """
+    Convert the (time, date) pair of zip headers into a POSIX timestamp.
+    """
+    return time.mktime(
+        (
+            (dos_date >> 9) + 1980,
+            dos_date >> 5 & 0x0F,
+            dos_date & 0x1F,
+            dos_time >> 11,
+            dos_time >> 5 & 0x3F,
+            (dos_time & 0x1F) * 2,
+            0,
+            0,
+            -1,
+        )
+    )
+
+
+def _gf2_matrix_times(matrix: List[int], vector: int) -> int:
+    total = 0
+    index = 0
+    while vector:
+        if vector & 1:
+            total ^= matrix[index]
+        vector >>= 1
+        index += 1
+    return total
+
+
+def _gf2_matrix_square(matrix: List[int]) -> List[int]:
+    return [_gf2_matrix_times(matrix, row) for row in matrix]
+
+
+def crc32_combine(crc1: int, crc2: int, length2: int) -> int:
+    """
+    Combine the CRC-32 of two consecutive blocks into the CRC-32 of their concatenation,
+    without access to the data (port of zlib's crc32_combine).
+
+    Parameters
+    ----------
+    crc1 : int
+        The CRC-32 of the first block.
+    crc2 : int
+        The CRC-32 of the second block.
+    length2 : int
+        The length of the second block.
+
+    Returns
+    -------
+    int
+        The CRC-32 of the first block followed by the second one.
+    """
+    if length2 <= 0:
+        return crc1
+
+    # Operator for one zero bit, then two and four zero bits
+    odd = [0xEDB88320] + [1 << n for n in range(31)]
+    even = _gf2_matrix_square(odd)
+    odd = _gf2_matrix_square(even)
+
+    # Apply length2 zero bytes to crc1
+    while True:
+        even = _gf2_matrix_square(odd)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(even, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+        odd = _gf2_matrix_square(even)
+        if length2 & 1:
+            crc1 = _gf2_matrix_times(odd, crc1)
+        length2 >>= 1
+        if not length2:
+            break
+
+    return crc1 ^ crc2
+
+
+class ZipEntry:
+    """
+    Metadata of a member already written to the archive, kept for the central directory.
+    """
+
+    def __init__(
+        self,
+        arcname: str,
+        method: int,
+        mtime: float,
+        mode: int,
+        header_offset: int,
+        zip64: bool,
+    ):
+        self.arcname = arcname
+        self.method = method
+        self.mtime = mtime
+        self.mode = mode
+        self.header_offset = header_offset
+        self.zip64 = zip64
+        self.crc = 0
+        self.compress_size = 0
+        self.file_size = 0
+
+
+class ZipStreamWriter:
+    """
+    Streaming zip writer.
+
+    Every member is written as a local header followed by its data and a data
+    descriptor, so the output is produced strictly sequentially and never needs
+    to be seeked or read back. Members are fed with already compressed blocks, which
+    lets the caller compress them in any order or process as long as they are
+    written in order.
+    """
+
+    def __init__(self, fileobj: BinaryIO):
+        self._fileobj = fileobj
+        self._offset = 0
+        self._entries: List[ZipEntry] = []
+        self._closed = False
+
+    @property
+    def bytes_written(self) -> int:
+        return self._offset
+
+    def _write(self, data: bytes) -> None:
+        self._fileobj.write(data)
+        self._offset += len(data)
+
+    def _write_local_header(self, entry: ZipEntry) -> None:
+        name = entry.arcname.encode("utf-8")
+        flags = FLAG_DATA_DESCRIPTOR
+        if not entry.arcname.isascii():
+            flags |= FLAG_UTF8
+        dos_time, dos_date = _dos_datetime(entry.mtime)
+        if entry.zip64:
+            # Sizes are unknown yet: they live in the zip64 data descriptor
+            extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0)
+            size_field = ZIP_MAX_32
+            version = 45
+        else:
+            extra = b""
+            size_field = 0
+            version = 20
+        self._write(
+            struct.pack(
+                "<IHHHHHIIIHH",
+                LOCAL_FILE_HEADER_SIGNATURE,
+                version,
+                flags,
+                entry.method,
+                dos_time,
+                dos_date,
+                0,
+                size_field,
+                size_field,
+                len(name),
+                len(extra),
+            )
+        )
+        self._write(name)
+        self._write(extra)
+
+    def _write_data_descriptor(self, entry: ZipEntry) -> None:
+        if entry.zip64:
+            descriptor = struct.pack(
+                "<IIQQ",
+                DATA_DESCRIPTOR_SIGNATURE,
+                entry.crc,
+                entry.compress_size,
+                entry.file_size,
+            )
+        else:
+            if entry.compress_size > ZIP_MAX_32 or entry.file_size > ZIP_MAX_32:
+                raise ValueError(
+                    f"{entry.arcname} grew past the zip64 limit while being archived"
+                )
+            descriptor = struct.pack(
+                "<IIII",
+                DATA_DESCRIPTOR_SIGNATURE,
+                entry.crc,
+                entry.compress_size,
+                entry.file_size,
+            )
+        self._write(descriptor)
+
+    def open_entry(
+        self,
+        arcname: str,
+        method: int,
+        mtime: float,
+        mode: int,
+        expected_size: int,
+    ) -> ZipEntry:
+        """
+        Start a new member whose compressed data will be fed with write_block.
+
+        Parameters
+        ----------
+        arcname : str
+            The name of the member inside the archive.
+        method : int
+            The zip compression method of the data that will be written.
+        mtime : float
+            The modification time of the member.
+        mode : int
+            The file mode of the member.
+        expected_size : int
+            The expected uncompressed size, used to decide whether zip64 records are needed.
+
+        Returns
+        -------
+        ZipEntry
+            The metadata of the opened member.
+        """
+        if self._closed:
+            raise ValueError("Cannot write to a closed archive")
+
+        entry = ZipEntry(
+            arcname=arcname,
+            method=method,
+            mtime=mtime,
+            mode=mode,
+            header_offset=self._offset,
+            # Same heuristic as the standard library: leave room for incompressible data
+            zip64=expected_size * 1.05 > ZIP64_LIMIT,
+        )
+        self._write_local_header(entry)
+        return entry
+
+    def write_block(self, entry: ZipEntry, data: bytes, crc: int, size: int) -> None:
+        """
+        Append already compressed data to an opened member.
+
+        Parameters
+        ----------
+        entry : ZipEntry
+            The member returned by open_entry.
+        data : bytes
+            The compressed data.
+        crc : int
+            The CRC-32 of the uncompressed data of this block.
+        size : int
+            The uncompressed size of this block.
+        """
+        # The first block needs no combination, which matters for small files
+        entry.crc = crc if entry.file_size == 0 else crc32_combine(entry.crc, crc, size)
+        entry.file_size += size
+        entry.compress_size += len(data)
+        self._write(data)
+
+    def close_entry(self, entry: ZipEntry) -> None:
+        """
+        Finish a member opened with open_entry by writing its data descriptor.
+        """
+        self._write_data_descriptor(entry)
+        self._entries.append(entry)
+
+    def write_bytes(self, arcname: str, data: bytes, mtime: float) -> ZipEntry:
+        """
+        Write an in-memory member, deflated, to the archive.
+
+        Parameters
+        ----------
+        arcname : str
+            The name of the member inside the archive.
+        data : bytes
+            The content of the member.
+        mtime : float
+            The modification time of the member.
+
+        Returns
+        -------
+        ZipEntry
+            The metadata of the written member.
+        """
+        entry = self.open_entry(arcname, ZIP_DEFLATED, mtime, 0o100644, len(data))
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+        self.write_block(
+            entry,
+            compressor.compress(data) + compressor.flush(),
+            zlib.crc32(data),
+            len(data),
+        )
+        self.close_entry(entry)
+        return entry
+
+    def close(self) -> None:
+        """
+        Write the central directory and the end of central directory records.
+        The underlying file object is left open.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        central_directory_offset = self._offset
+        for entry in self._entries:
+            name = entry.arcname.encode("utf-8")
+            flags = FLAG_DATA_DESCRIPTOR
+            if not entry.arcname.isascii():
+                flags |= FLAG_UTF8
+            dos_time, dos_date = _dos_datetime(entry.mtime)
+
+            zip64_fields = []
+            file_size, compress_size, header_offset = (
+                entry.file_size,
+                entry.compress_size,
+                entry.header_offset,
+            )
+            if file_size > ZIP_MAX_32 or entry.zip64:
+                zip64_fields.append(file_size)
+                file_size = ZIP_MAX_32
+            if compress_size > ZIP_MAX_32 or entry.zip64:
+                zip64_fields.append(compress_size)
+                compress_size = ZIP_MAX_32
+            if header_offset > ZIP_MAX_32:
+                zip64_fields.append(header_offset)
+                header_offset = ZIP_MAX_32
+            extra = b""
+            if zip64_fields:
+                extra = struct.pack(
+                    f"<HH{len(zip64_fields)}Q",
+                    0x0001,
+                    8 * len(zip64_fields),
+                    *zip64_fields,
+                )
+            version = 45 if zip64_fields else 20
+
+            self._write(
+                struct.pack(
+                    "<IHHHHHHIIIHHHHHII",
+                    CENTRAL_DIRECTORY_SIGNATURE,
+                    3 << 8 | version,  # Made by unix
+                    version,
+                    flags,
+                    entry.method,
+                    dos_time,
+                    dos_date,
+                    entry.crc,
+                    compress_size,
+                    file_size,
+                    len(name),
+                    len(extra),
+                    0,
+                    0,
+                    0,
+                    (entry.mode & 0xFFFF) << 16,
+                    header_offset,
+                )
+            )
+            self._write(name)
+            self._write(extra)
+
+        central_directory_size = self._offset - central_directory_offset
+        entries_count = len(self._entries)
+        if (
+            entries_count >= ZIP_MAX_ENTRIES
+            or central_directory_offset > ZIP_MAX_32
+            or central_directory_size > ZIP_MAX_32
+        ):
+            zip64_end_offset = self._offset
+            self._write(
+                struct.pack(
+                    "<IQHHIIQQQQ",
+                    ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE,
+                    44,
+                    3 << 8 | 45,
+                    45,
+                    0,
+                    0,
+                    entries_count,
+                    entries_count,
+                    central_directory_size,
+                    central_directory_offset,
+                )
+            )
+            self._write(
+                struct.pack(
+                    "<IIQI",
+                    ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE,
+                    0,
+                    zip64_end_offset,
+                    1,
+                )
+            )
+            entries_count = min(entries_count, ZIP_MAX_ENTRIES)
+            central_directory_offset = min(central_directory_offset, ZIP_MAX_32)
+            central_directory_size = min(central_directory_size, ZIP_MAX_32)
+
+        self._write(
+            struct.pack(
+                "<IHHHHIIH",
+                END_OF_CENTRAL_DIRECTORY_SIGNATURE,
+                0,
+                0,
+                entries_count,
+                entries_count,
+                central_directory_size,
+                central_directory_offset,
+                0,
+            )
+        )
+        self._fileobj.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+
+
+def find_central_directory(tail: bytes, archive_size: int) -> Tuple[int, int]:
+    """
+    Locate the central directory of an archive from its last bytes, e.g. read with
+    a ranged download. tail must hold the end of central directory record, its
+    comment and the zip64 records: the last MAX_COMMENT_SIZE + 98 bytes always do.
+
+    Parameters
+    ----------
+    tail : bytes
+        The last bytes of the archive.
+    archive_size : int
+        The size of the whole archive.
+
+    Returns
+    -------
+    Tuple[int, int]
+        The offset and the size of the central directory in the archive.
+
+    Raises
+    ------
+    ValueError
+        When tail is not the end of a zip archive.
+    """
+    end_position = tail.rfind(
+        struct.pack("<I", END_OF_CENTRAL_DIRECTORY_SIGNATURE),
+        0,
+        len(tail) - END_OF_CENTRAL_DIRECTORY_SIZE + 4,
+    )
+    if end_position < 0:
+        raise ValueError("No end of central directory record, not a zip archive")
+    _, _, _, _, _, directory_size, directory_offset, _ = struct.unpack_from(
+        "<IHHHHIIH", tail, end_position
+    )
+
+    locator_position = end_position - ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIZE
+    if (
+        locator_position >= 0
+        and struct.unpack_from("<I", tail, locator_position)[0]
+        == ZIP64_END_OF_CENTRAL_DIRECTORY_LOCATOR_SIGNATURE
+    ):
+        _, _, zip64_end_offset, _ = struct.unpack_from("<IIQI", tail, locator_position)
+        zip64_end_position = zip64_end_offset - (archive_size - len(tail))
+        if zip64_end_position < 0:
+            raise ValueError("The zip64 end of central directory record is not read")
+        signature, *_, directory_size, directory_offset = struct.unpack_from(
+            "<IQHHIIQQQQ", tail, zip64_end_position
+        )
+        if signature != ZIP64_END_OF_CENTRAL_DIRECTORY_SIGNATURE:
+            raise ValueError("Invalid zip64 end of central directory record")
+    return directory_offset, directory_size
+
+
+def parse_central_directory(data: bytes) -> List[ZipEntry]:
+    """
+    The members listed by a central directory, with their CRC-32, sizes and the
+    offset of their local header.
+
+    Raises
+    ------
+    ValueError
+        When data is not a valid central directory.
+    """
+    entries = []
+    position = 0
+    while position < len(data):
+        (
+            signature,
+            _,
+            _,
+            flags,
+            method,
+            dos_time,
+            dos_date,
+            crc,
+            compress_size,
+            file_size,
+            name_length,
+            extra_length,
+            comment_length,
+            _,
+            _,
+            external_attributes,
+            header_offset,
+        ) = struct.unpack_from("<IHHHHHHIIIHHHHHII", data, position)
+        if signature != CENTRAL_DIRECTORY_SIGNATURE:
+            raise ValueError("Invalid central directory header")
+        position += CENTRAL_DIRECTORY_HEADER_SIZE
+        name = data[position : position + name_length]
+        position += name_length
+        extra = data[position : position + extra_length]
+        position += extra_length + comment_length
+
+        # The zip64 extra field holds the fields too large for their 32 bits
+        zip64_fields = []
+        extra_position = 0
+        while extra_position + 4 <= len(extra):
+            field_id, field_length = struct.unpack_from("<HH", extra, extra_position)
+            if field_id == 0x0001:
+                zip64_fields = list(
+                    struct.unpack_from(
+                        f"<{field_length // 8}Q", extra, extra_position + 4
+                    )
+                )
+            extra_position += 4 + field_length
+        zip64 = bool(zip64_fields)
+        if file_size == ZIP_MAX_32 and zip64_fields:
+            file_size = zip64_fields.pop(0)
+        if compress_size == ZIP_MAX_32 and zip64_fields:
+            compress_size = zip64_fields.pop(0)
+        if header_offset == ZIP_MAX_32 and zip64_fields:
+            header_offset = zip64_fields.pop(0)
+
+        entry = ZipEntry(
+            arcname=name.decode("utf-8" if flags & FLAG_UTF8 else "cp437"),
+            method=method,
+            mtime=_from_dos_datetime(dos_time, dos_date),
+            mode=external_attributes >> 16,
+            header_offset=header_offset,
+            zip64=zip64,
+        )
+        entry.crc = crc
+        entry.compress_size = compress_size
+        entry.file_size = file_size
+        entries.append(entry)
+    return entries
+
+
+def local_header_size(header: bytes) -> int:
+    """
+    The size of a local file header, from its first LOCAL_FILE_HEADER_SIZE bytes:
+    the data of the member starts right after it.
+    """
+    signature, *_, name_length, extra_length = struct.unpack_from(
+        "<IHHHHHIIIHH", header
+    )
+    if signature != LOCAL_FILE_HEADER_SIGNATURE:
+        raise ValueError("Invalid local file header")
+    return LOCAL_FILE_HEADER_SIZE + name_length + extra_length